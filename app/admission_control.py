@@ -0,0 +1,257 @@
+"""
+
+  Module: admission_control.py
+  Description:
+   Admission control (load shedding) for the API endpoints, based on an estimate of the geometry cost
+   of each request made BEFORE the geometries are validated and built, so one client sending huge polygons
+   cannot hold the request threads while small (interactive) requests queue behind it.
+   Primary module funtion (@api_admit) is a DECORATOR, applied above @api_authorize.
+
+   Cost of a request (estimated vertices):
+    * JSON body: number of commas / 2 (one comma inside and one after each [x, y] position, or one after
+      each value of a flat coordinate list), plus the vertices of the referenced registered polygons
+    * binary geometry bodies (see api_payload.py): bytes / 16 (two float64 per vertex)
+    * streamed (NDJSON) bodies are not read up front: Content-Length / 16 (unknown: a heavy request)
+
+   Limits (ADMISSION_* settings in config.py), per WSGI process:
+    * body bytes, and estimated vertices, of one request: 413 (never admitted)
+    * per api-key: requests in progress (concurrency), and a budget of vertices refilled at a constant
+      rate (token bucket): 429, with Retry-After
+    * heavy requests (estimated vertices >= ADMISSION_HEAVY_VERTICES) in progress: a heavy request waits
+      for one of ADMISSION_HEAVY_CONCURRENCY slots (at most ADMISSION_HEAVY_QUEUE waiting, for at most
+      ADMISSION_QUEUE_TIMEOUT seconds), otherwise 503 with Retry-After. Light requests never wait.
+   The api-key is taken from the payload (parsed once per request, see api_payload.py), or the HEADERS,
+   as by api_authorization.py (where it is validated): requests are charged to the api-key they are
+   authorized with. Bodies are read up to the max body bytes (also without Content-Length, i.e. chunked).
+
+  Usage:
+     @api_blueprint.route("/api/polygon_overlap",  methods=['POST'])
+     @api_admit
+     @api_authorize
+     def polygon_overlap():
+     ...
+
+"""
+import re
+import math
+import time
+import threading
+from functools import wraps
+
+## Flask modules
+from flask import request, current_app, Response
+from werkzeug.exceptions import RequestEntityTooLarge, TooManyRequests, ServiceUnavailable
+
+## Custom modules
+import metrics
+from api_payload import D_BINARY_DECODERS, get_payload
+from api_authorization import NDJSON_MIMETYPES, get_request_api_key
+
+## bytes per vertex of binary geometry bodies, and of streamed bodies (lower bound of JSON coordinates)
+BYTES_PER_VERTEX = 16
+
+## registered polygon references in a raw JSON body
+RE_POLYGON_REF = re.compile(rb'"polygon_id"\s*:\s*"([0-9a-f]{64})"')
+
+## Max api-keys with a (not full) token bucket kept per process
+MAX_TRACKED_KEYS = 10000
+
+##-----------------------------------------------------------------------------------------
+class AdmissionError(Exception):
+  """ Base of the admission rejections (werkzeug HTTPExceptions: 413, 429, 503) """
+  retry_after = None
+
+class RequestTooLarge(AdmissionError, RequestEntityTooLarge):
+  pass
+
+class RateLimited(AdmissionError, TooManyRequests):
+  pass
+
+class Overloaded(AdmissionError, ServiceUnavailable):
+  pass
+
+##-----------------------------------------------------------------------------------------
+class AdmissionController(object):
+  """
+   Per-process admission state: requests in progress and vertex budgets by api-key, and heavy request slots.
+   Required Args:
+     max_vertices (int): max estimated vertices of one request
+     key_concurrency (int): max requests in progress per api-key (0: no limit)
+     key_cost_rate (float): vertices per second added to the budget of each api-key (0: no limit)
+     key_cost_burst (int): max budget of an api-key. A request costing more than the burst is admitted on a
+       full budget, which then goes negative.
+     heavy_vertices (int): requests of at least this estimated cost are heavy
+     heavy_concurrency (int): max heavy requests in progress
+   Optional Args:
+     heavy_queue (int): max heavy requests waiting for a slot
+     queue_timeout (float): max seconds a heavy request waits for a slot
+     retry_after (int): Retry-After seconds of 429 (concurrency) and 503 rejections
+  """
+
+  def __init__(self, max_vertices, key_concurrency, key_cost_rate, key_cost_burst, heavy_vertices, heavy_concurrency,
+               heavy_queue=0, queue_timeout=0, retry_after=1):
+    self.max_vertices = max_vertices
+    self.key_concurrency = key_concurrency
+    self.key_cost_rate = key_cost_rate
+    self.key_cost_burst = key_cost_burst
+    self.heavy_vertices = heavy_vertices
+    self.heavy_concurrency = heavy_concurrency
+    self.heavy_queue = heavy_queue
+    self.queue_timeout = queue_timeout
+    self.retry_after = retry_after
+    self.d_in_progress = {} ## api-key => requests in progress
+    self.d_budgets = {}     ## api-key => (vertices, time.monotonic() of last refill)
+    self.n_heavy = 0
+    self.n_waiting = 0
+    self.d_counts = {'admitted': 0, 'queued': 0, 413: 0, 429: 0, 503: 0}
+    self.cond = threading.Condition()
+
+  ##---------------------------------------------------------------------------------------
+  def _reject(self, exception_class, message, retry_after=None):
+    self.d_counts[exception_class.code] += 1
+    e = exception_class(message)
+    e.retry_after = retry_after
+    raise e
+
+  ##---------------------------------------------------------------------------------------
+  def _budget(self, api_key, now):
+    """ Return (float): current budget of api_key (refilled up to now). Call with self.cond held """
+    (vertices, t_refill) = self.d_budgets.get(api_key, (self.key_cost_burst, now))
+    return( min(self.key_cost_burst, vertices + (now - t_refill) * self.key_cost_rate) )
+
+  def _prune_budgets(self, now):
+    """ Forget the api-keys with a full budget (i.e. the same as an unknown key). Call with self.cond held """
+    for api_key in [key for key in self.d_budgets if self._budget(key, now) >= self.key_cost_burst]:
+      del self.d_budgets[api_key]
+
+  ##---------------------------------------------------------------------------------------
+  def acquire(self, api_key, cost):
+    """
+     Admit a request (or wait for a heavy slot). Each admitted request must be released with release().
+     Required Args: api_key (str), cost (int): estimated vertices
+     Raises: RequestTooLarge(), RateLimited() or Overloaded() if the request is not admitted
+    """
+    if cost > self.max_vertices:
+      self._reject(RequestTooLarge, "Request geometry too large: about %d vertices (max %d)" % (cost, self.max_vertices))
+    heavy = cost >= self.heavy_vertices
+    with self.cond:
+      if self.key_concurrency and self.d_in_progress.get(api_key, 0) >= self.key_concurrency:
+        self._reject(RateLimited, "Too many requests in progress for this api-key (max %d)" % (self.key_concurrency), self.retry_after)
+      now = time.monotonic()
+      if self.key_cost_rate:
+        budget = self._budget(api_key, now)
+        if budget < min(cost, self.key_cost_burst):
+          retry_after = math.ceil((min(cost, self.key_cost_burst) - budget) / self.key_cost_rate)
+          self._reject(RateLimited, "Geometry budget of this api-key exceeded: about %d vertices, %d available" % (cost, max(budget, 0)), retry_after)
+      if heavy and self.n_heavy >= self.heavy_concurrency:
+        if self.n_waiting >= self.heavy_queue:
+          self._reject(Overloaded, "Too many large geometry requests in progress", self.retry_after)
+        self.d_counts['queued'] += 1
+        self.n_waiting += 1
+        try:
+          admitted = self.cond.wait_for(lambda: self.n_heavy < self.heavy_concurrency, timeout=self.queue_timeout)
+        finally:
+          self.n_waiting -= 1
+        if not admitted:
+          self._reject(Overloaded, "Too many large geometry requests in progress", self.retry_after)
+        now = time.monotonic()
+      if self.key_cost_rate:
+        self.d_budgets[api_key] = (self._budget(api_key, now) - cost, now)
+        if len(self.d_budgets) > MAX_TRACKED_KEYS:
+          self._prune_budgets(now)
+      self.d_in_progress[api_key] = self.d_in_progress.get(api_key, 0) + 1
+      if heavy:
+        self.n_heavy += 1
+      self.d_counts['admitted'] += 1
+
+  ##---------------------------------------------------------------------------------------
+  def release(self, api_key, cost):
+    """ Release a request admitted by acquire() """
+    with self.cond:
+      n_in_progress = self.d_in_progress.pop(api_key) - 1
+      if n_in_progress:
+        self.d_in_progress[api_key] = n_in_progress
+      if cost >= self.heavy_vertices:
+        self.n_heavy -= 1
+        self.cond.notify()
+
+  ##---------------------------------------------------------------------------------------
+  def stats(self):
+    """ Return (dict): admitted/queued/rejected (by status code) counters, and requests in progress """
+    with self.cond:
+      return( dict(self.d_counts, in_progress=sum(self.d_in_progress.values()), heavy_in_progress=self.n_heavy, waiting=self.n_waiting) )
+
+##-----------------------------------------------------------------------------------------
+def _key_name(api_key):
+  ## '' if none found (or not a string: rejected by @api_authorize)
+  return( api_key if isinstance(api_key, str) else '' )
+
+##-----------------------------------------------------------------------------------------
+def estimate_request(max_body_bytes):
+  """
+    Estimate the geometry cost of the current request, from the raw body (geometries are not decoded).
+    Required Arg (int): max body bytes
+    Raises: RequestTooLarge() if the body is larger than max_body_bytes
+    Return (tuple): (api_key (str, '' if none found), cost (int): estimated vertices)
+  """
+  content_length = request.content_length
+  if content_length is not None and content_length > max_body_bytes:
+    raise RequestTooLarge("Request body too large: %d bytes (max %d)" % (content_length, max_body_bytes))
+
+  if request.mimetype in NDJSON_MIMETYPES: ## leave the body stream to the route (api-key in the HEADERS)
+    cost = content_length // BYTES_PER_VERTEX if content_length is not None else current_app.extensions['admission'].heavy_vertices
+    return( (_key_name(request.headers.get('X-Api-Key')), cost) )
+
+  ## bodies without Content-Length (i.e. chunked): read at most max_body_bytes + 1 bytes (the stream is truncated there)
+  try:
+    request.max_content_length = max_body_bytes + 1
+  except AttributeError: ## Flask < 3.1: read-only (app.config['MAX_CONTENT_LENGTH'])
+    pass
+  try:
+    body = request.get_data(cache=True)
+  except RequestEntityTooLarge:
+    raise RequestTooLarge("Request body too large: more than %d bytes" % (max_body_bytes))
+  if len(body) > max_body_bytes:
+    raise RequestTooLarge("Request body too large: %d bytes (max %d)" % (len(body), max_body_bytes))
+  api_key = _key_name(get_request_api_key(request, get_payload()))
+  if request.mimetype in D_BINARY_DECODERS:
+    return( (api_key, len(body) // BYTES_PER_VERTEX) )
+
+  cost = body.count(b',') // 2
+  o_registry = current_app.extensions.get('polygon_registry', None)
+  if o_registry is not None and b'"polygon_id"' in body:
+    for polygon_id in RE_POLYGON_REF.findall(body):
+      cost += o_registry.estimate_vertices(polygon_id.decode())
+  return( (api_key, cost) )
+
+##-----------------------------------------------------------------------------------------
+def api_admit(func):
+  """
+    Decorator function for route functions with admission control (above @api_authorize).
+    Raises: RequestTooLarge() (413), RateLimited() (429), Overloaded() (503)
+  """
+  @wraps(func)
+  def wrapper(**kwargs):
+    o_controller = current_app.extensions.get('admission', None)
+    if o_controller is None: ## ADMISSION_ENABLED = False
+      return( func(**kwargs) )
+    with metrics.stage('admission'):
+      try:
+        (api_key, cost) = estimate_request(current_app.config['ADMISSION_MAX_BODY_BYTES'])
+      except RequestTooLarge:
+        with o_controller.cond:
+          o_controller.d_counts[413] += 1
+        raise
+      o_controller.acquire(api_key, cost)
+    try:
+      response = func(**kwargs)
+    except BaseException:
+      o_controller.release(api_key, cost)
+      raise
+    if isinstance(response, Response) and response.is_streamed:
+      ## streamed results (/api/stream) are computed after the view returns: in progress until the response is closed
+      response.call_on_close(lambda: o_controller.release(api_key, cost))
+    else:
+      o_controller.release(api_key, cost)
+    return( response )
+  return wrapper
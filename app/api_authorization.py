@@ -14,19 +14,39 @@
 
   Notes: to use the same api_authorization() decorator on multiple routes you must include
          specify uniq endpoint=<endpoint> names in the route() args
+         Streamed (NDJSON) request bodies are not read by the decorator: the api-key must
+         be in the HEADERS for those requests.
  
 """
-import json
-
 ## Flask modules
 from functools import wraps
 from flask import request, current_app
 
+## Custom modules 
+import metrics
+from api_payload import get_payload
+
+## Content-Types of streamed (newline-delimited json) request bodies
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/ndjson')
+
 
 ##-----------------------------------------------------------------------------------------
 class ApiAuthorizationError(Exception):
   pass
 
+##-----------------------------------------------------------------------------------------
+def get_request_api_key(request, d_data):
+  """
+    Get the api-key of a request: from the payload if present, otherwise from the HEADERS.
+    Also used by admission control (admission_control.py), so requests are charged to the validated api-key.
+    Args:
+      * d_data (dict): request payload data.
+    Return: api-key (None if not found)
+  """
+  if isinstance(d_data, dict) and 'api_key' in d_data:
+    return( d_data['api_key'] )
+  return( request.headers.get('X-Api-Key') )
+
 ##-----------------------------------------------------------------------------------------
 def validate_api_key(request, d_data):
   """
@@ -36,11 +56,7 @@ def validate_api_key(request, d_data):
     Raises: ApiAuthorizationError if validation error.
   """
   api_key = current_app.config['API_KEY'] 
-  request_api_key = None
-  if 'api_key' in d_data:
-    request_api_key = d_data['api_key']
-  else:
-    request_api_key = request.headers.get('X-Api-Key')
+  request_api_key = get_request_api_key(request, d_data)
 
   if not request_api_key:
     raise ApiAuthorizationError("API request authorization failed: no api-key in payload or headers")
@@ -59,18 +75,20 @@ def api_authorize(func):
   def wrapper(**kwargs):
     tag = 'api_authorize'
     ##print( "\nSTART DECORATOR: validate_payload %s" % (str(kwargs)))
-    if request is None: 
-      raise ApiAuthorizationError("%s: Empty request object" % (tag))
-    d_payload = request.get_json(force=True) 
-    ##print("PAYLOAD: %s" % str(d_payload))
-    try:
-      json_payload = json.dumps(d_payload)
-    except Exception as e:
-      raise ApiAuthorizationError("%s: Request payload is not valid json: %s" % (tag, e))
-    try:
-      validate_api_key(request, d_payload)
-    except Exception as e:
-      raise
+    with metrics.stage('authorize'):
+      if request is None: 
+        raise ApiAuthorizationError("%s: Empty request object" % (tag))
+      if request.mimetype in NDJSON_MIMETYPES:
+        d_payload = {} ## leave the body stream to the route. api-key from HEADERS.
+      else:
+        d_payload = get_payload() ## parsed once, shared with api_data_validate and the route
+      ##print("PAYLOAD: %s" % str(d_payload))
+      if not isinstance(d_payload, dict):
+        raise ApiAuthorizationError("%s: Request payload is not valid json" % (tag))
+      try:
+        validate_api_key(request, d_payload)
+      except Exception as e:
+        raise
     ret = func(**kwargs)
     ##print( "END DECORATOR: return %s\n" % (ret))
     return ret 
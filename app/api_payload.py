@@ -0,0 +1,123 @@
+"""
+
+  Module: api_payload.py
+  Description: 
+   Request-scoped access to the parsed API request payload.
+   The JSON body is decoded once per request and stored on the flask.g object, so the
+   decorators (@api_authorize, @api_data_validate) and the route functions all share 
+   the same dict instead of each calling request.get_json().
+   The body is decoded with the configured JSON codec (json_codec.py). Responses (jsonify()) 
+   are encoded with it too, through CodecJSONProvider (Flask >= 2.2).
+
+   Content negotiation (Content-Type of the request body):
+    * anything else (default): JSON payload
+    * application/wkb: WKB geometry (or GeometryCollection, one geometry per argument)
+    * application/x-pgaas-coords: packed float64 coordinate buffer (see polygon_geometry.py)
+   For binary bodies, the other parameters come from the query string (values are parsed as 
+   JSON numbers/booleans where possible) and the api-key from the query string or HEADERS. 
+   The decoded geometries are assigned to the payload keys declared by the route 
+   (see @api_data_validate(binary_args=...)).
+
+  Usage:
+     from api_payload import get_payload
+     d_payload = get_payload() ## => dict, or None if the body is not valid json
+ 
+"""
+## Flask modules
+from flask import request, g
+try:
+  from flask.json.provider import DefaultJSONProvider
+except ImportError: ## Flask < 2.2: responses are encoded by Flask's own json module
+  DefaultJSONProvider = None
+
+## Custom modules 
+import metrics
+import json_codec
+import polygon_geometry
+
+## Content-Type => decoder of binary geometry bodies
+D_BINARY_DECODERS = {
+  'application/wkb': polygon_geometry.geometries_from_wkb,
+  'application/x-pgaas-coords': polygon_geometry.geometries_from_coords,
+}
+
+##-----------------------------------------------------------------------------------------
+def is_binary_request():
+  """ Return (bool): True if the request body is a binary geometry format """
+  return( request.mimetype in D_BINARY_DECODERS )
+
+##-----------------------------------------------------------------------------------------
+def _query_value(key, value):
+  if key == 'api_key':
+    return( value )
+  try:
+    parsed = json_codec.loads(value)
+  except ValueError:
+    return( value )
+  return( parsed if isinstance(parsed, (int, float)) else value )
+
+##-----------------------------------------------------------------------------------------
+def get_payload():
+  """
+    Get the parsed payload of the current request (decoded only on first call).
+    Return: (dict|None) decoded JSON payload. None if body is empty or not valid json.
+      For binary bodies: the query-string parameters (geometries are added by bind_binary_geometries())
+  """
+  if 'd_payload' not in g:
+    with metrics.stage('parse'):
+      if is_binary_request():
+        g.d_payload = {key: _query_value(key, value) for (key, value) in request.args.items()}
+      else:
+        try:
+          g.d_payload = json_codec.loads(request.get_data(cache=True))
+        except ValueError: ## includes json.JSONDecodeError and UnicodeDecodeError
+          g.d_payload = None
+  return( g.d_payload )
+
+##-----------------------------------------------------------------------------------------
+def bind_binary_geometries(l_keys):
+  """
+    Decode the binary body of the current request, and assign the geometries to payload keys.
+    Required Arg (tuple): payload key of each geometry, in body order. A key listed more than once
+      gets a list (i.e. ('polygons', 'polygons') => {'polygons': [<geometry>, <geometry>]})
+    Raises: polygon_geometry.InvalidGeoJson() if the body cannot be decoded, 
+      ValueError() if the number of geometries does not match
+    Return (dict): payload
+  """
+  d_payload = get_payload()
+  with metrics.stage('parse'):
+    l_geometries = D_BINARY_DECODERS[request.mimetype](request.get_data(cache=False))
+  if len(l_geometries) != len(l_keys):
+    raise ValueError("Expected %d geometries in %s body, got %d" % (len(l_keys), request.mimetype, len(l_geometries)))
+  for key in l_keys:
+    d_payload[key] = [] if l_keys.count(key) > 1 else None
+  for (key, geometry) in zip(l_keys, l_geometries):
+    if l_keys.count(key) > 1:
+      d_payload[key].append(geometry)
+    else:
+      d_payload[key] = geometry
+  return( d_payload )
+
+##-----------------------------------------------------------------------------------------
+class CodecJSONProvider(DefaultJSONProvider or object):
+  """
+    Flask JSON provider (app.json) using json_codec, for request.get_json() and jsonify().
+    Keys are sorted (as with the default provider). Calls with extra json.dumps()/loads() 
+    options are left to the default provider.
+  """
+
+  def dumps(self, obj, **kwargs):
+    if kwargs:
+      return( super().dumps(obj, **kwargs) )
+    return( json_codec.dumps(obj, sort_keys=self.sort_keys) )
+
+  def loads(self, s, **kwargs):
+    if kwargs:
+      return( super().loads(s, **kwargs) )
+    return( json_codec.loads(s) )
+
+  def response(self, *args, **kwargs):
+    obj = self._prepare_response_obj(args, kwargs)
+    with metrics.stage('jsonify'):
+      body = json_codec.dumpb(obj, sort_keys=self.sort_keys) + b"\n"
+    return( self._app.response_class(body, mimetype=self.mimetype) )
@@ -22,47 +22,87 @@
          specify uniq endpoint=<endpoint> names in the route() args
  
 """
-import json
 import jsonschema
 
 ## Flask modules
 from functools import wraps
 from flask import request, current_app
 
+from shapely.geometry.base import BaseGeometry
+from shapely.prepared import PreparedGeometry
+
+## Custom modules 
+import metrics
+from api_payload import get_payload, is_binary_request, bind_binary_geometries
+
 ##-----------------------------------------------------------------------------------------
 class ApiDataError(Exception):
   pass
 
 ##-----------------------------------------------------------------------------------------
-def api_data_validate(d_json_schema):
+def compile_schema(d_json_schema):
+  """
+   Build a reusable validator object for a jsonschema.
+   Geometries decoded from binary request bodies validate as "object".
+   Required Arg: jsonschema object in dict format. 
+   Raises: jsonschema.exceptions.SchemaError if the schema itself is invalid
+   Return: jsonschema Validator instance 
+  """
+  validator_cls = jsonschema.validators.validator_for(d_json_schema)
+  validator_cls.check_schema(d_json_schema)
+  o_type_checker = validator_cls.TYPE_CHECKER.redefine('object', 
+    lambda o_checker, instance: isinstance(instance, (dict, BaseGeometry, PreparedGeometry)))
+  validator_cls = jsonschema.validators.extend(validator_cls, type_checker=o_type_checker)
+  return( validator_cls(d_json_schema) )
+
+##-----------------------------------------------------------------------------------------
+def api_data_validate(d_json_schema, binary_args=None):
   """
    Decorator function for API request payload schema validation. Must be positioned AFTER @api_authorize.
      Uses jsonschema to validate that the request data from API payload has valid top-level parameters.
      Deeper GeoJSON validation performed by app/polygon_geometry module.
+   The schema is compiled into a validator once, when the decorator is applied (i.e. at
+   import time), rather than on every request.
    Required Arg: jsonschema object in dict format. 
+   Optional Arg (tuple): binary_args - payload keys of the geometries of a binary (WKB/packed coordinates)
+     request body (see api_payload.bind_binary_geometries()). None if the route only accepts JSON.
    Raises: ApiDataError if validation error
    Return True
   """
+  o_validator = compile_schema(d_json_schema)
+
   def data_validate(func):
     @wraps(func)
     def wrapper(*args, **kwargs):
       ##print( "\nSTART DECORATOR: json_schema: %s" % (str(d_json_schema)))
-      if request is None: 
-        raise ApiDataError("Empty request payload")
-      d_payload = request.get_json(force=True) 
-
-      try:
-        jsonschema.validate(d_payload, d_json_schema)
-        ##print("Validation success!")
-      except jsonschema.exceptions.ValidationError as e:
-        if "error" in e.schema:
-          err = e.schema["error"]
+      with metrics.stage('validate'):
+        if request is None: 
+          raise ApiDataError("Empty request payload")
+        if is_binary_request():
+          if not binary_args:
+            raise ApiDataError("Invalid request payload: %s body not supported by this endpoint" % (request.mimetype))
+          try:
+            d_payload = bind_binary_geometries(binary_args)
+          except ValueError as e:
+            raise ApiDataError("Invalid request payload: %s" % (e))
         else:
-          err = "%s: %s" % ( '.'.join(map(str,list(e.absolute_path))), e.message)
-        raise ApiDataError("Invalid request payload: %s" % (err))
-      except Exception as e:
-        raise ApiDataError("Invalid request payload - Unexpected jsonschema exception: %s" % (e))
-        raise
+          d_payload = get_payload() 
+
+        try:
+          ## same error selection as jsonschema.validate()
+          error = jsonschema.exceptions.best_match(o_validator.iter_errors(d_payload))
+          if error is not None:
+            raise error
+          ##print("Validation success!")
+        except jsonschema.exceptions.ValidationError as e:
+          if "error" in e.schema:
+            err = e.schema["error"]
+          else:
+            err = "%s: %s" % ( '.'.join(map(str,list(e.absolute_path))), e.message)
+          raise ApiDataError("Invalid request payload: %s" % (err))
+        except Exception as e:
+          raise ApiDataError("Invalid request payload - Unexpected jsonschema exception: %s" % (e))
+          raise
  
       ret = func(*args, **kwargs)
       ##print( "END DECORATOR: return %s\n" % (ret))
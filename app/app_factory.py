@@ -6,21 +6,39 @@
 """
 import sys
 import os
+import glob
+import time
+import multiprocessing
 
 from flask import Flask, request
 from config import *
 
 from blueprints.api.routes import bp_api
+from polygon_registry import PolygonRegistry
+from job_queue import JobStore, JobRunner
+from admission_control import AdmissionController
+from api_payload import CodecJSONProvider, DefaultJSONProvider
+import polygon_geometry
+import utils
+import json_codec
+import metrics
+import structured_log
 ## FUTURE: from blueprints.ui.routes import bp_ui
 
 DEBUG = 0
 
+## Environment variable selecting the config class (default: FLASK_ENV, else development)
+CONFIG_ENV_VAR = 'PGAAS_CONFIG'
+
+log = structured_log.get_logger('app_factory')
+
 ##---------------------------------------------------------------------------------------
 def create_app(d_init):
   """
    Create Flask instance (app context).
    Return app object
   """
+  t_start = time.perf_counter()
   
   app = Flask(__name__)
 
@@ -31,26 +49,72 @@ def create_app(d_init):
   _load_configs(app)
 
   ## set-up logging
-  ##_setup_logging(app) 
+  _setup_logging(app) 
 
   with app.app_context():
 
+    _init_json_codec(app)
+
+    _init_metrics(app)
+
     _register_blueprints(app)
 
+    _init_polygon_registry(app)
+
+    _init_geometry_cache(app)
+
+    _init_polygon_layers(app)
+
+    _init_multiprocessing(app)
+
+    _init_job_runner(app)
+
+    _init_geometry_executor(app)
+
+    _init_admission_control(app)
+
     if DEBUG > 1:
      _dump_info(app) ## prints to stderr (typically /var/log/httpd/error_log)
+
+  app.extensions['startup']['seconds'] = time.perf_counter() - t_start
+  log.info("app created", extra=app.extensions['startup'])
   
-    return( app )
+  return( app )
 
 ##---------------------------------------------------------------------------------------
 def _load_configs(app):
-  """Load app configuration settings"""
-  print("Loading configs...")
-  app.config.from_object(DevelopmentConfig)
+  """Load app configuration settings: config class selected by the environment (PGAAS_CONFIG)"""
+  d_configs = {'production': ProductionConfig, 'development': DevelopmentConfig, 'testing': TestingConfig}
+  config_env = os.environ.get(CONFIG_ENV_VAR) or os.environ.get('FLASK_ENV') or 'development'
+  if config_env not in d_configs:
+    raise ValueError("Invalid %s (%s). Expected one of: %s" % (CONFIG_ENV_VAR, config_env, ', '.join(d_configs)))
+  app.config.from_object(d_configs[config_env])
+  app.extensions['startup'] = {'config': config_env}
   
   if DEBUG > 2:
     app.debug = True 
 
+##---------------------------------------------------------------------------------------
+def _setup_logging(app):
+  """Structured logging (pgaas loggers), written by a background thread (see structured_log.py)"""
+  structured_log.configure_logging(app.config['LOG_LEVEL'], log_file=app.config['LOGFILE_PATH'], sample_rate=app.config['LOG_SAMPLE_RATE'],
+                                   max_chars=app.config['LOG_MAX_CHARS'], queue_size=app.config['LOG_QUEUE_SIZE'])
+  log.info("configs loaded", extra={'config': app.extensions['startup']['config'], 'log_level': app.config['LOG_LEVEL']})
+
+##---------------------------------------------------------------------------------------
+def _init_json_codec(app):
+  """Select the JSON codec (request payloads), and use it for jsonify() responses"""
+  json_codec.configure_codec(app.config['JSON_CODEC'])
+  if DefaultJSONProvider is not None: ## Flask >= 2.2
+    app.json = CodecJSONProvider(app)
+
+##---------------------------------------------------------------------------------------
+def _init_metrics(app):
+  """Record per-request latency/stage metrics (served by /metrics), in the metrics dir shared by the WSGI processes"""
+  metrics.configure_metrics(app.config['METRICS_DIR'], enabled=app.config['METRICS_ENABLED'])
+  app.before_request(lambda: metrics.start_request(request.endpoint))
+  app.teardown_request(lambda exc: metrics.end_request())
+
 ##---------------------------------------------------------------------------------------
 def _register_blueprints(app):
   """Register all app blueprints"""
@@ -61,9 +125,124 @@ def _register_blueprints(app):
   ## Register routes from "ui" blueprint object (bp_ui)
   ## FUTURE: app.register_blueprint(bp_ui)
 
+##---------------------------------------------------------------------------------------
+def _init_polygon_registry(app):
+  """Create the (per-process) registry of polygons referenced by polygon_id"""
+  app.extensions['polygon_registry'] = PolygonRegistry(app.config['POLYGON_REGISTRY_DIR'], max_vertices=app.config['GEOMETRY_CACHE_MAX_VERTICES'])
+
+##---------------------------------------------------------------------------------------
+def _init_geometry_cache(app):
+  """Size the (per-process) polygon_geometry caches of validated/prepared polygons and of results, and set the cheap-reject filters and grid indexes"""
+  polygon_geometry.configure_geometry_cache(app.config['GEOMETRY_CACHE_MAX_VERTICES'])
+  polygon_geometry.CONVEX_HULL_FILTER = app.config['GEOMETRY_CONVEX_HULL_FILTER']
+  polygon_geometry.configure_result_cache(app.config['RESULT_CACHE_MAX_ENTRIES'], app.config['RESULT_CACHE_TTL'])
+  polygon_geometry.configure_grid_index(app.config['GEOMETRY_GRID_INDEX_MIN_VERTICES'], app.config['GEOMETRY_GRID_INDEX_MIN_POINTS'], 
+                                        app.config['GEOMETRY_GRID_INDEX_MAX_CELLS'])
+
+##---------------------------------------------------------------------------------------
+def _init_polygon_layers(app):
+  """Load the configured polygon layers and build their spatial indexes (once per process)"""
+  d_layers = {}
+  for (layer_name, dir_path) in app.config['POLYGON_LAYERS'].items():
+    d_layers[layer_name] = polygon_geometry.PolygonLayer.from_directory(dir_path)
+  app.extensions['polygon_layers'] = d_layers
+
+##---------------------------------------------------------------------------------------
+def _init_multiprocessing(app):
+  """
+  Worker processes (spawned) must be started with the python interpreter. Under mod_wsgi, 
+  sys.executable is the apache (httpd) binary.
+  """
+  if not os.path.basename(sys.executable).startswith('python'):
+    multiprocessing.set_executable(os.path.join(sys.exec_prefix, 'bin', 'python3'))
+
+##---------------------------------------------------------------------------------------
+def _init_job_runner(app):
+  """Open the (shared) job store, and start running queued jobs in this process"""
+  o_store = JobStore(app.config['JOB_DB_PATH'])
+  app.extensions['job_store'] = o_store
+  app.extensions['job_runner'] = None
+  ## spawned worker processes re-import the __main__ module (i.e. pgaas_flask.py run from the command-line),
+  ## which creates an app: only the parent process runs the dispatcher
+  if multiprocessing.parent_process() is not None:
+    return
+  if app.config['JOB_WORKER_PROCESSES'] > 0:
+    o_runner = JobRunner(o_store, app.config['JOB_WORKER_PROCESSES'], app.config['JOB_RESULT_TTL'], 
+                         registry_dir=app.config['POLYGON_REGISTRY_DIR'], poll_interval=app.config['JOB_POLL_INTERVAL'])
+    o_runner.start()
+    app.extensions['job_runner'] = o_runner
+
+##---------------------------------------------------------------------------------------
+def _init_geometry_executor(app):
+  """Start the warm process pool for heavy polygon_geometry operations (if configured)"""
+  ## not in spawned worker processes (see _init_job_runner())
+  if multiprocessing.parent_process() is not None:
+    return
+  polygon_geometry.configure_executor(app.config['GEOMETRY_OFFLOAD_PROCESSES'], app.config['GEOMETRY_OFFLOAD_MIN_VERTICES'])
+
+##---------------------------------------------------------------------------------------
+def _init_admission_control(app):
+  """Per-process admission limits (budgets by api-key, heavy request slots) of the API endpoints"""
+  app.extensions['admission'] = None
+  if app.config['ADMISSION_ENABLED']:
+    app.extensions['admission'] = AdmissionController(app.config['ADMISSION_MAX_VERTICES'], app.config['ADMISSION_KEY_CONCURRENCY'], 
+      app.config['ADMISSION_KEY_COST_RATE'], app.config['ADMISSION_KEY_COST_BURST'], app.config['ADMISSION_HEAVY_VERTICES'], 
+      app.config['ADMISSION_HEAVY_CONCURRENCY'], heavy_queue=app.config['ADMISSION_HEAVY_QUEUE'], 
+      queue_timeout=app.config['ADMISSION_QUEUE_TIMEOUT'], retry_after=app.config['ADMISSION_RETRY_AFTER'])
+
+##---------------------------------------------------------------------------------------
+def warm_up(app):
+  """
+  Load the reference and registered polygons (validated, prepared, grid-indexed) into this process, and run one 
+  request of each geometry endpoint (first-call costs: jsonschema validators, Shapely, JSON codec, Flask).
+  Called once the app is set up (after its error handlers are registered: see pgaas_flask.py), before 
+  serving: Flask does not allow adding handlers after a request was handled. Logs the startup time.
+  """
+  ## not in spawned worker processes (see _init_job_runner())
+  if not app.config['WARMUP_ENABLED'] or multiprocessing.parent_process() is not None:
+    return
+  t_start = time.perf_counter()
+  n_polygons = 0
+  for pattern in app.config['WARMUP_POLYGON_FILES']:
+    for path in sorted(glob.glob(pattern)):
+      try:
+        with open(path, 'rb') as f:
+          polygon_geometry.grid_index(polygon_geometry.prepare_polygon(json_codec.loads(f.read())).context)
+        n_polygons += 1
+      except (OSError, ValueError, polygon_geometry.InvalidGeoJson) as e:
+        log.warning("warm-up polygon not loaded", extra={'file': path, 'error': str(e)})
+  n_registered = app.extensions['polygon_registry'].preload(app.config['WARMUP_REGISTRY_MAX'])
+
+  if app.config['WARMUP_REQUESTS']:
+    _warm_up_requests(app)
+
+  app.extensions['startup'].update({'warmup_seconds': time.perf_counter() - t_start, 'warmup_polygons': n_polygons, 
+                                    'warmup_registered': n_registered})
+  log.info("app ready", extra=dict(app.extensions['startup'], process_seconds=utils.process_uptime()))
+
+def _warm_up_requests(app):
+  """One request of each geometry endpoint (not recorded in the metrics)"""
+  d_poly_1 = {'type': 'Polygon', 'coordinates': [[[0.0, 0.0], [1.0, 0.0], [1.0, 1.0], [0.0, 1.0], [0.0, 0.0]]]}
+  d_poly_2 = {'type': 'Polygon', 'coordinates': [[[0.5, 0.5], [1.5, 0.5], [1.5, 1.5], [0.5, 1.5], [0.5, 0.5]]]}
+  l_requests = [('/api/polygon_intersection', {'polygons': [d_poly_1, d_poly_2]}),
+                ('/api/polygon_overlap_area', {'polygons': [d_poly_1, d_poly_2]}),
+                ('/api/point_in_polygon', {'polygon': d_poly_1, 'point': {'type': 'Point', 'coordinates': [0.5, 0.5]}})]
+  metrics_enabled = metrics.ENABLED
+  metrics.ENABLED = False
+  try:
+    o_client = app.test_client()
+    for (path, d_payload) in l_requests:
+      o_response = o_client.post(path, json=dict(d_payload, api_key=app.config['API_KEY']))
+      if o_response.status_code != 200 or 'error' in (o_response.get_json() or {}):
+        log.warning("warm-up request failed", extra={'path': path, 'status': o_response.status_code})
+  except Exception as e:
+    log.warning("warm-up request failed", exc_info=e)
+  finally:
+    metrics.ENABLED = metrics_enabled
+
 ##---------------------------------------------------------------------------------------
 def _dump_info(app):
-  """Output some app environment/config info for debug/troubleshooting"""
-  print("PATH: %s" % (sys.path))
+  """Log some app environment/config info for debug/troubleshooting"""
+  log.debug("app info", extra={'sys_path': sys.path})
 
 ##---------------------------------------------------------------------------------------
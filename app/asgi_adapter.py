@@ -0,0 +1,226 @@
+"""
+  File: asgi_adapter.py
+  Description:
+   Serve the (WSGI) Flask app as an ASGI application (see pgaas_asgi.py).
+
+   Under WSGI each request holds a server thread/process from the first byte received, so slow
+   clients (i.e. large polygon payloads on slow links) tie up the workers. Here the event loop
+   receives the request body (no thread held, thousands of connections per process), and only the
+   complete request is handed to a bounded thread pool, where the Flask app runs it as usual
+   (authorization, validation, polygon_geometry, error handlers, metrics, and the geometry process
+   pool for heavy overlap-area computations). Requests wait (as coroutines) for a free thread.
+
+   NDJSON requests (/api/stream) are not buffered: the thread reads the body from the event loop
+   as the app consumes it. Responses without a Content-Length (NDJSON results) are sent as produced.
+
+   Bodies larger than max_body_bytes get a 413 response (from the Content-Length header, or while
+   receiving), and bodies not received within body_timeout seconds a 408 response.
+"""
+import io
+import sys
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import utils
+import json_codec
+import structured_log
+from api_authorization import NDJSON_MIMETYPES
+
+log = structured_log.get_logger('asgi_adapter')
+
+##----------------------------------------------------------------------------------------------
+class ClientError(Exception):
+  """ Request rejected before it reaches the app """
+  def __init__(self, status, message):
+    super().__init__(message)
+    self.status = status
+
+##----------------------------------------------------------------------------------------------
+class _ReceiveStream(io.RawIOBase):
+  """ wsgi.input read by an executor thread, from the ASGI receive() of the event loop (on demand) """
+
+  def __init__(self, receive, loop, max_body_bytes=None):
+    self.receive = receive
+    self.loop = loop
+    self.max_body_bytes = max_body_bytes
+    self.chunk = b''
+    self.n_bytes = 0
+    self.more_body = True
+
+  def readable(self):
+    return( True )
+
+  def readinto(self, buffer):
+    while not self.chunk and self.more_body:
+      d_message = asyncio.run_coroutine_threadsafe(self.receive(), self.loop).result()
+      if d_message['type'] == 'http.disconnect':
+        raise IOError("client disconnected")
+      self.chunk = d_message.get('body', b'')
+      self.more_body = d_message.get('more_body', False)
+      self.n_bytes += len(self.chunk)
+      if self.max_body_bytes and self.n_bytes > self.max_body_bytes:
+        raise IOError("request body larger than %d bytes" % (self.max_body_bytes))
+    n = min(len(buffer), len(self.chunk))
+    buffer[:n] = self.chunk[:n]
+    self.chunk = self.chunk[n:]
+    return( n )
+
+##----------------------------------------------------------------------------------------------
+class WsgiToAsgi(object):
+  """ ASGI application running a WSGI application on a bounded thread pool """
+
+  def __init__(self, wsgi_app, threads=8, max_body_bytes=None, body_timeout=None):
+    """
+    Required Arg (callable): WSGI application
+    Optional Arg (int): max requests run at once (threads)
+    Optional Arg (int): max request body bytes (None: no limit)
+    Optional Arg (float): max seconds to receive a request body (None: no limit)
+    """
+    self.wsgi_app = wsgi_app
+    self.threads = threads
+    self.max_body_bytes = max_body_bytes
+    self.body_timeout = body_timeout
+    self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='pgaas-asgi')
+
+  async def __call__(self, scope, receive, send):
+    if scope['type'] == 'lifespan':
+      return( await self._lifespan(receive, send) )
+    if scope['type'] != 'http':
+      raise ValueError("Unsupported ASGI scope type (%s)" % (scope['type']))
+
+    d_headers = _headers(scope)
+    content_length = d_headers.get('content-length')
+    try:
+      if self.max_body_bytes and content_length and int(content_length) > self.max_body_bytes:
+        raise ClientError(413, "Request body larger than %d bytes" % (self.max_body_bytes))
+      if d_headers.get('content-type', '').split(';')[0].strip() in NDJSON_MIMETYPES:
+        o_input = io.BufferedReader(_ReceiveStream(receive, asyncio.get_running_loop(), self.max_body_bytes))
+      else:
+        body = await asyncio.wait_for(self._receive_body(receive), self.body_timeout)
+        if body is None: ## client disconnected
+          return
+        (o_input, content_length) = (io.BytesIO(body), str(len(body)))
+    except asyncio.TimeoutError:
+      return( await _send_error(send, ClientError(408, "Request body not received within %s seconds" % (self.body_timeout))) )
+    except ClientError as e:
+      return( await _send_error(send, e) )
+    except ValueError:
+      return( await _send_error(send, ClientError(400, "Invalid Content-Length header")) )
+
+    d_environ = _environ(scope, d_headers, o_input, content_length)
+    o_loop = asyncio.get_running_loop()
+    response = await o_loop.run_in_executor(self.executor, self._run, d_environ, send, o_loop)
+    if response is not None: ## not already sent (streamed)
+      (d_start, body) = response
+      await send(d_start)
+      await send({'type': 'http.response.body', 'body': body})
+
+  async def _receive_body(self, receive):
+    """ Return (bytes|None): request body (None if the client disconnected) """
+    l_chunks = []
+    n_bytes = 0
+    while True:
+      d_message = await receive()
+      if d_message['type'] == 'http.disconnect':
+        return( None )
+      chunk = d_message.get('body', b'')
+      n_bytes += len(chunk)
+      if self.max_body_bytes and n_bytes > self.max_body_bytes:
+        raise ClientError(413, "Request body larger than %d bytes" % (self.max_body_bytes))
+      l_chunks.append(chunk)
+      if not d_message.get('more_body', False):
+        return( b''.join(l_chunks) )
+
+  def _run(self, d_environ, send, o_loop):
+    """
+    Run the WSGI app (executor thread).
+    Return (tuple|None): (response start message, body), or None for a response without a Content-Length
+    (i.e. NDJSON results): sent from this thread, chunk by chunk as produced
+    """
+    d_start = {}
+    def start_response(status, l_headers, exc_info=None):
+      d_start.update({'type': 'http.response.start', 'status': int(status.split(' ', 1)[0]),
+                      'headers': [(name.lower().encode('latin-1'), value.encode('latin-1')) for (name, value) in l_headers]})
+
+    def send_now(d_message):
+      asyncio.run_coroutine_threadsafe(send(d_message), o_loop).result()
+
+    iterable = self.wsgi_app(d_environ, start_response)
+    try:
+      if any(name == b'content-length' for (name, value) in d_start['headers']):
+        return( (d_start, b''.join(iterable)) )
+      send_now(d_start)
+      for chunk in iterable:
+        if chunk:
+          send_now({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+      send_now({'type': 'http.response.body', 'body': b''})
+      return( None )
+    finally:
+      if hasattr(iterable, 'close'):
+        iterable.close()
+
+  async def _lifespan(self, receive, send):
+    while True:
+      d_message = await receive()
+      if d_message['type'] == 'lifespan.startup':
+        await send({'type': 'lifespan.startup.complete'})
+      elif d_message['type'] == 'lifespan.shutdown':
+        self.executor.shutdown(wait=True)
+        await send({'type': 'lifespan.shutdown.complete'})
+        return
+
+##----------------------------------------------------------------------------------------------
+def _headers(scope):
+  """ Return (dict): lower-case header name => value (repeated headers joined with commas) """
+  d_headers = {}
+  for (name, value) in scope.get('headers', []):
+    (name, value) = (name.decode('latin-1').lower(), value.decode('latin-1'))
+    d_headers[name] = "%s,%s" % (d_headers[name], value) if name in d_headers else value
+  return( d_headers )
+
+def _environ(scope, d_headers, o_input, content_length):
+  """ Return (dict): PEP 3333 environ of an ASGI http scope """
+  (server_name, server_port) = scope.get('server') or ('localhost', 80)
+  d_environ = {
+    'REQUEST_METHOD': scope['method'],
+    'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+    'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+    'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+    'SERVER_NAME': server_name,
+    'SERVER_PORT': str(server_port),
+    'SERVER_PROTOCOL': "HTTP/%s" % (scope.get('http_version', '1.1')),
+    'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+    'wsgi.version': (1, 0),
+    'wsgi.url_scheme': scope.get('scheme', 'http'),
+    'wsgi.input': o_input,
+    'wsgi.errors': sys.stderr,
+    'wsgi.multithread': True,
+    'wsgi.multiprocess': True,
+    'wsgi.run_once': False,
+    'wsgi.input_terminated': True,
+  }
+  for (name, value) in d_headers.items():
+    if name == 'content-type':
+      d_environ['CONTENT_TYPE'] = value
+    elif name != 'content-length':
+      d_environ['HTTP_' + name.upper().replace('-', '_')] = value
+  if content_length is not None:
+    d_environ['CONTENT_LENGTH'] = content_length
+  return( d_environ )
+
+async def _send_error(send, e):
+  """ Send an {"error": ...} response (same shape as the app error handlers) """
+  d_error = {'timestamp': utils.gmt_now(), 'exception': e.__class__.__name__, 'message': str(e)}
+  log.warning("request rejected: %s", e, extra={'status': e.status})
+  body = json_codec.dumpb({'error': d_error})
+  await send({'type': 'http.response.start', 'status': e.status, 'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]})
+  await send({'type': 'http.response.body', 'body': body})
+
+##----------------------------------------------------------------------------------------------
+def create_asgi_app(app):
+  """
+  Required Arg (Flask): app (from app_factory.create_app())
+  Return (WsgiToAsgi): ASGI application, configured by ASGI_* settings (config.py)
+  """
+  return( WsgiToAsgi(app, threads=app.config['ASGI_THREADS'],
+                     max_body_bytes=app.config['ASGI_MAX_BODY_BYTES'], body_timeout=app.config['ASGI_BODY_TIMEOUT']) )
@@ -3,22 +3,28 @@
  Route mapping for the "api" blueprint.
 
 """
-import json
-
 ## Flask modules
-from flask import Blueprint, request, current_app, jsonify
+from flask import Blueprint, request, current_app, jsonify, Response, stream_with_context, abort
 
 ## Custom modules 
 import utils
+import metrics
+import json_codec
+import structured_log
 import polygon_geometry
-from api_authorization import api_authorize
-from api_validation import api_data_validate
+import geometry_queries
+from api_authorization import api_authorize, NDJSON_MIMETYPES
+from admission_control import api_admit
+from api_validation import api_data_validate, ApiDataError
+from api_payload import get_payload
 
 ## Create a blueprint object
 blueprint_id = 'api'
 bp_api = Blueprint(blueprint_id, __name__, template_folder="views")
 setattr(bp_api, 'id', blueprint_id)
 
+log = structured_log.get_logger('routes')
+
 ##
 ## Payload validaiton is performed by jsonschema. The jsonschema objects below are passed to the 
 ## @api_data_validation decorator. However, this only validates the top-level json keys and the
@@ -30,29 +36,95 @@ json_schema_uri = 'http://json-schema.org/draft-04/schema#'
 ## jsonschema for point-in-polygon method (expect one point, and one polygon)
 d_schema_pip = {'$schema': json_schema_uri, 'title': 'apiPostData', 'description': 'top-level payload data for point-in-polygon method', 'type': 'object', 'properties': {'point':{'type': 'object'}, 'polygon': {'type':'object'}}, 'required': ['point', 'polygon' ] }
 
+## jsonschema for batch point-in-polygon method (expect one polygon, and a list of points OR flat list of coordinates)
+d_schema_pip_batch = {'$schema': json_schema_uri, 'title': 'apiPostData', 'description': 'top-level payload data for batch point-in-polygon method', 'type': 'object', 'properties': {'polygon': {'type':'object'}, 'points': {'type': 'array', 'items': {'type': 'array'}}, 'coordinates': {'type': 'array', 'items': {'type': 'number'}}}, 'required': ['polygon'] }
+
+## jsonschema for point-in-layer method (expect a layer name, and one point OR list of points OR flat list of coordinates)
+d_schema_pil = {'$schema': json_schema_uri, 'title': 'apiPostData', 'description': 'top-level payload data for point-in-layer method', 'type': 'object', 'properties': {'layer': {'type':'string'}, 'point':{'type': 'object'}, 'points': {'type': 'array', 'items': {'type': 'array'}}, 'coordinates': {'type': 'array', 'items': {'type': 'number'}}}, 'required': ['layer'] }
+
+## jsonschema for polygon-join method (expect two lists of polygons)
+d_schema_join = {'$schema': json_schema_uri, 'title': 'apiPostData', 'description': 'top-level payload data for polygon-join method', 'type': 'object', 'properties': {'polygons_1': {'type': 'array', 'items': {'type':'object'}}, 'polygons_2': {'type': 'array', 'items': {'type':'object'}}, 'overlap_area': {'type': 'boolean'}}, 'required': ['polygons_1', 'polygons_2'] }
+
+## jsonschema for job-submit method (expect one geometry query - see geometry_queries.py)
+d_schema_job_submit = {'$schema': json_schema_uri, 'title': 'apiPostData', 'description': 'top-level payload data for job-submit method', 'type': 'object', 'properties': {'query': {'type':'object', 'properties': {'op': {'type': 'string', 'enum': list(geometry_queries.D_QUERY_OPS)}}, 'required': ['op']}}, 'required': ['query'] }
+
+## jsonschema for job-status/result methods (expect one job_id)
+d_schema_job_id = {'$schema': json_schema_uri, 'title': 'apiPostData', 'description': 'top-level payload data for job-status/result methods', 'type': 'object', 'properties': {'job_id': {'type':'string'}}, 'required': ['job_id'] }
+
+## jsonschema for polygon-register method (expect one polygon)
+d_schema_register = {'$schema': json_schema_uri, 'title': 'apiPostData', 'description': 'top-level payload data for polygon-register method', 'type': 'object', 'properties': {'polygon': {'type':'object'}}, 'required': ['polygon'] }
+
+## jsonschema for polygon-delete method (expect one polygon_id)
+d_schema_polygon_id = {'$schema': json_schema_uri, 'title': 'apiPostData', 'description': 'top-level payload data for polygon-delete method', 'type': 'object', 'properties': {'polygon_id': {'type':'string'}}, 'required': ['polygon_id'] }
+
+## jsonschema for methods with no parameters (other than api_key)
+d_schema_empty = {'$schema': json_schema_uri, 'title': 'apiPostData', 'description': 'top-level payload data for methods without parameters', 'type': 'object'}
+
 ## jsonschema for polygon-intersection or overlap methods (expect two polygons)
+d_schema_overlap = {'$schema': json_schema_uri, 'title': 'apiPostData', 'description': 'top-level payload data for polygon overlap method', 'type': 'object', 'properties': {'polygons':{'type': 'array', 'minItems': 2, 'maxItems': 2, 'items': {'type':'object'}, 'error':'Two GeoJSON objects required',  'additionalItems': False }, 'tolerance': {'type': 'number', 'minimum': 0}, 'units': {'type': 'string', 'enum': list(polygon_geometry.D_AREA_UNITS)}},  'required': ['polygons']}
 d_schema_2poly = {'$schema': json_schema_uri, 'title': 'apiPostData', 'description': 'top-level payload data for polygon intersect or overlap methods', 'type': 'object', 'properties': {'polygons':{'type': 'array', 'minItems': 2, 'maxItems': 2, 'items': {'type':'object'}, 'error':'Two GeoJSON objects required',  'additionalItems': False }},  'required': ['polygons']}
 
+##
+## Any polygon object in the payloads can be either inline GeoJSON or a reference to a 
+## registered polygon: {"polygon_id": <id>} (see /api/polygon_register).
+##
+def resolve_polygon(obj):
+  """ Replace a {"polygon_id": <id>} reference with the registered (prepared) polygon """
+  return( current_app.extensions['polygon_registry'].resolve(obj) )
+
+##---------------------------------------------------------------------------------------
+## POST request to register a polygon. Returns an ID to use in place of the polygon GeoJSON. 
+@bp_api.route("/api/polygon_register",  methods=['GET', 'POST'], endpoint='polygon-register' )
+@api_admit
+@api_authorize
+@api_data_validate(d_schema_register)
+def polygon_register():
+  d_request_data = get_payload()
+
+  polygon = d_request_data['polygon'] ## already validated existence
+
+  polygon_id = current_app.extensions['polygon_registry'].register(polygon)
+  result = jsonify({'polygon_id': polygon_id})
+
+  return(result)
+
+##---------------------------------------------------------------------------------------
+## POST request to delete a registered polygon 
+@bp_api.route("/api/polygon_delete",  methods=['GET', 'POST'], endpoint='polygon-delete' )
+@api_admit
+@api_authorize
+@api_data_validate(d_schema_polygon_id)
+def polygon_delete():
+  d_request_data = get_payload()
+
+  polygon_id = d_request_data['polygon_id'] ## already validated existence
+
+  deleted = current_app.extensions['polygon_registry'].delete(polygon_id)
+  result = jsonify({'deleted': int(deleted)})
+
+  return(result)
 
 ##---------------------------------------------------------------------------------------
 ## POST request to identify if there is an intersection between 2 polygons 
 @bp_api.route("/api/polygon_intersection",  methods=['GET', 'POST'], endpoint='polygon-intersection' )
+@api_admit
 @api_authorize
-@api_data_validate(d_schema_2poly)
+@api_data_validate(d_schema_2poly, binary_args=('polygons', 'polygons'))
 def polygon_intersection():
   tag = "%s.polygon_intersection()" % blueprint_id
-  d_request_data = request.get_json(force=True)
+  d_request_data = get_payload()
   
   #print("%s: Getting intersection of polygons: %s" % (tag, str(d_request_data)))
   
   l_polygons = d_request_data['polygons'] ## already validated existence
-  poly_1 = l_polygons[0]
-  poly_2 = l_polygons[1]
+  poly_1 = resolve_polygon(l_polygons[0])
+  poly_2 = resolve_polygon(l_polygons[1])
 
   #print(poly_1)
   #print(poly_2)
 
-  d_result = polygon_geometry.check_polygon_intersection(poly_1, poly_2) ## => dict
+  with metrics.stage('geometry'):
+    d_result = polygon_geometry.check_polygon_intersection(poly_1, poly_2) ## => dict
  
   result = jsonify(d_result)
   return(result)
@@ -60,19 +132,21 @@ def polygon_intersection():
 ##---------------------------------------------------------------------------------------
 ## POST request to calculate overlap area between 2 polygons 
 @bp_api.route("/api/polygon_overlap_area",  methods=['GET', 'POST'], endpoint='polygon-overlap' )
+@api_admit
 @api_authorize
-@api_data_validate(d_schema_2poly)
+@api_data_validate(d_schema_overlap, binary_args=('polygons', 'polygons'))
 def polygon_overlap_area():
   tag = "%s.polygon_overlap_area()" % blueprint_id
-  d_request_data = request.get_json(force=True)
+  d_request_data = get_payload()
 
   #print("%s: Getting overlap-area of polygons: %s" % (tag, str(d_request_data)))
 
   l_polygons = d_request_data['polygons'] ## already validated existence
-  poly_1 = l_polygons[0]
-  poly_2 = l_polygons[1]
+  poly_1 = resolve_polygon(l_polygons[0])
+  poly_2 = resolve_polygon(l_polygons[1])
 
-  d_result = polygon_geometry.get_overlap_area(poly_1, poly_2) ## => dict 
+  with metrics.stage('geometry'):
+    d_result = polygon_geometry.get_overlap_area(poly_1, poly_2, tolerance=d_request_data.get('tolerance', None), units=d_request_data.get('units', None)) ## => dict 
   result = jsonify(d_result)
 
   return(result)
@@ -80,19 +154,197 @@ def polygon_overlap_area():
 ##---------------------------------------------------------------------------------------
 ## POST request to identify if point is "within" a polygon
 @bp_api.route("/api/point_in_polygon",  methods=['GET', 'POST'], endpoint='point-in-polygon' )
+@api_admit
 @api_authorize
-@api_data_validate(d_schema_pip)
+@api_data_validate(d_schema_pip, binary_args=('point', 'polygon'))
 def point_in_polygon():
-  tag = "%s.point_in_polygon()" % blueprint_id
-  d_request_data = request.get_json(force=True)
+  d_request_data = get_payload()
 
-  print("%s: Identifying if point is within polygon: %s" % (tag, str(d_request_data)))
+  log.debug("point in polygon", extra={'payload': d_request_data})
 
   point = d_request_data['point']     ## already validated existence
-  polygon = d_request_data['polygon'] ## already validated existence
+  polygon = resolve_polygon(d_request_data['polygon']) ## already validated existence
+
+  with metrics.stage('geometry'):
+    d_result = polygon_geometry.check_point_in_polygon(point=point, polygon=polygon) ## => dict 
+  result = jsonify(d_result)
+
+  return(result)
+
 
-  d_result = polygon_geometry.check_point_in_polygon(point=point, polygon=polygon) ## => dict 
+##---------------------------------------------------------------------------------------
+## POST request to identify which of a batch of points are "within" a polygon
+@bp_api.route("/api/point_in_polygon_batch",  methods=['GET', 'POST'], endpoint='point-in-polygon-batch' )
+@api_admit
+@api_authorize
+@api_data_validate(d_schema_pip_batch)
+def point_in_polygon_batch():
+  d_request_data = get_payload()
+
+  polygon = resolve_polygon(d_request_data['polygon']) ## already validated existence
+  points = d_request_data.get('points', None)
+  coordinates = d_request_data.get('coordinates', None)
+
+  with metrics.stage('geometry'):
+    d_result = polygon_geometry.check_points_in_polygon(polygon=polygon, points=points, coordinates=coordinates) ## => dict 
   result = jsonify(d_result)
 
   return(result)
 
+##---------------------------------------------------------------------------------------
+## POST request to identify which polygon of a layer (i.e. "states") contains a point (or each of a batch of points)
+@bp_api.route("/api/point_in_layer",  methods=['GET', 'POST'], endpoint='point-in-layer' )
+@api_admit
+@api_authorize
+@api_data_validate(d_schema_pil)
+def point_in_layer():
+  d_request_data = get_payload()
+
+  layer_name = d_request_data['layer'] ## already validated existence
+  o_layer = current_app.extensions['polygon_layers'].get(layer_name, None)
+  if o_layer is None:
+    raise ApiDataError("Invalid request payload: unknown layer (%s)" % (layer_name))
+
+  with metrics.stage('geometry'):
+    if 'point' in d_request_data:
+      d_result = polygon_geometry.find_containing_polygon(point=d_request_data['point'], layer=o_layer) ## => dict 
+    else:
+      points = d_request_data.get('points', None)
+      coordinates = d_request_data.get('coordinates', None)
+      d_result = polygon_geometry.find_containing_polygons(points=points, coordinates=coordinates, layer=o_layer) ## => dict 
+  result = jsonify(d_result)
+
+  return(result)
+
+##---------------------------------------------------------------------------------------
+## POST request to identify all intersecting pairs (and optionally overlap areas) between 2 lists of polygons
+@bp_api.route("/api/polygon_join",  methods=['GET', 'POST'], endpoint='polygon-join' )
+@api_admit
+@api_authorize
+@api_data_validate(d_schema_join)
+def polygon_join():
+  d_request_data = get_payload()
+
+  l_polygons_1 = [resolve_polygon(poly) for poly in d_request_data['polygons_1']] ## already validated existence
+  l_polygons_2 = [resolve_polygon(poly) for poly in d_request_data['polygons_2']] ## already validated existence
+  overlap_area = d_request_data.get('overlap_area', False)
+
+  processes = current_app.config['SPATIAL_JOIN_PROCESSES']
+  chunk_size = current_app.config['SPATIAL_JOIN_CHUNK_SIZE']
+  with metrics.stage('geometry'):
+    d_result = polygon_geometry.spatial_join(l_polygons_1, l_polygons_2, overlap_area=overlap_area, processes=processes, chunk_size=chunk_size) ## => dict 
+  result = jsonify(d_result)
+
+  return(result)
+
+##---------------------------------------------------------------------------------------
+## POST request with a stream of newline-delimited json (NDJSON) queries, one per line (see geometry_queries.py).
+## Results are streamed back as NDJSON, one line per query in input order, as each is computed. A failed 
+## query returns an {"error": ...} line and the stream continues. Requires the api-key in the HEADERS. 
+@bp_api.route("/api/stream",  methods=['POST'], endpoint='stream' )
+@api_admit
+@api_authorize
+def stream():
+  if request.mimetype not in NDJSON_MIMETYPES:
+    raise ApiDataError("Invalid request payload: Content-Type must be one of: %s" % (', '.join(NDJSON_MIMETYPES)))
+
+  ## body is read line-by-line while results are written, so memory stays flat for any number of queries
+  o_stream = request.stream
+
+  def generate():
+    line_number = 0
+    for line in o_stream:
+      line_number += 1
+      if not line.strip():
+        continue
+      d_query = None
+      try:
+        d_query = json_codec.loads(line)
+        with metrics.stage('geometry'):
+          d_result = geometry_queries.run_query(d_query, resolve_polygon)
+      except Exception as e:
+        d_error = {'line': line_number, 'exception': e.__class__.__name__, 'message': str(e)}
+        d_result = {'error': d_error}
+        if isinstance(d_query, dict) and 'id' in d_query:
+          d_result['id'] = d_query['id']
+      yield json_codec.dumpb(d_result) + b'\n'
+
+  return( Response(stream_with_context(generate()), mimetype='application/x-ndjson') )
+
+##---------------------------------------------------------------------------------------
+## POST request to submit an asynchronous job (one geometry query). Returns a job_id to poll with /api/job_status
+## and /api/job_result. Jobs run on a process pool, not in the WSGI request thread (see job_queue.py).
+@bp_api.route("/api/job_submit",  methods=['GET', 'POST'], endpoint='job-submit' )
+@api_admit
+@api_authorize
+@api_data_validate(d_schema_job_submit)
+def job_submit():
+  d_request_data = get_payload()
+
+  d_query = d_request_data['query'] ## already validated existence
+
+  job_id = current_app.extensions['job_store'].submit(d_query)
+  o_runner = current_app.extensions['job_runner']
+  if o_runner is not None:
+    o_runner.notify()
+  result = jsonify({'job_id': job_id, 'status': 'queued'})
+
+  return(result)
+
+##---------------------------------------------------------------------------------------
+## POST request for the status of an asynchronous job: (queued|running|done|failed)
+@bp_api.route("/api/job_status",  methods=['GET', 'POST'], endpoint='job-status' )
+@api_admit
+@api_authorize
+@api_data_validate(d_schema_job_id)
+def job_status():
+  d_request_data = get_payload()
+
+  d_job = current_app.extensions['job_store'].get(d_request_data['job_id'])
+  d_job.pop('result')
+  result = jsonify(d_job)
+
+  return(result)
+
+##---------------------------------------------------------------------------------------
+## POST request for the result of an asynchronous job. Result is the same as the synchronous endpoint response 
+## (or an error for a failed job). Results are kept for JOB_RESULT_TTL seconds after the job finished.
+@bp_api.route("/api/job_result",  methods=['GET', 'POST'], endpoint='job-result' )
+@api_admit
+@api_authorize
+@api_data_validate(d_schema_job_id)
+def job_result():
+  d_request_data = get_payload()
+
+  d_job = current_app.extensions['job_store'].get(d_request_data['job_id'])
+  d_result = {'job_id': d_job['job_id'], 'status': d_job['status']}
+  if d_job['status'] == 'done':
+    d_result['result'] = d_job['result']
+  elif d_job['status'] == 'failed':
+    d_result['error'] = d_job['result']
+  result = jsonify(d_result)
+
+  return(result)
+
+##---------------------------------------------------------------------------------------
+## POST request for the cache counters of this (WSGI) process. Used for sizing the caches.
+@bp_api.route("/api/cache_stats",  methods=['GET', 'POST'], endpoint='cache-stats' )
+@api_admit
+@api_authorize
+@api_data_validate(d_schema_empty)
+def cache_stats():
+  d_result = {'geometry_cache': polygon_geometry.get_geometry_cache_stats(), 'geometry_filters': polygon_geometry.get_filter_stats(),
+              'result_cache': polygon_geometry.get_result_cache_stats(), 'grid_index': polygon_geometry.get_grid_index_stats()}
+  result = jsonify(d_result)
+
+  return(result)
+
+##---------------------------------------------------------------------------------------
+## GET request (Prometheus scrape) for the request metrics of all WSGI processes, in the Prometheus text format 
+## (see metrics.py). No api-key: restrict access to /metrics in the web server if needed.
+@bp_api.route("/metrics",  methods=['GET'], endpoint='metrics' )
+def metrics_exposition():
+  if not metrics.ENABLED:
+    abort(404)
+
+  return( Response(metrics.render_metrics(), mimetype='text/plain', content_type='text/plain; version=0.0.4; charset=utf-8') )
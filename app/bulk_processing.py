@@ -0,0 +1,554 @@
+"""
+  File: bulk_processing.py
+  Description:
+   Offline bulk geometry processing (see pgaas_bulk.py): run the polygon_geometry operations over
+   a large input file without the HTTP API.
+
+   Input (read from a memory map of the file, so it never has to fit in RAM):
+    * NDJSON: one record per line
+    * GeoJSON FeatureCollection: one record per feature of the top-level "features" array. The file
+      is scanned for the feature boundaries (braces outside strings), and each feature parsed alone.
+   A record is either a geometry query (with an "op" member, see geometry_queries.py), run as is, or
+   a GeoJSON Feature (or geometry) tested against a reference polygon with the given op:
+     polygon_intersection, polygon_overlap_area: {"op": op, "polygons": [<geometry>, <reference>]}
+     point_in_polygon: {"op": op, "point": <geometry>, "polygon": <reference>}
+   The id of a Feature (or one of its properties) is the id of its result.
+
+   Records are sent in chunks to a process pool (raw bytes: parsed and encoded by the workers), and
+   the results written (CSV or NDJSON) in input order as each chunk completes, so the output is
+   always a prefix of the input: an interrupted run is resumed from the last record of its output.
+   Records are numbered from 1 ("record" column/member). A failed record gets an "error" and the
+   run continues.
+
+  Usage:
+     o_run = BulkRun(input_path, output_path, op='point_in_polygon', polygon=d_polygon)
+     d_stats = o_run.run() ## => {"records": <n>, "errors": <n>, "last_record": <n>, ...}
+
+"""
+import io
+import os
+import re
+import sys
+import csv
+import mmap
+import time
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+## Custom modules
+import json_codec
+import geometry_queries
+import polygon_geometry
+from geometry_queries import QueryError
+from polygon_registry import PolygonRegistry, PolygonNotFound
+
+## ops applied to Features/geometries against the reference polygon
+BULK_OPS = ('polygon_intersection', 'polygon_overlap_area', 'point_in_polygon')
+
+INPUT_FORMATS = ('ndjson', 'featurecollection')
+OUTPUT_FORMATS = ('ndjson', 'csv')
+CSV_FIELDS = ('record', 'id', 'intersects', 'overlap_area', 'error_bound', 'units', 'is_within', 'error')
+
+BULK_CHUNK_SIZE = 500        ## records per worker task
+BULK_PROGRESS_INTERVAL = 5.0 ## seconds between progress reports
+
+_RE_SPACE = re.compile(rb'[ \t\r\n]*')
+_RE_ARRAY_VALUE = re.compile(rb'[ \t\r\n]*:[ \t\r\n]*\[')
+
+##-----------------------------------------------------------------------------------------
+class BulkInputError(Exception):
+  pass
+
+##-----------------------------------------------------------------------------------------
+##
+## Input: memory-mapped file, records as (start, end) byte ranges
+##
+##-----------------------------------------------------------------------------------------
+def open_input(path):
+  """
+   Memory-map an input file (read-only).
+   Required Arg (str): path
+   Return (mmap|bytes): the file contents (b'' for an empty file, which cannot be mapped)
+  """
+  with open(path, 'rb') as f:
+    if os.fstat(f.fileno()).st_size == 0:
+      return( b'' )
+    return( mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) )
+
+def iter_ndjson(o_buffer):
+  """ Yield the (start, end) byte range of each non-empty line """
+  (pos, size) = (0, len(o_buffer))
+  while pos < size:
+    end = o_buffer.find(b'\n', pos)
+    if end < 0:
+      end = size
+    if o_buffer[pos:end].strip():
+      yield( pos, end )
+    pos = end + 1
+
+def _string_end(o_buffer, start):
+  """ Position after the JSON string starting at start ('"') """
+  end = o_buffer.find(b'"', start + 1)
+  while end > 0:
+    n_backslashes = 0
+    while o_buffer[end - 1 - n_backslashes] == 0x5c:
+      n_backslashes += 1
+    if n_backslashes % 2 == 0:
+      return( end + 1 )
+    end = o_buffer.find(b'"', end + 1)
+  raise BulkInputError("Invalid FeatureCollection: unterminated string at byte %d" % (start))
+
+def _iter_tokens(o_buffer, pos):
+  """
+   Yield the (start, end) byte range of each brace, and each string, from pos.
+   The bytes between tokens (i.e. coordinates) are skipped by find() (memchr), not by a Python/regex loop.
+  """
+  size = len(o_buffer)
+  def find(char, pos):
+    found = o_buffer.find(char, pos)
+    return( size if found < 0 else found )
+  (next_quote, next_open, next_close) = (find(b'"', pos), find(b'{', pos), find(b'}', pos))
+  while True:
+    start = min(next_quote, next_open, next_close)
+    if start == size:
+      return
+    if start == next_open:
+      next_open = find(b'{', start + 1)
+      end = start + 1
+    elif start == next_close:
+      next_close = find(b'}', start + 1)
+      end = start + 1
+    else:
+      end = _string_end(o_buffer, start)
+      next_quote = find(b'"', end)
+      if next_open < end:
+        next_open = find(b'{', end)
+      if next_close < end:
+        next_close = find(b'}', end)
+    yield( start, end )
+
+def _object_end(o_buffer, start):
+  """
+   Position after the JSON object starting at start ('{'). The braces are found with find(), and skipped
+   inside strings (odd number of quotes since the object start): the bytes in between (i.e. coordinates)
+   are skipped at memchr speed. Objects with backslashes (escaped quotes) are scanned token by token.
+  """
+  size = len(o_buffer)
+  (next_open, next_close) = (o_buffer.find(b'{', start), o_buffer.find(b'}', start))
+  (next_open, next_close) = (size if next_open < 0 else next_open, size if next_close < 0 else next_close)
+  (depth, last, n_quotes) = (0, start, 0)
+  while True:
+    if next_open < next_close:
+      (brace, delta) = (next_open, 1)
+      next_open = o_buffer.find(b'{', brace + 1)
+      if next_open < 0:
+        next_open = size
+    elif next_close < size:
+      (brace, delta) = (next_close, -1)
+      next_close = o_buffer.find(b'}', brace + 1)
+      if next_close < 0:
+        next_close = size
+    else:
+      break
+    n_quotes += o_buffer[last:brace].count(b'"') ## (mmap has no count())
+    last = brace
+    if n_quotes % 2 == 0:
+      depth += delta
+      if depth == 0:
+        ## an escaped quote before the end would have made the quote count wrong
+        if o_buffer.find(b'\\', start, brace) < 0:
+          return( brace + 1 )
+        break
+
+  depth = 0
+  for (token_start, token_end) in _iter_tokens(o_buffer, start):
+    if o_buffer[token_start] != 0x22:
+      depth += 1 if o_buffer[token_start] == 0x7b else -1
+      if depth == 0:
+        return( token_end )
+  raise BulkInputError("Invalid FeatureCollection: unterminated object at byte %d" % (start))
+
+def iter_feature_collection(o_buffer):
+  """ Yield the (start, end) byte range of each feature of the top-level "features" array """
+  pos = _RE_SPACE.match(o_buffer, 0).end()
+  if o_buffer[pos:pos + 1] != b'{':
+    raise BulkInputError("Invalid FeatureCollection: not a json object")
+
+  ## find the "features" member of the top-level object
+  (depth, o_array) = (1, None)
+  for (start, end) in _iter_tokens(o_buffer, pos + 1):
+    if o_buffer[start] == 0x22: ## string
+      if depth == 1 and o_buffer[start:end] == b'"features"':
+        o_array = _RE_ARRAY_VALUE.match(o_buffer, end)
+        if o_array is not None:
+          break
+      continue
+    depth += 1 if o_buffer[start] == 0x7b else -1
+    if depth == 0:
+      break
+  if o_array is None:
+    raise BulkInputError("Invalid FeatureCollection: no 'features' array")
+
+  ## features: comma-separated objects, up to the closing bracket
+  (pos, n_features) = (o_array.end(), 0)
+  while True:
+    pos = _RE_SPACE.match(o_buffer, pos).end()
+    if n_features and o_buffer[pos:pos + 1] == b',':
+      pos = _RE_SPACE.match(o_buffer, pos + 1).end()
+    elif o_buffer[pos:pos + 1] == b']':
+      return
+    if pos >= len(o_buffer):
+      raise BulkInputError("Invalid FeatureCollection: unterminated 'features' array")
+    if o_buffer[pos:pos + 1] != b'{':
+      raise BulkInputError("Invalid FeatureCollection: feature %d is not a json object (byte %d)" % (n_features + 1, pos))
+    end = _object_end(o_buffer, pos)
+    n_features += 1
+    yield( pos, end )
+    pos = end
+
+## input format => record iterator
+D_INPUT_READERS = {
+  'ndjson': iter_ndjson,
+  'featurecollection': iter_feature_collection,
+}
+
+def input_format_of(path):
+  """ Input format from the file extension: featurecollection for .json/.geojson, otherwise ndjson """
+  return( 'featurecollection' if os.path.splitext(path)[1].lower() in ('.json', '.geojson') else 'ndjson' )
+
+def output_format_of(path):
+  """ Output format from the file extension: csv for .csv, otherwise ndjson """
+  return( 'csv' if os.path.splitext(path)[1].lower() == '.csv' else 'ndjson' )
+
+##-----------------------------------------------------------------------------------------
+def load_polygon_file(path):
+  """
+   Load the reference polygon: GeoJSON Polygon, Feature, or FeatureCollection of one feature.
+   Required Arg (str): path
+   Raises: BulkInputError if the file holds no single geometry
+   Return (dict): GeoJSON geometry
+  """
+  with open(path, 'rb') as f:
+    d_obj = json_codec.loads(f.read())
+  if isinstance(d_obj, dict) and d_obj.get('type') == 'FeatureCollection':
+    l_features = d_obj.get('features', None)
+    if not isinstance(l_features, list) or len(l_features) != 1:
+      raise BulkInputError("Invalid polygon file (%s): FeatureCollection of one feature required" % (path))
+    d_obj = l_features[0]
+  if isinstance(d_obj, dict) and d_obj.get('type') == 'Feature':
+    d_obj = d_obj.get('geometry', None)
+  if not isinstance(d_obj, dict):
+    raise BulkInputError("Invalid polygon file (%s): not a GeoJSON object" % (path))
+  return( d_obj )
+
+##-----------------------------------------------------------------------------------------
+def make_query(d_record, op=None, polygon=None, id_property=None, tolerance=None, units=None):
+  """
+   Build the geometry query of one input record.
+   Required Arg (dict): record - geometry query (with "op"), GeoJSON Feature, or GeoJSON geometry
+   Optional Args:
+     * op (str): one of BULK_OPS, for Features/geometries
+     * polygon: reference polygon (GeoJSON, {"polygon_id": <id>}, or prepared polygon)
+     * id_property (str): Feature property used as id (default: the Feature "id")
+     * tolerance, units: polygon_overlap_area arguments
+   Raises: QueryError if the record is not a query and no op/reference polygon is given
+   Return (dict): query for geometry_queries.run_query()
+  """
+  if not isinstance(d_record, dict):
+    raise QueryError("Invalid record: not a json object")
+  if 'op' in d_record:
+    return( d_record )
+  if op is None or polygon is None:
+    raise QueryError("Invalid record: not a query (no 'op'), and no op/reference polygon given")
+
+  record_id = None
+  if d_record.get('type') == 'Feature':
+    if id_property is None:
+      record_id = d_record.get('id', None)
+    elif isinstance(d_record.get('properties', None), dict):
+      record_id = d_record['properties'].get(id_property, None)
+    d_record = d_record.get('geometry', None)
+    if not isinstance(d_record, dict):
+      raise QueryError("Invalid record: Feature without a geometry")
+
+  if op == 'point_in_polygon':
+    d_query = {'op': op, 'point': d_record, 'polygon': polygon}
+  else:
+    d_query = {'op': op, 'polygons': [d_record, polygon]}
+    if op == 'polygon_overlap_area':
+      d_query.update({'tolerance': tolerance, 'units': units})
+  if record_id is not None:
+    d_query['id'] = record_id
+  return( d_query )
+
+##-----------------------------------------------------------------------------------------
+def run_record(record, record_number, d_options, resolve_polygon=None):
+  """
+   Parse and run one record.
+   Return (dict): result {"record": <n>, ...}, or {"record": <n>, "error": {"exception": ..., "message": ...}} (plus "id")
+  """
+  (d_result, d_query) = ({'record': record_number}, None)
+  try:
+    d_query = make_query(json_codec.loads(record), **d_options)
+    d_result.update(geometry_queries.run_query(d_query, resolve_polygon))
+  except Exception as e:
+    d_result['error'] = {'exception': e.__class__.__name__, 'message': str(e)}
+    if isinstance(d_query, dict) and 'id' in d_query:
+      d_result['id'] = d_query['id']
+  return( d_result )
+
+##-----------------------------------------------------------------------------------------
+def _csv_value(value):
+  if isinstance(value, (list, dict)):
+    return( json_codec.dumps(value) )
+  if isinstance(value, str):
+    return( value.replace('\r', ' ').replace('\n', ' ') ) ## one line per record (see last_output_record())
+  return( value )
+
+def encode_results(l_results, output_format):
+  """ Encode results as NDJSON lines or CSV rows (CSV_FIELDS, no header). Return (bytes) """
+  if output_format == 'ndjson':
+    return( b''.join(json_codec.dumpb(d_result) + b'\n' for d_result in l_results) )
+  o_text = io.StringIO()
+  o_writer = csv.writer(o_text, lineterminator='\n')
+  for d_result in l_results:
+    d_row = dict(d_result)
+    if 'error' in d_row:
+      d_row['error'] = "%s: %s" % (d_row['error']['exception'], d_row['error']['message'])
+    o_writer.writerow([_csv_value(d_row.get(field, '')) for field in CSV_FIELDS])
+  return( o_text.getvalue().encode('utf-8') )
+
+def last_output_record(path, output_format):
+  """
+   Number of the last record in an output file (0 if none), to resume from.
+   An incomplete last line (interrupted write) is truncated.
+   Required Args (str): path, output_format
+   Return (int): record number
+  """
+  if not os.path.exists(path):
+    return( 0 )
+  with open(path, 'r+b') as f:
+    size = os.fstat(f.fileno()).st_size
+    if size == 0:
+      return( 0 )
+    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as o_map:
+      end = o_map.rfind(b'\n')
+      line = o_map[o_map.rfind(b'\n', 0, max(end, 0)) + 1:end] if end >= 0 else b''
+    if end + 1 < size:
+      f.truncate(end + 1)
+
+  if not line.strip() or (output_format == 'csv' and line.startswith(b'record,')):
+    return( 0 )
+  try:
+    if output_format == 'csv':
+      return( int(line.split(b',', 1)[0]) )
+    return( int(json_codec.loads(line)['record']) )
+  except (ValueError, KeyError, TypeError):
+    raise BulkInputError("Cannot resume: last line of %s is not a %s result" % (path, output_format))
+
+##-----------------------------------------------------------------------------------------
+## worker process state (reference polygon, registry), set once by the pool initializer
+_D_BULK_WORKER = {}
+
+def _registry(registry_dir):
+  return( PolygonRegistry(registry_dir) if registry_dir and os.path.isdir(registry_dir) else None )
+
+def _reference_polygon(polygon, o_registry):
+  """ Reference polygon, validated and prepared (and grid-indexed for point queries) once, not per record """
+  if o_registry is not None:
+    polygon = o_registry.resolve(polygon)
+  elif isinstance(polygon, dict) and 'polygon_id' in polygon and 'type' not in polygon:
+    raise PolygonNotFound("Invalid polygon_id: (%s): no polygon registry" % (polygon['polygon_id']))
+  return( polygon_geometry.prepare_polygon(polygon) )
+
+def _bulk_worker_init(d_options, output_format, registry_dir, cache):
+  if not cache:
+    ## records are distinct geometries (as a rule): hashing and caching each one costs more than it saves
+    polygon_geometry.configure_geometry_cache(0)
+    polygon_geometry.configure_result_cache(0)
+  o_registry = _registry(registry_dir)
+  (reference, prepared_reference) = (d_options.get('polygon', None), None)
+  if reference is not None:
+    prepared_reference = _reference_polygon(reference, o_registry)
+    if d_options.get('op', None) == 'point_in_polygon':
+      polygon_geometry.grid_index(prepared_reference.context)
+
+  def resolve_polygon(obj):
+    ## the reference polygon (same object in every query) => its prepared polygon
+    if obj is reference and reference is not None:
+      return( prepared_reference )
+    return( o_registry.resolve(obj) if o_registry is not None else obj )
+
+  _D_BULK_WORKER.update({'options': d_options, 'format': output_format, 'resolve': resolve_polygon})
+
+def _bulk_worker(first_record, l_records):
+  """ Run one chunk of records. Return (tuple): (encoded results (bytes), number of errors) """
+  l_results = [run_record(record, first_record + i, _D_BULK_WORKER['options'], _D_BULK_WORKER['resolve']) for (i, record) in enumerate(l_records)]
+  n_errors = sum(1 for d_result in l_results if 'error' in d_result)
+  return( encode_results(l_results, _D_BULK_WORKER['format']), n_errors )
+
+##-----------------------------------------------------------------------------------------
+class BulkRun(object):
+  """
+   One bulk run: input file => output file (see module description).
+   Required Args (str): input_path, output_path ('-' for stdout)
+   Optional kwargs:
+     * input_format, output_format (str): default from the file extensions (input_format_of(), output_format_of())
+     * op, polygon, id_property, tolerance, units: see make_query(). polygon may be a {"polygon_id": <id>} reference.
+     * registry_dir (str): polygon registry, to resolve {"polygon_id": <id>} references (if the dir exists)
+     * cache (bool): keep the geometry and result caches, for records that repeat the same polygons (default False)
+     * processes (int): worker processes (default os.cpu_count(); 0 runs the records in this process)
+     * chunk_size (int): records per worker task (default BULK_CHUNK_SIZE)
+     * offset (int): skip the first offset records; the output is appended to (default 0: output truncated)
+     * resume (bool): offset = last record of the existing output (see last_output_record())
+     * progress (function): called with the stats dict every progress_interval seconds, and at the end
+  """
+
+  def __init__(self, input_path, output_path, **kwargs):
+    self.input_path = input_path
+    self.output_path = output_path
+    self.input_format = kwargs.get('input_format', None) or input_format_of(input_path)
+    self.output_format = kwargs.get('output_format', None) or output_format_of(output_path)
+    if self.input_format not in INPUT_FORMATS:
+      raise ValueError("Invalid input format (%s). Expected one of: %s" % (self.input_format, ', '.join(INPUT_FORMATS)))
+    if self.output_format not in OUTPUT_FORMATS:
+      raise ValueError("Invalid output format (%s). Expected one of: %s" % (self.output_format, ', '.join(OUTPUT_FORMATS)))
+
+    op = kwargs.get('op', None)
+    if op is not None and op not in BULK_OPS:
+      raise ValueError("Invalid op (%s). Expected one of: %s" % (op, ', '.join(BULK_OPS)))
+    self.d_options = {'op': op, 'polygon': kwargs.get('polygon', None), 'id_property': kwargs.get('id_property', None),
+                      'tolerance': kwargs.get('tolerance', None), 'units': kwargs.get('units', None)}
+    self.registry_dir = kwargs.get('registry_dir', None)
+    self.cache = kwargs.get('cache', False)
+
+    processes = kwargs.get('processes', None)
+    self.processes = (os.cpu_count() or 1) if processes is None else processes
+    self.chunk_size = kwargs.get('chunk_size', None) or BULK_CHUNK_SIZE
+    self.progress = kwargs.get('progress', None)
+    self.progress_interval = kwargs.get('progress_interval', BULK_PROGRESS_INTERVAL)
+
+    self.resume = kwargs.get('resume', False)
+    if self.resume and output_path == '-':
+      raise ValueError("Cannot resume output to stdout")
+    self.offset = kwargs.get('offset', 0) or 0
+    if self.offset < 0:
+      raise ValueError("Invalid offset (%s): must be >= 0" % (self.offset))
+
+    self.d_stats = {'records': 0, 'errors': 0, 'last_record': self.offset, 'bytes_read': 0, 'input_bytes': 0,
+                    'seconds': 0.0, 'records_per_sec': 0.0}
+
+  ##---------------------------------------------------------------------------------------
+  def _open_output(self):
+    if self.output_path == '-':
+      return( sys.stdout.buffer, False )
+    o_output = open(self.output_path, 'ab' if self.offset else 'wb')
+    if self.output_format == 'csv' and o_output.tell() == 0:
+      o_output.write((','.join(CSV_FIELDS) + '\n').encode('utf-8'))
+    return( o_output, True )
+
+  def _write(self, o_output, n_records, end, encoded, n_errors):
+    o_output.write(encoded)
+    o_output.flush() ## the output is a complete prefix of the input after each chunk
+    self.d_stats['records'] += n_records
+    self.d_stats['errors'] += n_errors
+    self.d_stats['last_record'] += n_records
+    self.d_stats['bytes_read'] = end
+    self._update_rate()
+    if self.progress is not None and time.monotonic() >= self.t_next_progress:
+      self._report()
+
+  def _update_rate(self):
+    seconds = time.perf_counter() - self.t_start
+    self.d_stats.update({'seconds': round(seconds, 3), 'records_per_sec': round(self.d_stats['records'] / seconds, 1) if seconds > 0 else 0.0})
+
+  def _report(self):
+    self.t_next_progress = time.monotonic() + self.progress_interval
+    self.reported_records = self.d_stats['records']
+    self.progress(dict(self.d_stats))
+
+  def _write_next(self, o_output, dq_pending):
+    (o_future, n_records, end) = dq_pending.popleft()
+    self._write(o_output, n_records, end, *o_future.result())
+
+  def _chunks(self, o_buffer):
+    """ Yield (first record number, records, end position) of each chunk after the offset """
+    (record_number, l_chunk, end) = (0, [], 0)
+    try:
+      for (start, end) in D_INPUT_READERS[self.input_format](o_buffer):
+        record_number += 1
+        if record_number <= self.offset:
+          continue
+        l_chunk.append(o_buffer[start:end])
+        if len(l_chunk) >= self.chunk_size:
+          yield( record_number - len(l_chunk) + 1, l_chunk, end )
+          l_chunk = []
+    except BulkInputError:
+      ## records before the error are processed
+      if l_chunk:
+        yield( record_number - len(l_chunk) + 1, l_chunk, end )
+      raise
+    if l_chunk:
+      yield( record_number - len(l_chunk) + 1, l_chunk, len(o_buffer) )
+
+  ##---------------------------------------------------------------------------------------
+  def run(self):
+    """
+     Process the input (from the offset), writing the results as chunks complete.
+     Raises:
+       * BulkInputError for an invalid input file (the records before the error are processed and written)
+       * InvalidGeoJson, PolygonNotFound for an invalid reference polygon
+     Return (dict): stats (records, errors, last_record, bytes_read, input_bytes, seconds, records_per_sec)
+    """
+    if self.d_options['polygon'] is not None and self.processes != 0:
+      ## an invalid reference polygon fails here, not in the worker initializer
+      _reference_polygon(self.d_options['polygon'], _registry(self.registry_dir))
+    if self.resume:
+      self.offset = last_output_record(self.output_path, self.output_format)
+      self.d_stats['last_record'] = self.offset
+    (self.t_start, self.t_next_progress, self.reported_records) = (time.perf_counter(), time.monotonic() + self.progress_interval, None)
+
+    o_buffer = open_input(self.input_path)
+    self.d_stats['input_bytes'] = len(o_buffer)
+    (o_output, close_output) = self._open_output()
+    init_args = (self.d_options, self.output_format, self.registry_dir, self.cache)
+    try:
+      if self.processes == 0:
+        ## in this process: the cache sizes are restored after the run
+        cache_sizes = (polygon_geometry.GEOMETRY_CACHE.max_vertices, polygon_geometry.RESULT_CACHE.max_entries)
+        try:
+          _bulk_worker_init(*init_args)
+          for (first_record, l_chunk, end) in self._chunks(o_buffer):
+            self._write(o_output, len(l_chunk), end, *_bulk_worker(first_record, l_chunk))
+        finally:
+          polygon_geometry.configure_geometry_cache(cache_sizes[0])
+          polygon_geometry.configure_result_cache(cache_sizes[1])
+      else:
+        o_context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=self.processes, mp_context=o_context, initializer=_bulk_worker_init, initargs=init_args) as o_executor:
+          ## bounded number of chunks in flight: memory stays flat, results are written in input order
+          dq_pending = deque()
+          try:
+            for (first_record, l_chunk, end) in self._chunks(o_buffer):
+              dq_pending.append((o_executor.submit(_bulk_worker, first_record, l_chunk), len(l_chunk), end))
+              while len(dq_pending) > 2 * self.processes or (dq_pending and dq_pending[0][0].done()):
+                self._write_next(o_output, dq_pending)
+          except BulkInputError:
+            ## the chunks read before the error are written
+            while dq_pending:
+              self._write_next(o_output, dq_pending)
+            raise
+          while dq_pending:
+            self._write_next(o_output, dq_pending)
+      self.d_stats['bytes_read'] = len(o_buffer)
+      self._update_rate()
+    finally:
+      if close_output:
+        o_output.close()
+      if isinstance(o_buffer, mmap.mmap):
+        o_buffer.close()
+
+    if self.progress is not None and self.reported_records != self.d_stats['records']:
+      self._report()
+    return( self.d_stats )
@@ -4,9 +4,12 @@
    BaseConfig() class (and child classes) for Flask application configuration for
    multiple environments.  Default configs are set in BaseConfig() attributes. Child
    classes of BaseConfig() used for each specific environment. 
+   The class is selected by the PGAAS_CONFIG environment variable (see app_factory._load_configs()):
+   "production", "development" or "testing". 
 
 """
 import os
+import tempfile
 
 ##====================================================================================
 class BaseConfig(object):
@@ -26,9 +29,147 @@ class BaseConfig(object):
   ## Directory containing this file
   ROOT_DIR = os.path.dirname(os.path.realpath(__file__))
 
-  ## Logfile directory and path (NOT USED)
-  ##LOG_DIR = os.path.join(ROOT_DIR, 'log') 
-  ##LOGFILE_PATH = LOG_DIR + '/pgaas.log'
+  ## Directory for the runtime state of the service (registered polygons, job store, metrics files), outside
+  ## the source tree: $PGAAS_DATA_DIR, else <temp-dir>/pgaas. Set PGAAS_DATA_DIR to a persistent directory
+  ## in production (the temp directory may be emptied on reboot).
+  DATA_DIR = os.environ.get('PGAAS_DATA_DIR') or os.path.join(tempfile.gettempdir(), 'pgaas')
+
+  ## Directory for registered polygons (see polygon_registry.py). Shared by all WSGI processes.
+  POLYGON_REGISTRY_DIR = os.path.join(DATA_DIR, 'registry')
+
+  ## Polygon layers for "which polygon contains this point" lookups (/api/point_in_layer).
+  ## Layer name => directory of GeoJSON Polygon files (<polygon-name>.json)
+  POLYGON_LAYERS = {'states': os.path.join(os.path.dirname(ROOT_DIR), 'data')}
+
+  ## Spatial join (/api/polygon_join): worker processes for large joins (1 = no process pool), 
+  ## and polygons of the first collection per worker task. Joins with fewer polygons than 
+  ## SPATIAL_JOIN_CHUNK_SIZE in the first collection always run in the request process.
+  ## The pool is started by the first large join and reused (the GEOMETRY_OFFLOAD_PROCESSES pool if enabled).
+  SPATIAL_JOIN_PROCESSES = 1
+  SPATIAL_JOIN_CHUNK_SIZE = 2000
+
+  ## JSON codec for request decoding and response encoding (see json_codec.py): 
+  ## "auto" (orjson if installed, else the standard library), "orjson" or "json"
+  JSON_CODEC = 'auto'
+
+  ##==================================
+  ## Asynchronous jobs (/api/job_*)
+  ##==================================
+  ## SQLite job store, shared by all WSGI processes
+  JOB_DB_PATH = os.path.join(DATA_DIR, 'jobs', 'jobs.sqlite')
+
+  ## Worker processes running jobs, PER WSGI PROCESS: every WSGI process that creates the app starts its own
+  ## pool of JOB_WORKER_PROCESSES (0: this process does not run jobs). Jobs are queued in the shared store, so 
+  ## to run them on a single pool, set PGAAS_JOB_WORKER_PROCESSES=0 in the environment of all WSGI processes
+  ## but one (or of all of them, and run the jobs in a separate process).
+  JOB_WORKER_PROCESSES = int(os.environ.get('PGAAS_JOB_WORKER_PROCESSES', 2))
+
+  ## Seconds to keep finished jobs (and results)
+  JOB_RESULT_TTL = 3600
+
+  ## Seconds between checks for jobs queued by other WSGI processes
+  JOB_POLL_INTERVAL = 1.0
+
+  ##==================================
+  ## Geometry caching (per WSGI process)
+  ##==================================
+  ## Max total vertex count of validated/prepared polygons kept in the LRU geometry 
+  ## cache (see polygon_geometry.GeometryCache). 0 disables the cache.
+  GEOMETRY_CACHE_MAX_VERTICES = 2000000
+
+  ## Warm process pool (per WSGI process) for overlap-area computations on large polygons, 
+  ## so they do not hold the GIL of the WSGI process. Inputs with fewer than 
+  ## GEOMETRY_OFFLOAD_MIN_VERTICES (total) vertices always run inline. 0 processes disables the pool.
+  GEOMETRY_OFFLOAD_PROCESSES = 0
+  GEOMETRY_OFFLOAD_MIN_VERTICES = 20000
+  ## Intersection/overlap: after the bounding-box test, also test convex hulls (memoized per polygon)
+  ## before the exact computation. Worth it when many queried pairs are near but disjoint.
+  GEOMETRY_CONVEX_HULL_FILTER = True
+
+  ## Memoized results of intersection/overlap-area/point-in-polygon queries, keyed on the content
+  ## hashes of the inputs (per WSGI process). Max number of results (0 disables it), and seconds to keep a result.
+  RESULT_CACHE_MAX_ENTRIES = 100000
+  RESULT_CACHE_TTL = 3600
+
+  ## Point-in-polygon grid index (see polygon_geometry.PolygonGridIndex): polygons with at least GEOMETRY_GRID_INDEX_MIN_VERTICES
+  ## vertices (0 disables the index) get an index once tested against GEOMETRY_GRID_INDEX_MIN_POINTS points (cached polygons),
+  ## or when loaded (registered and warm-up polygons). ~55-60 bytes and ~1.5-3us to build per vertex (bench_grid_index.py).
+  GEOMETRY_GRID_INDEX_MIN_VERTICES = 20000
+  GEOMETRY_GRID_INDEX_MIN_POINTS = 10000
+  GEOMETRY_GRID_INDEX_MAX_CELLS = 2**20
+
+  ##==================================
+  ## Request metrics (/metrics)
+  ##==================================
+  ## Latency histograms by endpoint and processing stage, exception counters and input-size gauges,
+  ## in the Prometheus text format (see metrics.py). Each WSGI process writes its samples to a file in
+  ## METRICS_DIR, and /metrics reports the sum over all processes. Empty the directory when the service
+  ## is (re)started. None: /metrics only reports the process serving the scrape.
+  METRICS_ENABLED = True
+  METRICS_DIR = os.path.join(DATA_DIR, 'metrics')
+
+  ##==================================
+  ## Startup warm-up (app_factory.warm_up(), called by pgaas_flask.py)
+  ##==================================
+  ## A new (or recycled) WSGI process loads reference polygons before serving, so its first requests
+  ## run at full speed: GeoJSON Polygon files (glob patterns) are validated and prepared into the geometry
+  ## cache, and up to WARMUP_REGISTRY_MAX registered polygons (POLYGON_REGISTRY_DIR) are loaded. 
+  ## WARMUP_REQUESTS runs one request of each geometry endpoint (not counted in /metrics).
+  WARMUP_ENABLED = True
+  WARMUP_POLYGON_FILES = [os.path.join(os.path.dirname(ROOT_DIR), 'data', '*.json')]
+  WARMUP_REGISTRY_MAX = 1000
+  WARMUP_REQUESTS = True
+
+  ##==================================
+  ## ASGI serving (app/pgaas_asgi.py)
+  ##==================================
+  ## The event loop receives request bodies; requests then run on a bounded thread pool (per process).
+  ## Max requests run at once, max request body bytes (larger: 413), and max seconds to receive a 
+  ## request body (slower: 408). Bodies of NDJSON requests (/api/stream) are read as the app consumes them.
+  ASGI_THREADS = 8
+  ASGI_MAX_BODY_BYTES = 64 * 2**20
+  ASGI_BODY_TIMEOUT = 60
+
+  ##==================================
+  ## Admission control (see admission_control.py)
+  ##==================================
+  ## Load shedding on the estimated geometry cost (vertices) of each API request, estimated before the
+  ## payload is parsed. Limits are per WSGI process. Max body bytes, and max vertices, of one request (larger: 413).
+  ADMISSION_ENABLED = True
+  ADMISSION_MAX_BODY_BYTES = 32 * 2**20
+  ADMISSION_MAX_VERTICES = 2000000
+  ## Per api-key: max requests in progress, and a budget of vertices refilled at ADMISSION_KEY_COST_RATE 
+  ## vertices/sec up to ADMISSION_KEY_COST_BURST (over either: 429). 0 disables a limit. 
+  ## (All clients sharing one API_KEY share these limits: keep the concurrency >= the request threads then.)
+  ADMISSION_KEY_CONCURRENCY = 8
+  ADMISSION_KEY_COST_RATE = 2000000
+  ADMISSION_KEY_COST_BURST = 10000000
+  ## Requests of at least ADMISSION_HEAVY_VERTICES are heavy: at most ADMISSION_HEAVY_CONCURRENCY run at once,
+  ## and at most ADMISSION_HEAVY_QUEUE wait (up to ADMISSION_QUEUE_TIMEOUT seconds) for a slot (otherwise: 503),
+  ## so the other request threads stay available to light requests. A heavy request keeps a CPU core busy: 
+  ## with one WSGI process per core, one heavy request per process.
+  ADMISSION_HEAVY_VERTICES = 50000
+  ADMISSION_HEAVY_CONCURRENCY = 1
+  ADMISSION_HEAVY_QUEUE = 2
+  ADMISSION_QUEUE_TIMEOUT = 5.0
+  ## Retry-After seconds of the 429 (concurrency) and 503 responses
+  ADMISSION_RETRY_AFTER = 1
+
+  ##==================================
+  ## Logging (see structured_log.py)
+  ##==================================
+  ## JSON records, written by a background thread (the request thread never waits on log I/O).
+  ## Level of the pgaas loggers ("DEBUG" logs each request, with its truncated payload).
+  LOG_LEVEL = 'INFO'
+  ## Logfile directory and path. None: stderr (under mod_wsgi, the apache error log)
+  LOG_DIR = os.path.join(ROOT_DIR, 'log') 
+  LOGFILE_PATH = None ## i.e. os.path.join(LOG_DIR, 'pgaas.log')
+  ## Fraction of the records below WARNING that are written (sampling), 
+  ## max chars of a message or field (longer payloads are truncated, tracebacks to their last 4 x LOG_MAX_CHARS),
+  ## and max records waiting to be written (more are dropped, and counted).
+  LOG_SAMPLE_RATE = 1.0
+  LOG_MAX_CHARS = 500
+  LOG_QUEUE_SIZE = 10000
 
   ##==================================
   ## Anonymous user stuff 
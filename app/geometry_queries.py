@@ -0,0 +1,94 @@
+"""
+
+  Module: geometry_queries.py
+  Description:
+   Dispatch of a single geometry "query" (a dict naming the operation and its arguments) to the
+   polygon_geometry functions. Used wherever queries arrive as individual records rather than
+   as the payload of a dedicated endpoint (i.e. the NDJSON streaming endpoint).
+
+   Query format (same arguments as the payloads of the corresponding /api/* endpoints):
+     {"op": "polygon_intersection", "polygons": [<polygon>, <polygon>]}
+     {"op": "polygon_overlap_area", "polygons": [<polygon>, <polygon>]}  (optional "tolerance": <max relative error>, "units": "m2"|"km2")
+     {"op": "point_in_polygon", "point": <GeoJSON Point>, "polygon": <polygon>}
+     {"op": "point_in_polygon_batch", "polygon": <polygon>, "points": [[x, y], ...]}  (or "coordinates")
+   An optional "id" member is copied to the result, so clients can match results to queries.
+
+  Usage:
+     d_result = run_query(d_query, resolve_polygon) ## => dict (same as the endpoint response)
+
+"""
+
+## Custom modules
+import polygon_geometry
+
+##-----------------------------------------------------------------------------------------
+class QueryError(Exception):
+  pass
+
+##-----------------------------------------------------------------------------------------
+def _two_polygons(d_query, resolve_polygon):
+  l_polygons = d_query.get('polygons', None)
+  if not isinstance(l_polygons, list) or len(l_polygons) != 2:
+    raise QueryError("Invalid query: Two GeoJSON objects required")
+  return( resolve_polygon(l_polygons[0]), resolve_polygon(l_polygons[1]) )
+
+def _polygon(d_query, resolve_polygon):
+  if not isinstance(d_query.get('polygon', None), dict):
+    raise QueryError("Invalid query: 'polygon' is a required property")
+  return( resolve_polygon(d_query['polygon']) )
+
+def _query_intersection(d_query, resolve_polygon):
+  return( polygon_geometry.check_polygon_intersection(*_two_polygons(d_query, resolve_polygon)) )
+
+def _query_overlap_area(d_query, resolve_polygon):
+  tolerance = d_query.get('tolerance', None)
+  if tolerance is not None and (isinstance(tolerance, bool) or not isinstance(tolerance, (int, float)) or tolerance < 0):
+    raise QueryError("Invalid query: 'tolerance' must be a number >= 0")
+  units = d_query.get('units', None)
+  if units is not None and units not in polygon_geometry.D_AREA_UNITS:
+    raise QueryError("Invalid query: 'units' must be one of: %s" % (', '.join(polygon_geometry.D_AREA_UNITS)))
+  return( polygon_geometry.get_overlap_area(*_two_polygons(d_query, resolve_polygon), tolerance=tolerance, units=units) )
+
+def _query_point_in_polygon(d_query, resolve_polygon):
+  if not isinstance(d_query.get('point', None), dict):
+    raise QueryError("Invalid query: 'point' is a required property")
+  return( polygon_geometry.check_point_in_polygon(point=d_query['point'], polygon=_polygon(d_query, resolve_polygon)) )
+
+def _query_point_in_polygon_batch(d_query, resolve_polygon):
+  polygon = _polygon(d_query, resolve_polygon)
+  return( polygon_geometry.check_points_in_polygon(polygon=polygon, points=d_query.get('points', None), coordinates=d_query.get('coordinates', None)) )
+
+## op => query function
+D_QUERY_OPS = {
+  'polygon_intersection': _query_intersection,
+  'polygon_overlap_area': _query_overlap_area,
+  'point_in_polygon': _query_point_in_polygon,
+  'point_in_polygon_batch': _query_point_in_polygon_batch,
+}
+
+##-----------------------------------------------------------------------------------------
+def _no_resolve(obj):
+  return( obj )
+
+##-----------------------------------------------------------------------------------------
+def run_query(d_query, resolve_polygon=None):
+  """
+   Run one geometry query.
+   Required Arg (dict): query {"op": <op>, ...} (see module description)
+   Optional Arg (function): resolve_polygon(obj) to replace {"polygon_id": <id>} references
+     with registered polygons. Without it, polygons must be inline GeoJSON.
+   Raises: QueryError for an invalid query, polygon_geometry.InvalidGeoJson for invalid GeoJSON
+   Return (dict): result of the operation (plus "id" if the query has one)
+  """
+  if not isinstance(d_query, dict):
+    raise QueryError("Invalid query: not a json object")
+  op = d_query.get('op', None)
+  query_func = D_QUERY_OPS.get(op, None) if isinstance(op, str) else None
+  if query_func is None:
+    raise QueryError("Invalid query: unsupported op (%s). Expected one of: %s" % (op, ', '.join(D_QUERY_OPS)))
+
+  d_result = query_func(d_query, resolve_polygon or _no_resolve)
+  if 'id' in d_query:
+    d_result['id'] = d_query['id']
+
+  return( d_result )
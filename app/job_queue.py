@@ -0,0 +1,253 @@
+"""
+
+  Module: job_queue.py
+  Description:
+   Asynchronous geometry jobs, for queries too slow for a synchronous request (i.e. overlap
+   area of large, detailed boundaries). Used by the /api/job_* endpoints (submit/status/result).
+
+   * JobStore: jobs are persisted in a local SQLite database, so queued jobs and results
+     survive a restart, and all WSGI processes share the same queue.
+   * JobRunner: a dispatcher thread (one per WSGI process) claims queued jobs and runs them on
+     a process pool (geometry_queries.run_query() in the worker process), so slow jobs never
+     occupy the threads serving the interactive endpoints.
+
+   A job is a geometry query in the format of geometry_queries.py (i.e. {"op": "polygon_overlap_area", ...}).
+   Finished jobs (and their results) are removed after a TTL.
+
+   Job states: queued => running => (done|failed)
+
+  Usage:
+     o_store = JobStore(db_path)
+     o_runner = JobRunner(o_store, processes=2, result_ttl=3600)
+     o_runner.start()
+     job_id = o_store.submit(d_query)
+     d_job = o_store.get(job_id)
+
+"""
+import os
+import time
+import uuid
+import sqlite3
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+## Custom modules
+import utils
+import json_codec
+import geometry_queries
+from polygon_registry import PolygonRegistry
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+##-----------------------------------------------------------------------------------------
+class JobNotFound(Exception):
+  pass
+
+##-----------------------------------------------------------------------------------------
+class JobStore(object):
+  """
+   SQLite-backed store of jobs. A new connection is used for each operation, so the store
+   can be shared by threads (and processes).
+   Required Arg: db_path (str): path of the SQLite database file (created if needed)
+  """
+
+  def __init__(self, db_path):
+    self.db_path = db_path
+    db_dir = os.path.dirname(db_path)
+    if db_dir:
+      os.makedirs(db_dir, exist_ok=True)
+    with self._connect() as o_conn:
+      o_conn.execute("PRAGMA journal_mode=WAL")
+      o_conn.execute("CREATE TABLE IF NOT EXISTS jobs (job_id TEXT PRIMARY KEY, status TEXT NOT NULL, query TEXT NOT NULL, "
+                     "result TEXT, worker_pid INTEGER, created REAL NOT NULL, started REAL, finished REAL)")
+      o_conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)")
+
+  ##---------------------------------------------------------------------------------------
+  def _connect(self):
+    return( sqlite3.connect(self.db_path, timeout=30) )
+
+  ##---------------------------------------------------------------------------------------
+  def submit(self, d_query):
+    """
+     Queue a new job.
+     Required Arg (dict): geometry query
+     Return (str): job_id
+    """
+    job_id = uuid.uuid4().hex
+    with self._connect() as o_conn:
+      o_conn.execute("INSERT INTO jobs (job_id, status, query, created) VALUES (?, ?, ?, ?)",
+                     (job_id, JOB_QUEUED, json_codec.dumps(d_query), time.time()))
+    return( job_id )
+
+  ##---------------------------------------------------------------------------------------
+  def get(self, job_id):
+    """
+     Get a job.
+     Required Arg (str): job_id
+     Raises: JobNotFound() if job does not exist (or has expired)
+     Return (dict): {'job_id', 'status', 'created', 'started', 'finished', 'result'}
+    """
+    with self._connect() as o_conn:
+      row = o_conn.execute("SELECT job_id, status, created, started, finished, result FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+    if row is None:
+      raise JobNotFound("Unknown job_id: (%s)" % (job_id))
+    d_job = dict(zip(('job_id', 'status', 'created', 'started', 'finished', 'result'), row))
+    d_job['result'] = json_codec.loads(d_job['result']) if d_job['result'] else None
+    return( d_job )
+
+  ##---------------------------------------------------------------------------------------
+  def claim_next(self, worker_pid):
+    """
+     Atomically move the oldest queued job to "running" (safe with concurrent WSGI processes).
+     Required Arg (int): pid of the process running the job
+     Return (tuple|None): (job_id, d_query), or None if no job is queued
+    """
+    with self._connect() as o_conn:
+      while True:
+        row = o_conn.execute("SELECT job_id, query FROM jobs WHERE status = ? ORDER BY created LIMIT 1", (JOB_QUEUED,)).fetchone()
+        if row is None:
+          return( None )
+        o_cursor = o_conn.execute("UPDATE jobs SET status = ?, worker_pid = ?, started = ? WHERE job_id = ? AND status = ?",
+                                  (JOB_RUNNING, worker_pid, time.time(), row[0], JOB_QUEUED))
+        o_conn.commit()
+        if o_cursor.rowcount == 1:
+          return( row[0], json_codec.loads(row[1]) )
+        ## claimed by another process: try the next one
+
+  ##---------------------------------------------------------------------------------------
+  def finish(self, job_id, status, d_result):
+    """
+     Record the result of a job.
+     Required Args: job_id (str), status (JOB_DONE|JOB_FAILED), d_result (dict): result or error
+    """
+    with self._connect() as o_conn:
+      o_conn.execute("UPDATE jobs SET status = ?, result = ?, finished = ? WHERE job_id = ?",
+                     (status, json_codec.dumps(d_result), time.time(), job_id))
+
+  ##---------------------------------------------------------------------------------------
+  def requeue_orphans(self):
+    """
+     Re-queue "running" jobs whose worker process no longer exists (i.e. after a restart).
+     Return (int): number of re-queued jobs
+    """
+    n_requeued = 0
+    with self._connect() as o_conn:
+      for (job_id, worker_pid) in o_conn.execute("SELECT job_id, worker_pid FROM jobs WHERE status = ?", (JOB_RUNNING,)).fetchall():
+        if utils.pid_alive(worker_pid):
+          continue
+        o_conn.execute("UPDATE jobs SET status = ?, worker_pid = NULL, started = NULL WHERE job_id = ? AND status = ?",
+                       (JOB_QUEUED, job_id, JOB_RUNNING))
+        n_requeued += 1
+    return( n_requeued )
+
+  ##---------------------------------------------------------------------------------------
+  def purge_expired(self, ttl):
+    """
+     Delete finished jobs older than ttl seconds.
+     Return (int): number of deleted jobs
+    """
+    with self._connect() as o_conn:
+      o_cursor = o_conn.execute("DELETE FROM jobs WHERE status IN (?, ?) AND finished < ?", (JOB_DONE, JOB_FAILED, time.time() - ttl))
+    return( o_cursor.rowcount )
+
+##-----------------------------------------------------------------------------------------
+## Per-process state of the job worker processes
+_D_JOB_WORKER = {}
+
+def _job_worker_init(registry_dir):
+  _D_JOB_WORKER['registry'] = PolygonRegistry(registry_dir)
+
+def _job_worker(d_query):
+  """ Run one job in a worker process. Return (tuple): (status, result-or-error dict) """
+  try:
+    d_result = geometry_queries.run_query(d_query, _D_JOB_WORKER['registry'].resolve)
+  except Exception as e:
+    return( JOB_FAILED, {'exception': e.__class__.__name__, 'message': str(e)} )
+  return( JOB_DONE, d_result )
+
+##-----------------------------------------------------------------------------------------
+class JobRunner(object):
+  """
+   Dispatcher thread that runs queued jobs on a process pool.
+   Required Args:
+     * o_store (JobStore)
+     * processes (int): size of the process pool
+     * result_ttl (int): seconds to keep finished jobs
+   Optional Args:
+     * registry_dir (str): polygon registry dir, for jobs referencing {"polygon_id": <id>}
+     * poll_interval (float): seconds between checks for jobs queued by other processes
+  """
+
+  def __init__(self, o_store, processes, result_ttl, registry_dir=None, poll_interval=1.0):
+    self.o_store = o_store
+    self.processes = processes
+    self.result_ttl = result_ttl
+    self.registry_dir = registry_dir
+    self.poll_interval = poll_interval
+    self.o_wakeup = threading.Event()
+    self.o_stop = threading.Event()
+    self.o_slots = threading.Semaphore(processes)
+    self.o_thread = None
+    self.o_executor = None
+
+  ##---------------------------------------------------------------------------------------
+  def start(self):
+    """ Start the dispatcher thread (the worker processes are started on first use) """
+    self.o_store.requeue_orphans()
+    o_context = multiprocessing.get_context('spawn') ## safe to use from a threaded WSGI process
+    self.o_executor = ProcessPoolExecutor(max_workers=self.processes, mp_context=o_context,
+                                          initializer=_job_worker_init, initargs=(self.registry_dir,))
+    self.o_thread = threading.Thread(target=self._dispatch, name='job-dispatcher', daemon=True)
+    self.o_thread.start()
+
+  ##---------------------------------------------------------------------------------------
+  def stop(self):
+    """ Stop the dispatcher, and wait for running jobs to finish """
+    self.o_stop.set()
+    self.o_wakeup.set()
+    if self.o_thread:
+      self.o_thread.join()
+    if self.o_executor:
+      self.o_executor.shutdown(wait=True)
+
+  ##---------------------------------------------------------------------------------------
+  def notify(self):
+    """ Wake the dispatcher (i.e. after a job was submitted by this process) """
+    self.o_wakeup.set()
+
+  ##---------------------------------------------------------------------------------------
+  def _dispatch(self):
+    last_purge = 0
+    while not self.o_stop.is_set():
+      if time.time() - last_purge > 60:
+        self.o_store.purge_expired(self.result_ttl)
+        last_purge = time.time()
+
+      ## fill the free worker slots with queued jobs
+      while self.o_slots.acquire(blocking=False):
+        job = self.o_store.claim_next(os.getpid())
+        if job is None:
+          self.o_slots.release()
+          break
+        (job_id, d_query) = job
+        o_future = self.o_executor.submit(_job_worker, d_query)
+        o_future.add_done_callback(lambda o_future, job_id=job_id: self._job_done(job_id, o_future))
+
+      self.o_wakeup.wait(self.poll_interval)
+      self.o_wakeup.clear()
+
+  ##---------------------------------------------------------------------------------------
+  def _job_done(self, job_id, o_future):
+    try:
+      (status, d_result) = o_future.result()
+    except Exception as e: ## i.e. worker process died
+      (status, d_result) = (JOB_FAILED, {'exception': e.__class__.__name__, 'message': str(e)})
+    try:
+      self.o_store.finish(job_id, status, d_result)
+    finally:
+      self.o_slots.release()
+      self.o_wakeup.set()
@@ -0,0 +1,113 @@
+"""
+
+  Module: json_codec.py
+  Description:
+   Pluggable JSON codec for request decoding and response encoding. Everything that decodes or
+   encodes JSON (api_payload.py and the Flask json provider, the routes, polygon_geometry.py,
+   the polygon registry and job store) goes through the module-level functions below, which use
+   the codec selected with configure_codec() (JSON_CODEC in app/config.py):
+
+    * "json": Python standard library (always available)
+    * "orjson": orjson (pip install orjson) - several times faster for large coordinate lists
+    * "auto": orjson if installed, otherwise json (default)
+
+   Differences between the backends only concern non-standard JSON: orjson rejects NaN/Infinity
+   literals (invalid GeoJSON anyway) and encodes non-ASCII characters as UTF-8 instead of \\u escapes.
+
+  Usage:
+     import json_codec
+     json_codec.configure_codec('auto')
+     d_obj = json_codec.loads(body)   ## str or bytes
+     body = json_codec.dumpb(d_obj)   ## => bytes
+     text = json_codec.dumps(d_obj)   ## => str
+
+"""
+import json
+
+try:
+  import orjson
+except ImportError:
+  orjson = None
+
+##-----------------------------------------------------------------------------------------
+class JsonCodecError(Exception):
+  pass
+
+##-----------------------------------------------------------------------------------------
+def _check_input(data):
+  ## same error for every backend (orjson raises JSONDecodeError for non-text input)
+  if not isinstance(data, (str, bytes, bytearray, memoryview)):
+    raise TypeError("JSON input must be str or bytes, not %s" % (data.__class__.__name__))
+
+##-----------------------------------------------------------------------------------------
+class StdlibCodec(object):
+  """ Python standard library json (compact output) """
+  name = 'json'
+
+  def loads(self, data):
+    _check_input(data)
+    if isinstance(data, memoryview):
+      data = data.tobytes()
+    return( json.loads(data) )
+
+  def dumps(self, obj, sort_keys=False):
+    return( json.dumps(obj, separators=(',', ':'), sort_keys=sort_keys) )
+
+  def dumpb(self, obj, sort_keys=False):
+    return( self.dumps(obj, sort_keys=sort_keys).encode('utf-8') )
+
+##-----------------------------------------------------------------------------------------
+class OrjsonCodec(object):
+  """ orjson (decode errors are json.JSONDecodeError subclasses, like the stdlib) """
+  name = 'orjson'
+
+  def loads(self, data):
+    _check_input(data)
+    return( orjson.loads(data) )
+
+  def dumps(self, obj, sort_keys=False):
+    return( self.dumpb(obj, sort_keys=sort_keys).decode('utf-8') )
+
+  def dumpb(self, obj, sort_keys=False):
+    return( orjson.dumps(obj, option=orjson.OPT_SORT_KEYS if sort_keys else None) )
+
+## name => codec class
+D_CODECS = {'json': StdlibCodec, 'orjson': OrjsonCodec}
+
+CODEC = OrjsonCodec() if orjson is not None else StdlibCodec()
+
+##-----------------------------------------------------------------------------------------
+def configure_codec(name):
+  """
+   Select the JSON codec (for this process).
+   Required Arg (str): "json", "orjson" or "auto"
+   Raises: JsonCodecError() if the codec is unknown or not installed
+   Return (str): name of the selected codec
+  """
+  global CODEC
+  if name == 'auto':
+    name = 'orjson' if orjson is not None else 'json'
+  if name not in D_CODECS:
+    raise JsonCodecError("Unknown JSON codec: (%s). Expected one of: auto, %s" % (name, ', '.join(D_CODECS)))
+  if name == 'orjson' and orjson is None:
+    raise JsonCodecError("JSON codec (orjson) is not installed")
+  CODEC = D_CODECS[name]()
+  return( CODEC.name )
+
+##-----------------------------------------------------------------------------------------
+def loads(data):
+  """
+   Decode JSON text.
+   Required Arg (str|bytes): JSON text
+   Raises: TypeError() if data is not text, json.JSONDecodeError() (a ValueError) if not valid json
+   Return: decoded object
+  """
+  return( CODEC.loads(data) )
+
+def dumps(obj, sort_keys=False):
+  """ Return (str): compact JSON encoding of obj """
+  return( CODEC.dumps(obj, sort_keys=sort_keys) )
+
+def dumpb(obj, sort_keys=False):
+  """ Return (bytes): compact (UTF-8) JSON encoding of obj """
+  return( CODEC.dumpb(obj, sort_keys=sort_keys) )
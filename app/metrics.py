@@ -0,0 +1,397 @@
+"""
+
+  Module: metrics.py
+  Description:
+   Request metrics, served by /metrics in the Prometheus text exposition format:
+
+    * pgaas_request_duration_seconds (histogram): request latency, by endpoint
+    * pgaas_stage_duration_seconds (histogram): time of each processing stage of a request, by endpoint
+        and stage (parse, authorize, validate, geojson, shape, geometry, jsonify). Stages nest
+        (i.e. GeoJSON validation runs inside the geometry operation): each stage only counts its own
+        time, so the stages of a request add up to (at most) the request latency.
+    * pgaas_exceptions_total (counter): exceptions caught by the error handlers, by endpoint and exception type
+    * pgaas_input_vertices (gauge): polygon vertices in the input of the last request, by endpoint and process
+
+   Stage times of a request are accumulated in a thread-local record (stage() is a no-op outside of
+   a request, i.e. in worker processes), and written to the metric store once, when the request ends.
+
+   Multiple WSGI processes: each process writes its samples to its own memory-mapped file in the
+   metrics directory (METRICS_DIR in app/config.py), and /metrics sums the files of all processes,
+   so a scrape sees every process whichever one serves it. Counters and histograms of processes
+   that have exited are kept; gauges are only reported for running processes. The directory should
+   be emptied when the service is (re)started. Without a directory, only this process is reported.
+
+  Usage:
+     metrics.configure_metrics(metrics_dir)
+     metrics.start_request(endpoint)     ## before_request
+     with metrics.stage('geometry'):
+       ...
+     metrics.end_request()               ## teardown_request
+     text = metrics.render_metrics()
+
+"""
+import os
+import re
+import mmap
+import glob
+import struct
+import bisect
+import threading
+from time import perf_counter
+
+## Custom modules
+import utils
+
+## Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+## Metric family => (type, help)
+D_METRICS = {
+  'pgaas_request_duration_seconds': ('histogram', 'Request latency by endpoint'),
+  'pgaas_stage_duration_seconds': ('histogram', 'Time spent in each processing stage of a request (excluding nested stages), by endpoint and stage'),
+  'pgaas_exceptions_total': ('counter', 'Exceptions caught by the error handlers, by endpoint and exception type'),
+  'pgaas_input_vertices': ('gauge', 'Polygon vertices in the input of the last request, by endpoint and process'),
+}
+
+ENABLED = False
+
+##-----------------------------------------------------------------------------------------
+##
+## Metric stores. A sample key is "<family>\t<sample name>\t<labels>\t<le>" (le: histogram bucket
+## bound, empty for other samples), so the files of several processes can be merged by key.
+##
+_HEADER = struct.Struct('<I4x')  ## used bytes
+_KEY_LEN = struct.Struct('<I')
+_VALUE = struct.Struct('<d')
+
+def _entry_size(key_len):
+  """ Size of a file entry: key length, key, padding (8-byte aligned value), value """
+  return( _KEY_LEN.size + key_len + (-(_KEY_LEN.size + key_len) % 8) + _VALUE.size )
+
+def _read_entries(data, used):
+  """ Yield (key, value offset) of the entries of a metrics file """
+  offset = _HEADER.size
+  while offset < used:
+    key_len = _KEY_LEN.unpack_from(data, offset)[0]
+    key = bytes(data[offset + _KEY_LEN.size:offset + _KEY_LEN.size + key_len]).decode('utf-8')
+    offset += _entry_size(key_len)
+    yield( key, offset - _VALUE.size )
+
+##-----------------------------------------------------------------------------------------
+class MmapValues(object):
+  """
+   float64 values keyed by str, in a memory-mapped file readable by other processes (see read_values()).
+   Entries are only ever appended, and the header (used bytes) is updated after the entry is written,
+   so readers never see a partial entry. Not thread-safe: callers hold METRICS_LOCK.
+   Required Arg: path (str): file path (existing entries are kept)
+  """
+  INITIAL_SIZE = 1 << 16
+
+  def __init__(self, path):
+    self.path = path
+    self.f = open(path, 'a+b')
+    size = os.fstat(self.f.fileno()).st_size
+    if size < self.INITIAL_SIZE:
+      self.f.truncate(self.INITIAL_SIZE)
+      size = self.INITIAL_SIZE
+    self.o_mmap = mmap.mmap(self.f.fileno(), size)
+    self.used = _HEADER.unpack_from(self.o_mmap, 0)[0] or _HEADER.size
+    self.d_offsets = dict(_read_entries(self.o_mmap, self.used))
+
+  def _offset(self, key):
+    offset = self.d_offsets.get(key, None)
+    if offset is None:
+      b_key = key.encode('utf-8')
+      entry_size = _entry_size(len(b_key))
+      if self.used + entry_size > len(self.o_mmap):
+        size = len(self.o_mmap)
+        while self.used + entry_size > size:
+          size *= 2
+        self.o_mmap.close()
+        self.f.truncate(size)
+        self.o_mmap = mmap.mmap(self.f.fileno(), size)
+      _KEY_LEN.pack_into(self.o_mmap, self.used, len(b_key))
+      self.o_mmap[self.used + _KEY_LEN.size:self.used + _KEY_LEN.size + len(b_key)] = b_key
+      offset = self.used + entry_size - _VALUE.size
+      _VALUE.pack_into(self.o_mmap, offset, 0.0)
+      self.used += entry_size
+      _HEADER.pack_into(self.o_mmap, 0, self.used)
+      self.d_offsets[key] = offset
+    return( offset )
+
+  def add(self, key, amount):
+    offset = self._offset(key)
+    _VALUE.pack_into(self.o_mmap, offset, _VALUE.unpack_from(self.o_mmap, offset)[0] + amount)
+
+  def set(self, key, value):
+    _VALUE.pack_into(self.o_mmap, self._offset(key), value)
+
+  def items(self):
+    return( [(key, _VALUE.unpack_from(self.o_mmap, offset)[0]) for (key, offset) in self.d_offsets.items()] )
+
+  def close(self):
+    self.o_mmap.close()
+    self.f.close()
+
+##-----------------------------------------------------------------------------------------
+class DictValues(object):
+  """ Same interface as MmapValues, in process memory (no metrics directory) """
+
+  def __init__(self):
+    self.d_values = {}
+
+  def add(self, key, amount):
+    self.d_values[key] = self.d_values.get(key, 0.0) + amount
+
+  def set(self, key, value):
+    self.d_values[key] = value
+
+  def items(self):
+    return( list(self.d_values.items()) )
+
+  def close(self):
+    pass
+
+##-----------------------------------------------------------------------------------------
+def read_values(path):
+  """
+   Read the samples of a metrics file (written by any process).
+   Required Arg (str): file path
+   Return (list): [(key, value), ...]
+  """
+  with open(path, 'rb') as f:
+    data = f.read()
+  if len(data) < _HEADER.size:
+    return( [] )
+  used = min(_HEADER.unpack_from(data, 0)[0], len(data))
+  return( [(key, _VALUE.unpack_from(data, offset)[0]) for (key, offset) in _read_entries(data, used)] )
+
+METRICS_DIR = None
+METRICS_LOCK = threading.Lock()
+_STORE = None  ## store of this process (opened on first use)
+
+RE_METRICS_FILE = re.compile(r'^pgaas_(\d+)\.metrics$')
+
+def _store():
+  global _STORE
+  if _STORE is None:
+    if METRICS_DIR:
+      _STORE = MmapValues(os.path.join(METRICS_DIR, "pgaas_%d.metrics" % (os.getpid())))
+    else:
+      _STORE = DictValues()
+  return( _STORE )
+
+def _reset_after_fork():
+  ## a forked (i.e. pre-forking WSGI server) worker writes its own file; the parent keeps its samples
+  global _STORE, METRICS_LOCK
+  _STORE = None
+  METRICS_LOCK = threading.Lock()
+  _LOCAL.__dict__.clear()
+
+##-----------------------------------------------------------------------------------------
+def configure_metrics(metrics_dir=None, enabled=True):
+  """
+   Enable (or disable) request metrics for this process.
+   Optional Args:
+     * metrics_dir (str|None): directory of the per-process metrics files, shared by the WSGI
+       processes (created if needed). None: metrics of this process only.
+     * enabled (bool)
+  """
+  global METRICS_DIR, ENABLED, _STORE
+  with METRICS_LOCK:
+    if metrics_dir != METRICS_DIR and _STORE is not None:
+      _STORE.close()
+      _STORE = None
+    if metrics_dir:
+      os.makedirs(metrics_dir, exist_ok=True)
+    METRICS_DIR = metrics_dir
+    ENABLED = enabled
+
+##-----------------------------------------------------------------------------------------
+##
+## Per-request recording
+##
+_LOCAL = threading.local()
+
+if hasattr(os, 'register_at_fork'):
+  os.register_at_fork(after_in_child=_reset_after_fork)
+
+class _RequestMetrics(object):
+  """ Stage times and input size of the request being served by this thread """
+  __slots__ = ('endpoint', 't_start', 'd_stages', 'o_stage', 'n_vertices')
+
+  def __init__(self, endpoint):
+    self.endpoint = endpoint or 'none'
+    self.t_start = perf_counter()
+    self.d_stages = {}
+    self.o_stage = None
+    self.n_vertices = 0
+
+class _Stage(object):
+  """ Context manager timing one stage of the current request (minus its nested stages) """
+  __slots__ = ('o_request', 'name', 'o_parent', 'child_time', 't_start')
+
+  def __init__(self, o_request, name):
+    self.o_request = o_request
+    self.name = name
+
+  def __enter__(self):
+    self.o_parent = self.o_request.o_stage
+    self.o_request.o_stage = self
+    self.child_time = 0.0
+    self.t_start = perf_counter()
+    return( self )
+
+  def __exit__(self, *exc_info):
+    elapsed = perf_counter() - self.t_start
+    o_request = self.o_request
+    o_request.o_stage = self.o_parent
+    if self.o_parent is not None:
+      self.o_parent.child_time += elapsed
+    o_request.d_stages[self.name] = o_request.d_stages.get(self.name, 0.0) + elapsed - self.child_time
+    return( False )
+
+class _NoStage(object):
+  __slots__ = ()
+  def __enter__(self):
+    return( self )
+  def __exit__(self, *exc_info):
+    return( False )
+
+_NO_STAGE = _NoStage()
+
+##-----------------------------------------------------------------------------------------
+def start_request(endpoint):
+  """
+   Start recording a request in this thread (before_request).
+   Required Arg (str|None): endpoint name (flask.request.endpoint)
+  """
+  if ENABLED:
+    _LOCAL.request = _RequestMetrics(endpoint)
+
+def in_request():
+  """ Return (bool): True if a request is being recorded in this thread """
+  return( getattr(_LOCAL, 'request', None) is not None )
+
+def stage(name):
+  """
+   Time a stage of the current request: with metrics.stage('geometry'): ...
+   Required Arg (str): stage name
+   Return: context manager (no-op if no request is being recorded)
+  """
+  o_request = getattr(_LOCAL, 'request', None)
+  if o_request is None:
+    return( _NO_STAGE )
+  return( _Stage(o_request, name) )
+
+def add_input_vertices(n_vertices):
+  """ Count polygon vertices in the input of the current request """
+  o_request = getattr(_LOCAL, 'request', None)
+  if o_request is not None:
+    o_request.n_vertices += n_vertices
+
+def _labels(**kwargs):
+  return( ','.join('%s="%s"' % (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                   for (name, value) in kwargs.items()) )
+
+## (family, endpoint, stage) => (bucket keys, sum key) of a histogram
+_D_HISTOGRAM_KEYS = {}
+
+def _histogram_keys(family, endpoint, stage=None):
+  keys = _D_HISTOGRAM_KEYS.get((family, endpoint, stage), None)
+  if keys is None:
+    labels = _labels(endpoint=endpoint, stage=stage) if stage else _labels(endpoint=endpoint)
+    l_bucket_keys = ["%s\t%s_bucket\t%s\t%s" % (family, family, labels, le) for le in [repr(bound) for bound in LATENCY_BUCKETS] + ['+Inf']]
+    keys = (l_bucket_keys, "%s\t%s_sum\t%s\t" % (family, family, labels))
+    _D_HISTOGRAM_KEYS[(family, endpoint, stage)] = keys
+  return( keys )
+
+def _observe(o_store, keys, value):
+  ## buckets are stored non-cumulative (one update per observation), and accumulated (count = +Inf bucket) by render_metrics()
+  o_store.add(keys[0][bisect.bisect_left(LATENCY_BUCKETS, value)], 1.0)
+  o_store.add(keys[1], value)
+
+def end_request():
+  """ Stop recording the request of this thread, and add its samples to the metric store (teardown_request) """
+  o_request = getattr(_LOCAL, 'request', None)
+  if o_request is None:
+    return
+  _LOCAL.request = None
+  elapsed = perf_counter() - o_request.t_start
+  endpoint = o_request.endpoint
+  with METRICS_LOCK:
+    o_store = _store()
+    _observe(o_store, _histogram_keys('pgaas_request_duration_seconds', endpoint), elapsed)
+    for (name, stage_time) in o_request.d_stages.items():
+      _observe(o_store, _histogram_keys('pgaas_stage_duration_seconds', endpoint, name), stage_time)
+    if o_request.n_vertices:
+      o_store.set("pgaas_input_vertices\tpgaas_input_vertices\t%s\t" % (_labels(endpoint=endpoint)), o_request.n_vertices)
+
+def count_exception(e):
+  """ Count an exception caught by an error handler (for the endpoint of the current request) """
+  if not ENABLED:
+    return
+  o_request = getattr(_LOCAL, 'request', None)
+  endpoint = o_request.endpoint if o_request is not None else 'none'
+  with METRICS_LOCK:
+    _store().add("pgaas_exceptions_total\tpgaas_exceptions_total\t%s\t" % (_labels(endpoint=endpoint, exception=e.__class__.__name__)), 1.0)
+
+##-----------------------------------------------------------------------------------------
+def _collect():
+  """ Return (dict): sample key => value, summed over the processes (gauges get a pid label instead) """
+  l_sources = []
+  if METRICS_DIR:
+    with METRICS_LOCK:
+      _store() ## so this process is listed, even before its first request
+    for path in glob.glob(os.path.join(METRICS_DIR, 'pgaas_*.metrics')):
+      o_match = RE_METRICS_FILE.match(os.path.basename(path))
+      if o_match:
+        l_sources.append( (int(o_match.group(1)), read_values(path)) )
+  else:
+    with METRICS_LOCK:
+      l_sources.append( (os.getpid(), _store().items()) )
+
+  d_samples = {}
+  for (pid, l_values) in l_sources:
+    alive = None
+    for (key, value) in l_values:
+      family = key.split('\t', 1)[0]
+      if D_METRICS.get(family, ('',))[0] == 'gauge':
+        if alive is None:
+          alive = pid == os.getpid() or utils.pid_alive(pid)
+        if not alive:
+          continue
+        (family, name, labels, le) = key.split('\t')
+        key = "%s\t%s\t%s\t%s" % (family, name, ','.join(filter(None, (labels, _labels(pid=pid)))), le)
+      d_samples[key] = d_samples.get(key, 0.0) + value
+  return( d_samples )
+
+def _format_value(value):
+  return( repr(int(value)) if value.is_integer() else repr(value) )
+
+def render_metrics():
+  """
+   Render the metrics of all processes.
+   Return (str): Prometheus text exposition format (version 0.0.4)
+  """
+  d_families = {}
+  for (key, value) in _collect().items():
+    (family, name, labels, le) = key.split('\t')
+    d_families.setdefault(family, {}).setdefault(labels, {})[(name, le)] = value
+
+  l_lines = []
+  for (family, (metric_type, help_text)) in D_METRICS.items():
+    l_lines.append("# HELP %s %s" % (family, help_text))
+    l_lines.append("# TYPE %s %s" % (family, metric_type))
+    for (labels, d_values) in sorted(d_families.get(family, {}).items()):
+      if metric_type != 'histogram':
+        l_lines.append("%s{%s} %s" % (family, labels, _format_value(d_values[(family, '')])))
+        continue
+      count = 0.0
+      for le in [repr(bound) for bound in LATENCY_BUCKETS] + ['+Inf']:
+        count += d_values.get((family + '_bucket', le), 0.0)
+        l_lines.append("%s_bucket{%s,le=\"%s\"} %s" % (family, labels, le, _format_value(count)))
+      l_lines.append("%s_sum{%s} %s" % (family, labels, repr(d_values.get((family + '_sum', ''), 0.0))))
+      l_lines.append("%s_count{%s} %s" % (family, labels, _format_value(count)))
+
+  return( '\n'.join(l_lines) + '\n' )
@@ -0,0 +1,24 @@
+#!/usr/bin/python3
+"""
+
+  Module: pgaas_asgi.py
+  Description: ASGI entry point for the pGaaS service (alternative to pgass_flask.wsgi under mod_wsgi)
+
+   The same Flask app (pgaas_flask.py: app_factory configuration, routes and error handlers), served
+   by an ASGI server: request bodies are received by the event loop, and requests run on a bounded
+   thread pool (ASGI_* settings in config.py, see asgi_adapter.py). Requires an ASGI server, i.e. uvicorn.
+
+  Usage (from pGaaS dir):
+    $ uvicorn --app-dir app pgaas_asgi:application --port 8080 [--workers 4]
+    $ python app/pgaas_asgi.py   ## uvicorn, port 8080, one process
+
+"""
+from pgaas_flask import app
+from asgi_adapter import create_asgi_app
+
+application = create_asgi_app(app)
+
+##############################################################################
+if __name__ == '__main__':
+  import uvicorn
+  uvicorn.run(application, port=8080)
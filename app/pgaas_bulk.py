@@ -0,0 +1,100 @@
+#!/usr/bin/python3
+"""
+
+  Module: pgaas_bulk.py
+  Description: command-line entry point for offline bulk geometry processing (no HTTP API)
+
+   Runs the polygon_geometry operations over a GeoJSON FeatureCollection or NDJSON file, on a process
+   pool, and writes the results (CSV or NDJSON) as they complete (see bulk_processing.py). Input
+   records are geometry queries (NDJSON lines with an "op", as for /api/stream), or Features tested
+   against a reference polygon (--op with --polygon or --polygon-id). Progress is reported on stderr.
+   An interrupted run is continued with --resume (or --offset: number of records to skip).
+   Exit status: 0, 2 if some records failed (see their "error"), 1 for invalid arguments/input.
+
+  Usage (from pGaaS dir):
+    $ python app/pgaas_bulk.py parcels.geojson results.csv --op polygon_overlap_area --polygon data/montana.json --units km2
+    $ python app/pgaas_bulk.py points.ndjson results.ndjson --op point_in_polygon --polygon-id <id> --id-property name
+    $ python app/pgaas_bulk.py queries.ndjson results.ndjson --processes 8 --resume
+
+"""
+import sys
+import argparse
+
+## Custom modules
+import config
+import polygon_geometry
+import bulk_processing
+from bulk_processing import BulkRun, BulkInputError
+from polygon_registry import PolygonNotFound
+
+##----------------------------------------------------------------------------------------------
+def print_progress(d_stats):
+  if d_stats['input_bytes']:
+    percent = "%.1f%%" % (100.0 * d_stats['bytes_read'] / d_stats['input_bytes'])
+  else:
+    percent = "100.0%"
+  sys.stderr.write("pgaas_bulk: %d records (%d errors), %.0f records/sec, %s of input, last record %d\n" % (d_stats['records'],
+                   d_stats['errors'], d_stats['records_per_sec'], percent, d_stats['last_record']))
+  sys.stderr.flush()
+
+##----------------------------------------------------------------------------------------------
+def parse_args(l_args=None):
+  o_parser = argparse.ArgumentParser(description='pGaaS offline bulk geometry processing')
+  o_parser.add_argument('input', help='NDJSON or GeoJSON FeatureCollection file')
+  o_parser.add_argument('output', help="CSV or NDJSON results file ('-' for stdout)")
+  o_parser.add_argument('--input-format', choices=bulk_processing.INPUT_FORMATS, help='default: featurecollection for .json/.geojson, otherwise ndjson')
+  o_parser.add_argument('--format', dest='output_format', choices=bulk_processing.OUTPUT_FORMATS, help='output format (default: csv for .csv, otherwise ndjson)')
+  o_parser.add_argument('--op', choices=bulk_processing.BULK_OPS, help='operation of the Features/geometries against the reference polygon')
+  o_group = o_parser.add_mutually_exclusive_group()
+  o_group.add_argument('--polygon', help='reference polygon file (GeoJSON Polygon or Feature)')
+  o_group.add_argument('--polygon-id', help='reference polygon: registered polygon_id (see --registry-dir)')
+  o_parser.add_argument('--id-property', help='Feature property used as the result id (default: the Feature id)')
+  o_parser.add_argument('--tolerance', type=float, help='polygon_overlap_area: max relative error (fast mode)')
+  o_parser.add_argument('--units', choices=list(polygon_geometry.D_AREA_UNITS), help='polygon_overlap_area: geodesic area units')
+  o_parser.add_argument('--registry-dir', default=config.BaseConfig.POLYGON_REGISTRY_DIR, help='polygon registry (default: %(default)s)')
+  o_parser.add_argument('--cache', action='store_true', help='keep the geometry/result caches (records repeating the same polygons)')
+  o_parser.add_argument('--processes', type=int, help='worker processes (default: number of CPUs; 0: no process pool)')
+  o_parser.add_argument('--chunk-size', type=int, default=bulk_processing.BULK_CHUNK_SIZE, help='records per worker task (default: %(default)s)')
+  o_group = o_parser.add_mutually_exclusive_group()
+  o_group.add_argument('--offset', type=int, default=0, help='skip the first OFFSET records, and append to the output')
+  o_group.add_argument('--resume', action='store_true', help='continue after the last record of the output file')
+  o_parser.add_argument('--progress-interval', type=float, default=bulk_processing.BULK_PROGRESS_INTERVAL, help='seconds (default: %(default)s)')
+  o_parser.add_argument('--quiet', action='store_true', help='no progress reports')
+  o_args = o_parser.parse_args(l_args)
+
+  if (o_args.polygon or o_args.polygon_id) and not o_args.op:
+    o_parser.error('--polygon/--polygon-id require --op')
+  if o_args.op and not (o_args.polygon or o_args.polygon_id):
+    o_parser.error('--op requires --polygon or --polygon-id')
+  return( o_args )
+
+##----------------------------------------------------------------------------------------------
+def main(l_args=None):
+  o_args = parse_args(l_args)
+
+  o_run = None
+  try:
+    polygon = None
+    if o_args.polygon:
+      polygon = bulk_processing.load_polygon_file(o_args.polygon)
+    elif o_args.polygon_id:
+      polygon = {'polygon_id': o_args.polygon_id}
+    o_run = BulkRun(o_args.input, o_args.output, input_format=o_args.input_format, output_format=o_args.output_format,
+                    op=o_args.op, polygon=polygon, id_property=o_args.id_property, tolerance=o_args.tolerance, units=o_args.units,
+                    registry_dir=o_args.registry_dir, cache=o_args.cache, processes=o_args.processes, chunk_size=o_args.chunk_size,
+                    offset=o_args.offset, resume=o_args.resume, progress=None if o_args.quiet else print_progress,
+                    progress_interval=o_args.progress_interval)
+    d_stats = o_run.run()
+  except KeyboardInterrupt:
+    if o_run is not None:
+      sys.stderr.write("pgaas_bulk: interrupted after record %d: continue with --resume\n" % (o_run.d_stats['last_record']))
+    return( 130 )
+  except (BulkInputError, polygon_geometry.InvalidGeoJson, PolygonNotFound, ValueError, OSError) as e:
+    sys.stderr.write("pgaas_bulk: %s: %s\n" % (e.__class__.__name__, e))
+    return( 1 )
+
+  return( 0 if d_stats['errors'] == 0 else 2 )
+
+##############################################################################
+if __name__ == '__main__':
+  sys.exit(main())
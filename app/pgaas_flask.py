@@ -14,7 +14,6 @@
 ## Standard python libs
 import sys
 import os
-import traceback
 
 ## The "request" context contains request-specific variables containing the information needed to process the request
 from flask import request, render_template, jsonify
@@ -28,7 +27,12 @@ if not BASE_DIR:
 ## Custom flask modules 
 import app_factory
 import utils
+import metrics
+import structured_log
 from api_authorization import ApiAuthorizationError
+from polygon_registry import PolygonNotFound
+from job_queue import JobNotFound
+from admission_control import AdmissionError
 ##---------------------------------------------------------------------------------------
 ## Local configuration settings. This is separate from app.config settings, for flexibility
 DEBUG = 1 
@@ -38,6 +42,8 @@ DEBUG = 1
 d_init = {'DEBUG': DEBUG}
 app = app_factory.create_app(d_init)
 
+log = structured_log.get_logger('pgaas_flask')
+
 ##---------------------------------------------------------------------------------------
 def error_response(e):
   gmtime_now = utils.gmt_now()
@@ -51,11 +57,10 @@ def error_response(e):
 ##---------------------------------------------------------------------------------------
 ##
 ## Register some initialization tasks to be done before every request is processed.
-## NOT USED
+## (request records are at DEBUG level: see LOG_LEVEL in config.py)
 @app.before_request  
 def request_init():
-  if DEBUG:
-    print(">>REQUEST (%s)" % (request.path))
+  log.debug("request", extra={'method': request.method})
 
 ##---------------------------------------------------------------------------------------
 ##
@@ -63,13 +68,15 @@ def request_init():
 ##
 @app.errorhandler(404)
 def not_found_error(error):
+  metrics.count_exception(error)
   msg = "Requested URL (%s) not supported" % (request.url)
-  app.logger.error("SARS unsupported URL (%s)" % (request.url))
+  log.error("unsupported URL", extra={'url': request.url})
   d_response = { "message": msg } 
   return jsonify(error=d_response)
 
 @app.errorhandler(HTTPException)
 def http_error(e):
+  metrics.count_exception(e)
   d_response = error_response(e)
   if '/api/' in request.path:
     return jsonify(error=d_response)
@@ -78,19 +85,31 @@ def http_error(e):
 
 @app.errorhandler(TemplateNotFound)
 def template_not_found(e):
+  metrics.count_exception(e)
   d_response = error_response(e)
   return render_template('error.html', **d_response)
 
 @app.errorhandler(ApiAuthorizationError)
+@app.errorhandler(PolygonNotFound)
+@app.errorhandler(JobNotFound)
 def api_error(e):
+  metrics.count_exception(e)
   d_response = error_response(e)
   return jsonify(error=d_response)
 
+## Rejected by admission control: the HTTP status (413, 429, 503) and Retry-After are kept, so clients can back off
+@app.errorhandler(AdmissionError)
+def admission_error(e):
+  metrics.count_exception(e)
+  d_response = error_response(e)
+  d_headers = {'Retry-After': str(e.retry_after)} if e.retry_after is not None else {}
+  return( jsonify(error=d_response), e.code, d_headers )
+
 @app.errorhandler(Exception)
 def exception_error(e):
+  metrics.count_exception(e)
   d_response = error_response(e)
-  tb_str = ''.join(traceback.format_tb(e.__traceback__))
-  app.logger.error("Exception traceback: %s" % (tb_str))
+  log.error("unhandled exception", exc_info=e)
   return jsonify(error=d_response)
 
 ##---------------------------------------------------------------------------------------
@@ -110,6 +129,11 @@ def favicon():
     return send_from_directory(os.path.join(app.root_path, 'static'),
                           'favicon.ico',mimetype='image/vnd.microsoft.icon')
 
+##---------------------------------------------------------------------------------------
+## Warm-up (reference polygons, one request of each geometry endpoint) before serving: 
+## after all the handlers above are registered (see app_factory.warm_up())
+app_factory.warm_up(app)
+
 ##############################################################################
 ##
 ## For testing from command-line (rather than via WSGI)
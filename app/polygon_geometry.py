@@ -4,30 +4,76 @@
   File: polygon_geometry.py 
   Description: Simple polygon geometry methods using GeoJSON inputs
   Requires: 
-    pip install shapely
-    pip install geojson 
+    pip install shapely (>= 2.0)
+    pip install numpy
   Author: William Fanselow 2020-03-09 
   
   See tests/test_polygon_geometry.py for testing BAD json/geojson
 
 """
+import os
 import json
-import geojson
+import time
+import hashlib
+import tempfile
+import weakref
+import threading
+import multiprocessing
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from math import isfinite, sin, cos, radians, pi, floor
+import numpy as np
+import shapely
+from shapely import STRtree
 from shapely.geometry import shape, mapping
+from shapely.geometry.base import BaseGeometry
+from shapely.prepared import prep, PreparedGeometry
 from shapely.ops import unary_union
 
-DEBUG = 0 ## make sure this is 0 before deploying to service 
+## Custom modules 
+import metrics
+import json_codec
+import structured_log
+
+log = structured_log.get_logger('polygon_geometry')
+
+## Max total vertex count of the polygons held in the (per-process) geometry cache. 0 to disable.
+GEOMETRY_CACHE_MAX_VERTICES = 2000000
+
+## Result cache (memoized query results): max entries (0 to disable), and seconds to keep a result
+RESULT_CACHE_MAX_ENTRIES = 100000
+RESULT_CACHE_TTL = 3600
+
+## Test convex hulls (after bounding boxes) to settle non-overlapping inputs before the exact computation
+CONVEX_HULL_FILTER = True
+
+## Level-of-detail simplification tolerances for approximate overlap area, coarsest first. 
+## Fractions of the bounding-box diagonal of each polygon.
+LOD_TOLERANCES = (0.01, 0.002, 0.0005)
+
+## Overlap-area computations with at least this many (total) input vertices are run on the 
+## geometry process pool, if enabled (see configure_executor()).
+OFFLOAD_MIN_VERTICES = 20000
+
+## Geodesic areas of lon/lat polygons (get_overlap_area(units=...)): WGS84 ellipsoid, and area units => factor from m2
+WGS84_A = 6378137.0
+WGS84_F = 1 / 298.257223563
+D_AREA_UNITS = {'m2': 1.0, 'km2': 1e-6}
+
+## Grid index for point-in-polygon queries on large polygons (see PolygonGridIndex): polygons with at least
+## GRID_INDEX_MIN_VERTICES vertices (0 disables the index) get a grid index once they were tested against 
+## GRID_INDEX_MIN_POINTS points (registered polygons: when they are loaded). Building an index costs about as 
+## much as testing 10000 points exactly, whatever the polygon size. Max number of cells of an index.
+GRID_INDEX_MIN_VERTICES = 20000
+GRID_INDEX_MIN_POINTS = 10000
+GRID_INDEX_MAX_CELLS = 2**20
 
 ##----------------------------------------------------------------------------------------------
 class InvalidGeoJson(Exception):
   pass
  
-##----------------------------------------------------------------------------------------------
-def dprint(level, msg):
-  """ Print debug messages """
-  if level <= DEBUG:
-    print("DEBUG (%d): %s" % (level, msg))
-
 ##----------------------------------------------------------------------------------------------
 def basic_json_validation(obj):
   """
@@ -46,13 +92,14 @@ def basic_json_validation(obj):
   if not obj:
     raise InvalidGeoJson("Invalid GeoJSON format: empty object") 
 
-  ## If input is dict, translate to json
+  ## An already-decoded dict (i.e. from request.get_json()) is used as-is. There is 
+  ## no need to round-trip it through json.dumps()/json.loads() just to validate it.
   if isinstance(obj, dict):
-    obj = json.dumps(obj)
+    return( obj )
 
   ## basic json validation - is obj a valid JSON object?
   try:
-    d_obj = json.loads(obj)
+    d_obj = json_codec.loads(obj)
   except TypeError as e:
     raise InvalidGeoJson("Invalid GeoJSON format: not a valid json") 
   except json.decoder.JSONDecodeError as e:
@@ -62,13 +109,47 @@ def basic_json_validation(obj):
  
   return( d_obj )
  
+##----------------------------------------------------------------------------------------------
+def _check_position(position, geom_type):
+  """
+  Check a single GeoJSON position: a list of 2 or 3 finite numbers.
+  Required Args: 
+    * position (list): [x, y] or [x, y, z]
+    * geom_type (str): "Point" or "Polygon" (used for the exception message)
+  Raises: InvalidGeoJson() if position is invalid 
+  """
+  if not isinstance(position, (list, tuple)) or len(position) not in (2, 3):
+    raise InvalidGeoJson("Invalid GeoJSON %s: a position must have exactly 2 or 3 values" % (geom_type)) 
+  for value in position:
+    ## bool is a subclass of int, but is not a JSON number
+    if type(value) is not float and type(value) is not int:
+      raise InvalidGeoJson("Invalid GeoJSON %s: %r is not a JSON compliant number" % (geom_type, value)) 
+    try:
+      finite = isfinite(value)
+    except OverflowError: ## int too large for a float (json decodes 1000...0 to int, orjson to inf)
+      raise InvalidGeoJson("Invalid GeoJSON %s: integer out of range for a coordinate" % (geom_type)) 
+    if not finite:
+      raise InvalidGeoJson("Invalid GeoJSON %s: %r is not a JSON compliant number" % (geom_type, value)) 
+
+##----------------------------------------------------------------------------------------------
+def _check_geojson_type(d_obj, geom_type):
+  """
+  Check that a decoded GeoJSON object is a dict with the expected "type" member.
+  Raises: InvalidGeoJson() if object is not a GeoJSON object of type geom_type 
+  """
+  if not isinstance(d_obj, dict):
+    raise InvalidGeoJson("Invalid GeoJSON %s: not a GeoJSON object" % (geom_type)) 
+  obj_type = d_obj.get('type', None)
+  if obj_type != geom_type:
+    raise InvalidGeoJson("Invalid GeoJSON %s: invalid type (%s)" % (geom_type, obj_type)) 
+
 ##----------------------------------------------------------------------------------------------
 def validate_geojson_point(obj):
   """
   Validate that input object is a valid json and has valid GeoJSON format for a "Point".
   Required Arg (json|dict): GeoJSON Point object (we can handle json-str or dict)
   Raises: InvalidGeoJson() if object does not meet criteria for valid GeoJSON Point
-  Returns: dict representation of GeoJSON Point 
+  Returns: dict representation of GeoJSON Point (can be passed directly to shape())
   """
 
   d_point = None
@@ -80,23 +161,9 @@ def validate_geojson_point(obj):
     raise 
   
   ## GeoJSON Point validation
-  point = geojson.dumps(d_point)
-  dprint(1, point)
-  json_point = geojson.loads(point)
-  dprint(1, json_point)
-
-  try:
-    point = geojson.Point(json_point) 
-  except ValueError as e:
-    raise InvalidGeoJson("Invalid GeoJSON Point: %s" % e) 
-  dprint(1, point)
-
-  valid = point.is_valid
-  dprint(1, "VALID=%s" % valid)
-  if not valid:
-    l_errors = point.errors()
-    dprint(1, "ERRORS:%s" % l_errors)
-    raise InvalidGeoJson("Invalid GeoJSON Point: %s" % str(l_errors)) 
+  _check_geojson_type(d_point, 'Point')
+  _check_position(d_point.get('coordinates', None), 'Point')
+  log.debug("valid Point", extra={'point': d_point})
 
   return(d_point)
  
@@ -104,9 +171,11 @@ def validate_geojson_point(obj):
 def validate_geojson_polygon(obj):
   """
   Validate that input object is a valid json and has valid GeoJSON format for a "Polygon".
+  The coordinates are checked in a single walk (ring type, minimum positions, ring 
+  closure and numeric positions) without re-serializing the object.
   Required Arg (json|dict): GeoJSON Polygon object (we can handle json-str or dict)
   Raises: InvalidGeoJson() if object does not meet criteria for valid GeoJSON Polygon 
-  Returns: dict representation of GeoJSON Polygon 
+  Returns: dict representation of GeoJSON Polygon (can be passed directly to shape())
   """
 
   d_poly = None
@@ -118,124 +187,1506 @@ def validate_geojson_polygon(obj):
     raise 
  
   ## GeoJSON Poly validation
-  poly = geojson.dumps(d_poly)
-  dprint(1, poly)
-  json_poly = geojson.loads(poly)
-  dprint(1, json_poly)
+  _check_geojson_type(d_poly, 'Polygon')
 
-  try:
-    poly = geojson.Polygon(json_poly) 
-  except ValueError as e:
-    raise InvalidGeoJson("Invalid GeoJSON Polygon: %s" % e) 
-  dprint(1, poly)
-
-  valid = poly.is_valid
-  dprint(1, "VALID=%s" % valid)
-  if not valid:
-    l_errors = poly.errors()
-    dprint(1, "ERRORS:%s" % l_errors)
-    raise InvalidGeoJson("Invalid GeoJSON Polygon: %s" % str(l_errors)) 
-
-  ## If the "coordinates" key is mispelled or missing, geojson.Polygon will automatically
-  ## convert the object to {"coordinates": [], "type": "Polygon"} without errors.
-  l_coordinates = poly.get('coordinates', None)
+  l_coordinates = d_poly.get('coordinates', None)
   if not l_coordinates:
     raise InvalidGeoJson("Invalid GeoJSON Point: Missing required parameter: [coordinates]") 
+  if not isinstance(l_coordinates, (list, tuple)):
+    raise InvalidGeoJson("Invalid GeoJSON Polygon: coordinates must be a list of linear rings") 
+
+  for l_ring in l_coordinates:
+    if not isinstance(l_ring, (list, tuple)):
+      raise InvalidGeoJson("Invalid GeoJSON Polygon: Each element of a polygon's coordinates must be a list") 
+    if len(l_ring) < 4:
+      raise InvalidGeoJson("Invalid GeoJSON Polygon: Each linear ring must contain at least 4 positions") 
+    for position in l_ring:
+      _check_position(position, 'Polygon')
+    if l_ring[0] != l_ring[-1]:
+      raise InvalidGeoJson("Invalid GeoJSON Polygon: Each linear ring must end where it started") 
+
+  log.debug("valid Polygon", extra={'rings': len(l_coordinates)})
 
   return(d_poly)
 
+##----------------------------------------------------------------------------------------------
+def polygon_hash(d_poly):
+  """
+  Canonical content hash of a (validated) GeoJSON Polygon.
+  Coordinates are hashed as packed float64 values, so 1 and 1.0 hash the same and
+  formatting/key-order of the original json does not matter.
+  Required Arg (dict): validated GeoJSON Polygon (see validate_geojson_polygon())
+  Return (str): hex digest
+  """
+  o_hash = hashlib.sha256(b'Polygon')
+  for l_ring in d_poly['coordinates']:
+    l_flat = [] 
+    for position in l_ring:
+      l_flat.extend(position)
+    o_hash.update(array('q', [len(l_ring), len(l_flat)]).tobytes())
+    o_hash.update(array('d', l_flat).tobytes())
+  return( o_hash.hexdigest() )
+
+##----------------------------------------------------------------------------------------------
+class GeometryCache(object):
+  """
+  Bounded LRU cache of validated Shapely polygons (and their prepared versions), keyed 
+  on the canonical content hash of the coordinates (polygon_hash()).
+  The cache size is measured in total vertex count: least-recently-used polygons are 
+  evicted until the cached polygons total at most max_vertices.
+  Required Arg (int): max_vertices (0 disables the cache)
+  """
+
+  def __init__(self, max_vertices):
+    self.max_vertices = max_vertices
+    self.d_entries = OrderedDict() ## polygon_hash => (shape, prepared, n_vertices)
+    self.n_vertices = 0
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self.lock = threading.Lock()
+
+  def get(self, key):
+    """ Return (shape, prepared) for key, or None if not cached """
+    with self.lock:
+      entry = self.d_entries.get(key, None)
+      if entry is None:
+        self.misses += 1
+        return( None )
+      self.d_entries.move_to_end(key)
+      self.hits += 1
+    return( entry[0], entry[1] )
+
+  def put(self, key, shape_poly, prepared_poly, n_vertices):
+    """ Add an entry, evicting least-recently-used entries to stay within max_vertices """
+    if n_vertices > self.max_vertices:
+      return
+    with self.lock:
+      if key in self.d_entries:
+        return
+      self.d_entries[key] = (shape_poly, prepared_poly, n_vertices)
+      self.n_vertices += n_vertices
+      while self.n_vertices > self.max_vertices:
+        (evicted_key, evicted_entry) = self.d_entries.popitem(last=False)
+        self.n_vertices -= evicted_entry[2]
+        self.evictions += 1
+
+  def pop(self, key):
+    """ Remove an entry. Return (bool): True if key was cached """
+    with self.lock:
+      entry = self.d_entries.pop(key, None)
+      if entry is None:
+        return( False )
+      self.n_vertices -= entry[2]
+    return( True )
+
+  def resize(self, max_vertices):
+    """ Change the size limit (evicting entries if needed) """
+    with self.lock:
+      self.max_vertices = max_vertices
+      while self.d_entries and self.n_vertices > self.max_vertices:
+        (evicted_key, evicted_entry) = self.d_entries.popitem(last=False)
+        self.n_vertices -= evicted_entry[2]
+        self.evictions += 1
+
+  def clear(self):
+    """ Remove all entries and reset the counters """
+    with self.lock:
+      self.d_entries.clear()
+      self.n_vertices = 0
+      self.hits = self.misses = self.evictions = 0
+
+  def stats(self):
+    """ Return (dict): hit/miss/eviction counters and current size """
+    with self.lock:
+      return( {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+               'entries': len(self.d_entries), 'vertices': self.n_vertices, 
+               'max_vertices': self.max_vertices} )
+
+GEOMETRY_CACHE = GeometryCache(GEOMETRY_CACHE_MAX_VERTICES)
+
+##----------------------------------------------------------------------------------------------
+def configure_geometry_cache(max_vertices):
+  """
+  Set the size of the geometry cache (i.e. from app.config at app creation).
+  Required Arg (int): max total vertex count of cached polygons (0 disables the cache)
+  """
+  GEOMETRY_CACHE.resize(max_vertices)
+
+##----------------------------------------------------------------------------------------------
+def get_geometry_cache_stats():
+  """
+  Return (dict): geometry cache counters for this process 
+    {'hits', 'misses', 'evictions', 'entries', 'vertices', 'max_vertices'}
+  """
+  return( GEOMETRY_CACHE.stats() )
+
+##----------------------------------------------------------------------------------------------
+def get_polygon(obj):
+  """
+  Get the Shapely geometry, and prepared geometry, for a polygon argument.
+  Validated GeoJSON polygons are looked up in (and added to) the geometry cache.
+  Required Arg (json|dict|BaseGeometry|PreparedGeometry): GeoJSON Polygon, or an already 
+    built/prepared geometry (i.e. from prepare_polygon() or the binary decoders) which is used as-is.
+  Raises: InvalidGeoJson() if input is not a valid Polygon 
+  Return (tuple): (shape, prepared) - prepared is None for un-prepared geometry inputs
+  """
+  if isinstance(obj, PreparedGeometry):
+    (shape_poly, prepared_poly) = (obj.context, obj)
+  elif isinstance(obj, BaseGeometry):
+    (shape_poly, prepared_poly) = (obj, None)
+  else:
+    with metrics.stage('geojson'):
+      d_poly = validate_geojson_polygon(obj)
+    (shape_poly, prepared_poly) = _cached_polygon(lambda: polygon_hash(d_poly), lambda: shape(d_poly), 
+                                                  lambda: sum(len(l_ring) for l_ring in d_poly['coordinates']))
+
+  if shape_poly.geom_type != 'Polygon':
+    raise InvalidGeoJson("Invalid GeoJSON Polygon: invalid type (%s)" % (shape_poly.geom_type)) 
+  if metrics.in_request():
+    metrics.add_input_vertices(shapely.get_num_coordinates(shape_poly))
+  return( shape_poly, prepared_poly )
+
+##----------------------------------------------------------------------------------------------
+def _cached_polygon(get_key, build_shape, get_n_vertices):
+  """
+  Look up a polygon in the geometry cache, or build, prepare and cache it.
+  Required Args (functions, only called when needed): 
+    * get_key(): cache key (canonical content hash)
+    * build_shape(): Shapely polygon
+    * get_n_vertices(): vertex count of the polygon
+  Return (tuple): (shape, prepared)
+  """
+  if GEOMETRY_CACHE.max_vertices <= 0:
+    with metrics.stage('shape'):
+      shape_poly = build_shape()
+      return( shape_poly, prep(shape_poly) )
+
+  key = get_key()
+  entry = GEOMETRY_CACHE.get(key)
+  if entry is not None:
+    log.debug("geometry cache hit", extra={'key': key})
+    return( entry )
+
+  with metrics.stage('shape'):
+    shape_poly = build_shape()
+    prepared_poly = prep(shape_poly)
+  GEOMETRY_CACHE.put(key, shape_poly, prepared_poly, get_n_vertices())
+  _derived(shape_poly, 'hash', lambda shape_poly: key) ## no need to hash again for the result cache
+
+  return( shape_poly, prepared_poly )
+
+##----------------------------------------------------------------------------------------------
+def get_polygon_shape(obj):
+  """
+  Get the Shapely geometry for a polygon argument (see get_polygon()).
+  Raises: InvalidGeoJson() if GeoJSON input is not a valid Polygon 
+  Return: Shapely geometry
+  """
+  return( get_polygon(obj)[0] )
+
+##----------------------------------------------------------------------------------------------
+def prepare_polygon(obj):
+  """
+  Validate and build a prepared Shapely polygon for repeated predicate tests.
+  Required Arg (json|dict|BaseGeometry|PreparedGeometry): GeoJSON Polygon or geometry
+  Raises: InvalidGeoJson() if GeoJSON input is not a valid Polygon 
+  Return: shapely.prepared.PreparedGeometry
+  """
+  (shape_poly, prepared_poly) = get_polygon(obj)
+  if prepared_poly is None:
+    prepared_poly = prep(shape_poly)
+  return( prepared_poly )
+
+##----------------------------------------------------------------------------------------------
+##
+## Binary geometry input: decoded without per-coordinate Python objects. Polygons are returned
+## from the geometry cache (same content hash as the GeoJSON input), prepared.
+##
+##  * WKB: a single Point/Polygon, or a GeometryCollection of Points/Polygons (one per argument)
+##  * Packed coordinates (all little-endian, no padding):
+##      uint32  n_geometries
+##      uint32  n_rings
+##      uint32  geometry_offsets[n_geometries + 1]   (ring index ranges of each geometry)
+##      uint32  ring_offsets[n_rings + 1]            (position index ranges of each ring)
+##      float64 coordinates[2 * n_positions]         (x0, y0, x1, y1, ...)
+##    A geometry with a single ring of one position is a Point, otherwise a Polygon 
+##    (exterior ring first, then holes).
+##
+def _rings_hash(l_rings):
+  """ polygon_hash() of a polygon given as a list of (n, 2|3) float64 ring arrays """
+  o_hash = hashlib.sha256(b'Polygon')
+  for a_ring in l_rings:
+    o_hash.update(array('q', [a_ring.shape[0], a_ring.size]).tobytes())
+    o_hash.update(np.ascontiguousarray(a_ring, dtype=np.float64).tobytes())
+  return( o_hash.hexdigest() )
+
+def _check_binary_coordinates(a_coords, fmt):
+  if not np.isfinite(a_coords).all():
+    raise InvalidGeoJson("Invalid %s: coordinates must be finite numbers" % (fmt)) 
+
+def _check_binary_ring(a_ring, fmt):
+  if a_ring.shape[0] < 4:
+    raise InvalidGeoJson("Invalid %s: Each linear ring must contain at least 4 positions" % (fmt)) 
+  if not (a_ring[0] == a_ring[-1]).all():
+    raise InvalidGeoJson("Invalid %s: Each linear ring must end where it started" % (fmt)) 
+
+##----------------------------------------------------------------------------------------------
+def geometries_from_wkb(data):
+  """
+  Decode a WKB body into geometry arguments.
+  Required Arg (bytes): WKB Point/Polygon, or GeometryCollection of Points/Polygons 
+  Raises: InvalidGeoJson() if data is not valid WKB of Points/Polygons 
+  Return (list): shapely Point and (cached) PreparedGeometry polygons, in input order
+  """
+  try:
+    o_geom = shapely.from_wkb(data)
+  except Exception as e:
+    raise InvalidGeoJson("Invalid WKB: %s" % (e)) 
+  if o_geom is None:
+    raise InvalidGeoJson("Invalid WKB: empty body") 
+  l_geoms = list(o_geom.geoms) if o_geom.geom_type == 'GeometryCollection' else [o_geom]
+
+  l_geometries = []
+  for o_geom in l_geoms:
+    if o_geom.geom_type not in ('Point', 'Polygon') or o_geom.is_empty:
+      raise InvalidGeoJson("Invalid WKB: invalid geometry (%s). Expected Point or Polygon" % (o_geom.geom_type)) 
+    _check_binary_coordinates(shapely.get_coordinates(o_geom, include_z=o_geom.has_z), 'WKB')
+    if o_geom.geom_type == 'Point':
+      l_geometries.append(o_geom)
+      continue
+    l_rings = [shapely.get_coordinates(o_ring, include_z=o_geom.has_z) for o_ring in [o_geom.exterior] + list(o_geom.interiors)]
+    (shape_poly, prepared_poly) = _cached_polygon(lambda: _rings_hash(l_rings), lambda: o_geom, 
+                                                  lambda: sum(a_ring.shape[0] for a_ring in l_rings))
+    l_geometries.append(prepared_poly)
+
+  return( l_geometries )
+
+##----------------------------------------------------------------------------------------------
+def geometries_from_coords(data):
+  """
+  Decode a packed coordinate buffer (see format above) into geometry arguments.
+  Required Arg (bytes): packed coordinates
+  Raises: InvalidGeoJson() if the buffer is not valid
+  Return (list): shapely Point and (cached) PreparedGeometry polygons, in input order
+  """
+  try:
+    (n_geometries, n_rings) = (int(n) for n in np.frombuffer(data, dtype='<u4', count=2))
+    offset = 8
+    a_geometry_offsets = np.frombuffer(data, dtype='<u4', count=n_geometries + 1, offset=offset).astype(np.int64)
+    offset += 4 * (n_geometries + 1)
+    a_ring_offsets = np.frombuffer(data, dtype='<u4', count=n_rings + 1, offset=offset).astype(np.int64)
+    offset += 4 * (n_rings + 1)
+    a_coords = np.frombuffer(data, dtype='<f8', offset=offset).astype(np.float64, copy=False).reshape((-1, 2))
+  except ValueError as e: ## buffer too short, or not a whole number of positions
+    raise InvalidGeoJson("Invalid coordinate buffer: %s" % (e)) 
+
+  if n_geometries == 0 or a_geometry_offsets[0] != 0 or a_geometry_offsets[-1] != n_rings or (np.diff(a_geometry_offsets) < 1).any():
+    raise InvalidGeoJson("Invalid coordinate buffer: invalid geometry offsets") 
+  if a_ring_offsets[0] != 0 or a_ring_offsets[-1] != a_coords.shape[0] or (np.diff(a_ring_offsets) < 1).any():
+    raise InvalidGeoJson("Invalid coordinate buffer: invalid ring offsets") 
+  _check_binary_coordinates(a_coords, 'coordinate buffer')
+
+  l_geometries = []
+  for i in range(n_geometries):
+    l_rings = [a_coords[a_ring_offsets[j]:a_ring_offsets[j + 1]] for j in range(a_geometry_offsets[i], a_geometry_offsets[i + 1])]
+    if len(l_rings) == 1 and l_rings[0].shape[0] == 1:
+      l_geometries.append(shapely.points(l_rings[0][0]))
+      continue
+    for a_ring in l_rings:
+      _check_binary_ring(a_ring, 'coordinate buffer')
+    (shape_poly, prepared_poly) = _cached_polygon(lambda: _rings_hash(l_rings), lambda: shapely.polygons(l_rings[0], holes=l_rings[1:] or None), 
+                                                  lambda: sum(a_ring.shape[0] for a_ring in l_rings))
+    l_geometries.append(prepared_poly)
+
+  return( l_geometries )
+
+##----------------------------------------------------------------------------------------------
+def geometries_to_coords(l_geometries):
+  """
+  Encode GeoJSON Points/Polygons into a packed coordinate buffer (client side of geometries_from_coords()).
+  Required Arg (list): GeoJSON Points/Polygons (dicts), or Shapely Points/Polygons
+  Return (bytes): packed coordinates (2D: any z values are dropped)
+  """
+  l_geometry_offsets = [0]
+  l_ring_offsets = [0]
+  l_coords = []
+  for obj in l_geometries:
+    o_geom = obj if isinstance(obj, BaseGeometry) else shape(obj)
+    if o_geom.geom_type == 'Point':
+      l_rings = [shapely.get_coordinates(o_geom)]
+    else:
+      l_rings = [shapely.get_coordinates(o_ring) for o_ring in [o_geom.exterior] + list(o_geom.interiors)]
+    for a_ring in l_rings:
+      l_coords.append(a_ring)
+      l_ring_offsets.append(l_ring_offsets[-1] + a_ring.shape[0])
+    l_geometry_offsets.append(l_geometry_offsets[-1] + len(l_rings))
+  a_header = np.array([len(l_geometries), len(l_ring_offsets) - 1] + l_geometry_offsets + l_ring_offsets, dtype='<u4')
+  return( a_header.tobytes() + np.concatenate(l_coords).astype('<f8').tobytes() )
+
+##----------------------------------------------------------------------------------------------
+## Cheap-reject filters: number of calls settled by each stage, per operation
+D_FILTER_STATS = {op: {'envelope': 0, 'convex_hull': 0, 'exact': 0} for op in ('intersects', 'overlap_area')}
+_FILTER_STATS_LOCK = threading.Lock()
+
+## Geometries derived from a polygon (convex hull, simplified versions), computed once per geometry object:
+##   id(shape) => (weakref(shape), {name: derived})
+_D_DERIVED = {}
+
+def _derived(shape_poly, name, func):
+  """ Return func(shape_poly), memoized on the geometry object (for as long as the geometry lives) """
+  key = id(shape_poly)
+  entry = _D_DERIVED.get(key, None)
+  if entry is None or entry[0]() is not shape_poly:
+    ## entry is removed when the geometry is garbage collected (i.e. evicted from the geometry cache)
+    entry = (weakref.ref(shape_poly, lambda o_ref, key=key, d_derived=_D_DERIVED: d_derived.pop(key, None)), {})
+    _D_DERIVED[key] = entry
+  d_derived = entry[1]
+  if name not in d_derived:
+    d_derived[name] = func(shape_poly)
+  return( d_derived[name] )
+
+def _convex_hull(shape_poly):
+  """ Return the (memoized) convex hull of a geometry """
+  return( _derived(shape_poly, 'convex_hull', lambda shape_poly: shape_poly.convex_hull) )
+
+##----------------------------------------------------------------------------------------------
+def _filter_disjoint(op, shape_1, shape_2, use_hull):
+  """
+  Cascade of cheap tests run before an exact intersects/intersection computation. 
+  1) bounding boxes do not overlap, 2) (optional) convex hulls do not intersect.
+  Either one proves the polygons are disjoint.
+  Required Args:
+    * op (str): operation name for the counters ('intersects'|'overlap_area')
+    * shape_1, shape_2: Shapely geometries
+    * use_hull (bool): run the convex-hull test
+  Return (bool): True if the polygons are disjoint. False if the exact computation is needed.
+  """
+  stage = 'exact'
+  (min_x_1, min_y_1, max_x_1, max_y_1) = shape_1.bounds
+  (min_x_2, min_y_2, max_x_2, max_y_2) = shape_2.bounds
+  if max_x_1 < min_x_2 or max_x_2 < min_x_1 or max_y_1 < min_y_2 or max_y_2 < min_y_1:
+    stage = 'envelope'
+  elif use_hull and not _convex_hull(shape_1).intersects(_convex_hull(shape_2)):
+    stage = 'convex_hull'
+  with _FILTER_STATS_LOCK:
+    D_FILTER_STATS[op][stage] += 1
+  return( stage != 'exact' )
+
+##----------------------------------------------------------------------------------------------
+def get_filter_stats():
+  """
+  Return (dict): number of calls settled by each filter stage, per operation
+    {'intersects': {'envelope', 'convex_hull', 'exact'}, 'overlap_area': {...}}
+  """
+  with _FILTER_STATS_LOCK:
+    return( {op: dict(d_stages) for (op, d_stages) in D_FILTER_STATS.items()} )
+
+##----------------------------------------------------------------------------------------------
+def _simplified(shape_poly, lod_tolerance):
+  """
+  Topology-preserving simplification of a polygon, and its error: the parts of the symmetric 
+  difference with the full-resolution polygon, as arrays of part bounding boxes and areas.
+  Return (tuple): (simplified shape, a_error_bounds, a_error_areas). A simplification that is invalid, or does 
+    not remove at least half of the vertices, is not worth it: (shape_poly, None, None) is returned instead.
+  """
+  (min_x, min_y, max_x, max_y) = shape_poly.bounds
+  simple_poly = shape_poly.simplify(lod_tolerance * ((max_x - min_x) ** 2 + (max_y - min_y) ** 2) ** 0.5, preserve_topology=True)
+  if not simple_poly.is_valid or 2 * shapely.get_num_coordinates(simple_poly) > shapely.get_num_coordinates(shape_poly):
+    return( shape_poly, None, None )
+  a_parts = shapely.get_parts(shape_poly.symmetric_difference(simple_poly))
+  return( simple_poly, shapely.bounds(a_parts).reshape(-1, 4), shapely.area(a_parts) )
+
+def _error_area(a_error_bounds, a_error_areas, bounds):
+  """ Total area of the error parts whose bounding box intersects a bounding box """
+  if a_error_bounds is None:
+    return( 0.0 )
+  (min_x, min_y, max_x, max_y) = bounds
+  a_mask = (a_error_bounds[:, 0] <= max_x) & (a_error_bounds[:, 2] >= min_x) & (a_error_bounds[:, 1] <= max_y) & (a_error_bounds[:, 3] >= min_y)
+  return( float(a_error_areas[a_mask].sum()) )
+
+##----------------------------------------------------------------------------------------------
+def _lod_overlap_area(shape_1, shape_2, tolerance, units=None):
+  """
+  Approximate overlap area from simplified polygons, coarsest level first, stopping at the first level
+  whose error bound is within the relative tolerance. 
+  The intersections of the full-resolution and the simplified polygons differ by at most the union of the
+  symmetric differences of each polygon with its simplification (each restricted to the parts near the bounding 
+  box of the other polygon - simplified vertices are a subset of the originals), so the sum of those areas bounds the error.
+  (Geodesic areas: the planar bound times the max area of a square degree within the polygons' bounds.)
+  Required Args:
+    * shape_1, shape_2: Shapely polygons
+    * tolerance (float): max relative error (i.e. 0.01 => 1%)
+  Optional Arg (str): units of a geodesic area (see get_overlap_area())
+  Return (tuple): (area, error_bound, lod_tolerance), or None if no level is accurate enough
+  """
+  for lod_tolerance in LOD_TOLERANCES:
+    (simple_1, *error_1) = _derived(shape_1, ('lod', lod_tolerance), lambda shape_poly: _simplified(shape_poly, lod_tolerance))
+    (simple_2, *error_2) = _derived(shape_2, ('lod', lod_tolerance), lambda shape_poly: _simplified(shape_poly, lod_tolerance))
+    area = _area(simple_1.intersection(simple_2), units)
+    error_bound = _error_area(*error_1, shape_2.bounds) + _error_area(*error_2, shape_1.bounds)
+    if units is not None:
+      error_bound *= _area_scale(shapely.total_bounds([shape_1, shape_2]), units)
+    if error_1[0] is None and error_2[0] is None: ## no simplification at this level: this is the exact area
+      return( area, 0.0, 0.0 )
+    ## relative to the smallest possible exact area
+    if error_bound <= tolerance * (area - error_bound):
+      return( area, error_bound, lod_tolerance )
+  return( None )
+
+##----------------------------------------------------------------------------------------------
+##
+## Geodesic area. The area element of the ellipsoid is R_q^2 d(sin(beta)) d(lon), with beta the authalic 
+## latitude and R_q the radius of the sphere of the same surface area, so the area of a ring is the ring 
+## integral of R_q^2 sin(beta) d(lon) (Green's theorem). Edges are straight lines in lon/lat (as in GeoJSON, 
+## RFC 7946): along an edge, sin(beta) is integrated by Gauss-Legendre quadrature (exact along parallels, 
+## and meridians add nothing).
+##
+_E2 = WGS84_F * (2 - WGS84_F)
+_E = _E2 ** 0.5
+(_GL_NODES, _GL_WEIGHTS) = np.polynomial.legendre.leggauss(4)
+(_GL_NODES, _GL_WEIGHTS) = ((_GL_NODES + 1) / 2, _GL_WEIGHTS / 2) ## on [0, 1]
+
+def _authalic_q(a_sin_lat):
+  """ q(latitude) of the ellipsoid: sin(authalic latitude) = q / q(90 degrees) """
+  return( (1 - _E2) * (a_sin_lat / (1 - _E2 * a_sin_lat ** 2) - np.log((1 - _E * a_sin_lat) / (1 + _E * a_sin_lat)) / (2 * _E)) )
+
+_Q_POLE = float(_authalic_q(np.float64(1.0)))
+_AUTHALIC_R2 = WGS84_A ** 2 * _Q_POLE / 2
+
+def geodesic_area(geom, units='m2'):
+  """
+  Area on the WGS84 ellipsoid of a lon/lat polygon geometry, vectorized over all the edges of all the rings.
+  Required Arg: Shapely Polygon, MultiPolygon or GeometryCollection (non-polygon parts have no area), 
+    coordinates in degrees (x: longitude, y: latitude)
+  Optional Arg (str): units: 'm2' or 'km2' (see D_AREA_UNITS)
+  Raises: ValueError() if a latitude is not within [-90, 90] or a longitude within [-360, 360]
+  Return (float): area
+  """
+  a_polys = shapely.get_parts(geom)
+  a_polys = a_polys[(shapely.get_type_id(a_polys) == 3) & ~shapely.is_empty(a_polys)] ## non-empty Polygons
+  if not len(a_polys):
+    return( 0.0 )
+  a_rings = shapely.get_rings(a_polys) ## exterior, then interiors, of each polygon
+  a_n_rings = shapely.get_num_interior_rings(a_polys) + 1
+  a_exterior = np.zeros(len(a_rings), dtype=bool)
+  a_exterior[np.cumsum(a_n_rings) - a_n_rings] = True
+  (a_coords, a_ring_index) = shapely.get_coordinates(a_rings, return_index=True)
+  if np.abs(a_coords[:, 1]).max() > 90 or np.abs(a_coords[:, 0]).max() > 360:
+    raise ValueError("Geodesic area requires longitude/latitude coordinates (degrees)")
+  a_lon = np.radians(a_coords[:, 0])
+  a_lat = np.radians(a_coords[:, 1])
+  ## edges: consecutive vertices of the same (closed) ring
+  a_edge = a_ring_index[:-1] == a_ring_index[1:]
+  a_dlon = (a_lon[1:] - a_lon[:-1])[a_edge]
+  a_lat_1 = a_lat[:-1][a_edge]
+  a_dlat = (a_lat[1:] - a_lat[:-1])[a_edge]
+  a_sin_beta = _authalic_q(np.sin(a_lat_1[:, None] + a_dlat[:, None] * _GL_NODES)) / _Q_POLE
+  a_ring_area = np.abs(np.bincount(a_ring_index[:-1][a_edge], weights=a_dlon * (a_sin_beta @ _GL_WEIGHTS), minlength=len(a_rings)))
+  area = _AUTHALIC_R2 * (a_ring_area[a_exterior].sum() - a_ring_area[~a_exterior].sum())
+  return( float(area) * D_AREA_UNITS[units] )
+
+def _area_scale(bounds, units):
+  """ Max area (in units) of one square degree within lon/lat bounds: bounds a geodesic area from its planar area """
+  (min_x, min_y, max_x, max_y) = bounds
+  lat = 0.0 if min_y <= 0 <= max_y else radians(min(abs(min_y), abs(max_y)))
+  return( WGS84_A ** 2 * (1 - _E2) * cos(lat) / (1 - _E2 * sin(lat) ** 2) ** 2 * (pi / 180) ** 2 * D_AREA_UNITS[units] )
+
+def _area(geom, units):
+  """ Planar area (units None), or geodesic area in units """
+  return( geom.area if units is None else geodesic_area(geom, units) )
+
+##----------------------------------------------------------------------------------------------
+class ResultCache(object):
+  """
+  Bounded LRU cache of query results (small dicts), with a time-to-live. Keys are built from
+  the canonical content hashes of the inputs (see _result_key()), so identical queries hit
+  regardless of the input format (GeoJSON, registered polygon_id, binary).
+  Required Args: 
+    * max_entries (int): max number of results (0 disables the cache)
+    * ttl (float): seconds to keep a result
+  """
+
+  def __init__(self, max_entries, ttl):
+    self.max_entries = max_entries
+    self.ttl = ttl
+    self.d_entries = OrderedDict() ## key => (expires, d_result)
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self.expirations = 0
+    self.lock = threading.Lock()
+
+  def get(self, key):
+    """ Return (dict): a copy of the cached result for key, or None if not cached (or expired) """
+    if key is None:
+      return( None )
+    with self.lock:
+      entry = self.d_entries.get(key, None)
+      if entry is not None and entry[0] < time.monotonic():
+        del self.d_entries[key]
+        self.expirations += 1
+        entry = None
+      if entry is None:
+        self.misses += 1
+        return( None )
+      self.d_entries.move_to_end(key)
+      self.hits += 1
+    return( dict(entry[1]) )
+
+  def put(self, key, d_result):
+    """ Add a result (copied), evicting least-recently-used entries to stay within max_entries """
+    if key is None:
+      return
+    with self.lock:
+      self.d_entries[key] = (time.monotonic() + self.ttl, dict(d_result))
+      self.d_entries.move_to_end(key)
+      while len(self.d_entries) > self.max_entries:
+        self.d_entries.popitem(last=False)
+        self.evictions += 1
+
+  def configure(self, max_entries, ttl):
+    """ Change the size limit (evicting entries if needed) and the TTL (of new entries) """
+    with self.lock:
+      (self.max_entries, self.ttl) = (max_entries, ttl)
+      while len(self.d_entries) > self.max_entries:
+        self.d_entries.popitem(last=False)
+        self.evictions += 1
+
+  def clear(self):
+    """ Remove all entries and reset the counters """
+    with self.lock:
+      self.d_entries.clear()
+      self.hits = self.misses = self.evictions = self.expirations = 0
+
+  def stats(self):
+    """ Return (dict): hit/miss/eviction/expiration counters, hit rate and current size """
+    with self.lock:
+      n_lookups = self.hits + self.misses
+      return( {'hits': self.hits, 'misses': self.misses, 'hit_rate': (self.hits / n_lookups) if n_lookups else 0.0,
+               'evictions': self.evictions, 'expirations': self.expirations, 
+               'entries': len(self.d_entries), 'max_entries': self.max_entries, 'ttl': self.ttl} )
+
+RESULT_CACHE = ResultCache(RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_TTL)
+
+##----------------------------------------------------------------------------------------------
+def configure_result_cache(max_entries, ttl=None):
+  """
+  Set the size (and TTL) of the result cache (i.e. from app.config at app creation).
+  Required Arg (int): max number of cached results (0 disables the cache)
+  Optional Arg (float): seconds to keep a result
+  """
+  RESULT_CACHE.configure(max_entries, RESULT_CACHE.ttl if ttl is None else ttl)
+
+def get_result_cache_stats():
+  """ Return (dict): result cache counters for this process (see ResultCache.stats()) """
+  return( RESULT_CACHE.stats() )
+
+##----------------------------------------------------------------------------------------------
+def _shape_hash(shape_geom):
+  """ Canonical content hash of a Shapely Polygon (same as polygon_hash() of its GeoJSON) or Point """
+  if shape_geom.geom_type == 'Point':
+    return( shapely.get_coordinates(shape_geom, include_z=shape_geom.has_z).tobytes().hex() )
+  l_rings = [shapely.get_coordinates(o_ring, include_z=shape_geom.has_z) for o_ring in [shape_geom.exterior] + list(shape_geom.interiors)]
+  return( _rings_hash(l_rings) )
+
+def _result_key(op, shape_1, shape_2, symmetric, *l_args):
+  """
+  Result cache key of an operation on two geometries: (op, hash_1, hash_2, *args).
+  For symmetric operations the two hashes are sorted, so (a, b) and (b, a) share an entry.
+  Polygon hashes are memoized on the geometry objects (seeded by the geometry cache).
+  Return (tuple|None): None if the result cache is disabled
+  """
+  if RESULT_CACHE.max_entries <= 0:
+    return( None )
+  hash_1 = _derived(shape_1, 'hash', _shape_hash)
+  hash_2 = _shape_hash(shape_2) if shape_2.geom_type == 'Point' else _derived(shape_2, 'hash', _shape_hash)
+  if symmetric and hash_2 < hash_1:
+    (hash_1, hash_2) = (hash_2, hash_1)
+  return( (op, hash_1, hash_2) + l_args )
+
+##----------------------------------------------------------------------------------------------
+## Warm process pool for CPU-heavy geometry operations (None: everything runs inline)
+_GEOMETRY_EXECUTOR = None
+
+def _offload_warmup(i):
+  return( os.getpid() )
+
+def _offload_overlap_area(wkb_1, wkb_2, units=None):
+  """ Overlap area of two polygons, run in a geometry worker process (polygons passed as WKB) """
+  return( _area(shapely.from_wkb(wkb_1).intersection(shapely.from_wkb(wkb_2)), units) )
+
+##----------------------------------------------------------------------------------------------
+def configure_executor(processes, min_vertices=None):
+  """
+  Start (or stop) the warm process pool used for heavy geometry operations. Operations with 
+  fewer than min_vertices input vertices always run inline (the WKB transfer is not worth it).
+  Required Arg (int): processes (0 stops the pool - everything runs inline)
+  Optional Arg (int): min_vertices (default OFFLOAD_MIN_VERTICES)
+  """
+  global _GEOMETRY_EXECUTOR, OFFLOAD_MIN_VERTICES
+  if min_vertices is not None:
+    OFFLOAD_MIN_VERTICES = min_vertices
+  if _GEOMETRY_EXECUTOR is not None:
+    _GEOMETRY_EXECUTOR.shutdown(wait=True)
+    _GEOMETRY_EXECUTOR = None
+  if processes > 0:
+    o_context = multiprocessing.get_context('spawn') ## safe to use from a threaded WSGI process
+    _GEOMETRY_EXECUTOR = ProcessPoolExecutor(max_workers=processes, mp_context=o_context)
+    ## start (and import this module in) all the workers now, not on the first requests
+    l_futures = [_GEOMETRY_EXECUTOR.submit(_offload_warmup, i) for i in range(processes)]
+    [o_future.result() for o_future in l_futures]
+
+##----------------------------------------------------------------------------------------------
+def _use_executor(shape_1, shape_2):
+  """ Return True if an operation on these 2 geometries should run on the process pool """
+  if _GEOMETRY_EXECUTOR is None:
+    return( False )
+  n_vertices = shapely.get_num_coordinates(shape_1) + shapely.get_num_coordinates(shape_2)
+  return( n_vertices >= OFFLOAD_MIN_VERTICES )
+
 ##----------------------------------------------------------------------------------------------
 def check_polygon_intersection(poly_1, poly_2):
   """
   Identify if two polygons intersect or not.
-  Required Args (json): 2 polygons in GeoJSON format
+  Required Args (json|dict|PreparedGeometry): 2 polygons in GeoJSON format (or prepared polygons)
   Return (dict): {"intersects": (0|1)} 
   """
 
-  ## validate format and convert to dict
+  ## validate format and convert to (cached) shapes
   try:
-    d_poly_1 = validate_geojson_polygon(poly_1)
+    (shape_1, prepared_1) = get_polygon(poly_1)
   except Exception as e:
     raise 
   try:
-    d_poly_2 = validate_geojson_polygon(poly_2)
+    (shape_2, prepared_2) = get_polygon(poly_2)
   except Exception as e:
     raise 
   
+  ## same pair (in either order) already computed?
+  result_key = _result_key('intersects', shape_1, shape_2, True)
+  d_response = RESULT_CACHE.get(result_key)
+  if d_response is not None:
+    return(d_response)
+
   d_response = {'intersects': 0}
 
-  shape_1 = shape(d_poly_1)
-  shape_2 = shape(d_poly_2)
-  result = shape_1.intersects(shape_2) ## => True|False
+  ## cheap rejects first (on the geometries of prepared polygons too: hulls are memoized, and have few vertices)
+  if _filter_disjoint('intersects', shape_1, shape_2, CONVEX_HULL_FILTER):
+    result = False
+  ## use a prepared polygon (if any) for the predicate
+  elif prepared_1 is not None:
+    result = prepared_1.intersects(shape_2) 
+  elif prepared_2 is not None:
+    result = prepared_2.intersects(shape_1) 
+  else:
+    result = shape_1.intersects(shape_2) ## => True|False
 
   if result:
     d_response = {'intersects': 1}
 
+  RESULT_CACHE.put(result_key, d_response)
+
   return(d_response)
 
 ##----------------------------------------------------------------------------------------------
-def get_overlap_area(poly_1, poly_2):
+def get_overlap_area(poly_1, poly_2, tolerance=None, units=None):
   """
   Identify area of overlap of two polygons
-  Required Args (json): 2 polygons in GeoJSON format
+  Required Args (json|dict|PreparedGeometry): 2 polygons in GeoJSON format (or prepared polygons)
+  Optional Args:
+    * tolerance (float): max relative error of an approximate ("fast mode") area, computed on cached 
+      simplified polygons (see LOD_TOLERANCES). Falls back to the exact area if no level is accurate enough.
+    * units (str): geodesic area of lon/lat polygons, in 'm2' or 'km2' (see geodesic_area()). 
+      Default: planar area, in squared coordinate units.
+  Raises: ValueError() if tolerance is not a number >= 0, units is not supported, or (with units) 
+    the coordinates are not lon/lat
   Return (dict): {'overlap_area': <float>} 
+    With tolerance: {'overlap_area': <float>, 'error_bound': <float>, 'lod_tolerance': <float>} 
+    (error_bound: max absolute error of overlap_area. lod_tolerance: simplification level used, 0.0 for full resolution)
+    With units: also {'units': <units>}
   """
+  if tolerance is not None and (isinstance(tolerance, bool) or not isinstance(tolerance, (int, float)) or not tolerance >= 0):
+    raise ValueError("Invalid tolerance: (%s). Expected a number >= 0" % (tolerance))
+  if units is not None and units not in D_AREA_UNITS:
+    raise ValueError("Invalid units: (%s). Expected one of: %s" % (units, ', '.join(D_AREA_UNITS)))
   
-  ## validate format and convert to dict
+  ## validate format and convert to (cached) shapes
   try:
-    d_poly_1 = validate_geojson_polygon(poly_1)
+    shape_1 = get_polygon_shape(poly_1)
   except Exception as e:
     raise 
   try:
-    d_poly_2 = validate_geojson_polygon(poly_2)
+    shape_2 = get_polygon_shape(poly_2)
   except Exception as e:
     raise 
 
-  shape_1 = shape(d_poly_1)
-  shape_2 = shape(d_poly_2)
-  intersection = shape_1.intersection(shape_2)
+  ## same pair (in either order) already computed?
+  result_key = _result_key('overlap_area', shape_1, shape_2, True, tolerance, units)
+  d_response = RESULT_CACHE.get(result_key)
+  if d_response is not None:
+    return(d_response)
+
+  ## cheap rejects first (no need to build an intersection of disjoint polygons)
+  approx = None
+  if _filter_disjoint('overlap_area', shape_1, shape_2, CONVEX_HULL_FILTER):
+    area = 0.0
+  ## fast mode: simplified polygons
+  elif tolerance and (approx := _lod_overlap_area(shape_1, shape_2, tolerance, units)) is not None:
+    area = approx[0]
+  ## large inputs: run on the (warm) geometry process pool, so this does not hold the GIL of the WSGI process
+  elif _use_executor(shape_1, shape_2):
+    o_future = _GEOMETRY_EXECUTOR.submit(_offload_overlap_area, shapely.to_wkb(shape_1), shapely.to_wkb(shape_2), units)
+    area = o_future.result()
+  else:
+    intersection = shape_1.intersection(shape_2)
+    area = _area(intersection, units)
 
-  area = intersection.area
   d_response = {'overlap_area': area}
+  if tolerance is not None:
+    (d_response['error_bound'], d_response['lod_tolerance']) = approx[1:] if approx else (0.0, 0.0)
+  if units is not None:
+    d_response['units'] = units
+
+  RESULT_CACHE.put(result_key, d_response)
 
   return(d_response)
 
+##----------------------------------------------------------------------------------------------
+def get_point(obj):
+  """
+  Get the Shapely geometry for a point argument.
+  Required Arg (json|dict|Point): GeoJSON Point, or a Shapely Point (i.e. from the binary decoders)
+  Raises: InvalidGeoJson() if input is not a valid Point 
+  Return: Shapely Point
+  """
+  if isinstance(obj, PreparedGeometry):
+    obj = obj.context
+  if isinstance(obj, BaseGeometry):
+    if obj.geom_type != 'Point':
+      raise InvalidGeoJson("Invalid GeoJSON Point: invalid type (%s)" % (obj.geom_type)) 
+    return( obj )
+  with metrics.stage('geojson'):
+    d_point = validate_geojson_point(obj)
+  with metrics.stage('shape'):
+    return( shape(d_point) )
+
+##----------------------------------------------------------------------------------------------
+## Relative error bound of the floating-point orientation test (Shewchuk, "Adaptive Precision Floating-Point 
+## Arithmetic and Fast Robust Geometric Predicates", 1997): the sign of a result larger than this is exact.
+_ORIENTATION_ERROR_BOUND = (3.0 + 16.0 * 2.0**-53) * 2.0**-53
+
+def _orientation(a_x1, a_y1, a_x2, a_y2, a_x, a_y):
+  """ Return (tuple): (orientation of the points relative to the edges (> 0: left), error bound) - numpy arrays or floats """
+  a_left = (a_x2 - a_x1) * (a_y - a_y1)
+  a_right = (a_x - a_x1) * (a_y2 - a_y1)
+  return( a_left - a_right, _ORIENTATION_ERROR_BOUND * (abs(a_left) + abs(a_right)) )
+
+def _sorted_unique(a_values):
+  """ Return (numpy array): the sorted unique values (np.unique, without its hash table: faster on large int arrays) """
+  a_values = np.sort(a_values)
+  return( a_values[np.concatenate([[True], a_values[1:] != a_values[:-1]])[:len(a_values)]] )
+
+##----------------------------------------------------------------------------------------------
+class PolygonGridIndex(object):
+  """
+  Regular grid over the bounding box of a (large) polygon, for point-in-polygon tests in time independent 
+  of the polygon size. Each cell is classified when the index is built: fully inside, fully outside, or 
+  boundary (touched by edges). A boundary cell keeps the list of its edges, and whether its lower-right 
+  corner is inside: a point in the cell is inside if the corner is, flipped by each edge crossing the path 
+  point => right side of the cell (horizontally) => corner (vertically). Only the edges of the cell can cross it.
+  Crossings are decided by orientation tests with an error bound. Points for which the sign of a test 
+  is uncertain (on, or within rounding error of, an edge) are tested exactly against the polygon 
+  (shapely.contains_xy): results are always the same as shapely's (points on the boundary are not within).
+  The index does not keep a reference to the polygon (it is memoized on the polygon, see _derived()).
+  Required Arg: shape_poly (Shapely Polygon)
+  Optional Arg (int): max_cells (default GRID_INDEX_MAX_CELLS)
+  """
+
+  CELLS_PER_EDGE = 2 ## grid resolution: number of cells per polygon edge, up to max_cells
+  SCALAR_MAX_EDGES = 24 ## contains(): boundary cells with more edges are tested with numpy (contains_xy())
+  BATCH_MAX_EDGES = 16384 ## contains_xy(): (point, edge) pairs tested at once (bounds the memory of large batches)
+
+  ## cell states
+  OUTSIDE = 0
+  INSIDE = 1
+  BOUNDARY = 2 ## lower-right corner outside
+  BOUNDARY_CORNER_INSIDE = 3
+
+  def __init__(self, shape_poly, max_cells=None):
+    t_start = time.perf_counter()
+    if max_cells is None:
+      max_cells = GRID_INDEX_MAX_CELLS
+
+    ## edges of all the rings (exterior and holes), without repeated positions
+    (a_xy, a_ring_idx) = shapely.get_coordinates(shapely.get_rings(shape_poly), return_index=True)
+    a_edge_mask = (a_ring_idx[1:] == a_ring_idx[:-1]) & np.any(a_xy[1:] != a_xy[:-1], axis=1)
+    (self.a_x1, self.a_y1) = a_xy[:-1][a_edge_mask].T.copy()
+    (self.a_x2, self.a_y2) = a_xy[1:][a_edge_mask].T.copy()
+    n_edges = len(self.a_x1)
+
+    ## square cells, the grid extends past the bounding box on each side (its outer cells are outside)
+    (min_x, min_y, max_x, max_y) = shape_poly.bounds
+    (width, height) = (max_x - min_x, max_y - min_y)
+    n_cells = max(1, min(max_cells, self.CELLS_PER_EDGE * n_edges))
+    self.cell_size = max((width * height / n_cells) ** 0.5, width / max_cells, height / max_cells, 1e-300)
+    self.nx = int(width / self.cell_size) + 1
+    self.ny = int(height / self.cell_size) + 1
+    self.x0 = min_x - (self.nx * self.cell_size - width) / 2
+    self.y0 = min_y - (self.ny * self.cell_size - height) / 2
+    ## cell => x of its right side, y of its bottom side
+    self.a_cell_max_x = self.x0 + np.arange(1, self.nx + 1) * self.cell_size
+    self.a_cell_min_y = self.y0 + np.arange(self.ny) * self.cell_size
+
+    ## edges => cells they touch: each edge is cut into pieces shorter than a cell, and the pieces 
+    ## listed in all the cells of their (slightly enlarged) bounding box
+    a_n_pieces = np.maximum(np.ceil(np.maximum(np.abs(self.a_x2 - self.a_x1), np.abs(self.a_y2 - self.a_y1)) / self.cell_size), 1).astype(np.int64)
+    a_piece_edge = np.repeat(np.arange(n_edges), a_n_pieces)
+    a_piece_start = np.arange(len(a_piece_edge)) - np.repeat(np.cumsum(a_n_pieces) - a_n_pieces, a_n_pieces)
+    l_piece_ends = []
+    for a_t in (a_piece_start / a_n_pieces[a_piece_edge], (a_piece_start + 1) / a_n_pieces[a_piece_edge]):
+      l_piece_ends.append((self.a_x1[a_piece_edge] + a_t * (self.a_x2 - self.a_x1)[a_piece_edge], 
+                           self.a_y1[a_piece_edge] + a_t * (self.a_y2 - self.a_y1)[a_piece_edge]))
+    margin = 1e-6 * self.cell_size + 1e-12 * max(abs(min_x), abs(min_y), abs(max_x), abs(max_y))
+    (a_i0, a_i1) = (self._cells(np.minimum(l_piece_ends[0][0], l_piece_ends[1][0]) - margin, self.x0, self.nx),
+                    self._cells(np.maximum(l_piece_ends[0][0], l_piece_ends[1][0]) + margin, self.x0, self.nx))
+    (a_j0, a_j1) = (self._cells(np.minimum(l_piece_ends[0][1], l_piece_ends[1][1]) - margin, self.y0, self.ny),
+                    self._cells(np.maximum(l_piece_ends[0][1], l_piece_ends[1][1]) + margin, self.y0, self.ny))
+    a_piece_ni = a_i1 - a_i0 + 1
+    a_piece_cells = a_piece_ni * (a_j1 - a_j0 + 1)
+    a_piece = np.repeat(np.arange(len(a_piece_edge)), a_piece_cells)
+    a_k = np.arange(len(a_piece)) - np.repeat(np.cumsum(a_piece_cells) - a_piece_cells, a_piece_cells)
+    a_cell = (a_j0[a_piece] + a_k // a_piece_ni[a_piece]) * self.nx + a_i0[a_piece] + a_k % a_piece_ni[a_piece]
+    a_pairs = _sorted_unique(a_cell * max(n_edges, 1) + a_piece_edge[a_piece]) ## by cell, then edge
+
+    ## boundary cells => their edges (CSR: edges of cell c are a_cell_edges[a_cell_offsets[c]:a_cell_offsets[c + 1]])
+    a_cell_n_edges = np.bincount(a_pairs // max(n_edges, 1), minlength=self.nx * self.ny)
+    self.a_cell_offsets = np.concatenate([[0], np.cumsum(a_cell_n_edges)]).astype(np.int32)
+    self.a_cell_edges = (a_pairs % max(n_edges, 1)).astype(np.int32)
+
+    ## cell states: inside/outside cells by their center, boundary cells by their lower-right corner. The state of 
+    ## a point is the parity of the edges crossing its row to its left (the grid starts outside the polygon).
+    a_boundary = a_cell_n_edges > 0
+    a_row_pairs = _sorted_unique(a_pairs // max(n_edges, 1) // self.nx * max(n_edges, 1) + a_pairs % max(n_edges, 1))
+    (a_row, a_row_edge) = (a_row_pairs // max(n_edges, 1), a_row_pairs % max(n_edges, 1))
+    (a_cross_row, a_cross_x) = self._crossings(a_row, a_row_edge, self.y0 + (a_row + 0.5) * self.cell_size)
+    a_inside = self._count_left(a_cross_row, a_cross_x, self.x0 + (np.arange(self.nx) + 0.5) * self.cell_size, False) % 2 == 1
+    ## corners: "right of the corner" is the right side of the cell (see _boundary_contains()). Corners within 
+    ## rounding error of a crossing are tested exactly (a corner on an edge is never used: the point is tested exactly)
+    (a_cross_row, a_cross_x) = self._crossings(a_row, a_row_edge, self.a_cell_min_y[a_row])
+    a_corner_inside = self._count_left(a_cross_row, a_cross_x, self.a_cell_max_x, True) % 2 == 1
+    a_inside[a_boundary] = a_corner_inside[a_boundary]
+    a_col = np.minimum(np.searchsorted(self.a_cell_max_x, a_cross_x), self.nx - 1)
+    a_near = np.zeros(self.nx * self.ny, dtype=bool)
+    a_near[(a_cross_row * self.nx + a_col)[np.abs(self.a_cell_max_x[a_col] - a_cross_x) <= margin]] = True
+    a_near[(a_cross_row * self.nx + a_col - 1)[(a_col > 0) & (np.abs(a_cross_x - self.a_cell_max_x[a_col - 1]) <= margin)]] = True
+    a_idx = np.flatnonzero(a_near & a_boundary)
+    a_inside[a_idx] = shapely.contains_xy(shape_poly, self.a_cell_max_x[a_idx % self.nx], self.a_cell_min_y[a_idx // self.nx])
+    self.a_cell_state = (a_inside + np.where(a_boundary, self.BOUNDARY, 0)).astype(np.int8)
+
+    self.build_seconds = time.perf_counter() - t_start
+    self.n_edges = n_edges
+    self.n_boundary_cells = int(a_boundary.sum())
+
+  ##----------------------------------------------------------------------
+  def _cells(self, a_coord, origin, n_cells):
+    """ Return (numpy int64 array): index of the cell (row or column) of each coordinate, clipped to the grid """
+    return( np.clip(np.floor((a_coord - origin) / self.cell_size), 0, n_cells - 1).astype(np.int64) )
+
+  def _crossings(self, a_row, a_edge, a_line_y):
+    """ Return (tuple): (row, x) numpy arrays of the crossings of the edges with the horizontal lines (edge ends on the line count as above it) """
+    (a_x1, a_y1, a_x2, a_y2) = (self.a_x1[a_edge], self.a_y1[a_edge], self.a_x2[a_edge], self.a_y2[a_edge])
+    a_mask = (a_y1 > a_line_y) != (a_y2 > a_line_y)
+    a_x = a_x1[a_mask] + (a_line_y[a_mask] - a_y1[a_mask]) * (a_x2[a_mask] - a_x1[a_mask]) / (a_y2[a_mask] - a_y1[a_mask])
+    return( a_row[a_mask], a_x )
+
+  def _count_left(self, a_cross_row, a_cross_x, a_column_x, inclusive):
+    """ Return (numpy int64 array): for each cell, number of crossings in its row left of (inclusive: or at) a_column_x[column of the cell] """
+    a_col = np.searchsorted(a_column_x, a_cross_x, 'left' if inclusive else 'right') ## first column counting the crossing
+    a_n = np.bincount(a_cross_row * (self.nx + 1) + a_col, minlength=self.ny * (self.nx + 1)).reshape(self.ny, self.nx + 1)
+    return( np.cumsum(a_n, axis=1)[:, :self.nx].ravel() )
+
+  ##----------------------------------------------------------------------
+  def nbytes(self):
+    """ Return (int): memory used by the index arrays """
+    return( sum(a.nbytes for a in (self.a_x1, self.a_y1, self.a_x2, self.a_y2, self.a_cell_max_x, self.a_cell_min_y, 
+                                   self.a_cell_offsets, self.a_cell_edges, self.a_cell_state)) )
+
+  def stats(self):
+    """ Return (dict): size of the grid, memory used (bytes), and build time (seconds) """
+    return( {'cells': self.nx * self.ny, 'nx': self.nx, 'ny': self.ny, 'boundary_cells': self.n_boundary_cells, 
+             'edges': self.n_edges, 'cell_edges': len(self.a_cell_edges), 'bytes': self.nbytes(), 'build_seconds': self.build_seconds} )
+
+  ##----------------------------------------------------------------------
+  def contains(self, shape_poly, x, y):
+    """
+    Point-in-polygon test of one point (same result as shapely.contains_xy(shape_poly, x, y)).
+    Same tests as contains_xy(), on python floats (numpy calls cost more than the test of a few edges).
+    Required Args: 
+      * shape_poly (Shapely Polygon): the indexed polygon
+      * x, y (float): point coordinates
+    Return (bool): True if the point is within the polygon
+    """
+    (x, y) = (float(x), float(y))
+    (i, j) = (floor((x - self.x0) / self.cell_size), floor((y - self.y0) / self.cell_size))
+    cell = j * self.nx + i
+    state = int(self.a_cell_state[cell]) if (0 <= i < self.nx and 0 <= j < self.ny) else self.OUTSIDE
+    if state < self.BOUNDARY:
+      (within, stat) = (state == self.INSIDE, 'cell')
+    else:
+      (start, end) = (int(self.a_cell_offsets[cell]), int(self.a_cell_offsets[cell + 1]))
+      (within, stat) = (state == self.BOUNDARY_CORNER_INSIDE, 'edges')
+      if end - start > self.SCALAR_MAX_EDGES:
+        (a_within, a_uncertain) = self._boundary_contains(np.array([x]), np.array([y]), np.array([cell], dtype=np.int64), np.array([within]))
+        within = bool(a_within[0])
+        if a_uncertain[0]:
+          (within, stat) = (bool(shapely.contains_xy(shape_poly, x, y)), 'exact')
+      else:
+        a_edge = self.a_cell_edges[start:end]
+        (ex, ky) = (float(self.a_cell_max_x[i]), float(self.a_cell_min_y[j]))
+        for (x1, y1, x2, y2) in zip(self.a_x1[a_edge].tolist(), self.a_y1[a_edge].tolist(), self.a_x2[a_edge].tolist(), self.a_y2[a_edge].tolist()):
+          (orient_p, error_p) = _orientation(x1, y1, x2, y2, x, y)
+          (orient_e, error_e) = _orientation(x1, y1, x2, y2, ex, y)
+          (orient_k, error_k) = _orientation(x1, y1, x2, y2, ex, ky)
+          across_y = (y1 > y) != (y2 > y)
+          across_x = (x1 > ex) != (x2 > ex)
+          (min_x, max_x, min_y, max_y) = (min(x1, x2), max(x1, x2), min(y1, y2), max(y1, y2))
+          if ((abs(orient_p) <= error_p and (across_y or (min_x <= x <= max_x and min_y <= y <= max_y))) or 
+              (abs(orient_e) <= error_e and (across_y or across_x or (min_x <= ex <= max_x and min_y <= y <= max_y))) or 
+              (abs(orient_k) <= error_k and (across_x or (min_x <= ex <= max_x and min_y <= ky <= max_y)))):
+            (within, stat) = (bool(shapely.contains_xy(shape_poly, x, y)), 'exact')
+            break
+          if (across_y and ((orient_p > 0) != (orient_e > 0))) != (across_x and ((orient_e > 0) != (orient_k > 0))):
+            within = not within
+    with _GRID_INDEX_STATS_LOCK:
+      D_GRID_INDEX_STATS[stat] += 1
+    return( within )
+
+  def contains_xy(self, shape_poly, x, y):
+    """
+    Point-in-polygon test of a batch of points (same results as shapely.contains_xy(shape_poly, x, y)).
+    Required Args: 
+      * shape_poly (Shapely Polygon): the indexed polygon (for the exact test of uncertain points)
+      * x, y (numpy float64 arrays): point coordinates
+    Return (numpy bool array): True for the points within the polygon
+    """
+    a_i = np.floor((x - self.x0) / self.cell_size)
+    a_j = np.floor((y - self.y0) / self.cell_size)
+    a_in_grid = (a_i >= 0) & (a_i < self.nx) & (a_j >= 0) & (a_j < self.ny)
+    a_cell = np.where(a_in_grid, a_j * self.nx + a_i, 0).astype(np.int64)
+    a_state = np.where(a_in_grid, self.a_cell_state[a_cell], self.OUTSIDE)
+    a_within = a_state == self.INSIDE
+
+    a_idx = np.flatnonzero(a_state >= self.BOUNDARY)
+    (n_boundary, n_exact) = (len(a_idx), 0)
+    if n_boundary:
+      ## chunks of the points whose first (point, edge) pair falls in the same block of BATCH_MAX_EDGES pairs
+      a_n_edges = self.a_cell_offsets[a_cell[a_idx] + 1] - self.a_cell_offsets[a_cell[a_idx]]
+      a_first_pair = np.cumsum(a_n_edges) - a_n_edges
+      a_bounds = np.unique(np.concatenate([np.searchsorted(a_first_pair, np.arange(0, a_first_pair[-1] + 1, self.BATCH_MAX_EDGES)), [n_boundary]]))
+      l_uncertain = []
+      for (start, end) in zip(a_bounds[:-1].tolist(), a_bounds[1:].tolist()):
+        a_chunk = a_idx[start:end]
+        (a_within[a_chunk], a_uncertain) = self._boundary_contains(x[a_chunk], y[a_chunk], a_cell[a_chunk], a_state[a_chunk] == self.BOUNDARY_CORNER_INSIDE)
+        l_uncertain.append(a_chunk[a_uncertain])
+      a_idx = np.concatenate(l_uncertain)
+      n_exact = len(a_idx)
+      if n_exact:
+        a_within[a_idx] = shapely.contains_xy(shape_poly, x[a_idx], y[a_idx])
+
+    with _GRID_INDEX_STATS_LOCK:
+      D_GRID_INDEX_STATS['cell'] += len(x) - n_boundary
+      D_GRID_INDEX_STATS['edges'] += n_boundary - n_exact
+      D_GRID_INDEX_STATS['exact'] += n_exact
+
+    return( a_within )
+
+  def _boundary_contains(self, x, y, a_cell, a_corner_inside):
+    """
+    Point-in-polygon test of points in boundary cells, against the edges of their cell.
+    Return (tuple): (within, uncertain) numpy bool arrays - uncertain points must be tested exactly
+    """
+    ## (point, edge) pairs
+    a_start = self.a_cell_offsets[a_cell]
+    a_n = self.a_cell_offsets[a_cell + 1] - a_start
+    a_first = np.cumsum(a_n) - a_n
+    a_point = np.repeat(np.arange(len(x)), a_n)
+    a_edge = self.a_cell_edges[np.arange(len(a_point)) - np.repeat(a_first - a_start, a_n)]
+    (a_x1, a_y1, a_x2, a_y2) = (self.a_x1[a_edge], self.a_y1[a_edge], self.a_x2[a_edge], self.a_y2[a_edge])
+
+    ## path: point P => E (right side of the cell, at the height of the point) => corner K
+    (a_px, a_py) = (x[a_point], y[a_point])
+    a_ex = self.a_cell_max_x[a_cell % self.nx][a_point]
+    a_ky = self.a_cell_min_y[a_cell // self.nx][a_point]
+    (a_orient_p, a_error_p) = _orientation(a_x1, a_y1, a_x2, a_y2, a_px, a_py)
+    (a_orient_e, a_error_e) = _orientation(a_x1, a_y1, a_x2, a_y2, a_ex, a_py)
+    (a_orient_k, a_error_k) = _orientation(a_x1, a_y1, a_x2, a_y2, a_ex, a_ky)
+
+    ## an edge across the line of a leg crosses the leg if the ends of the leg are on opposite sides of the edge 
+    ## (half-open tests of the edge ends: edges through a vertex on a leg are counted once)
+    a_across_y = (a_y1 > a_py) != (a_y2 > a_py)
+    a_across_x = (a_x1 > a_ex) != (a_x2 > a_ex)
+    a_crossing = ((a_across_y & ((a_orient_p > 0) != (a_orient_e > 0))) != (a_across_x & ((a_orient_e > 0) != (a_orient_k > 0))))
+
+    ## uncertain signs that matter: P, E or K on (or near) an edge, or the path through a vertex
+    (a_min_x, a_max_x, a_min_y, a_max_y) = (np.minimum(a_x1, a_x2), np.maximum(a_x1, a_x2), np.minimum(a_y1, a_y2), np.maximum(a_y1, a_y2))
+    a_uncertain = (((np.abs(a_orient_p) <= a_error_p) & (a_across_y | ((a_px >= a_min_x) & (a_px <= a_max_x) & (a_py >= a_min_y) & (a_py <= a_max_y)))) | 
+                   ((np.abs(a_orient_e) <= a_error_e) & (a_across_y | a_across_x | ((a_ex >= a_min_x) & (a_ex <= a_max_x) & (a_py >= a_min_y) & (a_py <= a_max_y)))) | 
+                   ((np.abs(a_orient_k) <= a_error_k) & (a_across_x | ((a_ex >= a_min_x) & (a_ex <= a_max_x) & (a_ky >= a_min_y) & (a_ky <= a_max_y)))))
+
+    a_within = (np.add.reduceat(a_crossing.astype(np.int64), a_first) % 2 == 1) != a_corner_inside
+    return( a_within, np.logical_or.reduceat(a_uncertain, a_first) )
+
+##----------------------------------------------------------------------------------------------
+## Point-in-polygon tests answered by the grid indexes: by the cell alone, by the edges of a boundary cell, 
+## or by the exact test. Indexes built in this process: count, memory (bytes), build time (seconds).
+D_GRID_INDEX_STATS = {'cell': 0, 'edges': 0, 'exact': 0, 'indexes': 0, 'bytes': 0, 'build_seconds': 0.0}
+_GRID_INDEX_STATS_LOCK = threading.Lock()
+_GRID_INDEX_BUILD_LOCK = threading.Lock()
+
+def configure_grid_index(min_vertices, min_points=None, max_cells=None):
+  """
+  Set which polygons get a grid index for point-in-polygon queries (i.e. from app.config at app creation).
+  Required Arg (int): min_vertices - min vertex count of an indexed polygon (0 disables the index)
+  Optional Args (int): min_points (default GRID_INDEX_MIN_POINTS), max_cells (default GRID_INDEX_MAX_CELLS)
+  """
+  global GRID_INDEX_MIN_VERTICES, GRID_INDEX_MIN_POINTS, GRID_INDEX_MAX_CELLS
+  GRID_INDEX_MIN_VERTICES = min_vertices
+  if min_points is not None:
+    GRID_INDEX_MIN_POINTS = min_points
+  if max_cells is not None:
+    GRID_INDEX_MAX_CELLS = max_cells
+
+def get_grid_index_stats():
+  """
+  Return (dict): grid index counters for this process 
+    {'cell', 'edges', 'exact', 'indexes', 'bytes', 'build_seconds'}
+  """
+  with _GRID_INDEX_STATS_LOCK:
+    return( dict(D_GRID_INDEX_STATS) )
+
+def _build_grid_index(shape_poly):
+  o_index = PolygonGridIndex(shape_poly)
+  with _GRID_INDEX_STATS_LOCK:
+    D_GRID_INDEX_STATS['indexes'] += 1
+    D_GRID_INDEX_STATS['bytes'] += o_index.nbytes()
+    D_GRID_INDEX_STATS['build_seconds'] += o_index.build_seconds
+  log.debug("grid index built", extra=dict(o_index.stats(), vertices=int(shapely.get_num_coordinates(shape_poly))))
+  return( o_index )
+
+def grid_index(shape_poly, n_points=None):
+  """
+  Get the grid index of a polygon (memoized on the polygon), if it is large enough to have one.
+  Required Arg: shape_poly (Shapely Polygon)
+  Optional Arg (int): n_points - number of points about to be tested against the polygon: the index is 
+    only built once the polygon was tested against GRID_INDEX_MIN_POINTS points (None: build it now)
+  Return: PolygonGridIndex, or None
+  """
+  if GRID_INDEX_MIN_VERTICES <= 0 or shapely.get_num_coordinates(shape_poly) < GRID_INDEX_MIN_VERTICES:
+    return( None )
+  d_state = _derived(shape_poly, 'grid_index', lambda shape_poly: {'points': 0, 'index': None})
+  if d_state['index'] is None:
+    if n_points is not None:
+      d_state['points'] += n_points
+      if d_state['points'] < GRID_INDEX_MIN_POINTS:
+        return( None )
+    with _GRID_INDEX_BUILD_LOCK: ## one build per polygon, by one request thread
+      if d_state['index'] is None:
+        d_state['index'] = _build_grid_index(shape_poly)
+  return( d_state['index'] )
+
 ##----------------------------------------------------------------------------------------------
 def check_point_in_polygon(**kwargs):
   """
   Identify if a point is "within" the boundry of a polygon
   Required kwargs: 
-    * point (json): GeoJSON Point 
-    * polygon (json): GeoJSON Polygon
+    * point (json|dict|Point): GeoJSON Point (or Shapely Point)
+    * polygon (json|dict|PreparedGeometry): GeoJSON Polygon (or prepared polygon)
   Return (dict): {'is_within': (0|1)} 
   """
 
   point = kwargs.get("point", None)
   poly = kwargs.get("polygon", None)
  
-  ## validate format and convert to dict
+  ## validate format and convert to shape
   try:
-    d_point = validate_geojson_point(point)
+    shape_pt = get_point(point)
   except Exception as e:
     raise 
   try:
-    d_poly = validate_geojson_polygon(poly)
+    (shape_poly, prepared_poly) = get_polygon(poly)
   except Exception as e:
     raise 
   
-  d_response = {'is_within': 0}
+  ## same point and polygon already computed?
+  result_key = _result_key('contains', shape_poly, shape_pt, False)
+  d_response = RESULT_CACHE.get(result_key)
+  if d_response is not None:
+    return(d_response)
 
-  shape_pt = shape(d_point)
-  shape_poly = shape(d_poly)
+  d_response = {'is_within': 0}
 
   #print(shape_pt)
   #print(shape_poly)
 
-  result = shape_pt.within(shape_poly) ## => True|False
+  ## point.within(poly) is equivalent to poly.contains(point)
+  o_index = grid_index(shape_poly, 1)
+  if o_index is not None:
+    result = o_index.contains(shape_poly, shape_pt.x, shape_pt.y)
+  elif prepared_poly is not None:
+    result = prepared_poly.contains(shape_pt)
+  else:
+    result = shape_pt.within(shape_poly) ## => True|False
 
   if result:
     d_response = {'is_within': 1}
 
+  RESULT_CACHE.put(result_key, d_response)
+
+  return(d_response)
+
+##----------------------------------------------------------------------------------------------
+def points_to_xy(points=None, coordinates=None):
+  """
+  Convert a batch of points to x and y coordinate arrays (no per-point Python objects).
+  Optional Args (one required):
+    * points (list): list of [x, y] positions
+    * coordinates (list): flat list of coordinates [x0, y0, x1, y1, ...]
+  Raises: InvalidGeoJson() if the points are not numeric positions 
+  Return (tuple): (x, y) numpy float64 arrays
+  """
+  if points is not None:
+    try:
+      a_points = np.asarray(points)
+    except ValueError as e: ## i.e. ragged list of positions
+      raise InvalidGeoJson("Invalid points: each point must be a position with exactly 2 or 3 values") 
+    if a_points.size == 0:
+      a_points = a_points.reshape((0, 2))
+    if a_points.ndim != 2 or a_points.shape[1] not in (2, 3):
+      raise InvalidGeoJson("Invalid points: each point must be a position with exactly 2 or 3 values") 
+  elif coordinates is not None:
+    try:
+      a_points = np.asarray(coordinates)
+    except ValueError as e:
+      raise InvalidGeoJson("Invalid points: coordinates must be a flat list of x,y pairs") 
+    if a_points.ndim != 1 or a_points.size % 2:
+      raise InvalidGeoJson("Invalid points: coordinates must be a flat list of x,y pairs") 
+    a_points = a_points.reshape((-1, 2))
+  else:
+    raise InvalidGeoJson("Invalid points: Missing required parameter: [points] or [coordinates]") 
+
+  ## only int/float arrays (numpy would happily convert strings and booleans)
+  if a_points.size and a_points.dtype.kind not in 'iuf':
+    raise InvalidGeoJson("Invalid points: coordinates must be JSON compliant numbers") 
+  ## booleans mixed with numbers are converted to 1/0: check the type of the decoded values equal to 0 or 1 only
+  if a_points.size and not isinstance(points if points is not None else coordinates, np.ndarray):
+    a_suspect = np.flatnonzero((a_points == 0) | (a_points == 1))
+    if points is not None:
+      n_values = a_points.shape[1]
+      is_bool = any(type(points[idx // n_values][idx % n_values]) is bool for idx in a_suspect.tolist())
+    else:
+      is_bool = any(type(coordinates[idx]) is bool for idx in a_suspect.tolist())
+    if is_bool:
+      raise InvalidGeoJson("Invalid points: coordinates must be JSON compliant numbers") 
+  a_points = a_points.astype(np.float64, copy=False)
+  if not np.isfinite(a_points).all():
+    raise InvalidGeoJson("Invalid points: coordinates must be JSON compliant numbers") 
+
+  return( a_points[:, 0], a_points[:, 1] )
+
+##----------------------------------------------------------------------------------------------
+def check_points_in_polygon(**kwargs):
+  """
+  Identify which points of a batch are "within" the boundry of a polygon.
+  Containment is evaluated in vectorized form (shapely.contains_xy) against the prepared polygon, 
+  or its grid index (see grid_index()).
+  Required kwargs: 
+    * polygon (json|dict|PreparedGeometry): GeoJSON Polygon (or prepared polygon)
+    * points (list): list of [x, y] positions, OR
+    * coordinates (list): flat list of coordinates [x0, y0, x1, y1, ...]
+  Return (dict): {'is_within': [(0|1), ...]} in the same order as the input points
+  """
+
+  poly = kwargs.get("polygon", None)
+
+  ## validate format and convert to arrays/shape
+  try:
+    (x, y) = points_to_xy(points=kwargs.get("points", None), coordinates=kwargs.get("coordinates", None))
+  except Exception as e:
+    raise 
+  try:
+    (shape_poly, prepared_poly) = get_polygon(poly)
+  except Exception as e:
+    raise 
+
+  ## point.within(poly) is equivalent to poly.contains(point). prep() prepares shape_poly in-place.
+  o_index = grid_index(shape_poly, len(x))
+  if o_index is not None:
+    a_within = o_index.contains_xy(shape_poly, x, y)
+  else:
+    a_within = shapely.contains_xy(shape_poly, x, y)
+
+  d_response = {'is_within': a_within.astype(np.uint8).tolist()}
+
+  return(d_response)
+
+##----------------------------------------------------------------------------------------------
+class PolygonLayer(object):
+  """
+  A named set of polygons (i.e. every state) with an STRtree spatial index, for finding 
+  which polygon contains a point. Lookups first filter candidate polygons by bounding box 
+  (STRtree query), and only run the exact containment test on those candidates.
+  Required Arg (dict): polygon name => GeoJSON Polygon (json|dict) 
+  Raises: InvalidGeoJson() if any polygon is not a valid GeoJSON Polygon
+  """
+
+  def __init__(self, d_polygons):
+    self.l_names = list(d_polygons.keys())
+    l_shapes = []
+    for name in self.l_names:
+      try:
+        shape_poly = shape(validate_geojson_polygon(d_polygons[name]))
+      except InvalidGeoJson as e:
+        raise InvalidGeoJson("Polygon (%s): %s" % (name, e))
+      l_shapes.append(shape_poly)
+    self.a_shapes = np.array(l_shapes, dtype=object)
+    shapely.prepare(self.a_shapes)
+    self.o_tree = STRtree(self.a_shapes)
+
+  @classmethod
+  def from_directory(cls, dir_path):
+    """
+    Build a layer from a directory of GeoJSON Polygon files (i.e. data/). 
+    Each <name>.json file becomes the polygon <name>.
+    """
+    d_polygons = {}
+    for file_name in sorted(os.listdir(dir_path)):
+      (name, ext) = os.path.splitext(file_name)
+      if ext != '.json':
+        continue
+      with open(os.path.join(dir_path, file_name), 'rb') as f:
+        d_polygons[name] = json_codec.loads(f.read())
+    return( cls(d_polygons) )
+
+  def __len__(self):
+    return( len(self.l_names) )
+
+  def lookup_xy(self, x, y):
+    """
+    Find the containing polygon of each point.
+    Required Args: x, y (numpy float64 arrays): point coordinates
+    Return (list): polygon name (or None) per point. If polygons of the layer overlap, 
+      the first polygon of the layer containing the point is returned.
+    """
+    ## candidate (point, polygon) pairs by bounding box => array([[point_idx...], [poly_idx...]])
+    a_pairs = self.o_tree.query(shapely.points(x, y))
+    a_point_idx = a_pairs[0]
+    a_poly_idx = a_pairs[1]
+
+    ## exact test of candidates only (vectorized, against the prepared polygons)
+    a_mask = shapely.contains_xy(self.a_shapes[a_poly_idx], x[a_point_idx], y[a_point_idx])
+    a_point_idx = a_point_idx[a_mask]
+    a_poly_idx = a_poly_idx[a_mask]
+
+    ## first polygon (in layer order) for each point
+    a_order = np.lexsort((a_poly_idx, a_point_idx))
+    (a_points_found, a_first) = np.unique(a_point_idx[a_order], return_index=True)
+    l_result = [None] * len(x)
+    for (point_idx, poly_idx) in zip(a_points_found.tolist(), a_poly_idx[a_order][a_first].tolist()):
+      l_result[point_idx] = self.l_names[poly_idx]
+
+    return( l_result )
+
+##----------------------------------------------------------------------------------------------
+def find_containing_polygon(**kwargs):
+  """
+  Identify which polygon of a layer a point is "within"
+  Required kwargs: 
+    * point (json): GeoJSON Point 
+    * layer (PolygonLayer): the polygons to search
+  Return (dict): {'polygon': <name>|None} 
+  """
+
+  point = kwargs.get("point", None)
+  o_layer = kwargs.get("layer", None)
+
+  ## validate format and convert to dict
+  try:
+    d_point = validate_geojson_point(point)
+  except Exception as e:
+    raise 
+
+  coordinates = d_point['coordinates']
+  l_names = o_layer.lookup_xy(np.array([coordinates[0]], dtype=np.float64), np.array([coordinates[1]], dtype=np.float64))
+
+  d_response = {'polygon': l_names[0]}
+
+  return(d_response)
+
+##----------------------------------------------------------------------------------------------
+def find_containing_polygons(**kwargs):
+  """
+  Identify which polygon of a layer each point of a batch is "within"
+  Required kwargs: 
+    * layer (PolygonLayer): the polygons to search
+    * points (list): list of [x, y] positions, OR
+    * coordinates (list): flat list of coordinates [x0, y0, x1, y1, ...]
+  Return (dict): {'polygons': [<name>|None, ...]} in the same order as the input points
+  """
+
+  o_layer = kwargs.get("layer", None)
+
+  ## validate format and convert to arrays
+  try:
+    (x, y) = points_to_xy(points=kwargs.get("points", None), coordinates=kwargs.get("coordinates", None))
+  except Exception as e:
+    raise 
+
+  d_response = {'polygons': o_layer.lookup_xy(x, y)}
+
+  return(d_response)
+
+##----------------------------------------------------------------------------------------------
+def _collection_shapes(l_polys, label):
+  """
+  Validate a collection of polygons and build a numpy array of Shapely geometries.
+  Join inputs are not added to the geometry cache (they would just evict the hot polygons).
+  Required Args:
+    * l_polys (list): GeoJSON Polygons (json|dict) or geometries (i.e. registered polygons)
+    * label (str): name of the collection (used for the exception message)
+  Raises: InvalidGeoJson() if any polygon is not a valid GeoJSON Polygon
+  Return: numpy object array of Shapely geometries
+  """
+  l_shapes = []
+  for (idx, poly) in enumerate(l_polys):
+    if isinstance(poly, (BaseGeometry, PreparedGeometry)):
+      l_shapes.append(get_polygon_shape(poly))
+      continue
+    try:
+      l_shapes.append(shape(validate_geojson_polygon(poly)))
+    except InvalidGeoJson as e:
+      raise InvalidGeoJson("Polygon (%s.%d): %s" % (label, idx, e))
+  return( np.array(l_shapes, dtype=object) )
+
+##----------------------------------------------------------------------------------------------
+def _join_shapes(a_shapes_1, a_shapes_2, o_tree_2, with_area):
+  """
+  Find all intersecting pairs between two arrays of geometries.
+  Required Args:
+    * a_shapes_1, a_shapes_2: numpy arrays of Shapely geometries
+    * o_tree_2: STRtree of a_shapes_2
+    * with_area (bool): also compute the overlap area of each pair
+  Return (tuple): (index_1 array, index_2 array, overlap_area array|None) sorted by (index_1, index_2)
+  """
+  ## bounding-box candidates are pruned by the tree, then tested with the exact predicate
+  a_pairs = o_tree_2.query(a_shapes_1, predicate='intersects')
+  a_order = np.lexsort((a_pairs[1], a_pairs[0]))
+  a_idx_1 = a_pairs[0][a_order]
+  a_idx_2 = a_pairs[1][a_order]
+
+  a_area = None
+  if with_area:
+    a_area = shapely.area(shapely.intersection(a_shapes_1[a_idx_1], a_shapes_2[a_idx_2]))
+
+  return( a_idx_1, a_idx_2, a_area )
+
+##----------------------------------------------------------------------------------------------
+## Per-process state of the spatial-join worker processes (second collection of the current join and its tree, by WKB file)
+_D_JOIN_WORKER = {}
+
+## Process pool of spatial joins when the warm geometry pool is not configured (started on first use, then reused)
+_JOIN_EXECUTOR = None
+_JOIN_PROCESSES = 0
+_JOIN_EXECUTOR_LOCK = threading.Lock()
+
+def _join_worker(wkb_2_path, offset, l_wkb_1, with_area):
+  if _D_JOIN_WORKER.get('wkb_2_path', None) != wkb_2_path: ## first chunk of this join in this worker
+    with open(wkb_2_path, 'rb') as f:
+      a_shapes_2 = shapely.get_parts(shapely.from_wkb(f.read()))
+    _D_JOIN_WORKER.update({'wkb_2_path': wkb_2_path, 'shapes_2': a_shapes_2, 'tree_2': STRtree(a_shapes_2)})
+  a_shapes_1 = shapely.from_wkb(l_wkb_1)
+  (a_idx_1, a_idx_2, a_area) = _join_shapes(a_shapes_1, _D_JOIN_WORKER['shapes_2'], _D_JOIN_WORKER['tree_2'], with_area)
+  return( a_idx_1 + offset, a_idx_2, a_area )
+
+def _join_executor(processes):
+  """ Return the process pool for spatial joins: the warm geometry pool (configure_executor()) if any """
+  global _JOIN_EXECUTOR, _JOIN_PROCESSES
+  if _GEOMETRY_EXECUTOR is not None:
+    return( _GEOMETRY_EXECUTOR )
+  with _JOIN_EXECUTOR_LOCK:
+    if _JOIN_EXECUTOR is None or _JOIN_PROCESSES != processes:
+      if _JOIN_EXECUTOR is not None:
+        _JOIN_EXECUTOR.shutdown(wait=False)
+      o_context = multiprocessing.get_context('spawn') ## safe to use from a threaded WSGI process
+      (_JOIN_EXECUTOR, _JOIN_PROCESSES) = (ProcessPoolExecutor(max_workers=processes, mp_context=o_context), processes)
+    return( _JOIN_EXECUTOR )
+
+def _reset_join_executor(o_executor):
+  global _JOIN_EXECUTOR
+  with _JOIN_EXECUTOR_LOCK:
+    if _JOIN_EXECUTOR is o_executor:
+      _JOIN_EXECUTOR = None
+
+##----------------------------------------------------------------------------------------------
+def spatial_join(polys_1, polys_2, **kwargs):
+  """
+  Identify all intersecting pairs between two collections of polygons.
+  An STRtree on the second collection prunes candidates by bounding box before the exact 
+  intersects test, so the work (and output) scales with the number of hits rather than N x M.
+  Large inputs can be split into chunks of the first collection and run on a process pool 
+  (polygons are sent to the worker processes as WKB): the warm geometry pool if configured 
+  (configure_executor()), otherwise a pool of processes workers started by the first join.
+  Required Args (list): 2 lists of polygons in GeoJSON format (or prepared polygons)
+  Optional kwargs:
+    * overlap_area (bool): also return the overlap area of each intersecting pair (default False)
+    * processes (int): number of worker processes (default 1 - no process pool)
+    * chunk_size (int): polygons of the first collection per worker task (default 1000)
+  Raises: InvalidGeoJson() if any polygon is not a valid GeoJSON Polygon
+  Return (dict): {'pairs': <int>, 'index_1': [<int>, ...], 'index_2': [<int>, ...], 
+                  'overlap_area': [<float>, ...]} ('overlap_area' only if requested)
+  """
+  with_area = bool(kwargs.get("overlap_area", False))
+  processes = kwargs.get("processes", 1)
+  chunk_size = max(1, kwargs.get("chunk_size", 1000))
+
+  ## validate format and convert to shapes
+  try:
+    a_shapes_1 = _collection_shapes(polys_1, 'polygons_1')
+  except Exception as e:
+    raise 
+  try:
+    a_shapes_2 = _collection_shapes(polys_2, 'polygons_2')
+  except Exception as e:
+    raise 
+
+  if processes > 1 and len(a_shapes_1) > chunk_size:
+    log.debug("spatial join", extra={'polygons_1': len(a_shapes_1), 'polygons_2': len(a_shapes_2), 'processes': processes})
+    ## the second collection is written once (WKB GeometryCollection, in a temp file named by the tasks): each worker 
+    ## reads it, and builds its tree, on its first chunk of the join. Chunk tasks only carry their part of the first collection.
+    with tempfile.NamedTemporaryFile(prefix='pgaas-join-', suffix='.wkb', delete=False) as f:
+      f.write(shapely.to_wkb(shapely.geometrycollections(a_shapes_2)))
+    o_executor = _join_executor(processes)
+    try:
+      l_futures = []
+      for offset in range(0, len(a_shapes_1), chunk_size):
+        l_wkb_1 = shapely.to_wkb(a_shapes_1[offset:offset+chunk_size])
+        l_futures.append(o_executor.submit(_join_worker, f.name, offset, l_wkb_1, with_area))
+      l_results = [o_future.result() for o_future in l_futures]
+    except BrokenProcessPool:
+      _reset_join_executor(o_executor) ## i.e. a worker was killed: the next join starts a new pool
+      raise
+    finally:
+      os.remove(f.name)
+    a_idx_1 = np.concatenate([r[0] for r in l_results])
+    a_idx_2 = np.concatenate([r[1] for r in l_results])
+    a_area = np.concatenate([r[2] for r in l_results]) if with_area else None
+  else:
+    (a_idx_1, a_idx_2, a_area) = _join_shapes(a_shapes_1, a_shapes_2, STRtree(a_shapes_2), with_area)
+
+  d_response = {'pairs': len(a_idx_1), 'index_1': a_idx_1.tolist(), 'index_2': a_idx_2.tolist()}
+  if with_area:
+    d_response['overlap_area'] = a_area.tolist()
+
   return(d_response)
 
 ##----------------------------------------------------------------------------------------------
@@ -0,0 +1,186 @@
+"""
+
+  Module: polygon_registry.py
+  Description:
+   Server-side registry of polygons, so that clients can register a (large) polygon once
+   and then reference it by ID in the API payloads: {"polygon_id": <id>}
+
+   The polygon ID is the canonical content hash of the polygon (polygon_geometry.polygon_hash()),
+   so registering the same polygon twice returns the same ID, in every WSGI process.
+
+   Registered polygons are stored as GeoJSON files in a registry directory (shared by all
+   WSGI processes, and surviving restarts). Each process keeps the validated and prepared
+   Shapely geometries (and the grid index of large polygons, for point-in-polygon queries) in 
+   a vertex-bounded LRU cache (polygon_geometry.GeometryCache, GEOMETRY_CACHE_MAX_VERTICES),
+   loading them from the registry directory on first use, so repeat queries against a 
+   registered polygon only cost the geometry predicate.
+   Deleting a polygon removes the stored file: cached copies are dropped on their next use,
+   in every process, since a cache hit is only used while the stored file exists.
+
+  Usage:
+     o_registry = PolygonRegistry(registry_dir, max_vertices=app.config['GEOMETRY_CACHE_MAX_VERTICES'])
+     polygon_id = o_registry.register(d_geojson_poly)
+     prepared_poly = o_registry.get(polygon_id) ## => shapely.prepared.PreparedGeometry
+
+"""
+import os
+import re
+import shapely
+
+## Custom modules
+import json_codec
+import polygon_geometry
+
+## IDs are sha256 hex digests (this also protects against path traversal in the registry dir)
+RE_POLYGON_ID = re.compile(r'^[0-9a-f]{64}$')
+
+##-----------------------------------------------------------------------------------------
+class PolygonNotFound(Exception):
+  pass
+
+##-----------------------------------------------------------------------------------------
+class PolygonRegistry(object):
+  """
+   Registry of validated, prepared polygons keyed by content-hash ID.
+   Required Arg: registry_dir (str|None): directory for storing registered polygons.
+     If None, registered polygons are only kept in memory of the current process (never evicted).
+   Optional Arg: max_vertices (int): size of the cache of prepared polygons, in total vertex count
+     (0: load the polygon from the registry dir on every use)
+  """
+
+  def __init__(self, registry_dir=None, max_vertices=polygon_geometry.GEOMETRY_CACHE_MAX_VERTICES):
+    self.registry_dir = registry_dir
+    ## without a registry dir the cache is the only copy of the polygons
+    self.o_cache = polygon_geometry.GeometryCache(max_vertices if registry_dir else float('inf'))
+    if self.registry_dir:
+      os.makedirs(self.registry_dir, exist_ok=True)
+
+  ##---------------------------------------------------------------------------------------
+  def _path(self, polygon_id):
+    return( os.path.join(self.registry_dir, "%s.json" % (polygon_id)) )
+
+  def _cache(self, polygon_id, prepared_poly):
+    self.o_cache.put(polygon_id, prepared_poly.context, prepared_poly, int(shapely.get_num_coordinates(prepared_poly.context)))
+
+  ##---------------------------------------------------------------------------------------
+  def register(self, obj):
+    """
+     Validate, prepare and store a polygon.
+     Required Arg (json|dict): GeoJSON Polygon
+     Raises: polygon_geometry.InvalidGeoJson() if not a valid GeoJSON Polygon
+     Return (str): polygon_id
+    """
+    d_poly = polygon_geometry.validate_geojson_polygon(obj)
+    polygon_id = polygon_geometry.polygon_hash(d_poly)
+    prepared_poly = polygon_geometry.prepare_polygon(d_poly)
+    polygon_geometry.grid_index(prepared_poly.context) ## if large enough
+
+    if self.registry_dir and not os.path.exists(self._path(polygon_id)):
+      ## write to a temp file then rename, so other processes never see a partial file
+      tmp_path = "%s.%d.tmp" % (self._path(polygon_id), os.getpid())
+      with open(tmp_path, 'wb') as f:
+        f.write(json_codec.dumpb({'type': 'Polygon', 'coordinates': d_poly['coordinates']}))
+      os.replace(tmp_path, self._path(polygon_id))
+
+    self._cache(polygon_id, prepared_poly)
+
+    return( polygon_id )
+
+  ##---------------------------------------------------------------------------------------
+  def get(self, polygon_id):
+    """
+     Get the prepared geometry of a registered polygon.
+     Required Arg (str): polygon_id
+     Raises: PolygonNotFound() if polygon_id is not registered
+     Return: shapely.prepared.PreparedGeometry
+    """
+    if not isinstance(polygon_id, str) or not RE_POLYGON_ID.match(polygon_id):
+      raise PolygonNotFound("Invalid polygon_id: (%s)" % (polygon_id))
+
+    entry = self.o_cache.get(polygon_id)
+    if entry is not None:
+      if not self.registry_dir or os.path.exists(self._path(polygon_id)):
+        return( entry[1] )
+      self.o_cache.pop(polygon_id) ## deleted by another process
+
+    ## registered by another process (or before a restart)?
+    if not self.registry_dir or not os.path.exists(self._path(polygon_id)):
+      raise PolygonNotFound("Unknown polygon_id: (%s)" % (polygon_id))
+    with open(self._path(polygon_id), 'rb') as f:
+      d_poly = json_codec.loads(f.read())
+    prepared_poly = polygon_geometry.prepare_polygon(d_poly)
+    polygon_geometry.grid_index(prepared_poly.context)
+
+    self._cache(polygon_id, prepared_poly)
+
+    return( prepared_poly )
+
+  ##---------------------------------------------------------------------------------------
+  def preload(self, max_polygons=None):
+    """
+     Load (validate and prepare) polygons registered in the registry dir into this process.
+     Optional Arg (int): max polygons to load (None: all)
+     Return (int): number of polygons loaded
+    """
+    if not self.registry_dir:
+      return( 0 )
+    n_loaded = 0
+    for file_name in sorted(os.listdir(self.registry_dir)):
+      if max_polygons is not None and n_loaded >= max_polygons:
+        break
+      (polygon_id, ext) = os.path.splitext(file_name)
+      if ext != '.json' or not RE_POLYGON_ID.match(polygon_id):
+        continue
+      try:
+        self.get(polygon_id)
+        n_loaded += 1
+      except (PolygonNotFound, polygon_geometry.InvalidGeoJson, ValueError): ## deleted meanwhile, or unreadable
+        continue
+    return( n_loaded )
+
+  ##---------------------------------------------------------------------------------------
+  def estimate_vertices(self, polygon_id):
+    """
+     Vertex count of a registered polygon, without loading it (i.e. for admission control).
+     Required Arg (str): polygon_id
+     Return (int): vertex count if loaded in this process, else stored file bytes / 16. 0 if not registered.
+    """
+    entry = self.o_cache.d_entries.get(polygon_id, None)
+    if entry is not None:
+      return( entry[2] )
+    if not self.registry_dir or not isinstance(polygon_id, str) or not RE_POLYGON_ID.match(polygon_id):
+      return( 0 )
+    try:
+      return( os.path.getsize(self._path(polygon_id)) // 16 )
+    except OSError:
+      return( 0 )
+
+  ##---------------------------------------------------------------------------------------
+  def delete(self, polygon_id):
+    """
+     Remove a registered polygon.
+     Required Arg (str): polygon_id
+     Return (bool): True if polygon was registered
+    """
+    if not isinstance(polygon_id, str) or not RE_POLYGON_ID.match(polygon_id):
+      return( False )
+    found = self.o_cache.pop(polygon_id)
+    if self.registry_dir:
+      try:
+        os.remove(self._path(polygon_id))
+        found = True
+      except FileNotFoundError:
+        pass
+    return( found )
+
+  ##---------------------------------------------------------------------------------------
+  def resolve(self, obj):
+    """
+     Resolve a polygon argument from an API payload.
+     Required Arg (dict): inline GeoJSON Polygon, or a reference {"polygon_id": <id>}
+     Raises: PolygonNotFound() if the referenced polygon_id is not registered
+     Return: PreparedGeometry for references, otherwise the input object unchanged
+    """
+    if isinstance(obj, dict) and 'polygon_id' in obj and 'type' not in obj:
+      return( self.get(obj['polygon_id']) )
+    return( obj )
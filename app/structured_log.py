@@ -0,0 +1,210 @@
+"""
+  File: structured_log.py
+  Description:
+   Structured (JSON lines) logging that does not block the request thread on I/O.
+
+   Loggers (get_logger()) are children of the "pgaas" logger. configure_logging() gives it a
+   QueueHandler: the request thread only filters (level, sampling), snapshots the record (message,
+   extra fields and traceback as text, with values longer than max_chars truncated, and tracebacks 
+   to their last 4 x max_chars) and puts it on
+   a bounded queue, without waiting. A background thread (QueueListener) encodes the records as JSON
+   and writes them to stderr (under mod_wsgi, the apache error log) or to a log file. When the queue
+   is full, records are dropped and counted (the "dropped" field of the next record written).
+
+   Records below WARNING are kept with probability sample_rate (WARNING and above are always kept).
+   Extra fields are passed as keyword "extra" (i.e. log.debug("request", extra={'path': path})),
+   and are only rendered (bounded repr: large payloads cost the same as small ones) if the record
+   is kept. Until configure_logging() is called, records propagate to the root logger as usual.
+
+   Example record:
+     {"ts": "2026-10-18T11:38:41.123Z", "level": "DEBUG", "logger": "pgaas.routes", "pid": 123,
+      "msg": "point in polygon", "path": "/api/point_in_polygon", "payload": "{'api_key': ..."}
+"""
+import os
+import sys
+import json
+import time
+import queue
+import atexit
+import random
+import reprlib
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+
+try:
+  from flask import has_request_context, request
+except ImportError: ## polygon_geometry in a process without flask
+  has_request_context = None
+
+ROOT_LOGGER_NAME = 'pgaas'
+
+## LogRecord attributes (not extra fields)
+_RECORD_ATTRS = frozenset(logging.LogRecord('', 0, '', 0, '', (), None).__dict__) | {'message', 'asctime'}
+
+##----------------------------------------------------------------------------------------------
+def get_logger(name):
+  """
+  Required Arg (str): module name, i.e. "polygon_geometry"
+  Return (logging.Logger): the "pgaas.<name>" logger
+  """
+  return( logging.getLogger("%s.%s" % (ROOT_LOGGER_NAME, name)) )
+
+##----------------------------------------------------------------------------------------------
+class SamplingFilter(logging.Filter):
+  """ Keep records below WARNING with probability sample_rate """
+
+  def __init__(self, sample_rate=1.0):
+    super().__init__()
+    self.sample_rate = sample_rate
+
+  def filter(self, record):
+    if record.levelno >= logging.WARNING or self.sample_rate >= 1.0:
+      return( True )
+    return( random.random() < self.sample_rate )
+
+##----------------------------------------------------------------------------------------------
+class AsyncQueueHandler(QueueHandler):
+  """ Snapshot a record (bounded), and put it on the queue without blocking: drop it (and count it) if the queue is full """
+
+  def __init__(self, o_queue, max_chars=500):
+    super().__init__(o_queue)
+    self.max_chars = max_chars
+    self.dropped = 0
+    self.o_repr = reprlib.Repr()
+    self.o_repr.maxlevel = 4
+    self.o_repr.maxstring = max_chars
+    self.o_repr.maxother = max_chars
+    self.o_repr.maxlong = 40
+
+  ## tracebacks: each line truncated to max_chars, and the last TRACEBACK_MAX_CHARS x max_chars chars kept (the exception)
+  TRACEBACK_MAX_CHARS = 4
+
+  def truncate(self, text):
+    if len(text) > self.max_chars:
+      return( "%s...(%d chars)" % (text[:self.max_chars], len(text)) )
+    return( text )
+
+  def truncate_traceback(self, text):
+    text = "\n".join(self.truncate(line) for line in text.splitlines())
+    max_chars = self.TRACEBACK_MAX_CHARS * self.max_chars
+    if len(text) > max_chars:
+      return( "(%d chars)...%s" % (len(text), text[-max_chars:]) )
+    return( text )
+
+  def prepare(self, record):
+    """ Return (LogRecord): a copy with msg (args applied), extra fields and traceback rendered as text """
+    d_fields = {}
+    for (key, value) in record.__dict__.items():
+      if key not in _RECORD_ATTRS:
+        d_fields[key] = value if isinstance(value, (bool, int, float, type(None))) else self.truncate(value if isinstance(value, str) else self.o_repr.repr(value))
+    if has_request_context is not None and has_request_context() and 'path' not in d_fields:
+      d_fields['path'] = request.path
+    exc_text = record.exc_text
+    if record.exc_info and not exc_text:
+      exc_text = logging.Formatter().formatException(record.exc_info)
+    if exc_text:
+      exc_text = self.truncate_traceback(exc_text)
+    o_record = logging.makeLogRecord({'name': record.name, 'levelno': record.levelno, 'levelname': record.levelname,
+                                      'created': record.created, 'process': record.process, 'msg': self.truncate(record.getMessage()),
+                                      'exc_text': exc_text, 'fields': d_fields})
+    return( o_record )
+
+  def enqueue(self, record):
+    if self.dropped:
+      record.fields['dropped'] = self.dropped
+    try:
+      self.queue.put_nowait(record)
+      self.dropped = 0
+    except queue.Full:
+      self.dropped += 1
+
+##----------------------------------------------------------------------------------------------
+class JsonFormatter(logging.Formatter):
+  """ One JSON object per record (records prepared by AsyncQueueHandler) """
+
+  def format(self, record):
+    d_record = {'ts': "%s.%03dZ" % (time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)), int(record.created * 1000) % 1000),
+                'level': record.levelname, 'logger': record.name, 'pid': record.process, 'msg': record.msg}
+    d_record.update(getattr(record, 'fields', {}))
+    if record.exc_text:
+      d_record['traceback'] = record.exc_text
+    return( json.dumps(d_record, default=str) )
+
+##----------------------------------------------------------------------------------------------
+class Listener(QueueListener):
+  """ Background thread writing the queued records """
+
+  def __init__(self, o_queue, log_file=None):
+    super().__init__(o_queue, _output_handler(log_file))
+    self.log_file = log_file
+
+  def enqueue_sentinel(self):
+    self.queue.put(self._sentinel) ## waits for room (the thread is emptying the queue)
+
+  def stop(self):
+    if self._thread is not None:
+      super().stop()
+
+##----------------------------------------------------------------------------------------------
+## The configured handler/listener (None until configure_logging())
+QUEUE_HANDLER = None
+LISTENER = None
+_LOCK = threading.Lock()
+
+def _output_handler(log_file):
+  o_handler = logging.FileHandler(log_file) if log_file else logging.StreamHandler(sys.stderr)
+  o_handler.setFormatter(JsonFormatter())
+  return( o_handler )
+
+def configure_logging(level='INFO', log_file=None, sample_rate=1.0, max_chars=500, queue_size=10000):
+  """
+  (Re)configure the "pgaas" loggers: structured records written by a background thread.
+  Optional Arg (str|int): level of the "pgaas" logger, i.e. "DEBUG"
+  Optional Arg (str): log file path (default: stderr). Its directory is created if missing.
+  Optional Arg (float): fraction of the records below WARNING to keep
+  Optional Arg (int): max chars of the message and of each extra field
+  Optional Arg (int): max records waiting to be written (then records are dropped)
+  Return (AsyncQueueHandler)
+  """
+  global QUEUE_HANDLER, LISTENER
+  with _LOCK:
+    o_logger = logging.getLogger(ROOT_LOGGER_NAME)
+    if QUEUE_HANDLER is not None:
+      o_logger.removeHandler(QUEUE_HANDLER)
+      LISTENER.stop()
+    if log_file:
+      os.makedirs(os.path.dirname(os.path.abspath(log_file)), exist_ok=True)
+    QUEUE_HANDLER = AsyncQueueHandler(queue.Queue(maxsize=queue_size), max_chars=max_chars)
+    QUEUE_HANDLER.addFilter(SamplingFilter(sample_rate))
+    LISTENER = Listener(QUEUE_HANDLER.queue, log_file)
+    LISTENER.start()
+    o_logger.addHandler(QUEUE_HANDLER)
+    o_logger.setLevel(level)
+    o_logger.propagate = False
+  return( QUEUE_HANDLER )
+
+def flush_logging():
+  """ Write the queued records (stops and restarts the background thread) """
+  with _LOCK:
+    if LISTENER is not None:
+      LISTENER.stop()
+      LISTENER.start()
+
+def _stop_listener():
+  if LISTENER is not None:
+    LISTENER.stop()
+
+def _reset_after_fork():
+  """ The background thread does not survive a fork: new queue and thread in the child (records queued before the fork are the parent's) """
+  global LISTENER, _LOCK
+  _LOCK = threading.Lock()
+  if QUEUE_HANDLER is not None:
+    log_file = LISTENER.log_file
+    QUEUE_HANDLER.queue = queue.Queue(maxsize=QUEUE_HANDLER.queue.maxsize)
+    LISTENER = Listener(QUEUE_HANDLER.queue, log_file)
+    LISTENER.start()
+
+atexit.register(_stop_listener)
+if hasattr(os, 'register_at_fork'):
+  os.register_at_fork(after_in_child=_reset_after_fork)
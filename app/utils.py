@@ -3,6 +3,7 @@
  Description: Common util functions for Flask app
 
 """
+import os
 import datetime
 
 ##----------------------------------------------------------------------------------------------
@@ -24,3 +25,36 @@ def gmt_now(format=None):
   return(gmtime_now)
 
 ##----------------------------------------------------------------------------------------------
+def pid_alive(pid):
+  """ 
+    Check if a process exists (on this host).
+    Args:
+     * pid (int|None)
+    Return: (bool) True if the process exists
+  """ 
+  if not pid:
+    return( False )
+  try:
+    os.kill(pid, 0)
+  except ProcessLookupError:
+    return( False )
+  except PermissionError:
+    pass
+  return( True )
+
+##----------------------------------------------------------------------------------------------
+def process_uptime():
+  """ 
+    Seconds since this process started (Linux /proc).
+    Return: (float|None) None if not available
+  """ 
+  try:
+    with open('/proc/self/stat') as f:
+      start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+    with open('/proc/uptime') as f:
+      uptime = float(f.read().split()[0])
+  except (OSError, IndexError, ValueError):
+    return( None )
+  return( uptime - start_ticks / os.sysconf('SC_CLK_TCK') )
+
+##----------------------------------------------------------------------------------------------
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+"""
+
+  File: bench_admission.py
+  Description:
+   Interactive latency under abuse, with and without admission control (ADMISSION_* in config.py).
+   The server (uvicorn with app/pgaas_asgi.py, ASGI_THREADS request threads) runs in its own process.
+   --abusers clients send overlap-area requests of two --abuse-vertices synthetic polygons in a loop
+   (retrying after Retry-After when rejected), while load_test.py workers (--concurrency) send the
+   states intersection/point-in-polygon mix for --duration seconds. Reports the latency of the
+   interactive requests, and the responses of the abusive requests by status.
+
+   All clients share the one API_KEY: the per api-key budgets would also throttle the interactive
+   clients, so they are disabled here (ADMISSION_KEY_COST_RATE = 0). This measures the heavy request slots.
+
+   Requires uvicorn (pip install uvicorn).
+
+  Usage (from pGaaS dir):
+    $ python benchmarks/bench_admission.py [--abusers 8] [--abuse-vertices 100000] [--duration 10] [--concurrency 2]
+                                              [--heavy-concurrency 1]
+
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import argparse
+import threading
+import subprocess
+from collections import Counter
+
+from bench_utils import synthetic_polygon
+import load_test
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'app')
+
+##----------------------------------------------------------------------------------------------
+def serve(admission, port, heavy_concurrency):
+  """ Run in a subprocess (bench_admission.py --serve on|off PORT HEAVY_CONCURRENCY) """
+  sys.path.insert(0, APP_DIR)
+  import config
+  config.BaseConfig.ADMISSION_ENABLED = admission
+  config.BaseConfig.ADMISSION_KEY_COST_RATE = 0
+  config.BaseConfig.ADMISSION_HEAVY_CONCURRENCY = heavy_concurrency
+  config.BaseConfig.JOB_WORKER_PROCESSES = 0
+  import uvicorn
+  from pgaas_asgi import application
+  uvicorn.run(application, host='127.0.0.1', port=port, log_level='warning')
+
+def start_server(admission, port, heavy_concurrency):
+  o_process = subprocess.Popen([sys.executable, os.path.realpath(__file__), '--serve', admission, str(port), str(heavy_concurrency)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+  for i in range(300):
+    try:
+      socket.create_connection(('127.0.0.1', port), timeout=1).close()
+      return( o_process )
+    except OSError:
+      time.sleep(0.1)
+  o_process.kill()
+  raise RuntimeError("server did not start")
+
+##----------------------------------------------------------------------------------------------
+def abuser(o_target, body, t_end, o_counts, lock):
+  """ Send heavy requests until t_end, backing off for Retry-After seconds (approximated: 1s) when rejected """
+  send = o_target.sender()
+  while time.monotonic() < t_end:
+    try:
+      (status, response) = send(load_test.D_ENDPOINTS['overlap'], body)
+    except OSError:
+      status = 'connection error'
+    with lock:
+      o_counts[status] += 1
+    if status in (429, 503):
+      time.sleep(1.0)
+
+def run_case(admission, port, o_args, d_bodies, l_mix, abuse_body):
+  o_process = start_server(admission, port, o_args.heavy_concurrency)
+  try:
+    o_target = load_test.HttpTarget("http://127.0.0.1:%d" % (port))
+    (o_counts, lock) = (Counter(), threading.Lock())
+    t_end = time.monotonic() + o_args.duration + 1.0
+    l_threads = [threading.Thread(target=abuser, args=(o_target, abuse_body, t_end, o_counts, lock)) for i in range(o_args.abusers)]
+    for o_thread in l_threads:
+      o_thread.start()
+    time.sleep(1.0)
+    (elapsed, d_latencies, d_errors) = load_test.run_load(o_target, d_bodies, l_mix, o_args.concurrency, o_args.duration)
+    for o_thread in l_threads:
+      o_thread.join()
+  finally:
+    o_process.kill()
+    o_process.wait()
+  d_report = load_test.report(elapsed, d_latencies, d_errors)['all']
+  d_report.update({'admission': admission, 'abuse': dict(o_counts)})
+  return( d_report )
+
+##----------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+
+  o_parser = argparse.ArgumentParser(description='interactive latency under abuse, with/without admission control')
+  o_parser.add_argument('--abusers', type=int, default=8, help='clients sending heavy requests (default: %(default)s)')
+  o_parser.add_argument('--abuse-vertices', type=int, default=100000, help='vertices of each polygon of a heavy request (default: %(default)s)')
+  o_parser.add_argument('--duration', type=float, default=10.0, help='seconds of interactive requests (default: %(default)s)')
+  o_parser.add_argument('--concurrency', type=int, default=2, help='interactive clients (default: %(default)s)')
+  o_parser.add_argument('--heavy-concurrency', type=int, default=1, help='ADMISSION_HEAVY_CONCURRENCY of the server (default: %(default)s)')
+  o_parser.add_argument('--port', type=int, default=8093)
+  o_parser.add_argument('--serve', nargs=3, help=argparse.SUPPRESS)
+  o_args = o_parser.parse_args()
+
+  if o_args.serve:
+    serve(o_args.serve[0] == 'on', int(o_args.serve[1]), int(o_args.serve[2]))
+    sys.exit(0)
+
+  l_mix = load_test.parse_mix('intersection=1,pip=1')
+  l_pairs = load_test.base_polygon_pairs('states')
+  d_bodies = {name: load_test.make_bodies(name, l_pairs, 50, random.Random(0)) for (name, weight) in l_mix}
+  l_abuse = [synthetic_polygon(o_args.abuse_vertices, seed=1, jitter=0.02), synthetic_polygon(o_args.abuse_vertices, center=(0.5, 0.3), seed=2, jitter=0.02)]
+  abuse_body = json.dumps({'api_key': load_test.API_KEY, 'polygons': l_abuse}).encode()
+
+  print("%d abusers (%d byte overlap-area bodies), %d interactive clients for %.0fs" % (o_args.abusers, len(abuse_body), o_args.concurrency, o_args.duration))
+  print("%-9s %9s %9s %8s %10s %10s %10s  %s" % ('admission', 'requests', 'req/sec', 'errors', 'p50(ms)', 'p99(ms)', 'max(ms)', 'abusive responses'))
+  for (i, admission) in enumerate(('off', 'on')):
+    d_report = run_case(admission, o_args.port + i, o_args, d_bodies, l_mix, abuse_body)
+    print("%-9s %9d %9.1f %7.2f%% %10.2f %10.2f %10.2f  %s" % (admission, d_report['requests'], d_report['rps'], d_report['error_rate'] * 100,
+          d_report['p50'], d_report['p99'], d_report['max'], ', '.join("%s: %d" % (status, n) for (status, n) in sorted(d_report['abuse'].items(), key=str))))
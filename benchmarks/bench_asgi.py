@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+"""
+
+  File: bench_asgi.py
+  Description:
+   WSGI vs ASGI serving (pgaas_asgi.py) with slow clients. Each server runs in its own process
+   with the same number of request threads (ASGI_THREADS in config.py):
+    * wsgi: a WSGI server with a fixed pool of request threads, each thread serving one connection
+      from its first byte (like a mod_wsgi daemon process with threads=N)
+    * asgi: uvicorn with the ASGI adapter (bodies received by the event loop, requests run on N threads)
+   --slow clients send a point-in-polygon request (montana) with the body trickled over --slow-seconds,
+   while load_test.py workers (--concurrency) send the intersection/overlap/point-in-polygon mix for
+   --duration seconds. Reports the latency of the fast requests and how many slow requests completed.
+
+   Requires uvicorn (pip install uvicorn).
+
+  Usage (from pGaaS dir):
+    $ python benchmarks/bench_asgi.py [--slow 1000] [--slow-seconds 12] [--duration 10] [--concurrency 4]
+
+"""
+import os
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from bench_utils import load_state
+import load_test
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'app')
+
+##----------------------------------------------------------------------------------------------
+##
+## Servers (run in a subprocess: bench_asgi.py --serve wsgi|asgi PORT)
+##
+def serve_wsgi(port):
+  from wsgiref.simple_server import WSGIServer, WSGIRequestHandler, make_server
+  from pgaas_flask import app
+
+  class QuietHandler(WSGIRequestHandler):
+    def log_message(self, *args):
+      pass
+
+  class PooledWSGIServer(WSGIServer):
+    """ Fixed pool of request threads: a connection holds a thread until its response is sent """
+    request_queue_size = 4096
+    executor = ThreadPoolExecutor(max_workers=app.config['ASGI_THREADS'])
+
+    def process_request(self, request, client_address):
+      self.executor.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+      try:
+        self.finish_request(request, client_address)
+      except Exception:
+        self.handle_error(request, client_address)
+      finally:
+        self.shutdown_request(request)
+
+  make_server('127.0.0.1', port, app, server_class=PooledWSGIServer, handler_class=QuietHandler).serve_forever()
+
+def serve_asgi(port):
+  import uvicorn
+  from pgaas_asgi import application
+  uvicorn.run(application, host='127.0.0.1', port=port, log_level='warning', backlog=4096)
+
+def start_server(kind, port):
+  o_process = subprocess.Popen([sys.executable, os.path.realpath(__file__), '--serve', kind, str(port)], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+  for i in range(300):
+    try:
+      socket.create_connection(('127.0.0.1', port), timeout=1).close()
+      return( o_process )
+    except OSError:
+      time.sleep(0.1)
+  o_process.kill()
+  raise RuntimeError("%s server did not start" % (kind))
+
+def max_rss_mb(pid):
+  with open('/proc/%d/status' % (pid)) as f:
+    for line in f:
+      if line.startswith('VmHWM:'):
+        return( int(line.split()[1]) / 1024 )
+  return( float('nan') )
+
+##----------------------------------------------------------------------------------------------
+##
+## Slow clients (asyncio, in a thread of this process)
+##
+async def slow_request(port, body, seconds, n_chunks=10):
+  """ Return (bool): a 200 response, after sending the body in n_chunks over seconds """
+  try:
+    (o_reader, o_writer) = await asyncio.open_connection('127.0.0.1', port)
+    o_writer.write(b"POST /api/point_in_polygon HTTP/1.1\r\nHost: localhost\r\nContent-Type: application/json\r\nContent-Length: %d\r\nConnection: close\r\n\r\n" % (len(body)))
+    size = len(body) // n_chunks + 1
+    for i in range(n_chunks):
+      await asyncio.sleep(seconds / n_chunks)
+      o_writer.write(body[i*size:(i+1)*size])
+      await o_writer.drain()
+    response = await o_reader.read()
+    o_writer.close()
+    return( response.split(b' ', 2)[1:2] == [b'200'] and b'is_within' in response )
+  except OSError:
+    return( False )
+
+async def slow_clients(port, n_clients, seconds, body):
+  l_tasks = []
+  for i in range(n_clients):
+    l_tasks.append(asyncio.ensure_future(slow_request(port, body, seconds)))
+    if i % 100 == 99:
+      await asyncio.sleep(0.01) ## ramp up
+  return( await asyncio.gather(*l_tasks) )
+
+##----------------------------------------------------------------------------------------------
+def run_case(kind, port, o_args, d_bodies, l_mix, slow_body):
+  o_process = start_server(kind, port)
+  try:
+    d_slow = {}
+    o_thread = threading.Thread(target=lambda: d_slow.update(results=asyncio.run(slow_clients(port, o_args.slow, o_args.slow_seconds, slow_body))))
+    o_thread.start()
+    time.sleep(1.0)
+    (elapsed, d_latencies, d_errors) = load_test.run_load(load_test.HttpTarget("http://127.0.0.1:%d" % (port)), d_bodies, l_mix, o_args.concurrency, o_args.duration)
+    o_thread.join()
+    rss = max_rss_mb(o_process.pid)
+  finally:
+    o_process.kill()
+    o_process.wait()
+  d_report = load_test.report(elapsed, d_latencies, d_errors)['all']
+  d_report.update({'server': kind, 'slow_ok': sum(d_slow['results']), 'rss_mb': rss})
+  return( d_report )
+
+##----------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+
+  o_parser = argparse.ArgumentParser(description='WSGI vs ASGI serving with slow clients')
+  o_parser.add_argument('--slow', type=int, default=1000, help='slow clients (default: %(default)s)')
+  o_parser.add_argument('--slow-seconds', type=float, default=12.0, help='seconds to send each slow body (default: %(default)s)')
+  o_parser.add_argument('--duration', type=float, default=10.0, help='seconds of fast requests (default: %(default)s)')
+  o_parser.add_argument('--concurrency', type=int, default=4, help='fast clients (default: %(default)s)')
+  o_parser.add_argument('--port', type=int, default=8091)
+  o_parser.add_argument('--servers', default='wsgi,asgi')
+  o_parser.add_argument('--serve', nargs=2, help=argparse.SUPPRESS)
+  o_args = o_parser.parse_args()
+
+  if o_args.serve:
+    sys.path.insert(0, APP_DIR)
+    (serve_wsgi if o_args.serve[0] == 'wsgi' else serve_asgi)(int(o_args.serve[1]))
+    sys.exit(0)
+
+  l_mix = load_test.parse_mix('intersection=1,overlap=1,pip=1')
+  l_pairs = load_test.base_polygon_pairs('states')
+  d_bodies = {name: load_test.make_bodies(name, l_pairs, 50, random.Random(0)) for (name, weight) in l_mix}
+  slow_body = json.dumps({'api_key': load_test.API_KEY, 'point': {'type': 'Point', 'coordinates': [-110.0, 47.0]}, 'polygon': load_state('montana')}).encode()
+
+  print("%d slow clients (%d byte bodies over %.0fs), %d fast clients for %.0fs" % (o_args.slow, len(slow_body), o_args.slow_seconds, o_args.concurrency, o_args.duration))
+  print("%-6s %9s %9s %8s %10s %10s %10s %12s %10s" % ('server', 'requests', 'req/sec', 'errors', 'p50(ms)', 'p99(ms)', 'max(ms)', 'slow_ok', 'rss(MB)'))
+  for (i, kind) in enumerate(o_args.servers.split(',')):
+    d_report = run_case(kind, o_args.port + i, o_args, d_bodies, l_mix, slow_body)
+    print("%-6s %9d %9.1f %7.2f%% %10.2f %10.2f %10.2f %7d/%-4d %10.0f" % (kind, d_report['requests'], d_report['rps'], d_report['error_rate'] * 100,
+          d_report['p50'], d_report['p99'], d_report['max'], d_report['slow_ok'], o_args.slow, d_report['rss_mb']))
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""
+
+  File: bench_binary_input.py
+  Description: 
+   End-to-end latency of /api/polygon_intersection (Flask test client, no network) with the
+   polygons sent as JSON GeoJSON, WKB, or a packed float64 coordinate buffer.
+   Intersects on prepared polygons is cheap, so this mostly measures payload decoding and
+   polygon construction. Run with the geometry cache disabled (every request decodes and
+   builds the polygons) and enabled (repeat polygons: decode + hash only).
+
+  Usage (from pGaaS dir):
+    $ python benchmarks/bench_binary_input.py [iterations]
+
+"""
+import sys
+import json
+import time
+
+import shapely
+from shapely.geometry import shape
+from bench_utils import load_state, synthetic_polygon
+import app_factory
+import polygon_geometry
+
+API_KEY = 'fanselow-pgass-test'
+
+##----------------------------------------------------------------------------------------------
+def time_requests(o_client, body, content_type, iterations):
+  """ Return mean seconds per request """
+  t_start = time.perf_counter()
+  for i in range(iterations):
+    o_response = o_client.post('/api/polygon_intersection', data=body, headers={'Content-Type': content_type, 'X-Api-Key': API_KEY})
+  assert 'intersects' in o_response.get_json(), o_response.get_json()
+  return( (time.perf_counter() - t_start) / iterations )
+
+##----------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+
+  iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+  app = app_factory.create_app({})
+
+  ## repeated identical queries: time the computation, not the result cache
+  polygon_geometry.configure_result_cache(0)
+  o_client = app.test_client()
+
+  l_cases = [
+    ('colorado+montana', load_state('colorado'), load_state('montana')),
+    ('2 x 100000 vertices', synthetic_polygon(100000, seed=1), synthetic_polygon(100000, center=(0.5, 0.3), seed=2)),
+  ]
+
+  print("%-20s %-6s %-7s %10s %10s %8s" % ('payload', 'cache', 'format', 'bytes', 'ms/req', 'speedup'))
+  for (name, d_poly_1, d_poly_2) in l_cases:
+    d_bodies = {
+      'json': (json.dumps({'polygons': [d_poly_1, d_poly_2]}), 'application/json'),
+      'wkb': (shapely.to_wkb(shapely.GeometryCollection([shape(d_poly_1), shape(d_poly_2)])), 'application/wkb'),
+      'coords': (polygon_geometry.geometries_to_coords([d_poly_1, d_poly_2]), 'application/x-pgaas-coords'),
+    }
+    for cache_vertices in (0, polygon_geometry.GEOMETRY_CACHE_MAX_VERTICES):
+      polygon_geometry.configure_geometry_cache(cache_vertices)
+      t_json = None
+      for (fmt, (body, content_type)) in d_bodies.items():
+        t_request = time_requests(o_client, body, content_type, iterations)
+        t_json = t_json or t_request
+        print("%-20s %-6s %-7s %10d %10.2f %7.1fx" % (name, 'on' if cache_vertices else 'off', fmt, len(body), t_request*1e3, t_json/t_request))
@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+"""
+
+  File: bench_bulk.py
+  Description:
+   Offline bulk processing (bulk_processing.BulkRun, see app/pgaas_bulk.py) of synthetic Features
+   (polygons of --vertices vertices around Montana, or points over its bounding box) against
+   data/montana.json, from a GeoJSON FeatureCollection and from NDJSON:
+    * MB, scan(MB/s): input size, and the rate of the record scanner alone (memory-mapped input,
+      feature boundaries / lines, no parsing)
+    * inline, pool: records/sec of the whole run (parse, query, CSV output) in this process
+      (processes=0), and on the process pool (--processes, default: number of CPUs)
+   The pool only helps with more than one CPU core.
+
+  Usage (from pGaaS dir):
+    $ python benchmarks/bench_bulk.py [--features 20000] [--vertices 50] [--processes N]
+
+"""
+import os
+import time
+import random
+import argparse
+import tempfile
+
+from bench_utils import load_state, synthetic_polygon
+import json_codec
+import bulk_processing
+from bulk_processing import BulkRun
+
+##----------------------------------------------------------------------------------------------
+def make_features(kind, n_features, n_vertices):
+  o_random = random.Random(0)
+  for i in range(n_features):
+    (x, y) = (o_random.uniform(-116.0, -104.0), o_random.uniform(44.5, 49.0))
+    if kind == 'points':
+      d_geometry = {'type': 'Point', 'coordinates': [x, y]}
+    else:
+      d_geometry = synthetic_polygon(n_vertices, center=(x, y), radius=o_random.uniform(0.05, 0.5), seed=i)
+    yield( {'type': 'Feature', 'id': i, 'properties': {'name': "feature %d" % (i)}, 'geometry': d_geometry} )
+
+def write_inputs(dir_path, kind, n_features, n_vertices):
+  """ Same features as a FeatureCollection (.geojson) and NDJSON. Return (list): [(format, path)] """
+  (fc_path, nd_path) = (os.path.join(dir_path, kind + '.geojson'), os.path.join(dir_path, kind + '.ndjson'))
+  with open(fc_path, 'wb') as f_fc, open(nd_path, 'wb') as f_nd:
+    f_fc.write(b'{"type": "FeatureCollection", "features": [\n')
+    for (i, d_feature) in enumerate(make_features(kind, n_features, n_vertices)):
+      f_fc.write((b',\n' if i else b'') + json_codec.dumpb(d_feature))
+      f_nd.write(json_codec.dumpb(d_feature) + b'\n')
+    f_fc.write(b'\n]}\n')
+  return( [('featurecollection', fc_path), ('ndjson', nd_path)] )
+
+def scan_rate(input_format, path):
+  t_start = time.perf_counter()
+  o_buffer = bulk_processing.open_input(path)
+  n_records = sum(1 for record in bulk_processing.D_INPUT_READERS[input_format](o_buffer))
+  seconds = time.perf_counter() - t_start
+  return( n_records, len(o_buffer) / 2**20, len(o_buffer) / 2**20 / seconds )
+
+def run_rate(input_path, output_path, op, d_montana, processes):
+  d_stats = BulkRun(input_path, output_path, op=op, polygon=d_montana, processes=processes).run()
+  return( d_stats['records'] / d_stats['seconds'] )
+
+##----------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+
+  o_parser = argparse.ArgumentParser(description='offline bulk processing throughput')
+  o_parser.add_argument('--features', type=int, default=20000, help='features per input (default: %(default)s)')
+  o_parser.add_argument('--vertices', type=int, default=50, help='vertices per polygon feature (default: %(default)s)')
+  o_parser.add_argument('--processes', type=int, default=os.cpu_count(), help='pool size (default: %(default)s)')
+  o_args = o_parser.parse_args()
+
+  d_montana = load_state('montana')
+  l_cases = [('polygons', 'polygon_intersection'), ('polygons', 'polygon_overlap_area'), ('points', 'point_in_polygon')]
+
+  print("%d features, %d vertices per polygon, %d cpu(s), pool of %d process(es)" % (o_args.features, o_args.vertices, os.cpu_count(), o_args.processes))
+  print("%-22s %-18s %8s %10s %10s %12s" % ('op', 'input', 'MB', 'scan(MB/s)', 'inline', 'pool'))
+  with tempfile.TemporaryDirectory() as dir_path:
+    output_path = os.path.join(dir_path, 'results.csv')
+    d_inputs = {}
+    for (kind, op) in l_cases:
+      if kind not in d_inputs:
+        d_inputs[kind] = write_inputs(dir_path, kind, o_args.features, o_args.vertices)
+      for (input_format, input_path) in d_inputs[kind]:
+        (n_records, size_mb, scan_mb_sec) = scan_rate(input_format, input_path)
+        assert n_records == o_args.features
+        inline = run_rate(input_path, output_path, op, d_montana, 0)
+        pool = run_rate(input_path, output_path, op, d_montana, o_args.processes)
+        print("%-22s %-18s %8.1f %10.0f %10.0f %12.0f" % (op, input_format, size_mb, scan_mb_sec, inline, pool))
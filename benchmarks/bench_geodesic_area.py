@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+
+  File: bench_geodesic_area.py
+  Description:
+   Speed/accuracy of the geodesic overlap area (get_overlap_area(units='km2')) on lon/lat polygons:
+   data/montana.json against a shifted copy, and two synthetic polygons (centered at -100, 45).
+    * overlap(ms): get_overlap_area(), planar (square degrees) and geodesic (km2)
+    * area(ms): polygon_geometry.geodesic_area() of the intersection alone (vectorized), and the same
+      quadrature as a per-vertex python loop
+    * rel_error: vs the geodesic area of the intersection densified to 0.001 degree edges
+    * sphere: relative difference of a spherical area (mean earth radius, Chamberlain-Duquette formula)
+
+  Usage (from pGaaS dir):
+    $ python benchmarks/bench_geodesic_area.py [n_vertices]
+
+"""
+import sys
+import math
+import time
+import numpy as np
+
+from bench_utils import load_state, synthetic_polygon
+from bench_overlap_lod import shifted
+import polygon_geometry
+from polygon_geometry import shapely, geodesic_area
+
+N_CALLS = 20
+EARTH_MEAN_RADIUS = 6371008.8
+
+##----------------------------------------------------------------------------------------------
+def time_calls(func, n_calls=N_CALLS):
+  t_start = time.perf_counter()
+  for i in range(n_calls):
+    result = func()
+  return( result, (time.perf_counter() - t_start) / n_calls * 1e3 )
+
+def loop_area(geom):
+  """ geodesic_area() in km2, one edge at a time (python loop) """
+  (e2, q_pole) = (polygon_geometry._E2, polygon_geometry._Q_POLE)
+  e = e2 ** 0.5
+  def q(sin_lat):
+    return( (1 - e2) * (sin_lat / (1 - e2 * sin_lat ** 2) - math.log((1 - e * sin_lat) / (1 + e * sin_lat)) / (2 * e)) )
+  area = 0.0
+  for o_poly in shapely.get_parts(geom):
+    for (i, o_ring) in enumerate([o_poly.exterior] + list(o_poly.interiors)):
+      ring_area = 0.0
+      l_coords = list(o_ring.coords)
+      for ((lon_1, lat_1), (lon_2, lat_2)) in zip(l_coords[:-1], l_coords[1:]):
+        (lat_1, dlat) = (math.radians(lat_1), math.radians(lat_2 - lat_1))
+        sin_beta = sum(w * q(math.sin(lat_1 + t * dlat)) / q_pole for (t, w) in zip(polygon_geometry._GL_NODES, polygon_geometry._GL_WEIGHTS))
+        ring_area += math.radians(lon_2 - lon_1) * sin_beta
+      area += abs(ring_area) if i == 0 else -abs(ring_area)
+  return( area * polygon_geometry._AUTHALIC_R2 * 1e-6 )
+
+def sphere_area(geom):
+  """ Spherical area in km2: Chamberlain & Duquette, "Some algorithms for polygons on a sphere" (2007) """
+  area = 0.0
+  for o_poly in shapely.get_parts(geom):
+    for (i, o_ring) in enumerate([o_poly.exterior] + list(o_poly.interiors)):
+      a_coords = shapely.get_coordinates(o_ring)[:-1]
+      (a_lon, a_lat) = (np.radians(a_coords[:, 0]), np.radians(a_coords[:, 1]))
+      ring_area = abs(((np.roll(a_lon, -1) - np.roll(a_lon, 1)) * np.sin(a_lat)).sum()) / 2
+      area += ring_area if i == 0 else -ring_area
+  return( area * EARTH_MEAN_RADIUS ** 2 * 1e-6 )
+
+##----------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+
+  n_vertices = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+
+  ## repeated identical queries: time the computation, not the result cache
+  polygon_geometry.configure_result_cache(0)
+
+  d_montana = load_state('montana')
+  l_cases = [
+    ('montana+shifted', d_montana, shifted(d_montana, 1.0, 0.5)),
+    ('synthetic %d' % (n_vertices), synthetic_polygon(n_vertices, center=(-100.0, 45.0), radius=3.0, seed=1, jitter=0.02),
+                                    synthetic_polygon(n_vertices, center=(-98.5, 45.9), radius=3.0, seed=2, jitter=0.02)),
+  ]
+
+  print("%-18s %9s %14s %14s %14s %12s %10s %10s %10s" % ('case', 'out_vtx', 'area(km2)', 'overlap(ms)', 'overlap_km2(ms)', 'area(ms)', 'loop(ms)', 'rel_error', 'sphere'))
+  for (name, d_poly_1, d_poly_2) in l_cases:
+    shape_1 = polygon_geometry.get_polygon_shape(d_poly_1)
+    shape_2 = polygon_geometry.get_polygon_shape(d_poly_2)
+    (d_planar, t_planar) = time_calls(lambda: polygon_geometry.get_overlap_area(shape_1, shape_2))
+    (d_geodesic, t_geodesic) = time_calls(lambda: polygon_geometry.get_overlap_area(shape_1, shape_2, units='km2'))
+    o_intersection = shape_1.intersection(shape_2)
+    (area, t_area) = time_calls(lambda: geodesic_area(o_intersection, 'km2'))
+    (area_loop, t_loop) = time_calls(lambda: loop_area(o_intersection), 3)
+    area_dense = geodesic_area(shapely.segmentize(o_intersection, 0.001), 'km2')
+    print("%-18s %9d %14.1f %14.3f %14.3f %12.3f %10.1f %10.1e %10.1e" % (name, shapely.get_num_coordinates(o_intersection), d_geodesic['overlap_area'],
+          t_planar, t_geodesic, t_area, t_loop, abs(area - area_dense) / area_dense, (sphere_area(o_intersection) - area) / area))
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""
+
+  File: bench_grid_index.py
+  Description:
+   Point-in-polygon with the grid index (polygon_geometry.PolygonGridIndex) vs the exact path, on
+   data/montana.json and synthetic polygons of 20,000 to 1,000,000 vertices ("jagged": long radial
+   spikes, so most of the area is boundary cells):
+    * build(ms), memory (MB), boundary: time to build the index, size of its arrays, fraction of boundary cells
+    * single(us): one point per call (as one request per point does): prepared.contains() vs PolygonGridIndex.contains()
+    * batch(us): per point, for a batch of points: shapely.contains_xy() vs PolygonGridIndex.contains_xy()
+    * breakeven: number of (batch) points for which the index build pays off
+   Random points are generated uniformly over the bounding box of the polygon. Results are checked to be identical.
+
+  Usage (from pGaaS dir):
+    $ python benchmarks/bench_grid_index.py [n_points]
+
+"""
+import sys
+import time
+import numpy as np
+
+from bench_utils import load_state, synthetic_polygon
+import polygon_geometry
+from polygon_geometry import shapely, PolygonGridIndex
+
+N_SINGLE = 2000
+
+##----------------------------------------------------------------------------------------------
+def per_point_us(func, n_points):
+  t_start = time.perf_counter()
+  result = func()
+  return( result, (time.perf_counter() - t_start) / n_points * 1e6 )
+
+##----------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+
+  n_points = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+  l_cases = [
+    ('montana', load_state('montana')),
+    ('synthetic 20000', synthetic_polygon(20000, jitter=0.02)),
+    ('synthetic 100000', synthetic_polygon(100000, jitter=0.02)),
+    ('synthetic 1000000', synthetic_polygon(1000000, jitter=0.02)),
+    ('jagged 100000', synthetic_polygon(100000, jitter=0.3)),
+  ]
+
+  print("%-18s %8s %10s %10s %9s %12s %12s %11s %11s %10s" % ('polygon', 'cells', 'build(ms)', 'memory(MB)', 'boundary',
+        'single(us)', 'single_idx', 'batch(us)', 'batch_idx', 'breakeven'))
+  for (name, d_poly) in l_cases:
+    (shape_poly, prepared_poly) = polygon_geometry.get_polygon(d_poly)
+    o_index = PolygonGridIndex(shape_poly)
+    d_stats = o_index.stats()
+
+    o_random = np.random.default_rng(0)
+    (min_x, min_y, max_x, max_y) = shape_poly.bounds
+    (x, y) = (o_random.uniform(min_x, max_x, n_points), o_random.uniform(min_y, max_y, n_points))
+    l_points = [shapely.Point(point) for point in zip(x[:N_SINGLE].tolist(), y[:N_SINGLE].tolist())]
+    prepared_poly.contains(l_points[0]) ## GEOS builds its point locator on the first call
+
+    (l_single, t_single) = per_point_us(lambda: [prepared_poly.contains(o_point) for o_point in l_points], N_SINGLE)
+    (l_single_index, t_single_index) = per_point_us(lambda: [o_index.contains(shape_poly, o_point.x, o_point.y) for o_point in l_points], N_SINGLE)
+    (a_batch, t_batch) = per_point_us(lambda: shapely.contains_xy(shape_poly, x, y), n_points)
+    (a_batch_index, t_batch_index) = per_point_us(lambda: o_index.contains_xy(shape_poly, x, y), n_points)
+    assert l_single == l_single_index and (a_batch == a_batch_index).all()
+
+    print("%-18s %8d %10.1f %10.2f %8.1f%% %12.1f %12.1f %11.2f %11.2f %10.0f" % (name, d_stats['cells'], d_stats['build_seconds'] * 1e3,
+          d_stats['bytes'] / 2**20, 100.0 * d_stats['boundary_cells'] / d_stats['cells'], t_single, t_single_index, t_batch, t_batch_index,
+          d_stats['build_seconds'] * 1e6 / max(t_batch - t_batch_index, 1e-9)))
+
+  print(polygon_geometry.get_grid_index_stats())
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+"""
+
+  File: bench_json_codec.py
+  Description: 
+   JSON codec microbenchmark (json_codec.py): decode of a request body (bytes => dict) and
+   encode of a response (dict => bytes), with each available backend, for API payloads built
+   from the sample state polygons (data/*.json).
+
+  Usage (from pGaaS dir):
+    $ python benchmarks/bench_json_codec.py [iterations]
+
+"""
+import sys
+import json
+import time
+
+from bench_utils import load_state
+import json_codec
+
+##----------------------------------------------------------------------------------------------
+def time_func(func, arg, iterations):
+  """ Return mean seconds per call """
+  t_start = time.perf_counter()
+  for i in range(iterations):
+    func(arg)
+  return( (time.perf_counter() - t_start) / iterations )
+
+##----------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+
+  iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+  l_payloads = [(name, {'api_key': 'fanselow-pgass-test', 'polygons': [load_state(name), load_state(name)]}) for name in ('wyoming', 'colorado', 'montana')]
+  l_payloads.append(('colorado+montana+wyoming', {'api_key': 'fanselow-pgass-test', 'polygons': [load_state(name) for name in ('colorado', 'montana', 'wyoming')]}))
+  l_codecs = [name for name in json_codec.D_CODECS if name != 'orjson' or json_codec.orjson is not None]
+
+  print("%-26s %8s %-8s %12s %12s %10s" % ('payload', 'bytes', 'codec', 'decode(ms)', 'encode(ms)', 'speedup'))
+  for (name, d_payload) in l_payloads:
+    body = json.dumps(d_payload).encode('utf-8')
+    t_base = None
+    for codec_name in l_codecs:
+      json_codec.configure_codec(codec_name)
+      assert json_codec.loads(body) == d_payload
+      t_decode = time_func(json_codec.loads, body, iterations)
+      t_encode = time_func(json_codec.dumpb, d_payload, iterations)
+      t_base = t_base or (t_decode + t_encode)
+      print("%-26s %8d %-8s %12.3f %12.3f %9.1fx" % (name, len(body), codec_name, t_decode*1e3, t_encode*1e3, t_base/(t_decode + t_encode)))
+  json_codec.configure_codec('auto')
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+"""
+
+  File: bench_logging.py
+  Description:
+   Request-thread cost of logging a point-in-polygon payload (state polygons): the legacy
+   print() of the whole payload, and a structured_log record (disabled level, written in full,
+   sampled at 10%). Output goes to a file (the apache error log, under mod_wsgi).
+
+  Usage (from pGaaS dir):
+    $ python benchmarks/bench_logging.py [iterations]
+
+"""
+import os
+import sys
+import time
+import tempfile
+import contextlib
+
+from bench_utils import load_state
+import structured_log
+
+##----------------------------------------------------------------------------------------------
+def time_calls(func, iterations):
+  """ Return mean seconds per call """
+  t_start = time.perf_counter()
+  for i in range(iterations):
+    func()
+  return( (time.perf_counter() - t_start) / iterations )
+
+##----------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+
+  iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+  log = structured_log.get_logger('bench')
+
+  with tempfile.TemporaryDirectory() as log_dir:
+    log_file = os.path.join(log_dir, 'pgaas.log')
+    print("%-10s %8s %12s %12s %12s %12s" % ('payload', 'vertices', 'print(us)', 'disabled(us)', 'queued(us)', 'sampled(us)'))
+    for name in ('wyoming', 'colorado', 'montana'):
+      d_payload = {'api_key': 'fanselow-pgass-test', 'point': {'type': 'Point', 'coordinates': [-105.0, 40.0]}, 'polygon': load_state(name)}
+      n_vertices = sum(len(l_ring) for l_ring in d_payload['polygon']['coordinates'])
+
+      with open(log_file, 'a') as f, contextlib.redirect_stdout(f):
+        t_print = time_calls(lambda: print("api.point_in_polygon(): Identifying if point is within polygon: %s" % (str(d_payload))), iterations)
+
+      l_times = []
+      for (level, sample_rate) in (('INFO', 1.0), ('DEBUG', 1.0), ('DEBUG', 0.1)):
+        structured_log.configure_logging(level, log_file=log_file, sample_rate=sample_rate)
+        l_times.append(time_calls(lambda: log.debug("point in polygon", extra={'payload': d_payload}), iterations))
+        structured_log.flush_logging()
+      print("%-10s %8d %12.1f %12.2f %12.1f %12.1f" % (name, n_vertices, t_print*1e6, l_times[0]*1e6, l_times[1]*1e6, l_times[2]*1e6))
+    structured_log.configure_logging('INFO')
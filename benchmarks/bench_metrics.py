@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+"""
+
+  File: bench_metrics.py
+  Description:
+   Overhead of the request metrics (metrics.py): end-to-end latency of a polygon-intersection
+   request (Flask test client, no network) with metrics disabled and enabled (memory-mapped
+   metrics files), and the cost of recording one request (start, 7 stages, end) on its own.
+   Also times a /metrics scrape with 8 (simulated) WSGI processes.
+
+  Usage (from pGaaS dir):
+    $ python benchmarks/bench_metrics.py [iterations]
+
+"""
+import os
+import sys
+import time
+import tempfile
+
+from bench_utils import load_state
+import app_factory
+import polygon_geometry
+import metrics
+
+API_KEY = 'fanselow-pgass-test'
+STAGES = ('parse', 'authorize', 'validate', 'geojson', 'shape', 'geometry', 'jsonify')
+
+##----------------------------------------------------------------------------------------------
+def time_requests(o_client, d_payload, iterations):
+  """ Return mean seconds per request """
+  t_start = time.perf_counter()
+  for i in range(iterations):
+    o_response = o_client.post('/api/polygon_intersection', json=d_payload)
+  assert 'intersects' in o_response.get_json(), o_response.get_json()
+  return( (time.perf_counter() - t_start) / iterations )
+
+##----------------------------------------------------------------------------------------------
+def time_recording(iterations):
+  """ Return mean seconds to record one request with all stages """
+  t_start = time.perf_counter()
+  for i in range(iterations):
+    metrics.start_request('api.bench')
+    for name in STAGES:
+      with metrics.stage(name):
+        pass
+    metrics.add_input_vertices(100)
+    metrics.end_request()
+  return( (time.perf_counter() - t_start) / iterations )
+
+##----------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+
+  iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+  app = app_factory.create_app({})
+  o_client = app.test_client()
+  ## repeated identical queries: time the computation, not the result cache
+  polygon_geometry.configure_result_cache(0)
+
+  with tempfile.TemporaryDirectory() as metrics_dir:
+    metrics.configure_metrics(metrics_dir)
+
+    d_box = {'type': 'Polygon', 'coordinates': [[[-106, 38], [-105, 38], [-105, 39], [-106, 39], [-106, 38]]]}
+    d_payload = {'api_key': API_KEY, 'polygons': [load_state('colorado'), d_box]}
+    time_requests(o_client, d_payload, 50) ## warm-up
+    for enabled in (False, True, False, True):
+      metrics.ENABLED = enabled
+      print("polygon_intersection (colorado), metrics %-3s: %8.1f us/request" % ('on' if enabled else 'off', time_requests(o_client, d_payload, iterations)*1e6))
+
+    metrics.ENABLED = True
+    print("record 1 request (7 stages):                %8.1f us" % (time_recording(iterations*10)*1e6))
+
+    ## other WSGI processes: copies of this process' samples, under other pids
+    l_items = metrics._store().items()
+    for pid in range(2**22 + 1, 2**22 + 8):
+      o_values = metrics.MmapValues(os.path.join(metrics_dir, 'pgaas_%d.metrics' % (pid)))
+      for (key, value) in l_items:
+        o_values.add(key, value)
+      o_values.close()
+    t_start = time.perf_counter()
+    for i in range(20):
+      text = metrics.render_metrics()
+    print("/metrics scrape, 8 processes:               %8.1f ms (%d samples)" % ((time.perf_counter() - t_start) / 20 * 1e3, text.count('\n')))
+
+    metrics.configure_metrics(None, enabled=False)
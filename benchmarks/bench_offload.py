@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+"""
+
+  File: bench_offload.py
+  Description: 
+   Latency of get_overlap_area() on large polygons with 1, 4 and 16 concurrent clients (threads,
+   as in a threaded WSGI process), running inline vs on the warm geometry process pool
+   (polygon_geometry.configure_executor()).
+
+   Note: the process pool can only help if the machine has more than one CPU core.
+
+  Usage (from pGaaS dir):
+    $ python benchmarks/bench_offload.py [n_vertices] [processes]
+
+"""
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench_utils import synthetic_polygon, percentile
+import polygon_geometry
+
+REQUESTS_PER_CLIENT = 4
+
+##----------------------------------------------------------------------------------------------
+def run_clients(n_clients, shape_1, shape_2):
+  """ Return list of per-request latencies (seconds) with n_clients concurrent clients """
+  def client(i):
+    l_latency = []
+    for j in range(REQUESTS_PER_CLIENT):
+      t_start = time.perf_counter()
+      polygon_geometry.get_overlap_area(shape_1, shape_2)
+      l_latency.append(time.perf_counter() - t_start)
+    return( l_latency )
+  with ThreadPoolExecutor(max_workers=n_clients) as o_executor:
+    return( [t for l_latency in o_executor.map(client, range(n_clients)) for t in l_latency] )
+
+##----------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+
+  n_vertices = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+  processes = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1)
+
+  ## repeated identical queries: time the computation, not the result cache
+  polygon_geometry.configure_result_cache(0)
+
+  ## two overlapping polygons (geometries passed directly: only the overlap computation is timed)
+  shape_1 = polygon_geometry.get_polygon_shape(synthetic_polygon(n_vertices, center=(0.0, 0.0), seed=1))
+  shape_2 = polygon_geometry.get_polygon_shape(synthetic_polygon(n_vertices, center=(0.5, 0.3), seed=2))
+
+  print("get_overlap_area: 2 x %d vertices, %d cpu(s), pool of %d process(es)" % (n_vertices, os.cpu_count() or 1, processes))
+  print("%-8s %8s %10s %10s %10s %10s" % ('mode', 'clients', 'p50(ms)', 'p95(ms)', 'max(ms)', 'req/sec'))
+  for mode in ('inline', 'pool'):
+    polygon_geometry.configure_executor(processes if mode == 'pool' else 0, min_vertices=0)
+    for n_clients in (1, 4, 16):
+      t_start = time.perf_counter()
+      l_latency = run_clients(n_clients, shape_1, shape_2)
+      t_total = time.perf_counter() - t_start
+      print("%-8s %8d %10.1f %10.1f %10.1f %10.1f" % (mode, n_clients, percentile(l_latency, 50)*1e3, 
+            percentile(l_latency, 95)*1e3, max(l_latency)*1e3, len(l_latency)/t_total))
+  polygon_geometry.configure_executor(0)
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+"""
+
+  File: bench_overlap_lod.py
+  Description: 
+   Speed/accuracy of the approximate ("fast mode") get_overlap_area(), at each level-of-detail of
+   polygon_geometry.LOD_TOLERANCES, vs the exact area. Simplified polygons are cached, so the
+   one-time simplification cost is reported separately from the (warm) per-call time.
+
+  Usage (from pGaaS dir):
+    $ python benchmarks/bench_overlap_lod.py [n_vertices]
+
+"""
+import sys
+import copy
+import time
+
+from bench_utils import load_state, synthetic_polygon
+import polygon_geometry
+
+N_CALLS = 20
+
+##----------------------------------------------------------------------------------------------
+def shifted(d_poly, dx, dy):
+  d_poly = copy.deepcopy(d_poly)
+  for l_ring in d_poly['coordinates']:
+    for position in l_ring:
+      position[0] += dx
+      position[1] += dy
+  return( d_poly )
+
+##----------------------------------------------------------------------------------------------
+def time_calls(func):
+  t_start = time.perf_counter()
+  for i in range(N_CALLS):
+    result = func()
+  return( result, (time.perf_counter() - t_start) / N_CALLS )
+
+##----------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+
+  n_vertices = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+
+  ## repeated identical queries: time the computation, not the result cache
+  polygon_geometry.configure_result_cache(0)
+
+  d_montana = load_state('montana')
+  l_cases = [
+    ('montana+shifted', d_montana, shifted(d_montana, 1.0, 0.5)),
+    ('synthetic %d' % (n_vertices), synthetic_polygon(n_vertices, center=(0.0, 0.0), seed=1, jitter=0.02), 
+                                    synthetic_polygon(n_vertices, center=(0.5, 0.3), seed=2, jitter=0.02)),
+  ]
+  l_lod_tolerances = polygon_geometry.LOD_TOLERANCES
+
+  print("%-18s %8s %10s %12s %10s %12s %12s %10s" % ('case', 'lod', 'vertices', 'simplify(ms)', 'call(ms)', 'rel_error', 'rel_bound', 'speedup'))
+  for (name, d_poly_1, d_poly_2) in l_cases:
+    shape_1 = polygon_geometry.get_polygon_shape(d_poly_1)
+    shape_2 = polygon_geometry.get_polygon_shape(d_poly_2)
+    n_total = polygon_geometry.shapely.get_num_coordinates(shape_1) + polygon_geometry.shapely.get_num_coordinates(shape_2)
+    (d_exact, t_exact) = time_calls(lambda: polygon_geometry.get_overlap_area(shape_1, shape_2))
+    exact_area = d_exact['overlap_area']
+    print("%-18s %8s %10d %12s %10.2f %12s %12s %10s" % (name, 'exact', n_total, '-', t_exact*1e3, '-', '-', '1.0x'))
+
+    for lod_tolerance in l_lod_tolerances:
+      ## one level at a time, with a tolerance every level satisfies
+      polygon_geometry.LOD_TOLERANCES = (lod_tolerance,)
+      t_start = time.perf_counter()
+      simple_1 = polygon_geometry._derived(shape_1, ('lod', lod_tolerance), lambda shape_poly: polygon_geometry._simplified(shape_poly, lod_tolerance))[0]
+      simple_2 = polygon_geometry._derived(shape_2, ('lod', lod_tolerance), lambda shape_poly: polygon_geometry._simplified(shape_poly, lod_tolerance))[0]
+      t_simplify = time.perf_counter() - t_start
+      n_simple = polygon_geometry.shapely.get_num_coordinates(simple_1) + polygon_geometry.shapely.get_num_coordinates(simple_2)
+      (d_approx, t_approx) = time_calls(lambda: polygon_geometry.get_overlap_area(shape_1, shape_2, tolerance=1.0))
+      print("%-18s %8g %10d %12.1f %10.2f %12.2e %12.2e %9.1fx" % (name, lod_tolerance, n_simple, t_simplify*1e3, t_approx*1e3, 
+            abs(d_approx['overlap_area'] - exact_area) / exact_area, d_approx['error_bound'] / exact_area, t_exact / t_approx))
+  polygon_geometry.LOD_TOLERANCES = l_lod_tolerances
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+"""
+
+  File: bench_point_batch.py
+  Description: 
+   Point-in-polygon throughput (points per second) against data/montana.json:
+    * single: check_point_in_polygon() once per point (as one request per point does)
+    * batch: check_points_in_polygon() (vectorized shapely.contains_xy on the prepared polygon)
+
+   Random points are generated uniformly over the bounding box of the polygon.
+
+  Usage (from pGaaS dir):
+    $ python benchmarks/bench_point_batch.py [n_points]
+
+"""
+import sys
+import time
+import random
+
+from bench_utils import load_state
+import polygon_geometry
+
+##----------------------------------------------------------------------------------------------
+def random_points(d_poly, n_points, seed=42):
+  """ Return list of n_points [x, y] positions within the bounding box of d_poly """
+  o_random = random.Random(seed)
+  l_ring = d_poly['coordinates'][0]
+  (min_x, max_x) = (min(p[0] for p in l_ring), max(p[0] for p in l_ring))
+  (min_y, max_y) = (min(p[1] for p in l_ring), max(p[1] for p in l_ring))
+  return( [[o_random.uniform(min_x, max_x), o_random.uniform(min_y, max_y)] for i in range(n_points)] )
+
+##----------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+
+  n_points = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+
+  ## repeated identical queries: time the computation, not the result cache
+  polygon_geometry.configure_result_cache(0)
+
+  d_montana = load_state('montana')
+  l_points = random_points(d_montana, n_points)
+
+  ## warm the geometry cache so both modes measure the containment test
+  polygon_geometry.get_polygon(d_montana)
+
+  ## single-point calls (limited sample - this is slow)
+  n_single = min(n_points, 5000)
+  t_start = time.perf_counter()
+  for point in l_points[:n_single]:
+    polygon_geometry.check_point_in_polygon(point={'type': 'Point', 'coordinates': point}, polygon=d_montana)
+  t_single = time.perf_counter() - t_start
+
+  t_start = time.perf_counter()
+  d_result = polygon_geometry.check_points_in_polygon(points=l_points, polygon=d_montana)
+  t_batch = time.perf_counter() - t_start
+
+  l_flat = [c for point in l_points for c in point]
+  t_start = time.perf_counter()
+  polygon_geometry.check_points_in_polygon(coordinates=l_flat, polygon=d_montana)
+  t_flat = time.perf_counter() - t_start
+
+  print("montana.json (%d vertices), %d points, %d within" % (len(d_montana['coordinates'][0]), n_points, sum(d_result['is_within'])))
+  print("%-28s %14s" % ('mode', 'points/sec'))
+  print("%-28s %14.0f" % ('single (per-point call)', n_single/t_single))
+  print("%-28s %14.0f" % ('batch (points)', n_points/t_batch))
+  print("%-28s %14.0f" % ('batch (flat coordinates)', n_points/t_flat))
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+"""
+
+  File: bench_request_overhead.py
+  Description: 
+   Per-request overhead of the API decorators (@api_authorize, @api_data_validate) plus
+   the route's payload access, for large polygon payloads (data/*.json).
+
+   Compares:
+    * legacy: request.get_json() in each decorator and route, json.dumps() of the whole 
+              payload in api_authorize, and jsonschema.validate() (validator rebuilt every call)
+    * current: api_payload.get_payload() shared by decorators and route, and a validator 
+              compiled once at import time
+
+   No geometry is computed - this only measures the request-handling overhead.
+
+  Usage (from pGaaS dir):
+    $ python benchmarks/bench_request_overhead.py [iterations]
+
+"""
+import sys
+import json
+import time
+
+from bench_utils import load_state
+import jsonschema
+import app_factory
+from api_payload import get_payload
+from api_validation import compile_schema
+from blueprints.api.routes import d_schema_2poly
+
+API_KEY = 'fanselow-pgass-test'
+
+##----------------------------------------------------------------------------------------------
+def legacy_overhead(request):
+  """ Request handling as done before the shared payload/compiled validators """
+  d_payload = request.get_json(force=True)   ## api_authorize
+  json.dumps(d_payload)                      ## api_authorize "is valid json" test
+  d_payload = request.get_json(force=True)   ## api_data_validate
+  jsonschema.validate(d_payload, d_schema_2poly)
+  d_payload = request.get_json(force=True)   ## route
+  return( d_payload['polygons'] )
+
+##----------------------------------------------------------------------------------------------
+O_VALIDATOR = compile_schema(d_schema_2poly)
+
+def current_overhead(request):
+  """ Request handling with the request-scoped payload and compiled validator """
+  d_payload = get_payload()                  ## api_authorize
+  d_payload = get_payload()                  ## api_data_validate
+  error = jsonschema.exceptions.best_match(O_VALIDATOR.iter_errors(d_payload))
+  d_payload = get_payload()                  ## route
+  return( d_payload['polygons'] )
+
+##----------------------------------------------------------------------------------------------
+def time_overhead(app, func, body, iterations):
+  """ Return mean seconds per request for func() inside a fresh request context """
+  t_start = time.perf_counter()
+  for i in range(iterations):
+    with app.test_request_context('/api/polygon_overlap_area', method='POST', data=body, content_type='application/json'):
+      from flask import request
+      func(request)
+  return( (time.perf_counter() - t_start) / iterations )
+
+##----------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+
+  iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+
+  app = app_factory.create_app({})
+
+  l_pairs = [('colorado', 'wyoming'), ('colorado', 'montana'), ('montana', 'montana')]
+
+  print("%-20s %10s %12s %12s %8s" % ('payload', 'bytes', 'legacy(ms)', 'current(ms)', 'speedup'))
+  for (name_1, name_2) in l_pairs:
+    d_body = {'api_key': API_KEY, 'polygons': [load_state(name_1), load_state(name_2)]}
+    body = json.dumps(d_body)
+    t_legacy = time_overhead(app, legacy_overhead, body, iterations)
+    t_current = time_overhead(app, current_overhead, body, iterations)
+    label = "%s+%s" % (name_1, name_2)
+    print("%-20s %10d %12.3f %12.3f %7.1fx" % (label, len(body), t_legacy*1e3, t_current*1e3, t_legacy/t_current))
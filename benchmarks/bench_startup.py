@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""
+
+  File: bench_startup.py
+  Description:
+   Startup cost and first-request latency of a new (i.e. recycled) worker process, with and without the
+   warm-up phase (app_factory.warm_up(), WARMUP_ENABLED in config.py). Each run is a fresh process: module
+   imports, then the app setup time (import pgaas_flask: create_app(), handlers and warm-up), then the 
+   first and second request (Flask test client) of each endpoint,
+   with the state polygons (preloaded by the warm-up) and with synthetic polygons (not preloaded).
+   Medians over --runs processes.
+
+  Usage (from pGaaS dir):
+    $ python benchmarks/bench_startup.py [--runs 5]
+
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+API_KEY = 'fanselow-pgass-test'
+
+##----------------------------------------------------------------------------------------------
+def child(warmup):
+  """ Run in a fresh process: print a JSON dict of timings (ms) """
+  t_start = time.perf_counter()
+  from bench_utils import load_state, synthetic_polygon
+  import config
+  config.BaseConfig.WARMUP_ENABLED = warmup
+  config.BaseConfig.JOB_WORKER_PROCESSES = 0
+  import app_factory
+  t_imported = time.perf_counter()
+  import pgaas_flask
+  app = pgaas_flask.app
+  t_created = time.perf_counter()
+  d_times = {'import': (t_imported - t_start) * 1e3, 'app setup': (t_created - t_imported) * 1e3}
+
+  (d_co, d_wy, d_mt) = (load_state('colorado'), load_state('wyoming'), load_state('montana'))
+  (d_syn_1, d_syn_2) = (synthetic_polygon(1000, seed=1, jitter=0.02), synthetic_polygon(1000, center=(0.5, 0.3), seed=2, jitter=0.02))
+  l_requests = [
+    ('intersection (states)', '/api/polygon_intersection', {'polygons': [d_co, d_wy]}),
+    ('overlap (states)', '/api/polygon_overlap_area', {'polygons': [d_wy, d_mt]}),
+    ('pip (states)', '/api/point_in_polygon', {'polygon': d_mt, 'point': {'type': 'Point', 'coordinates': [-110.0, 47.0]}}),
+    ('intersection (synthetic)', '/api/polygon_intersection', {'polygons': [d_syn_1, d_syn_2]}),
+  ]
+  o_client = app.test_client()
+  for (label, path, d_payload) in l_requests:
+    for nth in ('1st', '2nd'):
+      if nth == '2nd':
+        app_factory.polygon_geometry.RESULT_CACHE.clear() ## time the computation again, not the memoized result
+      t_request = time.perf_counter()
+      o_response = o_client.post(path, json=dict(d_payload, api_key=API_KEY))
+      d_times["%s %s" % (label, nth)] = (time.perf_counter() - t_request) * 1e3
+      assert 'error' not in o_response.get_json(), o_response.get_json()
+  print(json.dumps(d_times))
+
+##----------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+
+  o_parser = argparse.ArgumentParser(description='worker startup and first-request latency, with/without warm-up')
+  o_parser.add_argument('--runs', type=int, default=5)
+  o_parser.add_argument('--child', choices=('on', 'off'), help=argparse.SUPPRESS)
+  o_args = o_parser.parse_args()
+
+  if o_args.child:
+    child(o_args.child == 'on')
+    sys.exit(0)
+
+  d_results = {}
+  for warmup in ('off', 'on'):
+    l_runs = []
+    for i in range(o_args.runs):
+      output = subprocess.run([sys.executable, os.path.realpath(__file__), '--child', warmup], capture_output=True, text=True, check=True).stdout
+      l_runs.append(json.loads(output.strip().splitlines()[-1]))
+    d_results[warmup] = {key: statistics.median(d[key] for d in l_runs) for key in l_runs[0]}
+
+  print("%-32s %14s %14s" % ('median (ms)', 'warm-up off', 'warm-up on'))
+  for key in d_results['off']:
+    print("%-32s %14.2f %14.2f" % (key, d_results['off'][key], d_results['on'][key]))
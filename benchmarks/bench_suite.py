@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+"""
+
+  File: bench_suite.py
+  Description:
+   Microbenchmark suite for the polygon_geometry operations, over the sample state polygons
+   (data/*.json) and synthetic polygons of 10 to 1,000,000 vertices:
+
+    * validate_geojson_polygon
+    * check_polygon_intersection
+    * get_overlap_area
+    * check_point_in_polygon
+
+   Each operation is timed per stage, with the geometry and result caches disabled:
+    * validate: GeoJSON validation of the inputs (validate_geojson_polygon/_point)
+    * shape: Shapely geometry construction (shape())
+    * op: the operation itself, on already-built Shapely geometries
+    * total: the public function on GeoJSON input (validation + construction + operation)
+   The second polygon of intersection/overlap partially overlaps the first (a shifted copy of a state,
+   another synthetic polygon of the same size), and the point is the centroid of the polygon.
+
+   Memory: py_peak is the peak Python heap allocated by the stage (tracemalloc, measured in a separate
+   untimed call). rss_peak is the peak resident memory growth of the whole case (GEOS memory included):
+   each case runs in a fresh worker process.
+
+   Results are saved as JSON (--output), and two result files can be compared (--compare) to flag
+   stages that got slower than a threshold. Exit status is 1 if any slowdown is flagged.
+
+  Usage (from pGaaS dir):
+    $ python benchmarks/bench_suite.py [--max-vertices 1000000] [--output results.json]
+    $ python benchmarks/bench_suite.py --compare base.json results.json [--threshold 0.1]
+
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import datetime
+import resource
+import statistics
+import tracemalloc
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from bench_utils import load_state, synthetic_polygon
+import shapely
+import numpy as np
+from shapely.geometry import shape
+import polygon_geometry
+
+SYNTHETIC_SIZES = (10, 100, 1000, 10000, 100000, 1000000)
+STATES = ('colorado', 'wyoming', 'montana')
+OPS = ('validate_geojson_polygon', 'check_polygon_intersection', 'get_overlap_area', 'check_point_in_polygon')
+
+##----------------------------------------------------------------------------------------------
+def time_call(func, min_time, max_runs):
+  """ Return (list): seconds of each run - at least one run, then until min_time has elapsed (or max_runs) """
+  l_times = []
+  t_end = time.perf_counter() + min_time
+  while not l_times or (len(l_times) < max_runs and time.perf_counter() < t_end):
+    t_start = time.perf_counter()
+    func()
+    l_times.append(time.perf_counter() - t_start)
+  return( l_times )
+
+def py_peak(func):
+  """ Return (int): peak bytes of Python heap allocated while running func once """
+  tracemalloc.start()
+  try:
+    func()
+    return( tracemalloc.get_traced_memory()[1] )
+  finally:
+    tracemalloc.stop()
+
+def _max_rss_bytes():
+  ## ru_maxrss is in KB on Linux, bytes on macOS
+  return( resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024) )
+
+def _current_rss_bytes():
+  try:
+    with open('/proc/self/statm', 'r') as f:
+      return( int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') )
+  except (OSError, ValueError):
+    return( _max_rss_bytes() )
+
+##----------------------------------------------------------------------------------------------
+def case_inputs(case):
+  """ Return (tuple): (polygon, shifted polygon, point) GeoJSON inputs of a case ("colorado", "synthetic-1000", ...) """
+  if case.startswith('synthetic-'):
+    ## (not a shifted copy: parallel edges of a jagged boundary are a worst case for the overlay, as is a high jitter)
+    n_vertices = int(case.split('-', 1)[1])
+    d_poly = synthetic_polygon(n_vertices, seed=1, jitter=0.02)
+    d_shifted = synthetic_polygon(n_vertices, center=(0.5, 0.3), seed=2, jitter=0.02)
+  else:
+    d_poly = load_state(case)
+    (minx, miny, maxx, maxy) = shape(d_poly).bounds
+    (dx, dy) = (0.3 * (maxx - minx), 0.2 * (maxy - miny))
+    d_shifted = {'type': 'Polygon', 'coordinates': [[[x + dx, y + dy] for (x, y) in l_ring] for l_ring in d_poly['coordinates']]}
+  d_point = {'type': 'Point', 'coordinates': list(shape(d_poly).centroid.coords[0])}
+  return( d_poly, d_shifted, d_point )
+
+def op_stages(op, d_poly, d_shifted, d_point):
+  """ Return (list): [(stage, function), ...] of an operation """
+  (shape_poly, shape_shifted, shape_point) = (shape(d_poly), shape(d_shifted), shape(d_point))
+  if op == 'validate_geojson_polygon':
+    return( [('validate', lambda: polygon_geometry.validate_geojson_polygon(d_poly))] )
+  if op == 'check_point_in_polygon':
+    return( [
+      ('validate', lambda: (polygon_geometry.validate_geojson_polygon(d_poly), polygon_geometry.validate_geojson_point(d_point))),
+      ('shape', lambda: (shape(d_poly), shape(d_point))),
+      ('op', lambda: polygon_geometry.check_point_in_polygon(point=shape_point, polygon=shape_poly)),
+      ('total', lambda: polygon_geometry.check_point_in_polygon(point=d_point, polygon=d_poly)),
+    ] )
+  func = getattr(polygon_geometry, op)
+  return( [
+    ('validate', lambda: (polygon_geometry.validate_geojson_polygon(d_poly), polygon_geometry.validate_geojson_polygon(d_shifted))),
+    ('shape', lambda: (shape(d_poly), shape(d_shifted))),
+    ('op', lambda: func(shape_poly, shape_shifted)),
+    ('total', lambda: func(d_poly, d_shifted)),
+  ] )
+
+##----------------------------------------------------------------------------------------------
+def run_case(case, l_ops, min_time, max_runs):
+  """
+  Run all stages of the operations for one case (in a fresh worker process, see main()).
+  Return (dict): {'case', 'vertices', 'rss_peak', 'results': [{'op', 'stage', 'median', 'min', 'runs', 'py_peak'}, ...]}
+  """
+  polygon_geometry.configure_geometry_cache(0)
+  polygon_geometry.configure_result_cache(0)
+  rss_start = _current_rss_bytes()
+
+  (d_poly, d_shifted, d_point) = case_inputs(case)
+  l_results = []
+  for op in l_ops:
+    for (stage, func) in op_stages(op, d_poly, d_shifted, d_point):
+      l_times = time_call(func, min_time, max_runs)
+      l_results.append({'op': op, 'stage': stage, 'median': statistics.median(l_times), 'min': min(l_times),
+                        'runs': len(l_times), 'py_peak': py_peak(func)})
+
+  n_vertices = sum(len(l_ring) for l_ring in d_poly['coordinates'])
+  return( {'case': case, 'vertices': n_vertices, 'rss_peak': max(0, _max_rss_bytes() - rss_start), 'results': l_results} )
+
+##----------------------------------------------------------------------------------------------
+def environment():
+  """ Return (dict): versions and host info, saved with the results """
+  return( {'timestamp': datetime.datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(),
+           'shapely': shapely.__version__, 'geos': shapely.geos_version_string, 'numpy': np.__version__,
+           'platform': platform.platform(), 'cpus': os.cpu_count()} )
+
+def print_case(d_case):
+  for d_result in d_case['results']:
+    print("%-16s %9d %-27s %-9s %12.4f %12.4f %5d %12.1f" % (d_case['case'], d_case['vertices'], d_result['op'], d_result['stage'],
+          d_result['median']*1e3, d_result['min']*1e3, d_result['runs'], d_result['py_peak']/1024.0))
+  print("%-16s %9d %-27s %-9s %43.1f" % (d_case['case'], d_case['vertices'], '(case)', 'rss_peak', d_case['rss_peak']/1024.0))
+
+##----------------------------------------------------------------------------------------------
+def compare(d_base, d_current, threshold, min_delta):
+  """
+  Compare the median stage times of two result files.
+  Required Args: d_base, d_current (dict): results, threshold (float): relative slowdown to flag (0.1 = 10%),
+    min_delta (float): seconds - smaller differences are never flagged (timer noise)
+  Return (int): number of flagged slowdowns
+  """
+  d_base_medians = {(d_case['case'], d_result['op'], d_result['stage']): d_result['median']
+                    for d_case in d_base['cases'] for d_result in d_case['results']}
+  print("base:    %s" % (json.dumps(d_base['environment'])))
+  print("current: %s" % (json.dumps(d_current['environment'])))
+  print("%-16s %-27s %-9s %12s %12s %8s" % ('case', 'op', 'stage', 'base(ms)', 'current(ms)', 'change'))
+  n_slower = 0
+  for d_case in d_current['cases']:
+    for d_result in d_case['results']:
+      base = d_base_medians.get((d_case['case'], d_result['op'], d_result['stage']), None)
+      if base is None:
+        continue
+      current = d_result['median']
+      flag = ''
+      if current > base * (1.0 + threshold) and current - base > min_delta:
+        flag = 'SLOWER'
+        n_slower += 1
+      elif current < base / (1.0 + threshold) and base - current > min_delta:
+        flag = 'faster'
+      print("%-16s %-27s %-9s %12.4f %12.4f %+7.1f%% %s" % (d_case['case'], d_result['op'], d_result['stage'],
+            base*1e3, current*1e3, (current / base - 1.0) * 100 if base else 0.0, flag))
+  print("%d slowdown(s) above %.0f%%" % (n_slower, threshold * 100))
+  return( n_slower )
+
+##----------------------------------------------------------------------------------------------
+def main(l_args):
+  o_parser = argparse.ArgumentParser(description='polygon_geometry microbenchmark suite')
+  o_parser.add_argument('--max-vertices', type=int, default=SYNTHETIC_SIZES[-1], help='largest synthetic polygon (default: %(default)s)')
+  o_parser.add_argument('--ops', default=','.join(OPS), help='comma-separated operations (default: all)')
+  o_parser.add_argument('--max-overlap-vertices', type=int, default=100000,
+                        help='skip get_overlap_area for larger synthetic polygons - the overlay of two 1M-vertex polygons takes minutes and GBs (default: %(default)s)')
+  o_parser.add_argument('--min-time', type=float, default=0.5, help='seconds to repeat each stage for (default: %(default)s)')
+  o_parser.add_argument('--max-runs', type=int, default=200, help='max runs per stage (default: %(default)s)')
+  o_parser.add_argument('--output', help='save the results to this JSON file')
+  o_parser.add_argument('--inline', action='store_true', help='run all cases in this process (rss_peak is then cumulative)')
+  o_parser.add_argument('--compare', nargs=2, metavar=('BASE', 'CURRENT'), help='compare two result files instead of running')
+  o_parser.add_argument('--threshold', type=float, default=0.10, help='relative slowdown flagged by --compare (default: %(default)s)')
+  o_parser.add_argument('--min-delta-ms', type=float, default=0.01, help='ignore differences below this (default: %(default)s)')
+  o_args = o_parser.parse_args(l_args)
+
+  if o_args.compare:
+    l_results = []
+    for path in o_args.compare:
+      with open(path, 'r') as f:
+        l_results.append(json.load(f))
+    return( 1 if compare(l_results[0], l_results[1], o_args.threshold, o_args.min_delta_ms / 1e3) else 0 )
+
+  l_ops = o_args.ops.split(',')
+  for op in l_ops:
+    if op not in OPS:
+      o_parser.error("unknown op (%s). Expected one of: %s" % (op, ', '.join(OPS)))
+  l_cases = list(STATES) + ['synthetic-%d' % (n) for n in SYNTHETIC_SIZES if n <= o_args.max_vertices]
+
+  print("%-16s %9s %-27s %-9s %12s %12s %5s %12s" % ('case', 'vertices', 'op', 'stage', 'median(ms)', 'min(ms)', 'runs', 'py_peak(KB)'))
+  d_run = {'environment': environment(), 'cases': []}
+  for case in l_cases:
+    l_case_ops = l_ops
+    if case.startswith('synthetic-') and int(case.split('-', 1)[1]) > o_args.max_overlap_vertices:
+      l_case_ops = [op for op in l_ops if op != 'get_overlap_area']
+    if o_args.inline:
+      d_case = run_case(case, l_case_ops, o_args.min_time, o_args.max_runs)
+    else:
+      ## fresh process per case, so rss_peak is the memory of this case only
+      with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as o_executor:
+        d_case = o_executor.submit(run_case, case, l_case_ops, o_args.min_time, o_args.max_runs).result()
+    print_case(d_case)
+    d_run['cases'].append(d_case)
+
+    ## saved after each case, so a long run that is interrupted keeps its results
+    if o_args.output:
+      with open(o_args.output, 'w') as f:
+        json.dump(d_run, f, indent=1)
+
+  if o_args.output:
+    print("Results saved to: %s" % (o_args.output))
+  return( 0 )
+
+##----------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
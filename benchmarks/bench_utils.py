@@ -0,0 +1,51 @@
+"""
+
+  File: bench_utils.py
+  Description: Common helpers for the benchmark scripts (path setup, test polygons, timing stats)
+
+"""
+import os
+import sys
+import json
+import math
+import random
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+APP_DIR = os.path.join(BASE_DIR, 'app')
+DATA_DIR = os.path.join(BASE_DIR, 'data')
+
+## benchmarks import the app modules the same way the WSGI app does
+if APP_DIR not in sys.path:
+  sys.path.insert(0, APP_DIR)
+
+##----------------------------------------------------------------------------------------------
+def load_state(name):
+  """ Return (dict): GeoJSON Polygon of data/<name>.json """
+  with open(os.path.join(DATA_DIR, '%s.json' % (name)), 'r') as f:
+    return( json.load(f) )
+
+##----------------------------------------------------------------------------------------------
+def synthetic_polygon(n_vertices, center=(0.0, 0.0), radius=1.0, seed=42, jitter=0.2):
+  """
+  Generate a valid (star-shaped, so never self-intersecting) GeoJSON Polygon with a jagged boundary. 
+  Required Arg (int): n_vertices (>= 3)
+  Optional Arg (float): jitter - random radial variation of the vertices (fraction of the radius)
+  Return (dict): GeoJSON Polygon (n_vertices + 1 positions, the ring is closed)
+  """
+  o_random = random.Random(seed)
+  l_ring = []
+  for i in range(n_vertices):
+    angle = 2 * math.pi * i / n_vertices
+    r = radius * (1.0 - jitter + jitter * o_random.random())
+    l_ring.append([center[0] + r * math.cos(angle), center[1] + r * math.sin(angle)])
+  l_ring.append(list(l_ring[0]))
+  return( {'type': 'Polygon', 'coordinates': [l_ring]} )
+
+##----------------------------------------------------------------------------------------------
+def percentile(l_values, pct):
+  """ Return the pct (0-100) percentile of a list of numbers (nearest-rank) """
+  l_sorted = sorted(l_values)
+  if not l_sorted:
+    return( float('nan') )
+  idx = max(0, min(len(l_sorted) - 1, int(math.ceil(pct / 100.0 * len(l_sorted))) - 1))
+  return( l_sorted[idx] )
@@ -0,0 +1,313 @@
+#!/usr/bin/env python
+"""
+
+  File: load_test.py
+  Description:
+   Concurrent load generator for the pGaaS API. Worker threads send a weighted mix of
+   /api/polygon_intersection, /api/polygon_overlap_area and /api/point_in_polygon requests
+   for a fixed duration (closed loop: each worker sends its next request when the previous one
+   returns), then reports requests/sec, p50/p95/p99/max latency and error rate per endpoint.
+
+   Targets:
+    * in-process (default): the Flask app from pgaas_flask.py, through the Flask test client (no network,
+      one process - the GIL limits concurrency, so this measures the app code, not the server)
+    * --url http://127.0.0.1:8080: a running server (keep-alive connection per worker)
+
+   Payloads: the state polygons (data/*.json) or synthetic polygons of the given vertex counts (--payload),
+   as --variants randomly translated copies, so the geometry/result caches only see repeats once every
+   variant has been sent. Bodies are encoded before the run starts.
+
+   An error is a non-200 response, or a 200 response with an {"error": ...} body (the API error handlers
+   return 200): errors are counted by exception type.
+
+   --smoke sends each of a list of valid and invalid requests once and prints the responses
+   (what pgass_test.sh did).
+
+  Usage (from pGaaS dir):
+    $ python benchmarks/load_test.py [--url URL] [--concurrency 8] [--duration 10] [--payload states|100,10000]
+                                     [--mix intersection=1,overlap=1,pip=1] [--variants 50] [--json report.json]
+    $ python benchmarks/load_test.py --url http://127.0.0.1:8080 --smoke
+
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import http.client
+from urllib.parse import urlsplit
+
+from bench_utils import load_state, synthetic_polygon, percentile
+
+API_KEY = 'fanselow-pgass-test'
+STATES = ('colorado', 'wyoming', 'montana')
+
+## endpoint name => path
+D_ENDPOINTS = {
+  'intersection': '/api/polygon_intersection',
+  'overlap': '/api/polygon_overlap_area',
+  'pip': '/api/point_in_polygon',
+}
+
+##----------------------------------------------------------------------------------------------
+##
+## Payloads
+##
+def _translated(d_poly, dx, dy):
+  return( {'type': 'Polygon', 'coordinates': [[[x + dx, y + dy] for (x, y) in l_ring] for l_ring in d_poly['coordinates']]} )
+
+def _bounds(d_poly):
+  l_x = [position[0] for position in d_poly['coordinates'][0]]
+  l_y = [position[1] for position in d_poly['coordinates'][0]]
+  return( min(l_x), min(l_y), max(l_x), max(l_y) )
+
+def base_polygon_pairs(payload):
+  """ Return (list): [(polygon, overlapping polygon), ...] for --payload ("states" or comma-separated vertex counts) """
+  l_pairs = []
+  if payload == 'states':
+    for name in STATES:
+      d_poly = load_state(name)
+      (minx, miny, maxx, maxy) = _bounds(d_poly)
+      l_pairs.append( (d_poly, _translated(d_poly, 0.3 * (maxx - minx), 0.2 * (maxy - miny))) )
+  else:
+    for n_vertices in [int(value) for value in payload.split(',')]:
+      l_pairs.append( (synthetic_polygon(n_vertices, seed=1, jitter=0.02), synthetic_polygon(n_vertices, center=(0.5, 0.3), seed=2, jitter=0.02)) )
+  return( l_pairs )
+
+def make_bodies(endpoint, l_pairs, n_variants, o_random):
+  """ Return (list): n_variants encoded JSON request bodies for an endpoint """
+  l_bodies = []
+  for i in range(n_variants):
+    (d_poly_1, d_poly_2) = l_pairs[i % len(l_pairs)]
+    (minx, miny, maxx, maxy) = _bounds(d_poly_1)
+    (dx, dy) = (0.05 * (maxx - minx) * o_random.random(), 0.05 * (maxy - miny) * o_random.random())
+    if endpoint == 'pip':
+      d_point = {'type': 'Point', 'coordinates': [o_random.uniform(minx, maxx), o_random.uniform(miny, maxy)]}
+      d_payload = {'api_key': API_KEY, 'point': d_point, 'polygon': _translated(d_poly_1, dx, dy)}
+    else:
+      d_payload = {'api_key': API_KEY, 'polygons': [_translated(d_poly_1, dx, dy), _translated(d_poly_2, dy, dx)]}
+    l_bodies.append(json.dumps(d_payload).encode('utf-8'))
+  return( l_bodies )
+
+##----------------------------------------------------------------------------------------------
+##
+## Targets: send(path, body) => (status, response body bytes)
+##
+class InProcessTarget(object):
+  """ Flask test client of the service app, with its error handlers (one client per worker thread) """
+
+  def __init__(self):
+    import pgaas_flask
+    self.app = pgaas_flask.app
+    self.name = 'in-process (Flask test client)'
+
+  def sender(self):
+    o_client = self.app.test_client()
+    def send(path, body):
+      o_response = o_client.post(path, data=body, content_type='application/json')
+      return( o_response.status_code, o_response.get_data() )
+    return( send )
+
+class HttpTarget(object):
+  """ Running server (one keep-alive connection per worker thread) """
+
+  def __init__(self, url):
+    o_url = urlsplit(url)
+    self.host = o_url.hostname
+    self.port = o_url.port or (443 if o_url.scheme == 'https' else 80)
+    self.prefix = o_url.path.rstrip('/') ## i.e. /pgass under mod_wsgi
+    self.connection_cls = http.client.HTTPSConnection if o_url.scheme == 'https' else http.client.HTTPConnection
+    self.name = url
+
+  def sender(self):
+    d_state = {'connection': None}
+    def send(path, body):
+      for attempt in (1, 2): ## reconnect once if the server closed the keep-alive connection
+        if d_state['connection'] is None:
+          d_state['connection'] = self.connection_cls(self.host, self.port, timeout=60)
+        try:
+          d_state['connection'].request('POST', self.prefix + path, body=body, headers={'Content-Type': 'application/json'})
+          o_response = d_state['connection'].getresponse()
+          return( o_response.status, o_response.read() )
+        except (http.client.HTTPException, ConnectionError) as e:
+          d_state['connection'].close()
+          d_state['connection'] = None
+          if attempt == 2:
+            raise
+    return( send )
+
+##----------------------------------------------------------------------------------------------
+def classify(status, body):
+  """ Return (str|None): error type of a response, None for a success """
+  if status != 200:
+    return( "HTTP %d" % (status) )
+  try:
+    d_response = json.loads(body)
+  except ValueError:
+    return( 'invalid json response' )
+  if isinstance(d_response, dict) and 'error' in d_response:
+    return( d_response['error'].get('exception', 'error') if isinstance(d_response['error'], dict) else 'error' )
+  return( None )
+
+def worker(send, d_bodies, l_mix, t_end, seed, d_latencies, d_errors, lock):
+  o_random = random.Random(seed)
+  l_names = [name for (name, weight) in l_mix]
+  l_weights = [weight for (name, weight) in l_mix]
+  while time.perf_counter() < t_end:
+    name = o_random.choices(l_names, l_weights)[0]
+    body = o_random.choice(d_bodies[name])
+    t_start = time.perf_counter()
+    try:
+      (status, response_body) = send(D_ENDPOINTS[name], body)
+      error = classify(status, response_body)
+    except Exception as e:
+      error = e.__class__.__name__
+    latency = time.perf_counter() - t_start
+    with lock:
+      d_latencies[name].append(latency)
+      if error:
+        d_errors[name][error] = d_errors[name].get(error, 0) + 1
+
+def run_load(o_target, d_bodies, l_mix, concurrency, duration, seed=0):
+  """
+  Run the workers for duration seconds.
+  Return (tuple): (elapsed seconds, {endpoint: [latency, ...]}, {endpoint: {error type: count}})
+  """
+  d_latencies = {name: [] for (name, weight) in l_mix}
+  d_errors = {name: {} for (name, weight) in l_mix}
+  lock = threading.Lock()
+  t_start = time.perf_counter()
+  t_end = t_start + duration
+  l_threads = [threading.Thread(target=worker, args=(o_target.sender(), d_bodies, l_mix, t_end, seed + i, d_latencies, d_errors, lock))
+               for i in range(concurrency)]
+  for o_thread in l_threads:
+    o_thread.start()
+  for o_thread in l_threads:
+    o_thread.join()
+  return( time.perf_counter() - t_start, d_latencies, d_errors )
+
+def report(elapsed, d_latencies, d_errors):
+  """ Return (dict): requests, rps, error_rate, p50/p95/p99/max (ms) and errors per endpoint, plus "all" """
+  d_report = {}
+  l_all = []
+  d_all_errors = {}
+  for name in d_latencies:
+    l_all.extend(d_latencies[name])
+    for (error, count) in d_errors[name].items():
+      d_all_errors[error] = d_all_errors.get(error, 0) + count
+  for (name, l_values, d_counts) in [(name, d_latencies[name], d_errors[name]) for name in d_latencies] + [('all', l_all, d_all_errors)]:
+    n_errors = sum(d_counts.values())
+    d_report[name] = {'requests': len(l_values), 'rps': len(l_values) / elapsed, 'error_rate': n_errors / len(l_values) if l_values else 0.0,
+                      'p50': percentile(l_values, 50) * 1e3, 'p95': percentile(l_values, 95) * 1e3, 'p99': percentile(l_values, 99) * 1e3,
+                      'max': max(l_values) * 1e3 if l_values else float('nan'), 'errors': d_counts}
+  return( d_report )
+
+def print_report(d_report):
+  print("%-14s %9s %9s %8s %10s %10s %10s %10s" % ('endpoint', 'requests', 'req/sec', 'errors', 'p50(ms)', 'p95(ms)', 'p99(ms)', 'max(ms)'))
+  for (name, d_values) in d_report.items():
+    print("%-14s %9d %9.1f %7.2f%% %10.2f %10.2f %10.2f %10.2f" % (name, d_values['requests'], d_values['rps'], d_values['error_rate'] * 100,
+          d_values['p50'], d_values['p95'], d_values['p99'], d_values['max']))
+  if d_report['all']['errors']:
+    print("errors: %s" % (json.dumps(d_report['all']['errors'], sort_keys=True)))
+
+##----------------------------------------------------------------------------------------------
+##
+## Smoke test: one request of each kind, responses printed (formerly pgass_test.sh)
+##
+SQUARE_1 = {"type": "Polygon", "coordinates": [[[1208064, 624154], [1208064, 601260], [1231345, 601260], [1231345, 624154], [1208064, 624154]]]}
+SQUARE_2 = {"type": "Polygon", "coordinates": [[[1199915, 633079], [1199915, 614453], [1219317, 614453], [1219317, 633079], [1199915, 633079]]]}
+SQUARE_FAR = {"type": "Polygon", "coordinates": [[[100.0, 0.0], [101.0, 0.0], [101.0, 1.0], [100.0, 1.0], [100.0, 0.0]]]}
+HELSINKI = {"type": "Polygon", "coordinates": [[[24.950899, 60.169158], [24.953492, 60.169158], [24.953510, 60.170104], [24.950958, 60.169990], [24.950899, 60.169158]]]}
+
+L_SMOKE_REQUESTS = [
+  ('GET (no payload)', 'GET', '/api/polygon_overlap_area', None),
+  ('GET (unsupported endpoint)', 'GET', '/api/bogus_endpoint', None),
+  ('POST (empty payload)', 'POST', '/api/polygon_intersection', {}),
+  ('POST (no api key)', 'POST', '/api/polygon_overlap_area', {"hello": "bill"}),
+  ('POST (invalid api key)', 'POST', '/api/polygon_overlap_area', {"api_key": "pgass-test"}),
+  ('POST (no polygons list)', 'POST', '/api/polygon_overlap_area', {"api_key": API_KEY}),
+  ('POST (single polygon)', 'POST', '/api/polygon_overlap_area', {"api_key": API_KEY, "polygons": [SQUARE_FAR]}),
+  ('POST (invalid polygons)', 'POST', '/api/polygon_overlap_area', {"api_key": API_KEY, "polygons": ["foo", "bar"]}),
+  ('POST (intersecting polygons)', 'POST', '/api/polygon_intersection', {"api_key": API_KEY, "polygons": [SQUARE_1, SQUARE_2]}),
+  ('POST (polygon overlap)', 'POST', '/api/polygon_overlap_area', {"api_key": API_KEY, "polygons": [SQUARE_1, SQUARE_2]}),
+  ('POST (non-intersecting polygons)', 'POST', '/api/polygon_intersection', {"api_key": API_KEY, "polygons": [SQUARE_1, SQUARE_FAR]}),
+  ('POST (polygon non-overlap)', 'POST', '/api/polygon_overlap_area', {"api_key": API_KEY, "polygons": [SQUARE_1, SQUARE_FAR]}),
+  ('POST (point-in-polygon)', 'POST', '/api/point_in_polygon', {"api_key": API_KEY, "polygon": HELSINKI, "point": {"type": "Point", "coordinates": [24.952242, 60.1696017]}}),
+  ('POST (point-NOT-in-polygon)', 'POST', '/api/point_in_polygon', {"api_key": API_KEY, "polygon": HELSINKI, "point": {"type": "Point", "coordinates": [240.42, 10.17]}}),
+]
+
+def smoke(o_target):
+  """ Send each smoke request once, and print the responses """
+  if isinstance(o_target, InProcessTarget):
+    o_client = o_target.app.test_client()
+    def request(method, path, body):
+      o_response = o_client.open(path, method=method, data=body, content_type='application/json')
+      return( o_response.status_code, o_response.get_data() )
+  else:
+    def request(method, path, body):
+      o_connection = o_target.connection_cls(o_target.host, o_target.port, timeout=60)
+      try:
+        o_connection.request(method, o_target.prefix + path, body=body, headers={'Content-Type': 'application/json'})
+        o_response = o_connection.getresponse()
+        return( o_response.status, o_response.read() )
+      finally:
+        o_connection.close()
+
+  for (label, method, path, d_payload) in L_SMOKE_REQUESTS:
+    body = json.dumps(d_payload).encode('utf-8') if d_payload is not None else None
+    (status, response_body) = request(method, path, body)
+    print("Testing %s %s..." % (label, path))
+    print("  %d %s" % (status, response_body.decode('utf-8', 'replace').strip()))
+
+##----------------------------------------------------------------------------------------------
+def parse_mix(mix):
+  """ Return (list): [(endpoint, weight), ...] from "intersection=1,overlap=1,pip=2" """
+  l_mix = []
+  for item in mix.split(','):
+    (name, sep, weight) = item.partition('=')
+    if name not in D_ENDPOINTS:
+      raise ValueError("unknown endpoint (%s). Expected one of: %s" % (name, ', '.join(D_ENDPOINTS)))
+    l_mix.append( (name, float(weight) if sep else 1.0) )
+  return( [(name, weight) for (name, weight) in l_mix if weight > 0] )
+
+def main(l_args):
+  o_parser = argparse.ArgumentParser(description='pGaaS API load generator')
+  o_parser.add_argument('--url', help='base URL of a running server (default: in-process Flask test client)')
+  o_parser.add_argument('--concurrency', type=int, default=8, help='worker threads (default: %(default)s)')
+  o_parser.add_argument('--duration', type=float, default=10.0, help='seconds (default: %(default)s)')
+  o_parser.add_argument('--payload', default='states', help='"states" or comma-separated synthetic vertex counts, i.e. 100,10000 (default: %(default)s)')
+  o_parser.add_argument('--mix', default='intersection=1,overlap=1,pip=1', help='endpoint weights (default: %(default)s)')
+  o_parser.add_argument('--variants', type=int, default=50, help='distinct payloads per endpoint (default: %(default)s)')
+  o_parser.add_argument('--seed', type=int, default=0)
+  o_parser.add_argument('--json', help='save the report to this JSON file')
+  o_parser.add_argument('--smoke', action='store_true', help='send one request of each kind and print the responses')
+  o_args = o_parser.parse_args(l_args)
+
+  o_target = HttpTarget(o_args.url) if o_args.url else InProcessTarget()
+  if o_args.smoke:
+    smoke(o_target)
+    return( 0 )
+
+  try:
+    l_mix = parse_mix(o_args.mix)
+  except ValueError as e:
+    o_parser.error(str(e))
+  o_random = random.Random(o_args.seed)
+  l_pairs = base_polygon_pairs(o_args.payload)
+  d_bodies = {name: make_bodies(name, l_pairs, o_args.variants, o_random) for (name, weight) in l_mix}
+
+  print("target: %s, concurrency %d, duration %.1fs, payload %s, mix %s" % (o_target.name, o_args.concurrency, o_args.duration, o_args.payload, o_args.mix))
+  (elapsed, d_latencies, d_errors) = run_load(o_target, d_bodies, l_mix, o_args.concurrency, o_args.duration, seed=o_args.seed)
+  d_report = report(elapsed, d_latencies, d_errors)
+  print_report(d_report)
+
+  if o_args.json:
+    with open(o_args.json, 'w') as f:
+      json.dump({'target': o_target.name, 'concurrency': o_args.concurrency, 'duration': elapsed, 'payload': o_args.payload,
+                 'mix': o_args.mix, 'variants': o_args.variants, 'endpoints': d_report}, f, indent=1)
+  return( 1 if d_report['all']['requests'] == 0 else 0 )
+
+##----------------------------------------------------------------------------------------------
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,20 @@
+"""
+ File: conftest.py
+ Description: pytest configuration. Puts app/ dir on the python path (as pgaas_flask.wsgi does),
+   so the app modules that use flat imports (i.e. "import polygon_geometry") can be tested.
+   Memoized query results are cleared before each test, so tests see the computation itself.
+"""
+import os
+import sys
+import pytest
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'app')
+if APP_DIR not in sys.path:
+  sys.path.insert(0, APP_DIR)
+
+##------------------------------------------------------------------------
+@pytest.fixture(autouse=True)
+def clear_result_cache():
+  import polygon_geometry
+  polygon_geometry.RESULT_CACHE.clear()
+  yield
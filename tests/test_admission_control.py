@@ -0,0 +1,148 @@
+"""
+ File: test_admission_control.py
+ Description: pytest tests for admission control (cost estimate from the raw body, per api-key budgets, heavy request slots)
+"""
+import os
+import io
+import json
+import time
+import threading
+import pytest
+import app_factory
+import polygon_geometry
+from admission_control import AdmissionController, RateLimited, Overloaded, RequestTooLarge
+from config import DevelopmentConfig
+
+API_KEY = 'fanselow-pgass-test'
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'data')
+POLY_1 = {"type": "Polygon", "coordinates": [[[ 100.0, 0.0 ], [ 101.0, 0.0 ], [ 101.0, 1.0 ], [ 100.0, 1.0 ], [ 100.0, 0.0 ]]]}
+
+##------------------------------------------------------------------------
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    class AdmissionTestConfig(DevelopmentConfig):
+      JOB_WORKER_PROCESSES = 0
+      JOB_DB_PATH = str(tmp_path / 'jobs.sqlite')
+      POLYGON_REGISTRY_DIR = str(tmp_path / 'registry')
+      METRICS_DIR = None
+      ADMISSION_MAX_BODY_BYTES = 100000
+      ADMISSION_MAX_VERTICES = 5000
+      ADMISSION_KEY_COST_RATE = 1000
+      ADMISSION_KEY_COST_BURST = 5000
+    monkeypatch.setattr(app_factory, 'DevelopmentConfig', AdmissionTestConfig)
+    return app_factory.create_app({})
+
+def load_polygon(name):
+    with open(os.path.join(DATA_DIR, "%s.json" % (name))) as f:
+      return json.load(f)
+
+def n_vertices(d_poly):
+    return sum(len(l_ring) for l_ring in d_poly['coordinates'])
+
+##------------------------------------------------------------------------
+def test_cost_estimate(app):
+    from admission_control import estimate_request
+    (d_co, d_wy) = (load_polygon('colorado'), load_polygon('wyoming'))
+    body = json.dumps({'api_key': API_KEY, 'polygons': [d_co, d_wy]})
+    with app.test_request_context('/api/polygon_intersection', method='POST', data=body, content_type='application/json'):
+      (api_key, cost) = estimate_request(10**6)
+    assert api_key == API_KEY and abs(cost - (n_vertices(d_co) + n_vertices(d_wy))) <= 2
+    ## a registered polygon counts with its vertices
+    polygon_id = app.extensions['polygon_registry'].register(d_co)
+    body = json.dumps({'polygons': [{'polygon_id': polygon_id}, POLY_1]})
+    with app.test_request_context('/api/polygon_intersection', method='POST', data=body, content_type='application/json', headers={'X-Api-Key': 'key-2'}):
+      (api_key, cost) = estimate_request(10**6)
+    assert api_key == 'key-2' and abs(cost - (n_vertices(d_co) + n_vertices(POLY_1))) <= 2
+    ## binary coordinates: 16 bytes per vertex
+    data = polygon_geometry.geometries_to_coords([d_co, d_wy])
+    with app.test_request_context('/api/polygon_intersection', method='POST', data=data, content_type='application/x-pgaas-coords'):
+      (api_key, cost) = estimate_request(10**6)
+    assert abs(cost - (n_vertices(d_co) + n_vertices(d_wy))) <= 2
+
+def test_request_too_large(app):
+    o_client = app.test_client()
+    d_big = {'type': 'Polygon', 'coordinates': [[[i * 1e-3, 0.0] for i in range(3000)] + [[0.0, 1.0], [0.0, 0.0]]]}
+    o_response = o_client.post('/api/polygon_overlap_area', json={'api_key': API_KEY, 'polygons': [d_big, d_big]})
+    assert o_response.status_code == 413 ## 6000 vertices
+    o_response = o_client.post('/api/polygon_overlap_area', json={'api_key': API_KEY, 'polygons': [POLY_1, POLY_1], 'padding': 'x' * 100000})
+    assert o_response.status_code == 413 ## body bytes
+    assert app.extensions['admission'].stats()[413] == 2
+
+def test_key_cost_budget(app):
+    o_client = app.test_client()
+    d_mt = load_polygon('montana') ## ~2000 vertices per request: a budget of 5000 is spent by the 2nd request
+    l_status = [o_client.post('/api/polygon_overlap_area', json={'api_key': API_KEY, 'polygons': [d_mt, d_mt]}).status_code for i in range(2)]
+    o_response = o_client.post('/api/polygon_overlap_area', json={'api_key': API_KEY, 'polygons': [d_mt, d_mt]})
+    assert l_status == [200, 200] and o_response.status_code == 429
+    assert 1 <= int(o_response.headers['Retry-After']) <= 2
+    ## other api-keys have their own budget (the request is then rejected by @api_authorize)
+    o_response = o_client.post('/api/polygon_overlap_area', json={'api_key': 'other-key', 'polygons': [d_mt, d_mt]})
+    assert o_response.status_code != 429
+
+def test_charged_to_authorized_key(app):
+    ## the api-key of the payload is the one authorized (see api_authorization.py): a random X-Api-Key does not get a new budget
+    o_client = app.test_client()
+    d_mt = load_polygon('montana')
+    l_status = [o_client.post('/api/polygon_overlap_area', json={'api_key': API_KEY, 'polygons': [d_mt, d_mt]},
+                              headers={'X-Api-Key': 'random-%d' % (i)}).status_code for i in range(3)]
+    assert l_status == [200, 200, 429]
+
+def test_chunked_body_too_large(app):
+    ## no Content-Length: the body is not read past ADMISSION_MAX_BODY_BYTES (100000)
+    o_client = app.test_client()
+    for (size, status) in ((100, 200), (10**7, 413)):
+      o_stream = io.BytesIO(json.dumps({'api_key': API_KEY, 'polygons': [POLY_1, POLY_1], 'padding': 'x' * size}).encode())
+      o_response = o_client.post('/api/polygon_intersection', input_stream=o_stream, content_type='application/json',
+                                 headers={'Transfer-Encoding': 'chunked'}, environ_base={'wsgi.input_terminated': True})
+      assert o_response.status_code == status
+    assert o_stream.tell() <= 100001
+    assert app.extensions['admission'].stats()[413] == 1
+
+def test_key_concurrency():
+    o_controller = AdmissionController(1000, 2, 0, 0, 100, 1)
+    o_controller.acquire('key-1', 10)
+    o_controller.acquire('key-1', 10)
+    with pytest.raises(RateLimited) as o_info:
+      o_controller.acquire('key-1', 10)
+    assert o_info.value.retry_after == 1
+    o_controller.acquire('key-2', 10)
+    o_controller.release('key-1', 10)
+    o_controller.acquire('key-1', 10)
+    assert o_controller.stats()['in_progress'] == 3
+
+def test_heavy_slots():
+    ## one heavy slot, one waiting heavy request: light requests are admitted meanwhile
+    o_controller = AdmissionController(10**6, 0, 0, 0, 100, 1, heavy_queue=1, queue_timeout=5)
+    o_controller.acquire('key-1', 500)
+    l_admitted = []
+    o_thread = threading.Thread(target=lambda: l_admitted.append(o_controller.acquire('key-2', 500)))
+    o_thread.start()
+    while o_controller.stats()['waiting'] == 0:
+      time.sleep(0.01)
+    with pytest.raises(Overloaded):
+      o_controller.acquire('key-3', 500) ## queue full
+    o_controller.acquire('key-3', 10)
+    o_controller.release('key-1', 500)
+    o_thread.join(5)
+    assert l_admitted == [None] and o_controller.stats()['heavy_in_progress'] == 1
+    with pytest.raises(RequestTooLarge):
+      o_controller.acquire('key-1', 10**6 + 1)
+    o_controller.queue_timeout = 0.05
+    o_controller.heavy_queue = 1
+    with pytest.raises(Overloaded):
+      o_controller.acquire('key-1', 500) ## waited for a slot
+
+def test_streamed_response_holds_slot(app):
+    ## NDJSON results are computed while the response is read: the request is in progress until it is closed
+    o_controller = app.extensions['admission']
+    body = ''.join(json.dumps({'op': 'polygon_intersection', 'polygons': [POLY_1, POLY_1], 'id': i}) + '\n' for i in range(3))
+    o_response = app.test_client().post('/api/stream', data=body, content_type='application/x-ndjson', headers={'X-Api-Key': API_KEY}, buffered=False)
+    o_iter = iter(o_response.response)
+    assert json.loads(next(o_iter)) == {'intersects': 1, 'id': 0}
+    assert o_controller.stats()['in_progress'] == 1
+    assert len(list(o_iter)) == 2
+    o_response.close()
+    assert o_controller.stats()['in_progress'] == 0
+    ## responses that are not streamed release the slot when the view returns
+    assert app.test_client().post('/api/polygon_intersection', json={'api_key': API_KEY, 'polygons': [POLY_1, POLY_1]}).status_code == 200
+    assert o_controller.stats()['in_progress'] == 0
@@ -0,0 +1,89 @@
+"""
+ File: test_asgi_adapter.py
+ Description: pytest tests for the ASGI serving mode (bodies received by the event loop, requests run on a bounded thread pool)
+"""
+import json
+import asyncio
+import pytest
+import app_factory
+from asgi_adapter import WsgiToAsgi, create_asgi_app
+from config import DevelopmentConfig
+
+API_KEY = 'fanselow-pgass-test'
+POLY_1 = {"type": "Polygon", "coordinates": [[[ 100.0, 0.0 ], [ 101.0, 0.0 ], [ 101.0, 1.0 ], [ 100.0, 1.0 ], [ 100.0, 0.0 ]]]}
+POLY_2 = {"type": "Polygon", "coordinates": [[[ 100.5, 0.5 ], [ 102.0, 0.5 ], [ 102.0, 2.0 ], [ 100.5, 2.0 ], [ 100.5, 0.5 ]]]}
+
+##------------------------------------------------------------------------
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    class AsgiTestConfig(DevelopmentConfig):
+      JOB_WORKER_PROCESSES = 0
+      JOB_DB_PATH = str(tmp_path / 'jobs.sqlite')
+      POLYGON_REGISTRY_DIR = str(tmp_path / 'registry')
+      METRICS_DIR = None
+      ASGI_THREADS = 1
+    monkeypatch.setattr(app_factory, 'DevelopmentConfig', AsgiTestConfig)
+    return app_factory.create_app({})
+
+async def request(o_asgi, path, body, content_type='application/json', headers=(), l_chunks=None, o_release=None):
+    """ Send a request to an ASGI app. Return (status, [body chunks]) """
+    l_chunks = list(l_chunks) if l_chunks is not None else [body]
+    l_headers = [(b'content-type', content_type.encode()), (b'content-length', str(len(body)).encode())] + list(headers)
+    d_scope = {'type': 'http', 'method': 'POST', 'path': path, 'headers': l_headers, 'query_string': b'', 'http_version': '1.1'}
+    async def receive():
+      if o_release is not None:
+        await o_release.wait()
+      chunk = l_chunks.pop(0) if l_chunks else b''
+      return {'type': 'http.request', 'body': chunk, 'more_body': bool(l_chunks)}
+    l_sent = []
+    async def send(d_message):
+      l_sent.append(d_message)
+    await o_asgi(d_scope, receive, send)
+    return (l_sent[0]['status'], [d['body'] for d in l_sent[1:] if d['body']])
+
+def post_json(o_asgi, path, d_payload, **kwargs):
+    (status, l_body) = asyncio.run(request(o_asgi, path, json.dumps(d_payload).encode(), **kwargs))
+    return (status, json.loads(b''.join(l_body)))
+
+##------------------------------------------------------------------------
+def test_geometry_request(app):
+    o_asgi = create_asgi_app(app)
+    d_point = {'type': 'Point', 'coordinates': [100.5, 0.5]}
+    assert post_json(o_asgi, '/api/point_in_polygon', {'api_key': API_KEY, 'polygon': POLY_1, 'point': d_point}) == (200, {'is_within': 1})
+    assert post_json(o_asgi, '/api/polygon_overlap_area', {'api_key': API_KEY, 'polygons': [POLY_1, POLY_2]}) == (200, {'overlap_area': 0.25})
+
+def test_slow_clients_do_not_hold_threads(app):
+    ## one thread: 50 requests still receiving their bodies, while another request is served
+    o_asgi = create_asgi_app(app)
+    body = json.dumps({'api_key': API_KEY, 'polygons': [POLY_1, POLY_2]}).encode()
+    async def run():
+      o_release = asyncio.Event()
+      l_slow = [asyncio.ensure_future(request(o_asgi, '/api/polygon_intersection', body, l_chunks=[body[:10], body[10:]], o_release=o_release)) for i in range(50)]
+      await asyncio.sleep(0.05)
+      fast = await asyncio.wait_for(request(o_asgi, '/api/polygon_intersection', body), 10)
+      assert not any(o_task.done() for o_task in l_slow)
+      o_release.set()
+      return (fast, await asyncio.gather(*l_slow))
+    (fast, l_slow) = asyncio.run(run())
+    assert json.loads(b''.join(fast[1])) == {'intersects': 1}
+    assert all(json.loads(b''.join(l_body)) == {'intersects': 1} for (status, l_body) in l_slow)
+    assert len(o_asgi.executor._threads) == 1
+
+def test_body_limits(app):
+    o_asgi = WsgiToAsgi(app, threads=1, max_body_bytes=100, body_timeout=0.1)
+    body = json.dumps({'api_key': API_KEY, 'polygons': [POLY_1, POLY_2]}).encode()
+    (status, l_body) = asyncio.run(request(o_asgi, '/api/polygon_intersection', body))
+    assert status == 413 and 'larger than 100 bytes' in json.loads(b''.join(l_body))['error']['message']
+    async def never():
+      return await request(o_asgi, '/api/polygon_intersection', b'{}', o_release=asyncio.Event())
+    (status, l_body) = asyncio.run(never())
+    assert status == 408
+
+def test_ndjson_stream(app):
+    o_asgi = create_asgi_app(app)
+    l_queries = [{'id': i, 'op': 'polygon_intersection', 'polygons': [POLY_1, POLY_2]} for i in range(3)]
+    body = b''.join(json.dumps(d).encode() + b'\n' for d in l_queries)
+    (status, l_body) = asyncio.run(request(o_asgi, '/api/stream', body, content_type='application/x-ndjson',
+                                           headers=[(b'x-api-key', API_KEY.encode())], l_chunks=[body[:50], body[50:120], body[120:]]))
+    assert status == 200 and len(l_body) == 3 ## one body message per result
+    assert [json.loads(line) for line in l_body] == [{'id': i, 'intersects': 1} for i in range(3)]
@@ -0,0 +1,88 @@
+"""
+ File: test_binary_input.py
+ Description: pytest tests for the binary geometry decoders (WKB, packed float64 coordinate buffers)
+"""
+import os
+import json
+import struct
+import pytest
+import shapely
+from shapely.geometry import shape
+import polygon_geometry
+from polygon_geometry import InvalidGeoJson, geometries_from_wkb, geometries_from_coords, geometries_to_coords
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'data')
+POINT = {"type": "Point", "coordinates": [-110.0, 47.0]}
+SQUARE_HOLE = {"type": "Polygon", "coordinates": [[[0, 0], [4, 0], [4, 4], [0, 4], [0, 0]], [[1, 1], [2, 1], [2, 2], [1, 2], [1, 1]]]}
+
+##------------------------------------------------------------------------
+@pytest.fixture
+def montana():
+    polygon_geometry.GEOMETRY_CACHE.clear()
+    with open(os.path.join(DATA_DIR, 'montana.json'), 'r') as f:
+        yield json.load(f)
+    polygon_geometry.GEOMETRY_CACHE.clear()
+
+##------------------------------------------------------------------------
+def test_coords_roundtrip(montana):
+    l_geometries = geometries_from_coords(geometries_to_coords([POINT, montana, SQUARE_HOLE]))
+    assert l_geometries[0].equals(shape(POINT))
+    assert l_geometries[1].context.equals(shape(montana))
+    assert l_geometries[2].context.equals(shape(SQUARE_HOLE))
+    assert polygon_geometry.check_point_in_polygon(point=l_geometries[0], polygon=l_geometries[1]) == {'is_within': 1}
+
+##------------------------------------------------------------------------
+def test_wkb_roundtrip(montana):
+    wkb = shapely.to_wkb(shapely.GeometryCollection([shape(montana), shape(SQUARE_HOLE)]))
+    l_geometries = geometries_from_wkb(wkb)
+    assert [o_prepared.context.equals(shape(d_poly)) for (o_prepared, d_poly) in zip(l_geometries, [montana, SQUARE_HOLE])] == [True, True]
+    ## single geometry (not a collection)
+    assert geometries_from_wkb(shapely.to_wkb(shape(POINT)))[0].equals(shape(POINT))
+
+##------------------------------------------------------------------------
+def test_shared_cache(montana):
+    ## binary and GeoJSON inputs of the same polygon share the geometry cache entry
+    (shape_poly, prepared_poly) = polygon_geometry.get_polygon(montana)
+    assert geometries_from_coords(geometries_to_coords([montana]))[0] is prepared_poly
+    assert geometries_from_wkb(shapely.to_wkb(shape(montana)))[0] is prepared_poly
+    assert polygon_geometry.get_geometry_cache_stats()['hits'] == 2
+
+##------------------------------------------------------------------------
+def _coords_buffer(l_geometry_offsets, l_ring_offsets, l_coords):
+    n = len(l_geometry_offsets) + len(l_ring_offsets)
+    return( struct.pack('<%dI%dd' % (n + 2, len(l_coords)), len(l_geometry_offsets) - 1, len(l_ring_offsets) - 1, *l_geometry_offsets, *l_ring_offsets, *l_coords) )
+
+@pytest.mark.parametrize("data", [
+    b'',
+    b'\x01\x00\x00\x00',
+    _coords_buffer([0, 1], [0, 4], [0, 0, 1, 0, 1, 1, 0, 0])[:-3],                ## truncated coordinates
+    _coords_buffer([0, 2], [0, 4], [0, 0, 1, 0, 1, 1, 0, 0]),                     ## geometry offsets past the rings
+    _coords_buffer([0, 1], [0, 5], [0, 0, 1, 0, 1, 1, 0, 0]),                     ## ring offsets past the coordinates
+    _coords_buffer([0, 1], [0, 3], [0, 0, 1, 0, 0, 0]),                           ## ring with 3 positions
+    _coords_buffer([0, 1], [0, 4], [0, 0, 1, 0, 1, 1, 0, 1]),                     ## ring not closed
+    _coords_buffer([0, 1], [0, 4], [0, 0, 1, 0, float('nan'), 1, 0, 0]),          ## non-finite coordinate
+])
+def test_invalid_coords(data):
+    with pytest.raises(InvalidGeoJson):
+        geometries_from_coords(data)
+
+##------------------------------------------------------------------------
+@pytest.mark.parametrize("data", [
+    b'',
+    b'\x01\x03\x00',
+    shapely.to_wkb(shapely.LineString([(0, 0), (1, 1)])),
+    shapely.to_wkb(shapely.from_wkt('POLYGON EMPTY')),
+    shapely.to_wkb(shapely.Point(float('inf'), 0)),
+])
+def test_invalid_wkb(data):
+    with pytest.raises(InvalidGeoJson):
+        geometries_from_wkb(data)
+
+##------------------------------------------------------------------------
+def test_argument_types(montana):
+    ## decoded geometries in the wrong argument position
+    (o_point, o_prepared) = geometries_from_coords(geometries_to_coords([POINT, montana]))
+    with pytest.raises(InvalidGeoJson):
+        polygon_geometry.check_point_in_polygon(point=o_prepared, polygon=o_point)
+    with pytest.raises(InvalidGeoJson):
+        polygon_geometry.check_polygon_intersection(o_point, o_prepared)
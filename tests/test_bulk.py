@@ -0,0 +1,148 @@
+"""
+ File: test_bulk.py
+ Description: pytest tests for offline bulk processing (bulk_processing.py, pgaas_bulk.py)
+"""
+import os
+import json
+import pytest
+import polygon_geometry
+import bulk_processing
+from bulk_processing import BulkRun, BulkInputError, iter_feature_collection
+import pgaas_bulk
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'data')
+MONTANA_PATH = os.path.join(DATA_DIR, 'montana.json')
+
+def square(x, y, size):
+    return {"type": "Polygon", "coordinates": [[[x, y], [x + size, y], [x + size, y + size], [x, y + size], [x, y]]]}
+
+def features(n=30):
+    ## squares along a line across the Montana border (lon -117 .. -102), and one invalid polygon
+    l_features = [{"type": "Feature", "id": i, "properties": {"name": "parcel %d" % (i)}, "geometry": square(-117.0 + 0.5 * i, 46.0, 0.3)} for i in range(n)]
+    l_features[3]['geometry'] = {"type": "Polygon", "coordinates": [[[0, 0], [1, 1]]]}
+    return l_features
+
+def write_feature_collection(path, l_features):
+    with open(path, 'w') as f:
+        json.dump({"type": "FeatureCollection", "name": "parcels", "features": l_features}, f, indent=1)
+    return str(path)
+
+def write_ndjson(path, l_records):
+    with open(path, 'w') as f:
+        f.write(''.join(json.dumps(record) + '\n' for record in l_records))
+    return str(path)
+
+def read_ndjson(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+##------------------------------------------------------------------------
+def test_feature_collection_scanner():
+    ## "features" also in strings and nested members, braces and escaped quotes in strings
+    text = b'''{"type": "FeatureCollection", "bbox": ["features", "{\\\\"], "x": {"features": [1]}, "features" : [
+      {"type": "Feature", "id": "a\\"}{", "properties": {"s": "\\\\", "t": "}}}"}, "geometry": {"type": "Point", "coordinates": [1, 2]}},
+      {"type": "Feature", "properties": {"t": "}{{"}, "geometry": null}], "after": {"features": []}}'''
+    assert [json.loads(text[start:end]) for (start, end) in iter_feature_collection(text)] == json.loads(text)['features']
+    assert list(iter_feature_collection(b' {"features": []}')) == []
+    for text in [b'[1]', b'{"type": "FeatureCollection"}', b'{"features": [1]}', b'{"features": [{"a": 1},, {}]}',
+                 b'{"features": [{"a": "x}]}', b'{"features": [{"a": 1}']:
+        with pytest.raises(BulkInputError):
+            list(iter_feature_collection(text))
+
+def test_feature_collection_to_csv(tmp_path):
+    input_path = write_feature_collection(tmp_path / 'parcels.geojson', features())
+    output_path = str(tmp_path / 'results.csv')
+    with open(MONTANA_PATH) as f:
+        d_montana = json.load(f)
+    d_stats = BulkRun(input_path, output_path, op='polygon_overlap_area', polygon=d_montana, units='km2', processes=0, chunk_size=7).run()
+    assert (d_stats['records'], d_stats['errors'], d_stats['last_record'], d_stats['bytes_read']) == (30, 1, 30, os.path.getsize(input_path))
+
+    with open(output_path) as f:
+        l_lines = f.read().splitlines()
+    assert l_lines[0] == ','.join(bulk_processing.CSV_FIELDS) and len(l_lines) == 31
+    for (i, d_feature) in enumerate(features()):
+        l_row = l_lines[i + 1].split(',')
+        assert l_row[:2] == [str(i + 1), str(i)]
+        if i == 3:
+            assert l_row[-1].startswith('InvalidGeoJson: ')
+        else:
+            d_expected = polygon_geometry.get_overlap_area(d_feature['geometry'], d_montana, units='km2')
+            assert float(l_row[3]) == pytest.approx(d_expected['overlap_area']) and l_row[5] == 'km2'
+    ## the caches of this process are restored after an inline run
+    assert polygon_geometry.GEOMETRY_CACHE.max_vertices > 0 and polygon_geometry.RESULT_CACHE.max_entries > 0
+
+def test_ndjson_queries(tmp_path):
+    l_records = [{"op": "polygon_intersection", "polygons": [square(0, 0, 1), square(0.5, 0.5, 1)], "id": "a"},
+                 {"op": "point_in_polygon", "point": {"type": "Point", "coordinates": [5, 5]}, "polygon": square(0, 0, 1)},
+                 {"op": "no_such_op", "id": "c"},
+                 {"type": "Feature", "geometry": square(0, 0, 1)}]
+    input_path = write_ndjson(tmp_path / 'queries.ndjson', l_records)
+    with open(input_path, 'a') as f:
+        f.write('\n{"op": \n')
+    output_path = str(tmp_path / 'results.ndjson')
+    d_stats = BulkRun(input_path, output_path, processes=0).run()
+    l_results = read_ndjson(output_path)
+    assert l_results[:2] == [{"record": 1, "intersects": 1, "id": "a"}, {"record": 2, "is_within": 0}]
+    ## failed records: the query error, a Feature without --op, invalid json
+    assert [(d_result['record'], d_result['error']['exception'], d_result.get('id')) for d_result in l_results[2:]] == \
+           [(3, 'QueryError', 'c'), (4, 'QueryError', None), (5, 'JSONDecodeError', None)]
+    assert (d_stats['records'], d_stats['errors']) == (5, 3)
+
+def test_resume(tmp_path):
+    input_path = write_feature_collection(tmp_path / 'parcels.geojson', features(40))
+    for output_format in bulk_processing.OUTPUT_FORMATS:
+        full_path = str(tmp_path / ('full.' + output_format))
+        d_kwargs = {'op': 'polygon_intersection', 'polygon': square(-112.0, 45.0, 5.0), 'processes': 0, 'chunk_size': 6}
+        BulkRun(input_path, full_path, **d_kwargs).run()
+        with open(full_path, 'rb') as f:
+            full_output = f.read()
+        ## interrupted in the middle of a line: the incomplete line is dropped, and the run continues after the last record
+        part_path = str(tmp_path / ('part.' + output_format))
+        with open(part_path, 'wb') as f:
+            f.write(full_output[:len(full_output) // 2])
+        assert bulk_processing.last_output_record(part_path, output_format) > 0
+        d_stats = BulkRun(input_path, part_path, resume=True, **d_kwargs).run()
+        with open(part_path, 'rb') as f:
+            assert f.read() == full_output
+        assert d_stats['last_record'] == 40 and 0 < d_stats['records'] < 40
+        ## nothing left to do
+        assert BulkRun(input_path, part_path, resume=True, **d_kwargs).run()['records'] == 0
+
+    ## offset: skip records, append to the output
+    output_path = str(tmp_path / 'offset.ndjson')
+    BulkRun(input_path, output_path, offset=37, **d_kwargs).run()
+    assert [d_result['record'] for d_result in read_ndjson(output_path)] == [38, 39, 40]
+
+def test_process_pool(tmp_path):
+    l_points = [{"type": "Point", "coordinates": [-117.0 + 0.5 * i, 47.0]} for i in range(25)]
+    input_path = write_ndjson(tmp_path / 'points.ndjson', l_points)
+    (inline_path, pool_path) = (str(tmp_path / 'inline.ndjson'), str(tmp_path / 'pool.ndjson'))
+    l_progress = []
+    for (path, processes) in ((inline_path, 0), (pool_path, 1)):
+        BulkRun(input_path, path, op='point_in_polygon', polygon=square(-112.0, 45.0, 5.0), processes=processes, chunk_size=4,
+                progress=l_progress.append, progress_interval=0).run()
+    assert read_ndjson(pool_path) == read_ndjson(inline_path)
+    assert [d_result['is_within'] for d_result in read_ndjson(pool_path)] == [int(-112.0 < -117.0 + 0.5 * i < -107.0) for i in range(25)]
+    assert l_progress[-1]['records'] == 25 and l_progress[-1]['bytes_read'] == os.path.getsize(input_path)
+
+##------------------------------------------------------------------------
+def test_cli(tmp_path, capsys):
+    l_points = [{"type": "Feature", "properties": {"name": "pt %d" % (i)}, "geometry": {"type": "Point", "coordinates": [x, 47.0]}}
+                for (i, x) in enumerate([-120.0, -110.0, -100.0])]
+    input_path = write_ndjson(tmp_path / 'points.ndjson', l_points)
+    output_path = str(tmp_path / 'results.ndjson')
+    l_args = [input_path, output_path, '--op', 'point_in_polygon', '--polygon', MONTANA_PATH, '--id-property', 'name', '--processes', '0']
+    assert pgaas_bulk.main(l_args) == 0
+    assert read_ndjson(output_path) == [{"record": 1, "is_within": 0, "id": "pt 0"}, {"record": 2, "is_within": 1, "id": "pt 1"},
+                                        {"record": 3, "is_within": 0, "id": "pt 2"}]
+    assert 'pgaas_bulk: 3 records (0 errors)' in capsys.readouterr().err
+
+    ## invalid reference polygon, unknown polygon_id, invalid input file
+    with open(tmp_path / 'line.json', 'w') as f:
+        json.dump({"type": "LineString", "coordinates": [[0, 0], [1, 1]]}, f)
+    assert pgaas_bulk.main(l_args[:5] + [str(tmp_path / 'line.json'), '--processes', '0']) == 1
+    assert pgaas_bulk.main(l_args[:4] + ['--polygon-id', 'no-such-id', '--registry-dir', str(tmp_path)]) == 1
+    assert pgaas_bulk.main([input_path, output_path, '--input-format', 'featurecollection', '--quiet', '--processes', '0']) == 1
+    assert 'InvalidGeoJson' in capsys.readouterr().err
+    with pytest.raises(SystemExit):
+        pgaas_bulk.main([input_path, output_path, '--op', 'point_in_polygon'])
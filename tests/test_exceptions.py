@@ -42,6 +42,21 @@ INVALID_TYPE = '{ "type": "Poli", "coordinates": [ [ [ 1208064, 624154 ], [ 1208
 ## invalid geojson-polygon (not a type="Polygon")
 TYPE_LINE_STR = '{ "type": "LineString", "coordinates": [ [ [ 1208064, 624154 ], [ 1208064, 601260 ], [ 1231345, 601260 ], [ 1231345, 624154 ], [ 1208064, 624154 ] ] ] }'
 
+## invalid geojson-polygon (valid ring coordinates, but type="LineString")
+TYPE_LINE_STR_RING = '{ "type": "LineString", "coordinates": [ [ [ 12, 62 ], [ 12, 60 ], [ 14, 60 ], [ 12, 62 ] ] ] }'
+
+## invalid geojson-polygon (non-numeric coordinate value)
+NON_NUMERIC_COORD = {"type": "Polygon", "coordinates": [[[12, 62], [12, "60"], [14, 60], [12, 62]]]}
+
+## invalid geojson-polygon (boolean is not a JSON number)
+BOOL_COORD = {"type": "Polygon", "coordinates": [[[12, 62], [12, True], [14, 60], [12, 62]]]}
+
+## invalid geojson-polygon (integer too large for a float, as decoded by the stdlib json codec)
+HUGE_INT_COORD = {"type": "Polygon", "coordinates": [[[12, 62], [12, 10**400], [14, 60], [12, 62]]]}
+
+## invalid geojson-polygon (position with a single value)
+SHORT_POSITION = {"type": "Polygon", "coordinates": [[[12], [12, 60], [14, 60], [12]]]}
+
 ##------------------------------------------------------------------------
 def test_exception_on_invalid_geojson():
     ## Test check_polygon_intersection() for raise(InvalidGeoJson) on invalid GeoJSON format
@@ -65,7 +80,12 @@ def test_exception_on_invalid_geojson():
    (POLY_GOOD, TWO_COORDS),
    (POLY_GOOD, NON_POLY),
    (POLY_GOOD, INVALID_TYPE),
-   (POLY_GOOD, TYPE_LINE_STR)
+   (POLY_GOOD, TYPE_LINE_STR),
+   (POLY_GOOD, TYPE_LINE_STR_RING),
+   (POLY_GOOD, NON_NUMERIC_COORD),
+   (POLY_GOOD, BOOL_COORD),
+   (POLY_GOOD, SHORT_POSITION),
+   (POLY_GOOD, HUGE_INT_COORD)
   ])
 def test_exception_on_bad_geojson(poly_bad,poly_good):
     with pytest.raises(InvalidGeoJson):
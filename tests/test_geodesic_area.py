@@ -0,0 +1,88 @@
+"""
+ File: test_geodesic_area.py
+ Description: pytest tests for the geodesic (WGS84 ellipsoid) overlap area of lon/lat polygons
+"""
+import os
+import copy
+import json
+import numpy as np
+import pytest
+import shapely
+from shapely.geometry import box, shape
+import polygon_geometry
+from polygon_geometry import get_overlap_area, geodesic_area
+from geometry_queries import run_query, QueryError
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'data')
+SQUARE = {"type": "Polygon", "coordinates": [[[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]]}
+SQUARE_OVERLAP = {"type": "Polygon", "coordinates": [[[0.5, 0.5], [1.5, 0.5], [1.5, 1.5], [0.5, 1.5], [0.5, 0.5]]]}
+
+def cell_area(lat_1, lat_2, dlon):
+    """ Area (m2) of a lon/lat cell: numerical integral of the ellipsoid area element """
+    (a, f) = (polygon_geometry.WGS84_A, polygon_geometry.WGS84_F)
+    e2 = f * (2 - f)
+    a_lat = np.linspace(np.radians(lat_1), np.radians(lat_2), 100001)
+    a_element = a ** 2 * (1 - e2) * np.cos(a_lat) / (1 - e2 * np.sin(a_lat) ** 2) ** 2
+    return np.trapezoid(a_element, a_lat) * np.radians(dlon)
+
+##------------------------------------------------------------------------
+@pytest.fixture(scope='module')
+def montana_pair():
+    with open(os.path.join(DATA_DIR, 'montana.json'), 'r') as f:
+        d_montana = json.load(f)
+    d_shifted = copy.deepcopy(d_montana)
+    for l_ring in d_shifted['coordinates']:
+        for position in l_ring:
+            position[0] += 1.0
+            position[1] += 0.5
+    return( d_montana, d_shifted )
+
+##------------------------------------------------------------------------
+@pytest.mark.parametrize("lat_1, lat_2", [(0, 1), (37, 41), (60, 61), (-50, -40), (89, 90)])
+def test_cells(lat_1, lat_2):
+    assert geodesic_area(box(10, lat_1, 12, lat_2)) == pytest.approx(cell_area(lat_1, lat_2, 2), rel=1e-9)
+    assert geodesic_area(box(10, lat_1, 12, lat_2), 'km2') == pytest.approx(cell_area(lat_1, lat_2, 2) / 1e6, rel=1e-9)
+
+def test_edges_and_parts():
+    ## a long diagonal edge (straight in lon/lat) is integrated, not approximated by its end points
+    triangle = shapely.Polygon([(0, 0), (10, 0), (10, 40), (0, 0)])
+    assert geodesic_area(triangle) == pytest.approx(geodesic_area(shapely.segmentize(triangle, 0.01)), rel=1e-8)
+    ## either orientation, holes, multipolygons, non-polygon parts
+    assert geodesic_area(triangle.reverse()) == pytest.approx(geodesic_area(triangle), rel=1e-12)
+    with_hole = box(0, 0, 2, 2).difference(box(0.5, 0.5, 1, 1))
+    assert geodesic_area(with_hole) == pytest.approx(geodesic_area(box(0, 0, 2, 2)) - geodesic_area(box(0.5, 0.5, 1, 1)), rel=1e-12)
+    o_collection = shapely.GeometryCollection([box(0, 0, 1, 1), box(2, 0, 3, 1), shapely.LineString([(0, 0), (1, 1)])])
+    assert geodesic_area(o_collection) == pytest.approx(2 * geodesic_area(box(0, 0, 1, 1)), rel=1e-12)
+    assert geodesic_area(shapely.Polygon()) == 0.0
+
+def test_state_area():
+    ## Montana: 380,831 km2 (total area, US Census)
+    with open(os.path.join(DATA_DIR, 'montana.json'), 'r') as f:
+        assert geodesic_area(shape(json.load(f)), 'km2') == pytest.approx(380831, rel=1e-3)
+
+##------------------------------------------------------------------------
+def test_overlap_area_units(montana_pair):
+    d_result = get_overlap_area(*montana_pair, units='km2')
+    o_intersection = shape(montana_pair[0]).intersection(shape(montana_pair[1]))
+    assert d_result == {'overlap_area': pytest.approx(geodesic_area(o_intersection, 'km2'), rel=1e-12), 'units': 'km2'}
+    assert get_overlap_area(*montana_pair, units='m2')['overlap_area'] == pytest.approx(d_result['overlap_area'] * 1e6, rel=1e-12)
+    ## planar area (square degrees) is unchanged, and cached separately
+    assert get_overlap_area(*montana_pair) == {'overlap_area': pytest.approx(o_intersection.area)}
+    assert get_overlap_area(SQUARE, SQUARE_OVERLAP, units='km2')['overlap_area'] == pytest.approx(cell_area(0.5, 1, 0.5) / 1e6, rel=1e-9)
+
+@pytest.mark.parametrize("tolerance", [0.1, 0.01, 0.0001])
+def test_overlap_area_units_error_bound(montana_pair, tolerance):
+    exact_area = get_overlap_area(*montana_pair, units='km2')['overlap_area']
+    d_result = get_overlap_area(*montana_pair, tolerance=tolerance, units='km2')
+    assert abs(d_result['overlap_area'] - exact_area) <= d_result['error_bound'] <= tolerance * exact_area
+
+def test_invalid_units():
+    with pytest.raises(ValueError):
+        get_overlap_area(SQUARE, SQUARE_OVERLAP, units='acres')
+    with pytest.raises(QueryError):
+        run_query({'op': 'polygon_overlap_area', 'polygons': [SQUARE, SQUARE_OVERLAP], 'units': 'acres'})
+    ## projected coordinates (not lon/lat)
+    d_poly = {"type": "Polygon", "coordinates": [[[1208064, 624154], [1208064, 601260], [1231345, 601260], [1231345, 624154], [1208064, 624154]]]}
+    with pytest.raises(ValueError):
+        get_overlap_area(d_poly, d_poly, units='m2')
+    assert run_query({'op': 'polygon_overlap_area', 'polygons': [SQUARE, SQUARE_OVERLAP], 'units': 'km2'})['units'] == 'km2'
@@ -0,0 +1,64 @@
+"""
+ File: test_geometry_cache.py
+ Description: pytest tests for the (content-hash keyed) cache of validated/prepared polygons
+"""
+import json
+import pytest
+import polygon_geometry
+from polygon_geometry import GeometryCache, get_polygon, polygon_hash, validate_geojson_polygon
+
+POLY_1 = '{"type": "Polygon", "coordinates": [[[ 100.0, 0.0 ], [ 101.0, 0.0 ], [ 101.0, 1.0 ], [ 100.0, 1.0 ], [ 100.0, 0.0 ]]]}'
+POLY_1_INT = '{"coordinates": [[[100, 0], [101, 0], [101, 1], [100, 1], [100, 0]]], "type": "Polygon"}'
+POLY_2 = '{ "type": "Polygon", "coordinates": [[[1208064, 624154], [1208064, 601260], [1231345, 601260], [1231345, 624154], [1208064, 624154]]] }'
+POLY_3 = '{ "type": "Polygon", "coordinates": [[[24.950899, 60.169158], [24.953492, 60.169158], [24.953510, 60.170104], [24.950958, 60.169990], [24.950899, 60.169158]]] }'
+
+##------------------------------------------------------------------------
+@pytest.fixture
+def geometry_cache():
+    ## Fresh module-level cache for each test
+    polygon_geometry.GEOMETRY_CACHE.clear()
+    yield polygon_geometry.GEOMETRY_CACHE
+    polygon_geometry.configure_geometry_cache(polygon_geometry.GEOMETRY_CACHE_MAX_VERTICES)
+    polygon_geometry.GEOMETRY_CACHE.clear()
+
+##------------------------------------------------------------------------
+def test_canonical_hash():
+    ## Formatting, key order and int/float coordinates do not change the hash
+    d_poly_1 = validate_geojson_polygon(POLY_1)
+    assert polygon_hash(d_poly_1) == polygon_hash(validate_geojson_polygon(POLY_1_INT))
+    assert polygon_hash(d_poly_1) != polygon_hash(validate_geojson_polygon(POLY_2))
+
+##------------------------------------------------------------------------
+def test_cache_hit(geometry_cache):
+    (shape_1, prepared_1) = get_polygon(POLY_1)
+    (shape_2, prepared_2) = get_polygon(json.loads(POLY_1_INT))
+    assert shape_1 is shape_2
+    assert prepared_1 is prepared_2
+    d_stats = polygon_geometry.get_geometry_cache_stats()
+    assert (d_stats['hits'], d_stats['misses'], d_stats['entries'], d_stats['vertices']) == (1, 1, 1, 5)
+
+##------------------------------------------------------------------------
+def test_cache_eviction_by_vertex_count(geometry_cache):
+    ## room for two 5-vertex polygons
+    polygon_geometry.configure_geometry_cache(10)
+    get_polygon(POLY_1)
+    get_polygon(POLY_2)
+    get_polygon(POLY_1)  ## POLY_1 is now most-recently-used
+    get_polygon(POLY_3)  ## evicts POLY_2
+    d_stats = polygon_geometry.get_geometry_cache_stats()
+    assert (d_stats['entries'], d_stats['vertices'], d_stats['evictions']) == (2, 10, 1)
+    get_polygon(POLY_1)
+    assert polygon_geometry.get_geometry_cache_stats()['hits'] == 2
+
+##------------------------------------------------------------------------
+def test_cache_disabled(geometry_cache):
+    polygon_geometry.configure_geometry_cache(0)
+    assert polygon_geometry.check_polygon_intersection(POLY_1, POLY_1) == {'intersects': 1}
+    assert polygon_geometry.get_geometry_cache_stats()['entries'] == 0
+
+##------------------------------------------------------------------------
+def test_oversized_polygon_not_cached():
+    o_cache = GeometryCache(4)
+    (shape_poly, prepared_poly) = get_polygon(POLY_1)
+    o_cache.put('key', shape_poly, prepared_poly, 5)
+    assert o_cache.get('key') is None
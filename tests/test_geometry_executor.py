@@ -0,0 +1,34 @@
+"""
+ File: test_geometry_executor.py
+ Description: pytest tests for running heavy polygon_geometry operations on the process pool
+"""
+import json
+import pytest
+import polygon_geometry
+
+##------------------------------------------------------------------------
+@pytest.fixture(scope='module')
+def geometry_executor():
+    ## every overlap-area computation goes to the pool
+    polygon_geometry.configure_executor(1, min_vertices=0)
+    yield
+    polygon_geometry.configure_executor(0, min_vertices=20000)
+
+##------------------------------------------------------------------------
+def test_offloaded_overlap_area_matches_inline(geometry_executor):
+    with open('./data/colorado.json', 'r') as f_colorado:
+      d_colorado = json.load(f_colorado)
+    d_box = {"type": "Polygon", "coordinates": [[[-106, 38], [-100, 38], [-100, 42], [-106, 42], [-106, 38]]]}
+    shape_1 = polygon_geometry.get_polygon_shape(d_colorado)
+    shape_2 = polygon_geometry.get_polygon_shape(d_box)
+    assert polygon_geometry._use_executor(shape_1, shape_2) == True
+    result = polygon_geometry.get_overlap_area(d_colorado, d_box)
+    assert result == {'overlap_area': shape_1.intersection(shape_2).area}
+
+##------------------------------------------------------------------------
+def test_small_inputs_inline(geometry_executor):
+    polygon_geometry.OFFLOAD_MIN_VERTICES = 100
+    d_box = {"type": "Polygon", "coordinates": [[[0, 0], [2, 0], [2, 2], [0, 2], [0, 0]]]}
+    shape_box = polygon_geometry.get_polygon_shape(d_box)
+    assert polygon_geometry._use_executor(shape_box, shape_box) == False
+    assert polygon_geometry.get_overlap_area(d_box, d_box) == {'overlap_area': 4.0}
@@ -0,0 +1,63 @@
+"""
+ File: test_geometry_filters.py
+ Description: pytest tests for the cheap-reject filters (bounding box, convex hull) of intersection/overlap-area
+"""
+import pytest
+from shapely.geometry import shape
+import polygon_geometry
+from polygon_geometry import check_polygon_intersection, get_overlap_area, get_filter_stats
+
+SQUARE = {"type": "Polygon", "coordinates": [[[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]]}
+SQUARE_FAR = {"type": "Polygon", "coordinates": [[[5, 5], [6, 5], [6, 6], [5, 6], [5, 5]]]}
+SQUARE_OVERLAP = {"type": "Polygon", "coordinates": [[[0.5, 0.5], [1.5, 0.5], [1.5, 1.5], [0.5, 1.5], [0.5, 0.5]]]}
+## bounding boxes overlap, convex hulls do not
+TRIANGLE_LOW = {"type": "Polygon", "coordinates": [[[0, 0], [4, 0], [0, 4], [0, 0]]]}
+TRIANGLE_HIGH = {"type": "Polygon", "coordinates": [[[4, 4], [1, 4], [4, 1], [4, 4]]]}
+## convex hulls overlap, polygons do not (U-shape around a square)
+U_SHAPE = {"type": "Polygon", "coordinates": [[[0, 0], [3, 0], [3, 3], [2, 3], [2, 1], [1, 1], [1, 3], [0, 3], [0, 0]]]}
+IN_U = {"type": "Polygon", "coordinates": [[[1.2, 1.5], [1.8, 1.5], [1.8, 2.5], [1.2, 2.5], [1.2, 1.5]]]}
+
+##------------------------------------------------------------------------
+@pytest.fixture
+def filter_stats():
+    for d_stages in polygon_geometry.D_FILTER_STATS.values():
+        for stage in d_stages:
+            d_stages[stage] = 0
+    yield
+    polygon_geometry.CONVEX_HULL_FILTER = True
+
+##------------------------------------------------------------------------
+@pytest.mark.parametrize("poly_1, poly_2, stage, intersects, area", [
+    (SQUARE, SQUARE_FAR, 'envelope', 0, 0.0),
+    (TRIANGLE_LOW, TRIANGLE_HIGH, 'convex_hull', 0, 0.0),
+    (U_SHAPE, IN_U, 'exact', 0, 0.0),
+    (SQUARE, SQUARE_OVERLAP, 'exact', 1, 0.25),
+])
+def test_filter_stages(filter_stats, poly_1, poly_2, stage, intersects, area):
+    ## Un-prepared geometries
+    assert check_polygon_intersection(shape(poly_1), shape(poly_2)) == {'intersects': intersects}
+    assert get_overlap_area(poly_1, poly_2) == {'overlap_area': area}
+    d_stats = get_filter_stats()
+    assert d_stats['intersects'][stage] == 1
+    assert d_stats['overlap_area'][stage] == 1
+    assert sum(d_stats['overlap_area'].values()) == 1
+
+##------------------------------------------------------------------------
+def test_prepared_hull(filter_stats):
+    ## Prepared (i.e. cached, or registered) polygons also go through the convex-hull stage before the prepared predicate
+    assert check_polygon_intersection(TRIANGLE_LOW, TRIANGLE_HIGH) == {'intersects': 0}
+    prepared_poly = polygon_geometry.prepare_polygon(U_SHAPE)
+    assert check_polygon_intersection(prepared_poly, IN_U) == {'intersects': 0}
+    assert get_filter_stats()['intersects'] == {'envelope': 0, 'convex_hull': 1, 'exact': 1}
+
+##------------------------------------------------------------------------
+def test_filters_disabled(filter_stats):
+    ## Same results without the convex-hull stage
+    polygon_geometry.CONVEX_HULL_FILTER = False
+    assert get_overlap_area(TRIANGLE_LOW, TRIANGLE_HIGH) == {'overlap_area': 0.0}
+    assert get_filter_stats()['overlap_area'] == {'envelope': 0, 'convex_hull': 0, 'exact': 1}
+
+##------------------------------------------------------------------------
+def test_hull_memoized():
+    shape_1 = polygon_geometry.get_polygon_shape(U_SHAPE)
+    assert polygon_geometry._convex_hull(shape_1) is polygon_geometry._convex_hull(shape_1)
@@ -0,0 +1,41 @@
+"""
+ File: test_geometry_queries.py
+ Description: pytest tests for dispatch of single geometry queries (as used by the NDJSON stream)
+"""
+import pytest
+from geometry_queries import run_query, QueryError
+from polygon_geometry import InvalidGeoJson
+
+POLY_1 = '{"type": "Polygon", "coordinates": [[[ 100.0, 0.0 ], [ 101.0, 0.0 ], [ 101.0, 1.0 ], [ 100.0, 1.0 ], [ 100.0, 0.0 ]]]}'
+POLY_2 = { "type": "Polygon", "coordinates": [[[1208064, 624154], [1208064, 601260], [1231345, 601260], [1231345, 624154], [1208064, 624154]]] }
+POLY_3 = { "type": "Polygon", "coordinates": [[[24.950899, 60.169158], [24.953492, 60.169158], [24.953510, 60.170104], [24.950958, 60.169990], [24.950899, 60.169158]]] }
+POINT = { "type": "Point", "coordinates": [24.952242, 60.1696017] }
+
+##------------------------------------------------------------------------
+@pytest.mark.parametrize("d_query, expected", [ 
+   ({'op': 'polygon_intersection', 'polygons': [POLY_1, POLY_1]}, {'intersects': 1}),
+   ({'op': 'polygon_intersection', 'polygons': [POLY_1, POLY_2], 'id': 7}, {'intersects': 0, 'id': 7}),
+   ({'op': 'polygon_overlap_area', 'polygons': [POLY_1, POLY_1]}, {'overlap_area': 1.0}),
+   ({'op': 'point_in_polygon', 'point': POINT, 'polygon': POLY_3}, {'is_within': 1}),
+   ({'op': 'point_in_polygon_batch', 'points': [[24.952242, 60.1696017], [0, 0]], 'polygon': POLY_3}, {'is_within': [1, 0]}),
+  ])
+def test_run_query(d_query, expected):
+    assert run_query(d_query) == expected
+
+##------------------------------------------------------------------------
+@pytest.mark.parametrize("d_query", [ 
+   [],
+   {'polygons': [POLY_1, POLY_1]},
+   {'op': 'bogus'},
+   {'op': 'polygon_intersection', 'polygons': [POLY_1]},
+   {'op': 'point_in_polygon', 'polygon': POLY_3},
+   {'op': 'point_in_polygon_batch', 'point': POINT},
+  ])
+def test_invalid_query(d_query):
+    with pytest.raises(QueryError):
+        run_query(d_query)
+
+##------------------------------------------------------------------------
+def test_invalid_geojson_query():
+    with pytest.raises(InvalidGeoJson):
+        run_query({'op': 'polygon_overlap_area', 'polygons': [POLY_1, {'type': 'Polygon'}]})
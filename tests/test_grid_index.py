@@ -0,0 +1,136 @@
+"""
+ File: test_grid_index.py
+ Description: pytest tests for the point-in-polygon grid index (same results as the exact test, incl. points on the boundary)
+"""
+import os
+import json
+import numpy as np
+import pytest
+import shapely
+from shapely.geometry import box, shape
+import polygon_geometry
+from polygon_geometry import PolygonGridIndex, check_point_in_polygon, check_points_in_polygon
+from polygon_registry import PolygonRegistry
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'data')
+
+def load_polygon(name):
+    with open(os.path.join(DATA_DIR, "%s.json" % (name))) as f:
+      return json.load(f)
+
+def jagged_polygon(n_vertices, jitter, seed=0):
+    o_random = np.random.default_rng(seed)
+    a_angle = np.linspace(0, 2 * np.pi, n_vertices, endpoint=False)
+    a_r = 1.0 - jitter * o_random.random(n_vertices)
+    return shapely.Polygon(np.column_stack([a_r * np.cos(a_angle), a_r * np.sin(a_angle)]))
+
+def sample_points(shape_poly, n_random=20000):
+    """ Random points, the vertices, and points on (or within rounding of) the edges """
+    o_random = np.random.default_rng(1)
+    (min_x, min_y, max_x, max_y) = shape_poly.bounds
+    a_xy = shapely.get_coordinates(shape_poly)
+    x = np.concatenate([o_random.uniform(min_x - 0.1, max_x + 0.1, n_random), a_xy[:, 0], (a_xy[:-1, 0] + a_xy[1:, 0]) / 2])
+    y = np.concatenate([o_random.uniform(min_y - 0.1, max_y + 0.1, n_random), a_xy[:, 1], (a_xy[:-1, 1] + a_xy[1:, 1]) / 2])
+    return (x, y)
+
+def assert_same_as_exact(shape_poly, o_index, x, y):
+    a_exact = shapely.contains_xy(shape_poly, x, y)
+    assert (o_index.contains_xy(shape_poly, x, y) == a_exact).all()
+    l_single = [o_index.contains(shape_poly, point_x, point_y) for (point_x, point_y) in zip(x.tolist(), y.tolist())]
+    assert l_single == a_exact.tolist()
+
+##------------------------------------------------------------------------
+@pytest.mark.parametrize("name", ['montana', 'colorado', 'jagged', 'holes'])
+def test_same_as_exact(name):
+    if name == 'jagged':
+      shape_poly = jagged_polygon(2000, 0.5)
+    elif name == 'holes':
+      o_hole = shapely.transform(jagged_polygon(500, 0.3), lambda a_xy: a_xy * 0.8 + [2.7, 1.5])
+      shape_poly = shapely.Polygon(shapely.segmentize(box(0, 0, 4, 3), 0.01).exterior, [box(0.5, 0.5, 1.5, 1.5).exterior, o_hole.exterior])
+    else:
+      shape_poly = shape(load_polygon(name))
+    o_index = PolygonGridIndex(shape_poly)
+    assert_same_as_exact(shape_poly, o_index, *sample_points(shape_poly))
+    ## coarse grid: many edges per boundary cell
+    assert_same_as_exact(shape_poly, PolygonGridIndex(shape_poly, max_cells=16), *sample_points(shape_poly, 2000))
+    d_stats = o_index.stats()
+    assert 0 < d_stats['boundary_cells'] < d_stats['cells'] <= polygon_geometry.GRID_INDEX_MAX_CELLS and d_stats['bytes'] > 0
+
+def test_batch_chunks(monkeypatch):
+    ## boundary points are tested in chunks of at most BATCH_MAX_EDGES (point, edge) pairs, plus the edges of the last point
+    shape_poly = shape(load_polygon('colorado'))
+    o_index = PolygonGridIndex(shape_poly, max_cells=256)
+    (x, y) = sample_points(shape_poly, n_random=5000)
+    l_pairs = []
+    boundary_contains = PolygonGridIndex._boundary_contains
+    def spy(self, x, y, a_cell, a_corner_inside):
+        l_pairs.append(int((self.a_cell_offsets[a_cell[:-1] + 1] - self.a_cell_offsets[a_cell[:-1]]).sum()))
+        return boundary_contains(self, x, y, a_cell, a_corner_inside)
+    monkeypatch.setattr(PolygonGridIndex, '_boundary_contains', spy)
+    monkeypatch.setattr(PolygonGridIndex, 'BATCH_MAX_EDGES', 50)
+    assert (o_index.contains_xy(shape_poly, x, y) == shapely.contains_xy(shape_poly, x, y)).all()
+    assert len(l_pairs) > 1 and max(l_pairs) < 50
+
+def test_edges_on_grid_lines():
+    ## 0..10 box with 200 edges, 100 cells => cells of 1.0 from -0.5: holes with edges and vertices on the grid lines and corners
+    l_holes = [[(1.5, 2.5), (2.5, 1.5), (3.5, 2.5), (2.5, 3.5)], [(3.5, 4.5), (5.5, 4.5), (5.5, 6.5), (3.5, 6.5)],
+               [(6.5, 6.5), (8.5, 6.5), (7.5, 8.5)], [(6.5, 1.5), (8.5, 1.5), (8.5, 2.0), (7.0, 2.0), (7.0, 4.5), (6.5, 4.5)]]
+    shape_poly = shapely.Polygon(shapely.segmentize(box(0, 0, 10, 10), 0.2).exterior, l_holes)
+    o_index = PolygonGridIndex(shape_poly, max_cells=100)
+    assert (o_index.cell_size, o_index.x0, o_index.y0) == (1.0, -0.5, -0.5)
+    ## grid corners, middles of the cell sides, and cell centers
+    (x, y) = np.meshgrid(np.arange(-0.5, 10.75, 0.5), np.arange(-0.5, 10.75, 0.5))
+    (x, y) = (np.concatenate([x.ravel(), sample_points(shape_poly)[0]]), np.concatenate([y.ravel(), sample_points(shape_poly)[1]]))
+    assert_same_as_exact(shape_poly, o_index, x, y)
+
+##------------------------------------------------------------------------
+def test_point_queries_build_index(monkeypatch):
+    monkeypatch.setattr(polygon_geometry, 'GRID_INDEX_MIN_VERTICES', 100)
+    monkeypatch.setattr(polygon_geometry, 'GRID_INDEX_MIN_POINTS', 3)
+    polygon_geometry.configure_result_cache(0)
+    d_montana = load_polygon('montana')
+    l_points = [[-110.0, 47.0], [-104.0, 45.0], [-116.04, 49.0], [-111.0, 46.5], [-120.0, 47.0]]
+    d_stats = polygon_geometry.get_grid_index_stats()
+    l_within = [check_point_in_polygon(point={'type': 'Point', 'coordinates': point}, polygon=d_montana)['is_within'] for point in l_points]
+    assert l_within == [1, 0, 1, 1, 0]
+    d_stats_after = polygon_geometry.get_grid_index_stats()
+    ## the index of the (cached) polygon is built on the 3rd point, and answers the next ones
+    assert d_stats_after['indexes'] == d_stats['indexes'] + 1 and d_stats_after['build_seconds'] > d_stats['build_seconds']
+    assert sum(d_stats_after[stat] - d_stats[stat] for stat in ('cell', 'edges', 'exact')) == 3
+    ## batch: same results as the single-point queries
+    assert check_points_in_polygon(points=l_points, polygon=d_montana)['is_within'] == l_within
+    assert polygon_geometry.get_grid_index_stats()['indexes'] == d_stats_after['indexes']
+    polygon_geometry.configure_result_cache(polygon_geometry.RESULT_CACHE_MAX_ENTRIES)
+
+def test_single_point_stats(monkeypatch):
+    ## every single-point test is counted, incl. boundary cells with many edges (tested with numpy)
+    shape_poly = shape(load_polygon('montana'))
+    o_index = PolygonGridIndex(shape_poly, max_cells=64)
+    (x, y) = sample_points(shape_poly, n_random=500)
+    for max_edges in (PolygonGridIndex.SCALAR_MAX_EDGES, 0):
+        monkeypatch.setattr(PolygonGridIndex, 'SCALAR_MAX_EDGES', max_edges)
+        d_stats = polygon_geometry.get_grid_index_stats()
+        assert [o_index.contains(shape_poly, point_x, point_y) for (point_x, point_y) in zip(x.tolist(), y.tolist())] == shapely.contains_xy(shape_poly, x, y).tolist()
+        d_stats_after = polygon_geometry.get_grid_index_stats()
+        assert sum(d_stats_after[stat] - d_stats[stat] for stat in ('cell', 'edges', 'exact')) == len(x)
+        assert d_stats_after['edges'] > d_stats['edges']
+
+def test_small_polygons_not_indexed(monkeypatch):
+    monkeypatch.setattr(polygon_geometry, 'GRID_INDEX_MIN_POINTS', 1)
+    d_square = {"type": "Polygon", "coordinates": [[[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]]}
+    d_stats = polygon_geometry.get_grid_index_stats()
+    assert check_points_in_polygon(points=[[0.5, 0.5], [1.5, 0.5]], polygon=d_square)['is_within'] == [1, 0]
+    assert polygon_geometry.get_grid_index_stats() == d_stats
+
+def test_registered_polygon_indexed(tmp_path, monkeypatch):
+    monkeypatch.setattr(polygon_geometry, 'GRID_INDEX_MIN_VERTICES', 100)
+    polygon_geometry.GEOMETRY_CACHE.clear()
+    n_indexes = polygon_geometry.get_grid_index_stats()['indexes']
+    polygon_id = PolygonRegistry(str(tmp_path)).register(load_polygon('wyoming'))
+    assert polygon_geometry.get_grid_index_stats()['indexes'] == n_indexes + 1
+    ## loaded (i.e. by another process): indexed when loaded
+    polygon_geometry.GEOMETRY_CACHE.clear()
+    o_registry = PolygonRegistry(str(tmp_path))
+    shape_poly = o_registry.get(polygon_id).context
+    assert polygon_geometry.get_grid_index_stats()['indexes'] == n_indexes + 2
+    assert polygon_geometry.grid_index(shape_poly, 1) is polygon_geometry.grid_index(shape_poly)
@@ -0,0 +1,63 @@
+"""
+ File: test_job_queue.py
+ Description: pytest tests for the asynchronous geometry job store and runner
+"""
+import time
+import pytest
+from job_queue import JobStore, JobRunner, JobNotFound, JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_FAILED
+
+POLY_1 = {"type": "Polygon", "coordinates": [[[ 100.0, 0.0 ], [ 101.0, 0.0 ], [ 101.0, 1.0 ], [ 100.0, 1.0 ], [ 100.0, 0.0 ]]]}
+QUERY_OVERLAP = {'op': 'polygon_overlap_area', 'polygons': [POLY_1, POLY_1]}
+
+##------------------------------------------------------------------------
+@pytest.fixture
+def job_store(tmp_path):
+    return JobStore(str(tmp_path / 'jobs.sqlite'))
+
+##------------------------------------------------------------------------
+def test_submit_claim_finish(job_store):
+    job_id = job_store.submit(QUERY_OVERLAP)
+    assert job_store.get(job_id)['status'] == JOB_QUEUED
+    assert job_store.claim_next(12345) == (job_id, QUERY_OVERLAP)
+    assert job_store.claim_next(12345) is None
+    assert job_store.get(job_id)['status'] == JOB_RUNNING
+    job_store.finish(job_id, JOB_DONE, {'overlap_area': 1.0})
+    d_job = job_store.get(job_id)
+    assert (d_job['status'], d_job['result']) == (JOB_DONE, {'overlap_area': 1.0})
+
+##------------------------------------------------------------------------
+def test_jobs_survive_restart(job_store):
+    ## jobs claimed by a process that no longer exists are re-queued
+    job_id = job_store.submit(QUERY_OVERLAP)
+    job_store.claim_next(2**22 + 1)  ## (not a running pid)
+    o_store = JobStore(job_store.db_path)
+    assert o_store.requeue_orphans() == 1
+    assert o_store.get(job_id)['status'] == JOB_QUEUED
+
+##------------------------------------------------------------------------
+def test_purge_expired(job_store):
+    job_id = job_store.submit(QUERY_OVERLAP)
+    job_store.claim_next(12345)
+    job_store.finish(job_id, JOB_DONE, {'overlap_area': 1.0})
+    assert job_store.purge_expired(3600) == 0
+    assert job_store.purge_expired(-1) == 1
+    with pytest.raises(JobNotFound):
+        job_store.get(job_id)
+
+##------------------------------------------------------------------------
+def test_job_runner(job_store):
+    o_runner = JobRunner(job_store, 1, 3600, poll_interval=0.1)
+    o_runner.start()
+    try:
+      job_id_ok = job_store.submit(QUERY_OVERLAP)
+      job_id_bad = job_store.submit({'op': 'polygon_overlap_area', 'polygons': [POLY_1]})
+      o_runner.notify()
+      for i in range(100):
+        if job_store.get(job_id_bad)['status'] in (JOB_DONE, JOB_FAILED):
+          break
+        time.sleep(0.1)
+    finally:
+      o_runner.stop()
+    assert job_store.get(job_id_ok)['result'] == {'overlap_area': 1.0}
+    d_job = job_store.get(job_id_bad)
+    assert (d_job['status'], d_job['result']['exception']) == (JOB_FAILED, 'QueryError')
@@ -0,0 +1,52 @@
+"""
+ File: test_json_codec.py
+ Description: pytest tests for the pluggable JSON codec (json_codec.py)
+"""
+import json
+import pytest
+import json_codec
+import polygon_geometry
+from polygon_geometry import InvalidGeoJson
+
+POLY_1 = '{"type": "Polygon", "coordinates": [[[ 100.0, 0.0 ], [ 101.0, 0.0 ], [ 101.0, 1.0 ], [ 100.0, 1.0 ], [ 100.0, 0.0 ]]]}'
+CODECS = [name for name in json_codec.D_CODECS if name != 'orjson' or json_codec.orjson is not None]
+
+##------------------------------------------------------------------------
+@pytest.fixture(params=CODECS)
+def codec(request):
+    json_codec.configure_codec(request.param)
+    yield request.param
+    json_codec.configure_codec('auto')
+
+##------------------------------------------------------------------------
+def test_roundtrip(codec):
+    d_obj = {'b': [1, 2.5, -3e-7], 'a': {'s': 'xé', 'n': None, 't': True}}
+    assert json_codec.loads(json_codec.dumps(d_obj)) == d_obj
+    assert json_codec.loads(json_codec.dumpb(d_obj)) == d_obj
+    assert json_codec.loads(POLY_1.encode('utf-8')) == json.loads(POLY_1)
+    assert json_codec.dumps({'b': 1, 'a': 2}, sort_keys=True) == '{"a":2,"b":1}'
+
+##------------------------------------------------------------------------
+@pytest.mark.parametrize("data, exception", [
+    ([1, 2], TypeError),
+    (None, TypeError),
+    ('{"a": ', json.JSONDecodeError),
+    (b'\xff\xfe', ValueError),
+])
+def test_errors(codec, data, exception):
+    with pytest.raises(exception):
+        json_codec.loads(data)
+
+##------------------------------------------------------------------------
+def test_geojson_validation(codec):
+    ## same validation result with every codec
+    assert polygon_geometry.validate_geojson_polygon(POLY_1) == json.loads(POLY_1)
+    with pytest.raises(InvalidGeoJson):
+        polygon_geometry.validate_geojson_polygon('{"type": "Polygon", ')
+
+##------------------------------------------------------------------------
+def test_configure():
+    assert json_codec.configure_codec('json') == 'json'
+    assert json_codec.configure_codec('auto') == ('orjson' if json_codec.orjson is not None else 'json')
+    with pytest.raises(json_codec.JsonCodecError):
+        json_codec.configure_codec('simdjson')
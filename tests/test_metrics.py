@@ -0,0 +1,117 @@
+"""
+ File: test_metrics.py
+ Description: pytest tests for the request metrics (per-stage timing, multi-process store, /metrics exposition)
+"""
+import os
+import re
+import time
+import pytest
+import metrics
+import app_factory
+import polygon_geometry
+from config import DevelopmentConfig
+
+API_KEY = 'fanselow-pgass-test'
+POLY_1 = {"type": "Polygon", "coordinates": [[[ 100.0, 0.0 ], [ 101.0, 0.0 ], [ 101.0, 1.0 ], [ 100.0, 1.0 ], [ 100.0, 0.0 ]]]}
+DEAD_PID = 2**22 + 1  ## (not a running pid)
+
+##------------------------------------------------------------------------
+@pytest.fixture
+def metrics_dir(tmp_path):
+    metrics.configure_metrics(str(tmp_path))
+    yield str(tmp_path)
+    metrics.configure_metrics(None, enabled=False)
+
+def sample(text, name, **labels):
+    """ Value of one sample of the exposition text (None if absent) """
+    for line in text.splitlines():
+      o_match = re.match(r'^(\w+)\{(.*)\} (\S+)$', line)
+      if o_match and o_match.group(1) == name:
+        d_labels = dict(re.findall(r'(\w+)="([^"]*)"', o_match.group(2)))
+        if d_labels == {k: str(v) for (k, v) in labels.items()}:
+          return float(o_match.group(3))
+    return None
+
+##------------------------------------------------------------------------
+def test_nested_stages_exclusive(metrics_dir):
+    metrics.start_request('api.test')
+    with metrics.stage('geometry'):
+      time.sleep(0.02)
+      with metrics.stage('shape'):
+        time.sleep(0.05)
+    metrics.add_input_vertices(10)
+    metrics.end_request()
+    text = metrics.render_metrics()
+    shape_time = sample(text, 'pgaas_stage_duration_seconds_sum', endpoint='api.test', stage='shape')
+    geometry_time = sample(text, 'pgaas_stage_duration_seconds_sum', endpoint='api.test', stage='geometry')
+    request_time = sample(text, 'pgaas_request_duration_seconds_sum', endpoint='api.test')
+    assert shape_time >= 0.05
+    assert 0.02 <= geometry_time < 0.05
+    assert request_time >= shape_time + geometry_time
+    assert sample(text, 'pgaas_stage_duration_seconds_bucket', endpoint='api.test', stage='shape', le='0.025') == 0
+    assert sample(text, 'pgaas_stage_duration_seconds_bucket', endpoint='api.test', stage='shape', le='+Inf') == 1
+    assert sample(text, 'pgaas_input_vertices', endpoint='api.test', pid=os.getpid()) == 10
+
+##------------------------------------------------------------------------
+def test_no_request_noop(metrics_dir):
+    assert metrics.in_request() == False
+    with metrics.stage('geometry'):
+      metrics.add_input_vertices(10)
+    metrics.end_request()
+    assert 'pgaas_stage_duration_seconds_sum' not in metrics.render_metrics()
+
+##------------------------------------------------------------------------
+def test_processes_merged(metrics_dir):
+    ## samples of another (exited) WSGI process: counters are summed, its gauges dropped
+    o_values = metrics.MmapValues(os.path.join(metrics_dir, 'pgaas_%d.metrics' % (DEAD_PID)))
+    o_values.add('pgaas_exceptions_total\tpgaas_exceptions_total\tendpoint="api.test",exception="InvalidGeoJson"\t', 2)
+    o_values.set('pgaas_input_vertices\tpgaas_input_vertices\tendpoint="api.test"\t', 99)
+    o_values.close()
+    metrics.start_request('api.test')
+    metrics.count_exception(ValueError('test'))
+    metrics.count_exception(ValueError('test'))
+    o_exception = type('InvalidGeoJson', (Exception,), {})('test')
+    metrics.count_exception(o_exception)
+    metrics.end_request()
+    text = metrics.render_metrics()
+    assert sample(text, 'pgaas_exceptions_total', endpoint='api.test', exception='InvalidGeoJson') == 3
+    assert sample(text, 'pgaas_exceptions_total', endpoint='api.test', exception='ValueError') == 2
+    assert sample(text, 'pgaas_input_vertices', endpoint='api.test', pid=DEAD_PID) is None
+
+##------------------------------------------------------------------------
+def test_mmap_values_grow(tmp_path):
+    path = str(tmp_path / 'values.metrics')
+    o_values = metrics.MmapValues(path)
+    for i in range(5000):
+      o_values.add('key-%d' % (i), i)
+    o_values.add('key-1', 1)
+    assert os.path.getsize(path) > metrics.MmapValues.INITIAL_SIZE
+    d_values = dict(metrics.read_values(path))
+    assert len(d_values) == 5000
+    assert (d_values['key-1'], d_values['key-4999']) == (2.0, 4999.0)
+    o_values.close()
+    ## re-opened (i.e. same pid after a restart): existing entries are kept
+    o_values = metrics.MmapValues(path)
+    o_values.add('key-1', 1)
+    assert dict(o_values.items())['key-1'] == 3.0
+    o_values.close()
+
+##------------------------------------------------------------------------
+def test_metrics_endpoint(metrics_dir, tmp_path, monkeypatch):
+    class MetricsTestConfig(DevelopmentConfig):
+      JOB_WORKER_PROCESSES = 0
+      JOB_DB_PATH = str(tmp_path / 'jobs.sqlite')
+      POLYGON_REGISTRY_DIR = str(tmp_path / 'registry')
+      METRICS_DIR = metrics_dir
+    monkeypatch.setattr(app_factory, 'DevelopmentConfig', MetricsTestConfig)
+    polygon_geometry.GEOMETRY_CACHE.clear() ## so the shape() stage runs
+    o_client = app_factory.create_app({}).test_client()
+    o_response = o_client.post('/api/polygon_intersection', json={'api_key': API_KEY, 'polygons': [POLY_1, POLY_1]})
+    assert o_response.get_json() == {'intersects': 1}
+    o_response = o_client.get('/metrics')
+    assert o_response.content_type.startswith('text/plain; version=0.0.4')
+    text = o_response.get_data(as_text=True)
+    assert sample(text, 'pgaas_request_duration_seconds_count', endpoint='api.polygon-intersection') == 1
+    for stage in ('parse', 'authorize', 'validate', 'geojson', 'shape', 'geometry', 'jsonify'):
+      assert sample(text, 'pgaas_stage_duration_seconds_count', endpoint='api.polygon-intersection', stage=stage) == 1
+    assert sample(text, 'pgaas_input_vertices', endpoint='api.polygon-intersection', pid=os.getpid()) == 10
@@ -0,0 +1,62 @@
+"""
+ File: test_overlap_lod.py
+ Description: pytest tests for the approximate ("fast mode") overlap area on simplified polygons
+"""
+import os
+import copy
+import json
+import pytest
+import polygon_geometry
+from polygon_geometry import get_overlap_area
+from geometry_queries import run_query, QueryError
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'data')
+SQUARE = {"type": "Polygon", "coordinates": [[[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]]}
+SQUARE_OVERLAP = {"type": "Polygon", "coordinates": [[[0.5, 0.5], [1.5, 0.5], [1.5, 1.5], [0.5, 1.5], [0.5, 0.5]]]}
+
+##------------------------------------------------------------------------
+@pytest.fixture(scope='module')
+def montana_pair():
+    with open(os.path.join(DATA_DIR, 'montana.json'), 'r') as f:
+        d_montana = json.load(f)
+    d_shifted = copy.deepcopy(d_montana)
+    for l_ring in d_shifted['coordinates']:
+        for position in l_ring:
+            position[0] += 1.0
+            position[1] += 0.5
+    return( d_montana, d_shifted )
+
+##------------------------------------------------------------------------
+@pytest.mark.parametrize("tolerance", [0.1, 0.02, 0.005, 0.0001])
+def test_error_bound(montana_pair, tolerance):
+    exact_area = get_overlap_area(*montana_pair)['overlap_area']
+    d_result = get_overlap_area(*montana_pair, tolerance=tolerance)
+    assert abs(d_result['overlap_area'] - exact_area) <= d_result['error_bound']
+    assert d_result['error_bound'] <= tolerance * exact_area
+    assert d_result['lod_tolerance'] in polygon_geometry.LOD_TOLERANCES + (0.0,)
+
+##------------------------------------------------------------------------
+def test_coarse_level(montana_pair):
+    ## a loose tolerance is met by the coarsest level
+    d_result = get_overlap_area(*montana_pair, tolerance=0.5)
+    assert d_result['lod_tolerance'] == polygon_geometry.LOD_TOLERANCES[0]
+    assert d_result['error_bound'] > 0
+
+##------------------------------------------------------------------------
+def test_small_polygons_exact():
+    ## nothing to simplify: exact area, no error
+    assert get_overlap_area(SQUARE, SQUARE_OVERLAP, tolerance=0.1) == {'overlap_area': 0.25, 'error_bound': 0.0, 'lod_tolerance': 0.0}
+    assert get_overlap_area(SQUARE, SQUARE_OVERLAP, tolerance=0) == {'overlap_area': 0.25, 'error_bound': 0.0, 'lod_tolerance': 0.0}
+
+##------------------------------------------------------------------------
+@pytest.mark.parametrize("tolerance", [-0.1, "0.1", True])
+def test_invalid_tolerance(tolerance):
+    with pytest.raises(ValueError):
+        get_overlap_area(SQUARE, SQUARE_OVERLAP, tolerance=tolerance)
+    with pytest.raises(QueryError):
+        run_query({'op': 'polygon_overlap_area', 'polygons': [SQUARE, SQUARE_OVERLAP], 'tolerance': tolerance})
+
+##------------------------------------------------------------------------
+def test_query_tolerance(montana_pair):
+    d_result = run_query({'op': 'polygon_overlap_area', 'polygons': list(montana_pair), 'tolerance': 0.5})
+    assert d_result['lod_tolerance'] == polygon_geometry.LOD_TOLERANCES[0]
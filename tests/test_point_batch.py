@@ -0,0 +1,61 @@
+"""
+ File: test_point_batch.py
+ Description: pytest tests for batch (vectorized) point-in-polygon
+"""
+import json
+import pytest
+from polygon_geometry import check_points_in_polygon, check_point_in_polygon, InvalidGeoJson
+
+POLY_3 = '{ "type": "Polygon", "coordinates": [[[24.950899, 60.169158], [24.953492, 60.169158], [24.953510, 60.170104], [24.950958, 60.169990], [24.950899, 60.169158]]] }'
+
+POINT_IN = [24.952242, 60.1696017]
+POINT_OUT = [24.0, 60.0]
+POINT_EDGE = [24.952, 60.169158]  ## on the boundary (not "within")
+
+##------------------------------------------------------------------------
+def test_points_in_polygon():
+    result = check_points_in_polygon(points=[POINT_IN, POINT_OUT, POINT_EDGE], polygon=POLY_3)
+    assert result == {'is_within': [1, 0, 0]}
+
+##------------------------------------------------------------------------
+def test_flat_coordinates_in_polygon():
+    result = check_points_in_polygon(coordinates=POINT_OUT + POINT_IN, polygon=POLY_3)
+    assert result == {'is_within': [0, 1]}
+
+##------------------------------------------------------------------------
+def test_zero_one_coordinates():
+    ## 0 and 1 (int or float) are numbers, only booleans converted to 0/1 are rejected (see test_invalid_points)
+    d_square = {"type": "Polygon", "coordinates": [[[0, 0], [2, 0], [2, 2], [0, 2], [0, 0]]]}
+    assert check_points_in_polygon(points=[[1, 1], [1.0, 0.5], [3, 1]], polygon=d_square) == {'is_within': [1, 1, 0]}
+    assert check_points_in_polygon(coordinates=[0.5, 1, 1, 3.0], polygon=d_square) == {'is_within': [1, 0]}
+
+##------------------------------------------------------------------------
+def test_batch_matches_single_point():
+    ## Same answers as check_point_in_polygon() for points across colorado
+    with open('./data/colorado.json', 'r') as f_colorado:
+      d_colorado = json.load(f_colorado)
+    l_points = [[-109.5 + 0.5*i, 36.5 + 0.25*j] for i in range(16) for j in range(20)]
+    l_within = check_points_in_polygon(points=l_points, polygon=d_colorado)['is_within']
+    for (point, is_within) in zip(l_points, l_within):
+      d_point = {'type': 'Point', 'coordinates': point}
+      assert check_point_in_polygon(point=d_point, polygon=d_colorado) == {'is_within': is_within}
+
+##------------------------------------------------------------------------
+def test_empty_batch():
+    assert check_points_in_polygon(points=[], polygon=POLY_3) == {'is_within': []}
+
+##------------------------------------------------------------------------
+@pytest.mark.parametrize("d_kwargs", [ 
+   {},
+   {'points': [[1, 2], [3]]},
+   {'points': [1, 2]},
+   {'points': [['a', 'b']]},
+   {'points': [[True, False]]},
+   {'points': [[0.5, 0.5], [True, 1]]},
+   {'coordinates': [0.5, 0.5, 1, False]},
+   {'coordinates': [1, 2, 3]},
+   {'coordinates': [1, float('nan')]},
+  ])
+def test_invalid_points(d_kwargs):
+    with pytest.raises(InvalidGeoJson):
+        check_points_in_polygon(polygon=POLY_3, **d_kwargs)
@@ -0,0 +1,50 @@
+"""
+ File: test_polygon_layer.py
+ Description: pytest tests for "which polygon contains this point" lookups over a layer of polygons
+"""
+import pytest
+from polygon_geometry import PolygonLayer, find_containing_polygon, find_containing_polygons, check_point_in_polygon, InvalidGeoJson
+
+PT_DENVER = { "type": "Point", "coordinates": [-104.94189, 39.743764] }
+PT_HELENA = { "type": "Point", "coordinates": [-112.0391, 46.5891] }
+PT_CASPER = { "type": "Point", "coordinates": [-106.3131, 42.8666] }
+PT_HELSINKI = { "type": "Point", "coordinates": [24.952242, 60.1696017] }
+
+POLY_A = {"type": "Polygon", "coordinates": [[[0, 0], [2, 0], [2, 2], [0, 2], [0, 0]]]}
+POLY_B = {"type": "Polygon", "coordinates": [[[1, 1], [3, 1], [3, 3], [1, 3], [1, 1]]]}
+
+##------------------------------------------------------------------------
+@pytest.fixture(scope='module')
+def states():
+    return PolygonLayer.from_directory('./data')
+
+##------------------------------------------------------------------------
+@pytest.mark.parametrize("point, expected", [ 
+   (PT_DENVER, 'colorado'),
+   (PT_HELENA, 'montana'),
+   (PT_CASPER, 'wyoming'),
+   (PT_HELSINKI, None),
+  ])
+def test_find_containing_polygon(states, point, expected):
+    assert find_containing_polygon(point=point, layer=states) == {'polygon': expected}
+
+##------------------------------------------------------------------------
+def test_find_containing_polygons_matches_exact_test(states):
+    ## batch lookup agrees with check_point_in_polygon() over the whole layer
+    l_points = [[-117.0 + 0.5*i, 36.0 + 0.5*j] for i in range(26) for j in range(26)]
+    l_found = find_containing_polygons(points=l_points, layer=states)['polygons']
+    for (point, found) in zip(l_points, l_found):
+      d_point = {'type': 'Point', 'coordinates': point}
+      l_within = [name for (name, shape_poly) in zip(states.l_names, states.a_shapes) if check_point_in_polygon(point=d_point, polygon=shape_poly)['is_within']]
+      assert found == (l_within[0] if l_within else None)
+
+##------------------------------------------------------------------------
+def test_overlapping_polygons_first_match():
+    o_layer = PolygonLayer({'a': POLY_A, 'b': POLY_B})
+    result = find_containing_polygons(coordinates=[1.5, 1.5, 2.5, 2.5, 0.5, 0.5, 5, 5], layer=o_layer)
+    assert result == {'polygons': ['a', 'b', 'a', None]}
+
+##------------------------------------------------------------------------
+def test_invalid_layer_polygon():
+    with pytest.raises(InvalidGeoJson):
+        PolygonLayer({'a': POLY_A, 'bad': {"type": "Polygon", "coordinates": [[[0, 0], [1, 1]]]}})
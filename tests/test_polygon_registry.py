@@ -0,0 +1,80 @@
+"""
+ File: test_polygon_registry.py
+ Description: pytest tests for registered (prepared) polygons referenced by polygon_id
+"""
+import json
+import pytest
+import polygon_geometry
+from polygon_registry import PolygonRegistry, PolygonNotFound
+
+POLY_1 = '{"type": "Polygon", "coordinates": [[[ 100.0, 0.0 ], [ 101.0, 0.0 ], [ 101.0, 1.0 ], [ 100.0, 1.0 ], [ 100.0, 0.0 ]]]}'
+POLY_1_INT = {"type": "Polygon", "coordinates": [[[100, 0], [101, 0], [101, 1], [100, 1], [100, 0]]]}
+POLY_2 = '{ "type": "Polygon", "coordinates": [[[1208064, 624154], [1208064, 601260], [1231345, 601260], [1231345, 624154], [1208064, 624154]]] }'
+POLY_3 = '{ "type": "Polygon", "coordinates": [[[24.950899, 60.169158], [24.953492, 60.169158], [24.953510, 60.170104], [24.950958, 60.169990], [24.950899, 60.169158]]] }'
+POINT = '{ "type": "Point", "coordinates": [24.952242, 60.1696017] }'
+
+##------------------------------------------------------------------------
+def test_register_returns_stable_id(tmp_path):
+    ## Same polygon (int or float coordinates) always gets the same id
+    o_registry = PolygonRegistry(str(tmp_path))
+    polygon_id = o_registry.register(POLY_1)
+    assert o_registry.register(POLY_1_INT) == polygon_id
+    assert o_registry.register(POLY_2) != polygon_id
+
+##------------------------------------------------------------------------
+def test_registered_polygon_shared_by_registry_dir(tmp_path):
+    ## A polygon registered by one process can be loaded by another from the registry dir
+    polygon_id = PolygonRegistry(str(tmp_path)).register(POLY_3)
+    o_registry = PolygonRegistry(str(tmp_path))
+    result = polygon_geometry.check_point_in_polygon(point=POINT, polygon=o_registry.get(polygon_id))
+    assert result == {'is_within': 1}
+
+##------------------------------------------------------------------------
+def test_resolve_and_delete(tmp_path):
+    o_registry = PolygonRegistry(str(tmp_path))
+    polygon_id = o_registry.register(POLY_1)
+    prepared_poly = o_registry.resolve({'polygon_id': polygon_id})
+    assert polygon_geometry.check_polygon_intersection(prepared_poly, POLY_1) == {'intersects': 1}
+    assert polygon_geometry.check_polygon_intersection(POLY_2, prepared_poly) == {'intersects': 0}
+    assert polygon_geometry.get_overlap_area(prepared_poly, POLY_1) == {'overlap_area': 1.0}
+
+    ## inline GeoJSON is passed through unchanged
+    assert o_registry.resolve(json.loads(POLY_2)) == json.loads(POLY_2)
+
+    assert o_registry.delete(polygon_id) == True
+    assert o_registry.delete(polygon_id) == False
+    with pytest.raises(PolygonNotFound):
+        o_registry.resolve({'polygon_id': polygon_id})
+
+##------------------------------------------------------------------------
+def test_delete_in_other_process(tmp_path):
+    ## a polygon deleted through another registry (i.e. another WSGI process) is no longer served from the cache
+    (o_registry, o_registry_2) = (PolygonRegistry(str(tmp_path)), PolygonRegistry(str(tmp_path)))
+    polygon_id = o_registry.register(POLY_1)
+    assert o_registry_2.get(polygon_id) is not None
+    assert o_registry.delete(polygon_id) == True
+    with pytest.raises(PolygonNotFound):
+        o_registry_2.get(polygon_id)
+    assert o_registry_2.o_cache.stats()['entries'] == 0
+
+##------------------------------------------------------------------------
+def test_cache_max_vertices(tmp_path):
+    ## prepared polygons are cached up to max_vertices (LRU), evicted polygons are loaded again from the registry dir
+    o_registry = PolygonRegistry(str(tmp_path), max_vertices=12)
+    l_ids = [o_registry.register(poly) for poly in (POLY_1, POLY_2, POLY_3)]
+    assert sorted(o_registry.o_cache.d_entries) == sorted(l_ids[1:])
+    assert o_registry.o_cache.stats()['vertices'] == 10
+    assert polygon_geometry.check_point_in_polygon(point=POINT, polygon=o_registry.get(l_ids[2])) == {'is_within': 1}
+    assert polygon_geometry.get_overlap_area(o_registry.get(l_ids[0]), POLY_1) == {'overlap_area': 1.0}
+    assert sorted(o_registry.o_cache.d_entries) == sorted([l_ids[0], l_ids[2]])
+
+    ## nothing is evicted from a registry without registry dir (the only copy)
+    o_registry = PolygonRegistry(max_vertices=0)
+    polygon_id = o_registry.register(POLY_1)
+    assert o_registry.get(polygon_id) is not None and o_registry.estimate_vertices(polygon_id) == 5
+
+##------------------------------------------------------------------------
+@pytest.mark.parametrize("polygon_id", ['bogus', '../../etc/passwd', 42, ['a'], 'a'*64])
+def test_unknown_polygon_id(polygon_id):
+    with pytest.raises(PolygonNotFound):
+        PolygonRegistry().get(polygon_id)
@@ -0,0 +1,79 @@
+"""
+ File: test_result_cache.py
+ Description: pytest tests for the memoized results of intersection/overlap-area/point-in-polygon queries
+"""
+import time
+import pytest
+import shapely
+from shapely.geometry import shape
+import polygon_geometry
+from polygon_geometry import ResultCache, check_polygon_intersection, get_overlap_area, check_point_in_polygon, get_result_cache_stats
+
+SQUARE = {"type": "Polygon", "coordinates": [[[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]]}
+SQUARE_FLOAT = {"type": "Polygon", "coordinates": [[[0.0, 0.0], [1.0, 0.0], [1.0, 1.0], [0.0, 1.0], [0.0, 0.0]]]}
+SQUARE_OVERLAP = {"type": "Polygon", "coordinates": [[[0.5, 0.5], [1.5, 0.5], [1.5, 1.5], [0.5, 1.5], [0.5, 0.5]]]}
+POINT_IN = {"type": "Point", "coordinates": [0.25, 0.25]}
+POINT_OUT = {"type": "Point", "coordinates": [1.25, 0.25]}
+
+##------------------------------------------------------------------------
+def test_symmetric_hit():
+    ## swapped pair (and int/float formatting) hits the same entry
+    assert get_overlap_area(SQUARE, SQUARE_OVERLAP) == {'overlap_area': 0.25}
+    assert get_overlap_area(SQUARE_OVERLAP, SQUARE_FLOAT) == {'overlap_area': 0.25}
+    assert check_polygon_intersection(SQUARE_OVERLAP, SQUARE) == {'intersects': 1}
+    assert check_polygon_intersection(SQUARE, SQUARE_OVERLAP) == {'intersects': 1}
+    d_stats = get_result_cache_stats()
+    assert (d_stats['hits'], d_stats['misses'], d_stats['entries'], d_stats['hit_rate']) == (2, 2, 2, 0.5)
+
+##------------------------------------------------------------------------
+def test_input_formats_share_entry():
+    ## GeoJSON, shapely and binary inputs of the same polygons share the entry
+    assert get_overlap_area(SQUARE, SQUARE_OVERLAP) == {'overlap_area': 0.25}
+    assert get_overlap_area(shape(SQUARE_OVERLAP), shape(SQUARE)) == {'overlap_area': 0.25}
+    l_geometries = polygon_geometry.geometries_from_wkb(shapely.to_wkb(shapely.GeometryCollection([shape(SQUARE), shape(SQUARE_OVERLAP)])))
+    assert get_overlap_area(*l_geometries) == {'overlap_area': 0.25}
+    assert get_result_cache_stats()['hits'] == 2
+
+##------------------------------------------------------------------------
+def test_tolerance_key():
+    ## exact and approximate results are cached separately
+    assert get_overlap_area(SQUARE, SQUARE_OVERLAP) == {'overlap_area': 0.25}
+    assert get_overlap_area(SQUARE, SQUARE_OVERLAP, tolerance=0.1) == {'overlap_area': 0.25, 'error_bound': 0.0, 'lod_tolerance': 0.0}
+    assert get_result_cache_stats()['entries'] == 2
+
+##------------------------------------------------------------------------
+def test_point_in_polygon():
+    assert check_point_in_polygon(point=POINT_IN, polygon=SQUARE) == {'is_within': 1}
+    assert check_point_in_polygon(point=POINT_OUT, polygon=SQUARE) == {'is_within': 0}
+    assert check_point_in_polygon(point=POINT_IN, polygon=SQUARE_FLOAT) == {'is_within': 1}
+    assert get_result_cache_stats()['hits'] == 1
+
+##------------------------------------------------------------------------
+def test_cached_result_copy():
+    ## callers may add members to a result (i.e. query "id") without changing the cached entry
+    d_result = check_polygon_intersection(SQUARE, SQUARE_OVERLAP)
+    d_result['id'] = 1
+    assert check_polygon_intersection(SQUARE, SQUARE_OVERLAP) == {'intersects': 1}
+
+##------------------------------------------------------------------------
+def test_lru_and_ttl():
+    o_cache = ResultCache(2, 0.05)
+    o_cache.put('a', {'v': 1})
+    o_cache.put('b', {'v': 2})
+    assert o_cache.get('a') == {'v': 1}
+    o_cache.put('c', {'v': 3}) ## evicts "b" (least recently used)
+    assert o_cache.get('b') is None
+    time.sleep(0.06)
+    assert o_cache.get('a') is None
+    d_stats = o_cache.stats()
+    assert (d_stats['evictions'], d_stats['expirations'], d_stats['entries']) == (1, 1, 1)
+
+##------------------------------------------------------------------------
+def test_disabled():
+    polygon_geometry.configure_result_cache(0)
+    try:
+        assert get_overlap_area(SQUARE, SQUARE_OVERLAP) == {'overlap_area': 0.25}
+        assert get_overlap_area(SQUARE, SQUARE_OVERLAP) == {'overlap_area': 0.25}
+        assert get_result_cache_stats()['hits'] + get_result_cache_stats()['misses'] == 0
+    finally:
+        polygon_geometry.configure_result_cache(polygon_geometry.RESULT_CACHE_MAX_ENTRIES)
@@ -0,0 +1,87 @@
+"""
+ File: test_spatial_join.py
+ Description: pytest tests for the spatial join of two collections of polygons
+"""
+import os
+import json
+import pytest
+import polygon_geometry
+from polygon_geometry import spatial_join, check_polygon_intersection, get_overlap_area, InvalidGeoJson
+
+##------------------------------------------------------------------------
+def square(x, y, size):
+    return {"type": "Polygon", "coordinates": [[[x, y], [x+size, y], [x+size, y+size], [x, y+size], [x, y]]]}
+
+## 10x10 grid of unit "parcels" and a 3x3 grid of overlapping 4x4 "zones"
+PARCELS = [square(i, j, 1) for i in range(10) for j in range(10)]
+ZONES = [square(0.5 + 3*i, 0.5 + 3*j, 4) for i in range(3) for j in range(3)]
+
+##------------------------------------------------------------------------
+def brute_force_join(l_polys_1, l_polys_2):
+    l_pairs = []
+    for (i, poly_1) in enumerate(l_polys_1):
+      for (j, poly_2) in enumerate(l_polys_2):
+        if check_polygon_intersection(poly_1, poly_2)['intersects']:
+          l_pairs.append((i, j, get_overlap_area(poly_1, poly_2)['overlap_area']))
+    return l_pairs
+
+##------------------------------------------------------------------------
+@pytest.mark.parametrize("processes, chunk_size", [(1, 1000), (2, 30)])
+def test_spatial_join_matches_brute_force(processes, chunk_size):
+    result = spatial_join(PARCELS, ZONES, overlap_area=True, processes=processes, chunk_size=chunk_size)
+    l_expected = brute_force_join(PARCELS, ZONES)
+    assert result['pairs'] == len(l_expected)
+    assert list(zip(result['index_1'], result['index_2'])) == [(i, j) for (i, j, area) in l_expected]
+    assert result['overlap_area'] == pytest.approx([area for (i, j, area) in l_expected])
+
+##------------------------------------------------------------------------
+def test_spatial_join_reuses_pool():
+    ## the join pool is started once, and the warm geometry pool is used when configured
+    l_expected = spatial_join(PARCELS, ZONES)['index_2']
+    assert spatial_join(PARCELS, ZONES, processes=2, chunk_size=30)['index_2'] == l_expected
+    o_executor = polygon_geometry._JOIN_EXECUTOR
+    assert o_executor is not None
+    assert spatial_join(PARCELS[::-1], ZONES[:4], processes=2, chunk_size=30)['pairs'] == spatial_join(PARCELS[::-1], ZONES[:4])['pairs']
+    assert polygon_geometry._JOIN_EXECUTOR is o_executor
+    polygon_geometry.configure_executor(1)
+    try:
+        assert polygon_geometry._join_executor(2) is polygon_geometry._GEOMETRY_EXECUTOR
+        assert spatial_join(PARCELS, ZONES, processes=2, chunk_size=30)['index_2'] == l_expected
+    finally:
+        polygon_geometry.configure_executor(0)
+
+##------------------------------------------------------------------------
+def test_spatial_join_second_collection_sent_once(monkeypatch):
+    ## chunk tasks name the (temp) WKB file of the second collection, which is removed after the join
+    l_tasks = []
+    join_executor = polygon_geometry._join_executor
+    class RecordingExecutor(object):
+        def __init__(self, o_executor):
+            self.o_executor = o_executor
+        def submit(self, func, *l_args):
+            l_tasks.append(l_args)
+            return self.o_executor.submit(func, *l_args)
+    monkeypatch.setattr(polygon_geometry, '_join_executor', lambda processes: RecordingExecutor(join_executor(processes)))
+    assert spatial_join(PARCELS, ZONES, processes=2, chunk_size=30) == spatial_join(PARCELS, ZONES)
+    assert len(l_tasks) == 4 and len(set(l_args[0] for l_args in l_tasks)) == 1
+    assert not os.path.exists(l_tasks[0][0])
+
+##------------------------------------------------------------------------
+def test_spatial_join_states():
+    ## touching states intersect (with 0 overlap area)
+    l_states = []
+    for name in ['colorado', 'wyoming', 'montana']:
+      with open('./data/%s.json' % (name), 'r') as f:
+        l_states.append(json.load(f))
+    result = spatial_join(l_states, l_states)
+    assert list(zip(result['index_1'], result['index_2'])) == [(0, 0), (0, 1), (1, 0), (1, 1), (1, 2), (2, 1), (2, 2)]
+    assert 'overlap_area' not in result
+
+##------------------------------------------------------------------------
+def test_spatial_join_no_hits():
+    assert spatial_join(PARCELS[:1], [square(100, 100, 1)], overlap_area=True) == {'pairs': 0, 'index_1': [], 'index_2': [], 'overlap_area': []}
+
+##------------------------------------------------------------------------
+def test_spatial_join_invalid_polygon():
+    with pytest.raises(InvalidGeoJson):
+        spatial_join(PARCELS, ZONES + [{"type": "Polygon", "coordinates": [[[0, 0], [1, 1]]]}])
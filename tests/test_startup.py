@@ -0,0 +1,82 @@
+"""
+ File: test_startup.py
+ Description: pytest tests for app startup (config class from the environment, warm-up preloading)
+"""
+import os
+import json
+import pytest
+import app_factory
+import polygon_geometry
+from polygon_registry import PolygonRegistry
+from config import BaseConfig, DevelopmentConfig, TestingConfig
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), 'data')
+
+##------------------------------------------------------------------------
+@pytest.fixture
+def startup_config(tmp_path, monkeypatch):
+    class StartupConfig(DevelopmentConfig):
+      JOB_WORKER_PROCESSES = 0
+      JOB_DB_PATH = str(tmp_path / 'jobs.sqlite')
+      POLYGON_REGISTRY_DIR = str(tmp_path / 'registry')
+      METRICS_DIR = None
+      WARMUP_POLYGON_FILES = [os.path.join(DATA_DIR, 'colorado.json'), os.path.join(DATA_DIR, 'wyoming.json')]
+    monkeypatch.setattr(app_factory, 'DevelopmentConfig', StartupConfig)
+    monkeypatch.delenv(app_factory.CONFIG_ENV_VAR, raising=False)
+    monkeypatch.delenv('FLASK_ENV', raising=False)
+    polygon_geometry.GEOMETRY_CACHE.clear()
+    return StartupConfig
+
+def load_polygon(name):
+    with open(os.path.join(DATA_DIR, "%s.json" % (name))) as f:
+      return json.load(f)
+
+##------------------------------------------------------------------------
+def test_config_from_environment(startup_config, monkeypatch):
+    assert app_factory.create_app({}).extensions['startup']['config'] == 'development'
+    monkeypatch.setattr(TestingConfig, 'JOB_WORKER_PROCESSES', 0)
+    monkeypatch.setattr(TestingConfig, 'WARMUP_ENABLED', False)
+    monkeypatch.setenv(app_factory.CONFIG_ENV_VAR, 'testing')
+    app = app_factory.create_app({})
+    assert app.config['TESTING'] is True and app.extensions['startup']['config'] == 'testing'
+    monkeypatch.setenv(app_factory.CONFIG_ENV_VAR, 'staging')
+    with pytest.raises(ValueError):
+      app_factory.create_app({})
+
+def test_runtime_state_outside_source_tree():
+    repo_dir = os.path.dirname(BaseConfig.ROOT_DIR)
+    for path in (BaseConfig.POLYGON_REGISTRY_DIR, BaseConfig.JOB_DB_PATH, BaseConfig.METRICS_DIR):
+      assert path.startswith(BaseConfig.DATA_DIR)
+      assert os.path.commonpath([repo_dir, os.path.realpath(path)]) != repo_dir
+
+def test_warm_up_preloads_reference_polygons(startup_config):
+    app = app_factory.create_app({})
+    app_factory.warm_up(app)
+    d_startup = app.extensions['startup']
+    assert d_startup['warmup_polygons'] == 2 and d_startup['warmup_seconds'] > 0
+    d_stats = polygon_geometry.get_geometry_cache_stats()
+    polygon_geometry.get_polygon(load_polygon('colorado'))
+    polygon_geometry.get_polygon(load_polygon('wyoming'))
+    assert polygon_geometry.get_geometry_cache_stats()['hits'] == d_stats['hits'] + 2
+
+def test_warm_up_disabled(startup_config, monkeypatch):
+    monkeypatch.setattr(startup_config, 'WARMUP_ENABLED', False)
+    app = app_factory.create_app({})
+    app_factory.warm_up(app)
+    assert 'warmup_polygons' not in app.extensions['startup']
+    assert polygon_geometry.get_geometry_cache_stats()['entries'] == 0
+
+def test_warm_up_before_handlers(startup_config):
+    ## handlers can still be registered after the warm-up requests (i.e. by pgaas_flask.py)
+    app = app_factory.create_app({})
+    app.errorhandler(KeyError)(lambda e: ('', 500))
+    app_factory.warm_up(app)
+    assert app.extensions['startup']['warmup_polygons'] == 2
+
+def test_registry_preload(tmp_path):
+    registry_dir = str(tmp_path / 'registry')
+    l_ids = [PolygonRegistry(registry_dir).register(load_polygon(name)) for name in ('colorado', 'wyoming', 'montana')]
+    o_registry = PolygonRegistry(registry_dir) ## i.e. a new process
+    assert o_registry.preload(max_polygons=2) == 2
+    assert o_registry.preload() == 3
+    assert sorted(o_registry.o_cache.d_entries) == sorted(l_ids)
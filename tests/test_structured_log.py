@@ -0,0 +1,93 @@
+"""
+ File: test_structured_log.py
+ Description: pytest tests for the structured logging (JSON records written by a background thread, sampling, truncation)
+"""
+import json
+import queue
+import logging
+import pytest
+import structured_log
+
+##------------------------------------------------------------------------
+@pytest.fixture
+def log_file(tmp_path):
+    yield str(tmp_path / 'log' / 'pgaas.log')
+    structured_log.configure_logging('INFO')
+
+def read_records(log_file):
+    structured_log.flush_logging()
+    with open(log_file) as f:
+      return [json.loads(line) for line in f]
+
+##------------------------------------------------------------------------
+def test_json_records(log_file):
+    structured_log.configure_logging('DEBUG', log_file=log_file)
+    log = structured_log.get_logger('test')
+    log.debug("valid Polygon", extra={'rings': 2})
+    try:
+      1/0
+    except ZeroDivisionError as e:
+      log.error("unhandled exception", exc_info=e)
+    l_records = read_records(log_file)
+    assert [d['msg'] for d in l_records] == ["valid Polygon", "unhandled exception"]
+    assert l_records[0]['rings'] == 2 and l_records[0]['logger'] == 'pgaas.test' and l_records[0]['level'] == 'DEBUG'
+    assert 'ZeroDivisionError' in l_records[1]['traceback']
+
+def test_level_and_sampling(log_file):
+    structured_log.configure_logging('INFO', log_file=log_file, sample_rate=0.0)
+    log = structured_log.get_logger('test')
+    log.debug("not written (level)")
+    for i in range(20):
+      log.info("not written (sampled out)")
+    log.warning("always written")
+    assert [d['msg'] for d in read_records(log_file)] == ["always written"]
+
+def test_payload_truncated(log_file):
+    structured_log.configure_logging('DEBUG', log_file=log_file, max_chars=100)
+    d_payload = {'api_key': 'x', 'polygon': {'type': 'Polygon', 'coordinates': [[[float(i), float(i)] for i in range(100000)]]}}
+    structured_log.get_logger('test').debug("x" * 1000, extra={'payload': d_payload, 'note': "y" * 1000})
+    d_record = read_records(log_file)[0]
+    assert len(d_record['payload']) <= 100 + len("...(1000 chars)")
+    assert d_record['note'].startswith("y" * 100) and d_record['note'].endswith("...(1000 chars)")
+    assert d_record['msg'].endswith("...(1000 chars)")
+
+def test_traceback_truncated(log_file):
+    ## i.e. a validation error chained from an exception whose message contains the whole payload
+    structured_log.configure_logging('DEBUG', log_file=log_file, max_chars=100)
+    try:
+      try:
+        raise ValueError("\n".join("[%d.0, %d.0]," % (i, i) for i in range(5000)) + "x" * 1000)
+      except ValueError as e:
+        raise KeyError("invalid payload") from e
+    except KeyError as e:
+      structured_log.get_logger('test').error("request failed", exc_info=e)
+    traceback = read_records(log_file)[0]['traceback']
+    assert len(traceback) <= 400 + len("(100000 chars)...")
+    assert traceback.endswith("KeyError: 'invalid payload'")
+
+def test_full_queue_drops(log_file):
+    o_handler = structured_log.configure_logging('INFO', log_file=log_file, queue_size=2)
+    structured_log.LISTENER.stop() ## nothing written: the queue fills up
+    log = structured_log.get_logger('test')
+    for i in range(5):
+      log.info("record %d" % (i))
+    assert o_handler.dropped == 3
+    structured_log.LISTENER.start()
+    log.info("after")
+    assert [(d['msg'], d.get('dropped')) for d in read_records(log_file)] == [("record 0", None), ("record 1", None), ("after", 3)]
+
+def test_request_path_logged(log_file, monkeypatch, capsys):
+    import app_factory
+    from config import DevelopmentConfig
+    class LogConfig(DevelopmentConfig):
+      JOB_WORKER_PROCESSES = 0
+      LOG_LEVEL = 'DEBUG'
+      LOGFILE_PATH = log_file
+    monkeypatch.setattr(app_factory, 'DevelopmentConfig', LogConfig)
+    app = app_factory.create_app({})
+    d_poly = {"type": "Polygon", "coordinates": [[[100.0, 0.0], [101.0, 0.0], [101.0, 1.0], [100.0, 1.0], [100.0, 0.0]]]}
+    o_response = app.test_client().post('/api/point_in_polygon', json={'api_key': LogConfig.API_KEY, 'polygon': d_poly, 'point': {'type': 'Point', 'coordinates': [100.5, 0.5]}})
+    assert o_response.get_json() == {'is_within': 1}
+    d_record = [d for d in read_records(log_file) if d['msg'] == "point in polygon"][0]
+    assert d_record['path'] == '/api/point_in_polygon' and 'coordinates' in d_record['payload']
+    assert capsys.readouterr().out == ''